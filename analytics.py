@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 离线分析模块
+
+该模块把记录的事件按块加载为NumPy列数组（时间戳、事件类型、坐标、应用），
+并在列上做向量化统计：事件间隔分布、点击频率、鼠标移动距离和速度、
+各应用使用时长以及按星期和小时的活跃度矩阵。
+
+统计按块累加，块之间只保留最后一个事件的少量状态，
+内存占用由chunk_size决定，与记录的事件总数无关。需要安装NumPy。
+
+用法:
+    python analytics.py output.json
+    python analytics.py output.json --from 2026-01-01 --to 2026-01-08 --json
+"""
+
+import os
+import sys
+import math
+import logging
+import argparse
+import datetime
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+from event_store import parse_timestamp
+
+logger = logging.getLogger("analytics")
+
+NUMPY_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+
+# 每块加载的事件数
+DEFAULT_CHUNK_SIZE = 100000
+
+# 默认空闲阈值（秒）：间隔超过该值的时间不计入使用时长
+DEFAULT_IDLE_GAP = 300.0
+
+# 事件间隔分布的分桶上界（秒），最后一桶为超过最大上界的间隔
+INTERVAL_BOUNDS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0)
+
+# 鼠标速度分布的分桶上界（像素/秒）
+SPEED_BOUNDS = (100.0, 300.0, 1000.0, 3000.0, 10000.0)
+
+# 只有间隔不超过该值（秒）的相邻鼠标事件才计算速度
+VELOCITY_MAX_GAP = 1.0
+
+POINTER_TYPES = ("mouse_move", "mouse_click", "mouse_scroll")
+WEEKDAYS = ("周一", "周二", "周三", "周四", "周五", "周六", "周日")
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("离线分析需要NumPy，请先安装: pip install numpy")
+
+
+def local_utc_offset() -> float:
+    """本地时区相对UTC的偏移（秒）"""
+    return datetime.datetime.now().astimezone().utcoffset().total_seconds()
+
+
+class _Vocabulary:
+    """字符串到连续整数编码的映射，跨块共享"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class EventColumns:
+    """一块事件的列式表示，types和apps为编码对应的名称"""
+
+    __slots__ = ("ts", "type", "x", "y", "app", "types", "apps")
+
+    def __init__(self, ts, type_codes, x, y, app, types: List[str], apps: List[str]):
+        self.ts = ts
+        self.type = type_codes
+        self.x = x
+        self.y = y
+        self.app = app
+        self.types = types
+        self.apps = apps
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def type_code(self, name: str) -> int:
+        """事件类型的编码，不存在时返回-1"""
+        return self.types.index(name) if name in self.types else -1
+
+
+def iter_columns(events: Iterable[Dict[str, Any]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[EventColumns]:
+    """
+    把事件流按块转换为列数组
+
+    Args:
+        events: 按时间顺序的事件
+        chunk_size: 每块的事件数
+
+    Yields:
+        EventColumns，同一次调用产生的各块使用相同的类型和应用编码
+    """
+    _require_numpy()
+    types = _Vocabulary()
+    apps = _Vocabulary()
+    nan = math.nan
+    ts, codes, xs, ys, app_codes = [], [], [], [], []
+    for event in events:
+        position = event.get("position") or {}
+        ts.append(event.get("timestamp"))
+        codes.append(types.code(event.get("type", "")))
+        xs.append(position.get("x", nan))
+        ys.append(position.get("y", nan))
+        app_codes.append(apps.code((event.get("window") or {}).get("app_name", "")))
+        if len(ts) >= chunk_size:
+            yield _columns(ts, codes, xs, ys, app_codes, types, apps)
+            ts, codes, xs, ys, app_codes = [], [], [], [], []
+    if ts:
+        yield _columns(ts, codes, xs, ys, app_codes, types, apps)
+
+
+def parse_timestamps(values: List[Any]) -> Any:
+    """
+    批量把时间戳转换为Unix时间（秒），无法解析的为NaN
+
+    监控器写入的都是UTC的ISO时间，这种情况下由NumPy一次解析整块，
+    其他格式逐个解析。
+    """
+    if all(isinstance(value, str) and value.endswith("+00:00") for value in values):
+        try:
+            parsed = np.array([value[:-6] for value in values], dtype="datetime64[us]")
+            return parsed.astype(np.int64) / 1e6
+        except ValueError:
+            pass
+    result = np.empty(len(values), dtype=np.float64)
+    for i, value in enumerate(values):
+        try:
+            ts = parse_timestamp(value)
+        except (ValueError, TypeError):
+            ts = None
+        result[i] = math.nan if ts is None else ts
+    return result
+
+
+def _columns(ts, codes, xs, ys, app_codes, types: _Vocabulary, apps: _Vocabulary) -> EventColumns:
+    timestamps = parse_timestamps(ts)
+    # 丢弃时间戳无效的事件
+    valid = ~np.isnan(timestamps)
+    return EventColumns(
+        timestamps[valid],
+        np.array(codes, dtype=np.int32)[valid],
+        np.array(xs, dtype=np.float32)[valid],
+        np.array(ys, dtype=np.float32)[valid],
+        np.array(app_codes, dtype=np.int32)[valid],
+        list(types.names),
+        list(apps.names)
+    )
+
+
+def load_columns(store,
+                 start: Optional[float] = None,
+                 end: Optional[float] = None,
+                 types: Optional[Iterable[str]] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 workers: int = 1) -> Iterator[EventColumns]:
+    """按块加载EventStore中的事件"""
+    return iter_columns(store.iter_events(start=start, end=end, types=types, workers=workers), chunk_size)
+
+
+def _add_padded(total, values):
+    """按位相加两个长度可能不同的一维数组"""
+    if len(values) > len(total):
+        total = np.concatenate((total, np.zeros(len(values) - len(total), dtype=total.dtype)))
+    total[:len(values)] += values
+    return total
+
+
+def _bucket_counts(values, bounds) -> Any:
+    return np.bincount(np.searchsorted(bounds, values, side="left"), minlength=len(bounds) + 1)
+
+
+class ActivityStats:
+    """按块累加的活动统计"""
+
+    def __init__(self, idle_gap: float = DEFAULT_IDLE_GAP, tz_offset: Optional[float] = None):
+        """
+        初始化统计
+
+        Args:
+            idle_gap: 空闲阈值（秒）
+            tz_offset: 计算星期和小时使用的时区偏移（秒），为None时使用本地时区
+        """
+        _require_numpy()
+        self.idle_gap = idle_gap
+        self.tz_offset = local_utc_offset() if tz_offset is None else tz_offset
+        self.event_count = 0
+        self.types: List[str] = []
+        self.apps: List[str] = []
+        self._type_counts = np.zeros(0, dtype=np.int64)
+        self._app_seconds = np.zeros(0, dtype=np.float64)
+        self._interval_counts = np.zeros(len(INTERVAL_BOUNDS) + 1, dtype=np.int64)
+        self._interval_sum = 0.0
+        self._interval_max = 0.0
+        self._active_seconds = 0.0
+        self._distance = 0.0
+        self._moving_distance = 0.0
+        self._moving_seconds = 0.0
+        self._max_speed = 0.0
+        self._speed_counts = np.zeros(len(SPEED_BOUNDS) + 1, dtype=np.int64)
+        self._hourly = np.zeros(7 * 24, dtype=np.int64)
+        self._first_ts: Optional[float] = None
+        # 块之间延续的状态：上一个事件的时间和应用、上一个鼠标事件的位置和时间
+        self._last_ts: Optional[float] = None
+        self._last_app = 0
+        self._last_pointer = None
+
+    def update(self, columns: EventColumns):
+        """累加一块事件"""
+        n = len(columns)
+        if n == 0:
+            return
+        ts = columns.ts
+        self.event_count += n
+        self.types = columns.types
+        self.apps = columns.apps
+        self._type_counts = _add_padded(self._type_counts, np.bincount(columns.type, minlength=len(columns.types)))
+        if self._first_ts is None:
+            self._first_ts = float(ts[0])
+
+        # 相邻事件间隔，时间倒退的按0处理
+        if self._last_ts is None:
+            dt = np.diff(ts)
+            prev_app = columns.app[:-1]
+        else:
+            dt = np.diff(ts, prepend=self._last_ts)
+            prev_app = np.concatenate(([self._last_app], columns.app[:-1]))
+        dt = np.maximum(dt, 0.0)
+        if len(dt):
+            self._interval_counts += _bucket_counts(dt, INTERVAL_BOUNDS)
+            self._interval_sum += float(dt.sum())
+            self._interval_max = max(self._interval_max, float(dt.max()))
+            # 非空闲的间隔计入前一个事件所在的应用
+            active = dt <= self.idle_gap
+            self._active_seconds += float(dt[active].sum())
+            app_seconds = np.bincount(prev_app[active], weights=dt[active], minlength=len(columns.apps))
+            self._app_seconds = _add_padded(self._app_seconds, app_seconds)
+
+        self._update_pointer(columns)
+
+        local = ts + self.tz_offset
+        days = np.floor_divide(local, 86400.0)
+        # 1970-01-01是星期四，周一编码为0
+        weekday = ((days + 3) % 7).astype(np.int64)
+        hour = ((local - days * 86400.0) // 3600.0).astype(np.int64)
+        self._hourly += np.bincount(weekday * 24 + hour, minlength=7 * 24)
+
+        self._last_ts = float(ts[-1])
+        self._last_app = int(columns.app[-1])
+
+    def _update_pointer(self, columns: EventColumns):
+        pointer_codes = [columns.type_code(name) for name in POINTER_TYPES if name in columns.types]
+        mask = np.isin(columns.type, pointer_codes) & ~np.isnan(columns.x) & ~np.isnan(columns.y)
+        x = columns.x[mask].astype(np.float64)
+        y = columns.y[mask].astype(np.float64)
+        ts = columns.ts[mask]
+        if self._last_pointer is not None:
+            last_x, last_y, last_ts = self._last_pointer
+            x = np.concatenate(([last_x], x))
+            y = np.concatenate(([last_y], y))
+            ts = np.concatenate(([last_ts], ts))
+        if len(ts) == 0:
+            return
+        self._last_pointer = (float(x[-1]), float(y[-1]), float(ts[-1]))
+        if len(ts) < 2:
+            return
+        distance = np.hypot(np.diff(x), np.diff(y))
+        dt = np.diff(ts)
+        self._distance += float(distance.sum())
+        moving = (dt > 0) & (dt <= VELOCITY_MAX_GAP)
+        if moving.any():
+            speeds = distance[moving] / dt[moving]
+            self._moving_distance += float(distance[moving].sum())
+            self._moving_seconds += float(dt[moving].sum())
+            self._max_speed = max(self._max_speed, float(speeds.max()))
+            self._speed_counts += _bucket_counts(speeds, SPEED_BOUNDS)
+
+    def result(self) -> Dict[str, Any]:
+        """统计结果，可直接编码为JSON"""
+        clicks = int(self._type_counts[self.types.index("mouse_click")]) if "mouse_click" in self.types else 0
+        active_minutes = self._active_seconds / 60.0
+        return {
+            "event_count": self.event_count,
+            "start": _iso(self._first_ts),
+            "end": _iso(self._last_ts),
+            "type_counts": {name: int(count) for name, count in zip(self.types, self._type_counts) if count},
+            "intervals": {
+                "bounds": list(INTERVAL_BOUNDS),
+                "counts": self._interval_counts.tolist(),
+                "mean": self._interval_sum / max(self.event_count - 1, 1),
+                "max": self._interval_max
+            },
+            "active_seconds": self._active_seconds,
+            "clicks": clicks,
+            "clicks_per_active_minute": clicks / active_minutes if active_minutes else 0.0,
+            "mouse": {
+                "distance_px": self._distance,
+                "mean_speed_px_per_sec": self._moving_distance / self._moving_seconds if self._moving_seconds else 0.0,
+                "max_speed_px_per_sec": self._max_speed,
+                "speed_bounds": list(SPEED_BOUNDS),
+                "speed_counts": self._speed_counts.tolist()
+            },
+            "app_seconds": {name: float(seconds) for name, seconds in zip(self.apps, self._app_seconds)
+                            if name and seconds > 0},
+            # 7行（周一至周日）× 24列（小时）的事件数
+            "hourly_activity": self._hourly.reshape(7, 24).tolist()
+        }
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+def analyze(store,
+            start: Optional[float] = None,
+            end: Optional[float] = None,
+            types: Optional[Iterable[str]] = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            idle_gap: float = DEFAULT_IDLE_GAP,
+            tz_offset: Optional[float] = None,
+            workers: int = 1) -> Dict[str, Any]:
+    """
+    分析EventStore中的事件
+
+    Returns:
+        ActivityStats.result()的统计结果
+    """
+    stats = ActivityStats(idle_gap, tz_offset)
+    for columns in load_columns(store, start, end, types, chunk_size, workers):
+        stats.update(columns)
+    return stats.result()
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    """把统计结果格式化为文本报告"""
+    lines = [
+        f"时间范围: {result['start']} ~ {result['end']}",
+        f"事件数: {result['event_count']}",
+        f"活跃时长: {result['active_seconds'] / 3600:.2f}小时",
+        f"点击: {result['clicks']}次，每活跃分钟{result['clicks_per_active_minute']:.2f}次",
+        f"鼠标移动: {result['mouse']['distance_px']:.0f}像素，"
+        f"平均速度{result['mouse']['mean_speed_px_per_sec']:.0f}像素/秒",
+        "各应用使用时长:"
+    ]
+    for app, seconds in sorted(result["app_seconds"].items(), key=lambda item: -item[1]):
+        lines.append(f"  {app}: {seconds / 60:.1f}分钟")
+    lines.append("事件间隔分布:")
+    lower = 0.0
+    for bound, count in zip(list(result["intervals"]["bounds"]) + [None], result["intervals"]["counts"]):
+        label = f"{lower:g}-{bound:g}秒" if bound is not None else f">{lower:g}秒"
+        lines.append(f"  {label}: {count}")
+        lower = bound
+    lines.append("按小时的活跃度（行：周一至周日）:")
+    for name, row in zip(WEEKDAYS, result["hourly_activity"]):
+        lines.append(f"  {name} " + " ".join(f"{count:>5}" for count in row))
+    return "\n".join(lines)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 离线分析",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", type=str, help="事件数据文件路径")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件由本机加密写入")
+    parser.add_argument("--from", dest="start", type=str, help="起始时间（ISO格式或Unix时间戳）")
+    parser.add_argument("--to", dest="end", type=str, help="结束时间（不含）")
+    parser.add_argument("--types", type=str, help="只分析指定类型，逗号分隔")
+    parser.add_argument("--idle_gap", type=float, default=DEFAULT_IDLE_GAP, help="空闲阈值（秒）")
+    parser.add_argument("--chunk_size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块加载的事件数")
+    parser.add_argument("--workers", type=int, default=1, help="并行解码的进程数")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出统计结果")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import EventStore
+    from codec import CODEC
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not NUMPY_AVAILABLE:
+        logger.error("离线分析需要NumPy，请先安装: pip install numpy")
+        return 1
+    if not os.path.exists(args.input):
+        logger.error(f"输入文件不存在: {args.input}")
+        return 1
+    try:
+        start = parse_timestamp(args.start)
+        end = parse_timestamp(args.end)
+    except ValueError:
+        logger.error("无效的时间范围")
+        return 1
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    types = [t.strip() for t in args.types.split(",") if t.strip()] if args.types else None
+
+    result = analyze(EventStore(args.input, key), start, end, types,
+                     chunk_size=args.chunk_size, idle_gap=args.idle_gap, workers=args.workers)
+    if args.json:
+        sys.stdout.write(CODEC.dumps_pretty(result).decode("utf-8") + "\n")
+    else:
+        print(format_report(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - asyncio事件核心
+
+该模块提供EventMonitor的另一种运行方式，所有采集、处理和刷新都在一个asyncio
+事件循环线程中完成，不再为刷新、模拟事件和鼠标位置各启动一个轮询线程：
+1. 事件源是异步迭代器，产生(事件类型, 事件数据)，经有界asyncio.Queue交给处理协程；
+   队列满时异步事件源等待，其他线程通过submit()提交的事件被丢弃并计数；
+2. 刷新由定时器驱动，缓冲区满或修改刷新间隔时立即唤醒；
+3. 刷新的事件先写入主sink（事件存储、写入进程或收集器客户端，在线程池中写入），
+   成功后并发写入其他sink：SQLite（专用的写入线程）、收集器套接字（asyncio流）；
+4. 停止时取消所有任务，处理队列中剩余的事件并完成最后一次刷新。
+
+AsyncEventMonitor保持EventMonitor的同步接口（start、stop、get_status、
+get_events_since、reconfigure等），可直接替换。定时使用事件循环的真实时间，
+不支持SimulatedClock推进。
+"""
+
+import time
+import socket
+import shutil
+import sqlite3
+import asyncio
+import logging
+import itertools
+import threading
+import concurrent.futures
+from typing import Dict, List, Any, Optional, Set, Tuple, AsyncIterator, Callable
+from event_monitor import (
+    EventMonitor, random_test_event, parse_cliclick_position, NATIVE_API_AVAILABLE,
+    FLUSH_DURATION, EVENTS_DROPPED
+)
+from collector import (
+    HEADER, MSG_HELLO, MSG_BATCH, MSG_ACK, STATUS_OK, PROTOCOL_VERSION,
+    MAX_MESSAGE_SIZE, ProtocolError, parse_address, encode_events
+)
+from metrics import REGISTRY
+from codec import CODEC
+
+logger = logging.getLogger("async_core")
+
+# 事件源与处理协程之间的队列长度
+DEFAULT_QUEUE_SIZE = 10000
+
+# 鼠标位置的查询间隔（秒）
+POSITION_INTERVAL = 1.0
+
+# 停止时等待事件循环线程完成最后一次刷新的最长时间（秒）
+STOP_TIMEOUT = 10.0
+
+SINK_ERRORS = REGISTRY.counter("async_sink_errors_total", "写入附加sink失败的次数", ("sink",))
+QUEUE_DEPTH = REGISTRY.gauge("async_queue_depth", "asyncio核心事件队列中的事件数")
+
+Source = AsyncIterator[Tuple[str, Dict[str, Any]]]
+
+
+async def simulated_source(monitor: EventMonitor) -> Source:
+    """模拟事件，间隔与监控器的刷新间隔相同（与线程版的测试模式一致）"""
+    while True:
+        yield random_test_event()
+        await asyncio.sleep(monitor.flush_interval)
+
+
+async def cliclick_source(interval: float = POSITION_INTERVAL) -> Source:
+    """用cliclick查询鼠标位置，位置变化时产生mouse_move事件"""
+    last_pos = None
+    while True:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "cliclick", "p", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            output, _ = await process.communicate()
+            text = output.decode("utf-8", "replace")
+            try:
+                pos = parse_cliclick_position(text)
+            except ValueError as e:
+                logger.error(f"解析鼠标位置失败: {str(e)}, 原始数据: {text.strip()}")
+                pos = None
+            if pos is not None and pos != last_pos:
+                last_pos = pos
+                yield "mouse_move", {"position": {"x": pos[0], "y": pos[1]}}
+            await asyncio.sleep(interval)
+        except OSError as e:
+            logger.error(f"监听鼠标位置失败: {str(e)}")
+            await asyncio.sleep(interval * 2)  # 出错后等待较长时间再重试
+
+
+class StoreSink:
+    """在默认线程池中追加写入（事件存储、写入进程或收集器客户端）"""
+
+    name = "store"
+
+    def __init__(self, target):
+        self.target = target
+
+    async def write(self, events: List[Dict[str, Any]]):
+        await asyncio.get_running_loop().run_in_executor(None, self.target.append, events)
+
+    async def close(self):
+        pass
+
+
+class SQLiteSink:
+    """
+    写入SQLite数据库，便于用SQL查询
+
+    sqlite3连接只能在创建它的线程中使用，所有操作都在一个专用的写入线程中执行。
+    数据库不加密，每个事件一行，完整事件以JSON保存在data列。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-sink")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _write(self, events: List[Dict[str, Any]]):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS events "
+                "(seq INTEGER, timestamp TEXT, type TEXT, app_name TEXT, data TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)")
+        rows = [
+            (event.get("seq"), event.get("timestamp"), event.get("type"),
+             (event.get("window") or {}).get("app_name"), CODEC.dumps(event).decode("utf-8"))
+            for event in events
+        ]
+        with self._conn:
+            self._conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", rows)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def write(self, events: List[Dict[str, Any]]):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, events)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+
+
+class SocketSink:
+    """按收集器协议把批次发送给收集器，收到确认后才算写入成功；连接断开后下次写入时重连"""
+
+    name = "socket"
+
+    def __init__(self, address: str, host: Optional[str] = None, timeout: float = 5.0):
+        self.address = address
+        self.family, self._address = parse_address(address)
+        self.host = host or socket.gethostname()
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop = None
+        self._batch_ids = itertools.count(1)
+
+    async def _request(self, msg_type: int, batch_id: int = 0, body: bytes = b"") -> int:
+        """发送一条消息并读取确认，返回状态码"""
+        self._writer.write(HEADER.pack(len(body), msg_type, 0, batch_id) + body)
+        await self._writer.drain()
+        length, reply_type, status, reply_id = HEADER.unpack(await self._reader.readexactly(HEADER.size))
+        if length > MAX_MESSAGE_SIZE:
+            raise ProtocolError(f"消息过长: {length}字节")
+        if length:
+            await self._reader.readexactly(length)
+        if reply_type != MSG_ACK or reply_id != batch_id:
+            raise ProtocolError(f"意外的确认: 类型{reply_type}, 批次{reply_id}")
+        return status
+
+    async def _connect(self):
+        if self.family == socket.AF_UNIX:
+            self._reader, self._writer = await asyncio.open_unix_connection(self._address)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(*self._address)
+        self._loop = asyncio.get_running_loop()
+        hello = CODEC.dumps({"version": PROTOCOL_VERSION, "host": self.host})
+        if await self._request(MSG_HELLO, body=hello) != STATUS_OK:
+            raise ProtocolError("握手失败")
+
+    async def write(self, events: List[Dict[str, Any]]):
+        # 连接属于创建它的事件循环，停止后再次启动时重新连接
+        if self._loop is not asyncio.get_running_loop():
+            self._reader = self._writer = None
+        try:
+            if self._writer is None:
+                await asyncio.wait_for(self._connect(), self.timeout)
+            status = await asyncio.wait_for(
+                self._request(MSG_BATCH, next(self._batch_ids), encode_events(events)), self.timeout
+            )
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            await self.close()
+            raise ConnectionError(f"发送到收集器{self.address}失败: {e}")
+        if status != STATUS_OK:
+            raise ConnectionError(f"收集器拒绝批次，状态码: {status}")
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None and self._loop is asyncio.get_running_loop():
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class AsyncEventMonitor(EventMonitor):
+    """在一个asyncio事件循环线程中运行的事件监控器，接口与EventMonitor相同"""
+
+    def __init__(self, *args,
+                 sinks: Optional[List[Any]] = None,
+                 sources: Optional[List[Callable[[], Source]]] = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 **kwargs):
+        """
+        初始化监控器，其他参数与EventMonitor相同
+
+        Args:
+            sinks: 主存储之外的sink（SQLiteSink、SocketSink等），写入失败只记录不重试
+            sources: 事件源工厂，每次启动时调用得到异步迭代器，默认按模式使用模拟事件或cliclick
+            queue_size: 事件队列长度
+
+        Raises:
+            ValueError: 同时指定了共享刷新线程池
+        """
+        super().__init__(*args, **kwargs)
+        if self.flush_pool:
+            raise ValueError("asyncio核心由定时器刷新，不使用共享刷新线程池")
+        self.sinks = [StoreSink(self._output())] + list(sinks or [])
+        self.source_factories = sources
+        self.queue_size = max(1, queue_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._main: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._flush_now: Optional[asyncio.Event] = None
+        self._flush_serial: Optional[asyncio.Lock] = None
+        # 进行中的刷新任务，停止时等待它们完成而不是中途取消
+        self._flushes: Set[asyncio.Future] = set()
+
+    def start(self):
+        """启动事件循环线程"""
+        if self.running:
+            logger.warning("监控器已经在运行中")
+            return False
+        if not self.test_mode and self.source_factories is None:
+            if not NATIVE_API_AVAILABLE:
+                logger.error("无法启动正常模式：缺少必要的库")
+                return False
+            if shutil.which("cliclick") is None:
+                logger.error("未找到cliclick工具，请先安装: brew install cliclick")
+                return False
+
+        self._reset()
+        self._loop = asyncio.new_event_loop()
+        self._main = self._loop.create_task(self._run())
+        self._loop_thread = threading.Thread(target=self._run_loop, name="async-core", daemon=True)
+        self._loop_thread.start()
+        logger.info(f"asyncio事件核心已启动，{'测试' if self.test_mode else '正常'}模式")
+        return True
+
+    def stop(self):
+        """取消所有任务，等待最后一次刷新完成"""
+        if not self.running:
+            logger.warning("监控器已经停止")
+            return False
+
+        self.running = False
+        self._stop_event.set()
+        self._wake_event.set()
+        self._loop.call_soon_threadsafe(self._main.cancel)
+        self._loop_thread.join(timeout=STOP_TIMEOUT)
+        if self._loop_thread.is_alive():
+            logger.error("事件循环线程未能在超时前结束")
+        self._loop = None
+        self._close_outputs()
+
+        logger.info(f"事件监控器已停止，共记录{self.event_count}个事件")
+        return True
+
+    def submit(self, event_type: str, event_data: Dict[str, Any]) -> bool:
+        """
+        从其他线程提交一个事件，不阻塞调用线程，队列已满时丢弃并计数
+
+        Returns:
+            是否已提交（未运行时返回False）
+        """
+        loop = self._loop
+        if not self.running or loop is None:
+            return False
+
+        def put():
+            try:
+                self._queue.put_nowait((event_type, event_data))
+            except asyncio.QueueFull:
+                EVENTS_DROPPED.inc(labels=(event_type, "queue_full"))
+
+        try:
+            loop.call_soon_threadsafe(put)
+        except RuntimeError:
+            return False  # 事件循环已关闭
+        return True
+
+    def reconfigure(self, **changes) -> Dict[str, Any]:
+        config = super().reconfigure(**changes)
+        loop = self._loop
+        if "flush_interval" in config and loop is not None and self._flush_now is not None:
+            # 唤醒刷新定时器，按新的间隔重新计算等待时间
+            loop.call_soon_threadsafe(self._flush_now.set)
+        return config
+
+    def _buffer_full(self):
+        """缓冲区已满：唤醒刷新定时器，不在当前线程中写入"""
+        loop = self._loop
+        if loop is None or self._flush_now is None:
+            super()._buffer_full()
+        elif threading.current_thread() is self._loop_thread:
+            self._flush_now.set()
+        else:
+            loop.call_soon_threadsafe(self._flush_now.set)
+
+    def _flush_buffer(self):
+        """同步刷新（/api/save等调用）：运行中交给事件循环，与定时刷新依次进行"""
+        if threading.current_thread() is self._loop_thread and self.running:
+            raise RuntimeError("事件循环线程中应使用await self._flush()")
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(self._flush(), loop)
+            try:
+                future.result(timeout=STOP_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                logger.error("等待事件循环刷新超时")
+        else:
+            asyncio.run(self._flush())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"asyncio事件核心异常退出: {str(e)}")
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    def _sources(self) -> List[Source]:
+        if self.source_factories is not None:
+            return [factory() for factory in self.source_factories]
+        if self.test_mode:
+            return [simulated_source(self)]
+        return [cliclick_source()]
+
+    async def _run(self):
+        """运行事件源、处理协程和刷新定时器，被取消时完成最后一次刷新"""
+        self._queue = asyncio.Queue(self.queue_size)
+        self._flush_now = asyncio.Event()
+        self._flush_serial = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        tasks = [loop.create_task(self._pump(source)) for source in self._sources()]
+        tasks.append(loop.create_task(self._consume()))
+        tasks.append(loop.create_task(self._flush_timer()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # 取消定时器不会中断已开始的刷新（包括线程池中的_after_write），等它完成后再做最后一次刷新
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+            # 处理已进入队列的事件，未结束的按键汇总窗口随最后一次刷新写入
+            while not self._queue.empty():
+                self._add_event(*self._queue.get_nowait())
+            for summary in self.keystrokes.close(self.clock.time()):
+                self._record(summary, flush_when_full=False)
+            await self._flush()
+            for sink in self.sinks:
+                try:
+                    await sink.close()
+                except Exception as e:
+                    logger.error(f"关闭{sink.name}失败: {str(e)}")
+            self._flush_now = None
+            self._flush_serial = None
+
+    async def _pump(self, source: Source):
+        """把一个事件源的事件放入队列，队列满时等待"""
+        async for item in source:
+            await self._queue.put(item)
+            QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _consume(self):
+        while True:
+            event_type, event_data = await self._queue.get()
+            try:
+                self._add_event(event_type, event_data)
+            except Exception as e:
+                logger.error(f"处理事件失败: {str(e)}")
+
+    async def _flush_timer(self):
+        """按刷新间隔刷新；缓冲区满时立即刷新，修改刷新间隔时重新计算等待时间"""
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        while True:
+            timeout = last_flush + self.flush_interval - loop.time()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    self._flush_now.clear()
+                    if (len(self.event_buffer) < self.buffer_size
+                            and not self.memory.over_budget(self._buffer_bytes)):
+                        continue
+            await self._flush()
+            last_flush = loop.time()
+
+    async def _flush(self):
+        """刷新一次；调用方被取消时刷新仍在单独的任务中完成，写入的帧与会话、汇总和索引保持一致"""
+        task = asyncio.ensure_future(self._serial_write())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        await asyncio.shield(task)
+
+    async def _serial_write(self):
+        if self._flush_serial is None:
+            await self._write_sinks()
+        else:
+            async with self._flush_serial:
+                await self._write_sinks()
+
+    async def _write_sinks(self):
+        """先写回溢出到磁盘的事件，再写入缓冲区"""
+        loop = asyncio.get_running_loop()
+        while True:
+            spilled = await loop.run_in_executor(None, self.memory.peek_spilled)
+            if spilled is None:
+                break
+            try:
+                await self._write_batch(spilled)
+            except Exception as e:
+                logger.error(f"写回溢出的事件失败: {str(e)}")
+                self._flush_failed()
+                return
+            self.memory.consume_spilled()
+            await self._after_write_sinks(spilled)
+
+        events = self._take_buffer()
+        if events is None:
+            return
+        try:
+            await self._write_batch(events)
+        except Exception as e:
+            logger.error(f"写入文件失败: {str(e)}")
+            self._restore_buffer(events)
+            return
+        await self._after_write_sinks(events)
+
+    async def _write_batch(self, events: List[Dict[str, Any]]):
+        """写入主sink，失败时抛出异常"""
+        flush_start = time.perf_counter()
+        try:
+            await self.sinks[0].write(events)
+            logger.debug("已写入%d个事件到%s", len(events), self.collector_address or self.output_path)
+        finally:
+            FLUSH_DURATION.observe(time.perf_counter() - flush_start)
+
+    async def _after_write_sinks(self, events: List[Dict[str, Any]]):
+        """主sink已写入：并发写入其他sink，再在线程池中更新会话、汇总和热力图"""
+
+        # 主存储已写入，附加sink失败时不重试，避免主存储中出现重复事件
+        extra = self.sinks[1:]
+        results = await asyncio.gather(*(sink.write(events) for sink in extra), return_exceptions=True)
+        for sink, result in zip(extra, results):
+            if isinstance(result, Exception):
+                SINK_ERRORS.inc(labels=(sink.name,))
+                logger.error(f"写入{sink.name}失败: {str(result)}")
+        await asyncio.get_running_loop().run_in_executor(None, self._after_write, events)
@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 性能基准测试
+
+该模块对事件采集、刷新和导出流水线进行基准测试，结果以JSON格式输出，
+并可与提交在仓库中的基准结果比较，发现性能回退。
+
+用法:
+    python benchmark.py                          # 运行全部基准并打印结果
+    python benchmark.py --only flush_latency     # 只运行指定基准
+    python benchmark.py --output results.json    # 写出结果
+    python benchmark.py --quick --compare benchmark_baseline.json   # 与基准比较，有回退时返回1
+    python benchmark.py --quick --save-baseline  # 更新benchmark_baseline.json（基准为--quick规模）
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import datetime
+import tempfile
+import subprocess
+from typing import Dict, List, Any, Callable, Optional
+from unittest.mock import patch
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# 默认允许的性能波动比例
+DEFAULT_THRESHOLD = 0.5
+
+# 已注册的基准测试
+BENCHMARKS: Dict[str, Callable[[bool], Dict[str, Dict[str, Any]]]] = {}
+
+
+def benchmark(name: str):
+    """注册基准测试的装饰器，被装饰函数接收quick参数并返回指标字典"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def metric(value: float, unit: str, better: str = "lower") -> Dict[str, Any]:
+    """构造一个指标，better为lower或higher"""
+    return {"value": round(value, 6), "unit": unit, "better": better}
+
+
+def best_of(func: Callable[[], float], repeat: int = 3) -> float:
+    """多次运行取最小耗时"""
+    return min(func() for _ in range(repeat))
+
+
+def timed(func: Callable[[], Any]) -> float:
+    """运行一次并返回耗时（秒）"""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def make_events(count: int, start: float = 1767225600.0, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成与测试模式结构一致的事件"""
+    rng = random.Random(seed)
+    apps = [("Safari", "Google - Safari"), ("VSCode", "event_monitor.py - Project"),
+            ("Terminal", "Terminal — bash"), ("Slack", "Team Channel - Slack")]
+    events = []
+    for i in range(count):
+        app, title = apps[rng.randrange(len(apps))]
+        event = {
+            "type": rng.choice(["mouse_move", "mouse_click", "mouse_scroll", "key_press", "key_release"]),
+            "timestamp": datetime.datetime.fromtimestamp(start + i * 0.1, datetime.timezone.utc).isoformat(),
+            "screen_id": 0,
+            "window": {"window_id": str(rng.randint(1000, 9999)), "app_name": app, "window_title": title},
+            "seq": i + 1
+        }
+        if event["type"].startswith("key"):
+            event.update({"key_code": rng.randint(1, 100), "key_name": "a", "state": "pressed", "modifiers": []})
+        else:
+            event["position"] = {"x": rng.uniform(0, 1920), "y": rng.uniform(0, 1080)}
+        events.append(event)
+    return events
+
+
+def new_monitor(temp_dir: str, **kwargs):
+    """创建不启动线程的测试模式监控器"""
+    from event_monitor import EventMonitor
+    options = {"test_mode": True, "output_path": os.path.join(temp_dir, "output.json")}
+    options.update(kwargs)
+    return EventMonitor(**options)
+
+
+def populate(monitor, count: int, frame_size: int = 1000):
+    """向监控器的存储写入指定数量的历史事件"""
+    events = make_events(count)
+    for i in range(0, count, frame_size):
+        monitor.store.append(events[i:i + frame_size])
+
+
+@benchmark("add_event")
+def bench_add_event(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """_add_event吞吐量：完整记录路径与被采样间隔丢弃的路径"""
+    count = 5000 if quick else 50000
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 采样间隔为0，每个事件都走完整记录路径
+        monitor = new_monitor(temp_dir, buffer_size=count * 10, sample_interval=0)
+        data = {"position": {"x": 100.0, "y": 200.0}}
+
+        def recorded():
+            monitor.event_buffer = []
+            return timed(lambda: [monitor._add_event("mouse_move", data) for _ in range(count)])
+
+        recorded_time = best_of(recorded)
+
+        # 采样间隔内的事件直接被丢弃
+        monitor = new_monitor(temp_dir, sample_interval=3600)
+        monitor.last_sample_time = time.time()
+        gated_time = best_of(lambda: timed(lambda: [monitor._add_event("mouse_move", data) for _ in range(count)]))
+
+    return {
+        "recorded_events_per_sec": metric(count / recorded_time, "events/s", "higher"),
+        "gated_events_per_sec": metric(count / gated_time, "events/s", "higher")
+    }
+
+
+@benchmark("flush_latency")
+def bench_flush_latency(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """刷新1000个事件的延迟与已存储历史大小的关系"""
+    histories = [0, 10000, 50000] if quick else [0, 10000, 100000, 500000]
+    batch = make_events(1000, start=1800000000.0)
+    results = {}
+    for history in histories:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = new_monitor(temp_dir)
+            populate(monitor, history)
+
+            def flush():
+                # 派生数据在后台线程中更新，等上一次的更新完成再计时
+                monitor.derived.drain()
+                monitor.event_buffer = list(batch)
+                return timed(monitor._flush_buffer)
+
+            results[f"flush_ms_history_{history}"] = metric(best_of(flush) * 1000, "ms")
+            monitor.derived.drain()
+    return results
+
+
+@benchmark("flush_encryption")
+def bench_flush_encryption(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """加密与明文刷新的耗时对比"""
+    batch = make_events(1000)
+    results = {}
+    for encryption in (False, True):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = new_monitor(temp_dir, encryption=encryption)
+
+            def flush():
+                # 派生数据在后台线程中更新，等上一次的更新完成再计时
+                monitor.derived.drain()
+                monitor.event_buffer = list(batch)
+                return timed(monitor._flush_buffer)
+
+            name = "encrypted" if encryption else "plaintext"
+            results[f"{name}_flush_ms"] = metric(best_of(flush, 5) * 1000, "ms")
+            monitor.derived.drain()
+    return results
+
+
+class FakeQuartz:
+    """模拟Quartz窗口列表接口的假实现"""
+
+    kCGWindowListOptionOnScreenOnly = 1
+    kCGNullWindowID = 0
+
+    def __init__(self, window_count: int):
+        self.windows = [{
+            "kCGWindowLayer": (i * 7) % 25,
+            "kCGWindowNumber": 1000 + i,
+            "kCGWindowOwnerName": f"App{i % 10}",
+            "kCGWindowName": f"Document {i} - App{i % 10}"
+        } for i in range(window_count)]
+
+    def CGWindowListCopyWindowInfo(self, option, window_id):
+        return self.windows
+
+
+@benchmark("window_info")
+def bench_window_info(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """_get_window_info在假窗口提供者上的耗时"""
+    import event_monitor
+    calls = 2000 if quick else 20000
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monitor = new_monitor(temp_dir)
+        for window_count in (10, 100):
+            with patch.object(event_monitor, "NATIVE_API_AVAILABLE", True), \
+                    patch.object(event_monitor, "Quartz", FakeQuartz(window_count), create=True):
+                monitor.test_mode = False
+                elapsed = best_of(lambda: timed(lambda: [monitor._get_window_info() for _ in range(calls)]))
+                monitor.test_mode = True
+            results[f"lookup_us_{window_count}_windows"] = metric(elapsed / calls * 1e6, "us")
+    return results
+
+
+@benchmark("api_save")
+def bench_api_save(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """/api/save耗时与输出文件大小的关系"""
+    import web_app
+    sizes = [1000, 10000] if quick else [1000, 10000, 100000]
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            client = web_app.app.test_client()
+            for size in sizes:
+                monitor = new_monitor(temp_dir, output_path=os.path.join(temp_dir, f"output-{size}.json"))
+                populate(monitor, size)
+                web_app.registry.attach(web_app.DEFAULT_MONITOR, monitor)
+
+                def save():
+                    start = time.perf_counter()
+                    response = client.post('/api/save', json={"filename": f"bench-{size}.json"})
+                    assert response.status_code == 200, response.get_data(as_text=True)
+                    return time.perf_counter() - start
+
+                results[f"save_ms_{size}_events"] = metric(best_of(save) * 1000, "ms")
+        finally:
+            web_app.registry.attach(web_app.DEFAULT_MONITOR, None)
+            os.chdir(cwd)
+    return results
+
+
+@benchmark("parallel_decode")
+def bench_parallel_decode(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """
+    加密历史数据的全量读取吞吐量随解码进程数的变化
+
+    解码进程数不超过CPU核数，超过核数的点实际只用了核数个进程，不测量也不记录
+    """
+    from cryptography.fernet import Fernet
+    from event_store import EventStore
+    count = 50000 if quick else 300000
+    cpus = os.cpu_count() or 1
+    worker_counts = [workers for workers in (1, 2, 4) if workers <= cpus]
+    if len(worker_counts) < 3:
+        print(f"  只有{cpus}个CPU核，跳过更多解码进程的测量", file=sys.stderr)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EventStore(os.path.join(temp_dir, "output.json"), Fernet.generate_key())
+        events = make_events(count)
+        for i in range(0, count, 1000):
+            store.append(events[i:i + 1000])
+        del events
+
+        def read_all(workers):
+            return timed(lambda: sum(1 for _ in store.iter_events(workers=workers)))
+
+        elapsed = {workers: best_of(lambda: read_all(workers), 2) for workers in worker_counts}
+    results = {}
+    for workers in worker_counts:
+        results[f"events_per_sec_workers_{workers}"] = metric(count / elapsed[workers], "events/s", "higher")
+        if workers > 1:
+            results[f"speedup_workers_{workers}"] = metric(elapsed[1] / elapsed[workers], "x", "higher")
+    return results
+
+
+@benchmark("flush_jitter")
+def bench_flush_jitter(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """大批量加密刷新期间，另一个每毫秒唤醒一次的线程（模拟采集线程）的最大延迟"""
+    import threading
+    batch = make_events(10000 if quick else 50000)
+    results = {}
+    for mode in ("inline", "writer_process"):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            monitor = new_monitor(temp_dir, encryption=True, compression=True,
+                                  writer_process=mode == "writer_process")
+            if monitor.writer:
+                monitor.writer.start()
+            stop = threading.Event()
+            gaps = []
+
+            def ticker():
+                last = time.perf_counter()
+                while not stop.wait(0.001):
+                    now = time.perf_counter()
+                    gaps.append(now - last)
+                    last = now
+
+            thread = threading.Thread(target=ticker, daemon=True)
+            thread.start()
+            time.sleep(0.05)
+            monitor.event_buffer = list(batch)
+            elapsed = timed(monitor._flush_buffer)
+            stop.set()
+            thread.join()
+            monitor.derived.drain()
+            if monitor.writer:
+                monitor.writer.close()
+        results[f"{mode}_flush_ms"] = metric(elapsed * 1000, "ms")
+        results[f"{mode}_max_tick_gap_ms"] = metric(max(gaps) * 1000, "ms")
+    return results
+
+
+@benchmark("codec")
+def bench_codec(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """各JSON实现编码和解码1000个事件一帧的吞吐量"""
+    from codec import get_codec, available_codecs
+    frames = 5 if quick else 50
+    batch = make_events(1000)
+    results = {}
+    for name in available_codecs():
+        codec = get_codec(name)
+        data = codec.dumps(batch)
+        encode_time = best_of(lambda: timed(lambda: [codec.dumps(batch) for _ in range(frames)]))
+        decode_time = best_of(lambda: timed(lambda: [codec.decode_events(data) for _ in range(frames)]))
+        results[f"{name}_encode_events_per_sec"] = metric(frames * len(batch) / encode_time, "events/s", "higher")
+        results[f"{name}_decode_events_per_sec"] = metric(frames * len(batch) / decode_time, "events/s", "higher")
+    return results
+
+
+def naive_analyze(events: List[Dict[str, Any]], idle_gap: float = 300.0, tz_offset: float = 0.0) -> Dict[str, Any]:
+    """逐个遍历事件字典计算与analytics相同的统计，作为向量化实现的对照"""
+    import bisect
+    from event_store import parse_timestamp
+    from analytics import INTERVAL_BOUNDS, SPEED_BOUNDS, VELOCITY_MAX_GAP, POINTER_TYPES
+    interval_counts = [0] * (len(INTERVAL_BOUNDS) + 1)
+    speed_counts = [0] * (len(SPEED_BOUNDS) + 1)
+    app_seconds: Dict[str, float] = {}
+    hourly = [[0] * 24 for _ in range(7)]
+    clicks = 0
+    active = distance = 0.0
+    last_ts = last_app = last_pointer = None
+    for event in events:
+        ts = parse_timestamp(event["timestamp"])
+        app = (event.get("window") or {}).get("app_name", "")
+        if last_ts is not None:
+            dt = max(ts - last_ts, 0.0)
+            interval_counts[bisect.bisect_left(INTERVAL_BOUNDS, dt)] += 1
+            if dt <= idle_gap:
+                active += dt
+                app_seconds[last_app] = app_seconds.get(last_app, 0.0) + dt
+        if event["type"] == "mouse_click":
+            clicks += 1
+        position = event.get("position")
+        if event["type"] in POINTER_TYPES and position:
+            if last_pointer is not None:
+                step = ((position["x"] - last_pointer[0]) ** 2 + (position["y"] - last_pointer[1]) ** 2) ** 0.5
+                distance += step
+                dt = ts - last_pointer[2]
+                if 0 < dt <= VELOCITY_MAX_GAP:
+                    speed_counts[bisect.bisect_left(SPEED_BOUNDS, step / dt)] += 1
+            last_pointer = (position["x"], position["y"], ts)
+        local = datetime.datetime.fromtimestamp(ts + tz_offset, datetime.timezone.utc)
+        hourly[local.weekday()][local.hour] += 1
+        last_ts, last_app = ts, app
+    return {
+        "intervals": interval_counts,
+        "active_seconds": active,
+        "app_seconds": {app: seconds for app, seconds in app_seconds.items() if app and seconds > 0},
+        "clicks": clicks,
+        "distance_px": distance,
+        "speed_counts": speed_counts,
+        "hourly_activity": hourly
+    }
+
+
+@benchmark("analytics")
+def bench_analytics(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """离线分析吞吐量：逐个遍历事件字典与NumPy列数组上的向量化统计"""
+    from analytics import ActivityStats, iter_columns
+    events = make_events(50000 if quick else 500000)
+    naive_time = best_of(lambda: timed(lambda: naive_analyze(events)), repeat=1 if quick else 2)
+    chunks = []
+    load_time = timed(lambda: chunks.extend(iter_columns(events)))
+
+    def vectorized():
+        stats = ActivityStats(tz_offset=0.0)
+        for columns in chunks:
+            stats.update(columns)
+        return stats.result()
+
+    vectorized_time = best_of(lambda: timed(vectorized))
+    return {
+        "naive_events_per_sec": metric(len(events) / naive_time, "events/s", "higher"),
+        "load_events_per_sec": metric(len(events) / load_time, "events/s", "higher"),
+        "vectorized_events_per_sec": metric(len(events) / vectorized_time, "events/s", "higher"),
+        "vectorized_speedup": metric(naive_time / vectorized_time, "x", "higher"),
+        "end_to_end_speedup": metric(naive_time / (load_time + vectorized_time), "x", "higher")
+    }
+
+
+@benchmark("rollups")
+def bench_rollups(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """汇总的增量维护吞吐量，以及一个月范围的图表查询与扫描原始事件的耗时对比"""
+    from rollups import RollupAggregator
+    from event_store import EventStore
+    count = 50000 if quick else 300000
+    month = 30 * 86400
+    start = 1767225600.0
+    events = make_events(count, start=start)
+    # 把事件均匀分布在一个月内
+    for i, event in enumerate(events):
+        event["timestamp"] = datetime.datetime.fromtimestamp(
+            start + i * month / count, datetime.timezone.utc).isoformat()
+    rollups = RollupAggregator()
+    add_time = timed(lambda: [rollups.add(events[i:i + 1000]) for i in range(0, count, 1000)])
+    query_time = best_of(lambda: timed(lambda: rollups.query(start, start + month)))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EventStore(os.path.join(temp_dir, "output.json"))
+        for i in range(0, count, 1000):
+            store.append(events[i:i + 1000])
+        scan_time = timed(lambda: RollupAggregator().add(store.iter_events(start, start + month)))
+    return {
+        "add_events_per_sec": metric(count / add_time, "events/s", "higher"),
+        "month_query_ms": metric(query_time * 1000, "ms"),
+        "month_raw_scan_ms": metric(scan_time * 1000, "ms")
+    }
+
+
+@benchmark("search")
+def bench_search(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """按窗口标题搜索：倒排索引只读取匹配的段，与逐帧扫描全部历史的耗时对比"""
+    from search_index import SearchIndex, search_events
+    from event_store import EventStore
+    count = 50000 if quick else 500000
+    events = make_events(count)
+    # 少数几帧中出现要查找的窗口
+    for i in range(0, count, count // 5):
+        events[i]["window"] = {"window_id": "1", "app_name": "Preview", "window_title": "Invoice-2031.pdf"}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EventStore(os.path.join(temp_dir, "output.json"))
+        index = SearchIndex(os.path.join(temp_dir, "output.json.search"))
+        for i in range(0, count, 1000):
+            store.append(events[i:i + 1000])
+        add_time = timed(lambda: [index.add(events[i:i + 1000]) for i in range(0, count, 1000)])
+        search_time = best_of(lambda: timed(lambda: list(search_events(store, index, "*invoice*"))))
+        scan_time = timed(lambda: list(store._scan(None, None, None, None, "invoice", 0, 0)))
+    return {
+        "index_events_per_sec": metric(count / add_time, "events/s", "higher"),
+        "indexed_search_ms": metric(search_time * 1000, "ms"),
+        "full_scan_ms": metric(scan_time * 1000, "ms")
+    }
+
+
+@benchmark("keystroke_volume")
+def bench_keystroke_volume(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """持续打字（每秒8次按键）时逐个记录与按分钟汇总写入的字节数和推送的字节数"""
+    from clock import SimulatedClock
+    from event_transport import encode_batch, MAX_BATCH_SIZE
+    minutes = 2 if quick else 10
+    results = {}
+    sizes = {}
+    pushed_sizes = {}
+    for mode in ("raw", "anonymous"):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            clock = SimulatedClock()
+            monitor = new_monitor(temp_dir, sample_interval=0, clock=clock, keystroke_mode=mode)
+            pushed = last_seq = 0
+            for second in range(minutes * 60):
+                for _ in range(8):
+                    monitor._add_event("key_press", {"key_code": 0, "key_name": "a", "state": "pressed", "modifiers": []})
+                    monitor._add_event("key_release", {"key_code": 0, "key_name": "a", "state": "released", "modifiers": []})
+                    clock.advance(0.125)
+                if second % 10 == 9:
+                    # 每10秒刷新一次，并按压缩二进制帧推送新事件
+                    monitor._flush_buffer()
+                    events = monitor.get_events_since(last_seq)
+                    for i in range(0, len(events), MAX_BATCH_SIZE):
+                        pushed += len(encode_batch(events[i:i + MAX_BATCH_SIZE], compress=True))
+                    if events:
+                        last_seq = events[-1]["seq"]
+            monitor.derived.drain()
+            sizes[mode] = os.path.getsize(monitor.output_path)
+            results[f"{mode}_stored_bytes_per_min"] = metric(sizes[mode] / minutes, "bytes/min")
+            pushed_sizes[mode] = pushed
+            results[f"{mode}_pushed_bytes_per_min"] = metric(pushed / minutes, "bytes/min")
+    results["stored_bytes_reduction"] = metric(sizes["raw"] / sizes["anonymous"], "x", "higher")
+    results["pushed_bytes_reduction"] = metric(pushed_sizes["raw"] / pushed_sizes["anonymous"], "x", "higher")
+    return results
+
+
+@benchmark("simulated_day")
+def bench_simulated_day(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """在虚拟时钟下运行测试模式监控器，测量模拟一段时间（刷新、采样）所需的真实时间"""
+    from clock import SimulatedClock
+    hours = 6 if quick else 24
+    with tempfile.TemporaryDirectory() as temp_dir:
+        clock = SimulatedClock()
+        monitor = new_monitor(temp_dir, flush_interval=60.0, clock=clock)
+        monitor.start()
+        # 刷新线程和事件生成线程都进入等待后再推进时间
+        clock.wait_for_sleepers(2)
+        elapsed = timed(lambda: clock.advance(hours * 3600))
+        monitor.stop()
+        frames = monitor.store.frame_count()
+    return {
+        "wall_seconds_per_simulated_day": metric(elapsed * 24 / hours, "s"),
+        "flushes_per_sec": metric(frames / elapsed, "flushes/s", "higher")
+    }
+
+
+def rss_child(buffer_size: int):
+    """子进程：填满指定大小的缓冲区后报告峰值RSS"""
+    import resource
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monitor = new_monitor(temp_dir, buffer_size=max(buffer_size, 1) + 1, sample_interval=0)
+        data = {"position": {"x": 100.0, "y": 200.0}}
+        for _ in range(buffer_size):
+            monitor._add_event("mouse_move", data)
+    peak = None
+    # Linux上fork出的子进程会继承父进程的ru_maxrss，优先使用exec后重新计数的VmHWM
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    if peak is None:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux以KB为单位，macOS以字节为单位
+        peak = usage * 1024 if platform.system() != "Darwin" else usage
+    print(json.dumps({"peak_rss_bytes": peak}))
+
+
+@benchmark("peak_rss")
+def bench_peak_rss(quick: bool) -> Dict[str, Dict[str, Any]]:
+    """不同buffer_size下的峰值RSS，以及扣除空缓冲区基线后每个事件的内存占用"""
+    sizes = [0, 1000, 50000] if quick else [0, 1000, 10000, 100000]
+
+    def peak_rss(size):
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--rss-child", str(size)],
+                                capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])["peak_rss_bytes"]
+
+    peaks = {size: peak_rss(size) for size in sizes}
+    results = {f"peak_rss_mb_buffer_{size}": metric(peak / 1024 / 1024, "MB")
+               for size, peak in peaks.items() if size}
+    largest = max(sizes)
+    results["bytes_per_buffered_event"] = metric((peaks[largest] - peaks[0]) / largest, "bytes")
+    return results
+
+
+def run_benchmarks(names: Optional[List[str]] = None, quick: bool = False) -> Dict[str, Any]:
+    """运行基准测试并返回结果"""
+    results = {}
+    for name, func in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        print(f"运行基准: {name} ...", file=sys.stderr)
+        results[name] = func(quick)
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick
+        },
+        "results": results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    与基准结果比较
+
+    Args:
+        current: 本次结果
+        baseline: 基准结果
+        threshold: 允许变差的比例
+
+    Returns:
+        每个共同指标的比较结果，regression为True表示出现回退
+
+    Raises:
+        ValueError: 本次结果与基准的数据规模（--quick）不同，指标不可比较
+    """
+    current_quick = current.get("meta", {}).get("quick")
+    baseline_quick = baseline.get("meta", {}).get("quick")
+    if current_quick is not None and baseline_quick is not None and current_quick != baseline_quick:
+        def scale(quick):
+            return "--quick" if quick else "完整"
+        raise ValueError(f"本次结果为{scale(current_quick)}规模，基准为{scale(baseline_quick)}规模，"
+                         f"无法比较，请使用相同的规模运行")
+    rows = []
+    for bench, metrics in current["results"].items():
+        for name, entry in metrics.items():
+            base = baseline.get("results", {}).get(bench, {}).get(name)
+            if not base or not base["value"]:
+                continue
+            ratio = entry["value"] / base["value"]
+            if entry["better"] == "higher":
+                regression = ratio < 1.0 - threshold
+            else:
+                regression = ratio > 1.0 + threshold
+            rows.append({
+                "benchmark": bench,
+                "metric": name,
+                "baseline": base["value"],
+                "current": entry["value"],
+                "unit": entry["unit"],
+                "ratio": round(ratio, 3),
+                "regression": regression
+            })
+    return rows
+
+
+def print_results(data: Dict[str, Any]):
+    for bench, metrics in data["results"].items():
+        print(f"[{bench}]")
+        for name, entry in metrics.items():
+            print(f"  {name}: {entry['value']:.3f} {entry['unit']}")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 性能基准测试",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="只运行指定的基准")
+    parser.add_argument("--quick", action="store_true", help="使用较小的数据规模")
+    parser.add_argument("--output", type=str, help="结果JSON文件路径")
+    parser.add_argument("--compare", type=str, help="与指定的基准结果比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许变差的比例")
+    parser.add_argument("--save-baseline", action="store_true", help=f"将结果写入{os.path.basename(BASELINE_PATH)}")
+    parser.add_argument("--rss-child", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    if args.rss_child is not None:
+        rss_child(args.rss_child)
+        return 0
+
+    # 日志写入空设备：保留格式化和写出的开销，但不刷屏
+    logging.root.handlers = [logging.FileHandler(os.devnull)]
+    logging.root.setLevel(logging.INFO)
+
+    data = run_benchmarks(args.only, args.quick)
+    print_results(data)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基准结果已保存到: {BASELINE_PATH}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        cpus = (data["meta"].get("cpu_count"), baseline.get("meta", {}).get("cpu_count"))
+        if None not in cpus and cpus[0] != cpus[1]:
+            print(f"警告: 本机有{cpus[0]}个CPU核，基准记录时有{cpus[1]}个，并行解码的指标不可直接比较",
+                  file=sys.stderr)
+        try:
+            rows = compare(data, baseline, args.threshold)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 2
+        regressions = [row for row in rows if row["regression"]]
+        for row in rows:
+            flag = "回退" if row["regression"] else "正常"
+            print(f"{flag} {row['benchmark']}.{row['metric']}: {row['baseline']} -> {row['current']} "
+                  f"{row['unit']} (x{row['ratio']})")
+        if regressions:
+            print(f"发现{len(regressions)}项性能回退（阈值 {args.threshold:.0%}）")
+            return 1
+        print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
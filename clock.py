@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 时钟模块
+
+该模块提供可注入的时钟。监控器及其后台线程通过时钟读取时间和等待，
+而不是直接调用time.time()/time.sleep()：
+1. SystemClock 使用真实时间，是默认实现；
+2. SimulatedClock 使用虚拟时间，由测试或基准代码调用advance()推进，
+   等待中的线程会按截止时间依次被唤醒，一整天的刷新和采样可以在几秒内跑完。
+"""
+
+import time
+import datetime
+import threading
+import itertools
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("clock")
+
+# 虚拟等待中检查停止事件的真实时间间隔（秒）
+EVENT_POLL_INTERVAL = 0.05
+
+
+class SystemClock:
+    """使用真实时间的时钟"""
+
+    def time(self) -> float:
+        """当前Unix时间戳"""
+        return time.time()
+
+    def now(self) -> datetime.datetime:
+        """当前UTC时间"""
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def sleep(self, seconds: float):
+        """等待指定时长"""
+        time.sleep(seconds)
+
+    def wait(self, event: Optional[threading.Event], timeout: float) -> bool:
+        """
+        等待事件被设置或超时
+
+        Returns:
+            事件是否已被设置
+        """
+        if event is None:
+            time.sleep(timeout)
+            return False
+        return event.wait(timeout)
+
+
+class SimulatedClock:
+    """使用虚拟时间的时钟，时间只在调用advance()时前进"""
+
+    def __init__(self, start: float = 1767225600.0, settle_timeout: float = 5.0):
+        """
+        初始化虚拟时钟
+
+        Args:
+            start: 起始Unix时间戳
+            settle_timeout: 唤醒线程后等待其重新进入等待状态的最长真实时间（秒）
+        """
+        self._now = float(start)
+        self.settle_timeout = settle_timeout
+        self._cond = threading.Condition()
+        # 等待中的线程：令牌 -> (截止时间, 线程)
+        self._waiters: Dict[int, Tuple[float, threading.Thread]] = {}
+        self._tokens = itertools.count()
+
+    def time(self) -> float:
+        with self._cond:
+            return self._now
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self.time(), datetime.timezone.utc)
+
+    def sleep(self, seconds: float):
+        self.wait(None, seconds)
+
+    def wait(self, event: Optional[threading.Event], timeout: float) -> bool:
+        """等待事件被设置或虚拟时间到达截止时间"""
+        with self._cond:
+            deadline = self._now + max(0.0, timeout)
+            token = next(self._tokens)
+            self._waiters[token] = (deadline, threading.current_thread())
+            # 通知advance()：当前线程已重新进入等待
+            self._cond.notify_all()
+            try:
+                while self._now < deadline:
+                    if event is not None and event.is_set():
+                        return True
+                    # 事件被设置时不会通知条件变量，需要定期检查
+                    self._cond.wait(EVENT_POLL_INTERVAL if event is not None else None)
+            finally:
+                del self._waiters[token]
+                self._cond.notify_all()
+            return event is not None and event.is_set()
+
+    def wait_for_sleepers(self, count: int, timeout: float = 5.0) -> bool:
+        """
+        等待至少count个线程进入等待状态，用于在推进时间前确认后台线程已就绪
+
+        Returns:
+            是否在超时前满足条件
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._waiters) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _idle(self, thread: threading.Thread) -> bool:
+        """线程已退出，或正在等待一个尚未到达的截止时间"""
+        if not thread.is_alive():
+            return True
+        return any(t is thread and deadline > self._now for deadline, t in self._waiters.values())
+
+    def advance(self, seconds: float):
+        """
+        推进虚拟时间
+
+        按截止时间顺序逐个唤醒等待中的线程，每次唤醒后等到这些线程重新进入等待
+        或退出，再继续推进，使后台线程看到的时间与真实运行时的顺序一致。
+        """
+        with self._cond:
+            target = self._now + max(0.0, seconds)
+            while True:
+                pending = [deadline for deadline, _ in self._waiters.values() if deadline <= target]
+                step = min(pending) if pending else target
+                self._now = max(self._now, step)
+                woken = [thread for deadline, thread in self._waiters.values() if deadline <= self._now]
+                self._cond.notify_all()
+
+                settle_deadline = time.monotonic() + self.settle_timeout
+                while not all(self._idle(thread) for thread in woken):
+                    remaining = settle_deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning(f"虚拟时钟等待线程就绪超时: {[t.name for t in woken if not self._idle(t)]}")
+                        break
+                    # 线程退出时不会通知条件变量，需要定期检查
+                    self._cond.wait(min(remaining, EVENT_POLL_INTERVAL))
+
+                if not pending:
+                    break
+
+
+# 进程内默认时钟
+SYSTEM_CLOCK = SystemClock()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - JSON编解码模块
+
+该模块统一存储、收集器和导出使用的JSON编解码。安装了orjson或msgspec时使用
+对应的实现，否则回退到标准库json。默认输出不缩进的紧凑格式，
+只有面向人阅读的导出才使用dumps_pretty()。
+
+可通过环境变量MONITOR_JSON_CODEC指定实现（orjson、msgspec或json）。
+"""
+
+import os
+import json
+import logging
+from typing import Dict, List, Any, Optional, Union
+
+logger = logging.getLogger("codec")
+
+ORJSON_AVAILABLE = False
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+
+MSGSPEC_AVAILABLE = False
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    msgspec = None
+
+try:
+    from typing import TypedDict
+except ImportError:
+    # Python 3.7
+    TypedDict = None
+
+# 自动选择时的优先顺序
+CODEC_PREFERENCE = ("orjson", "msgspec", "json")
+
+CODEC_ENV = "MONITOR_JSON_CODEC"
+
+
+# 事件结构。内部事件就是普通字典，解码结果直接作为事件使用，不再转换；
+# 除下列字段外，事件还可以带任意附加字段（如host、key_code），解码时原样保留。
+if TypedDict is not None:
+    class WindowInfo(TypedDict, total=False):
+        """窗口信息"""
+        window_id: str
+        app_name: str
+        window_title: str
+
+    class Position(TypedDict, total=False):
+        """鼠标位置（点）"""
+        x: float
+        y: float
+
+    class Event(TypedDict, total=False):
+        """一个行为事件"""
+        type: str
+        timestamp: str
+        seq: int
+        screen_id: int
+        window: WindowInfo
+        position: Position
+        button: str
+        state: str
+        key_name: str
+        key_code: int
+        modifiers: List[str]
+        scroll_dx: float
+        scroll_dy: float
+        host: str
+else:
+    WindowInfo = Position = Event = Dict[str, Any]
+
+
+class JsonCodec:
+    """标准库json实现，也是其他实现不支持某些对象时的回退"""
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        """编码为紧凑的UTF-8 JSON"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def dumps_pretty(self, obj: Any) -> bytes:
+        """编码为缩进的JSON，只用于面向人阅读的导出"""
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """解码JSON，格式错误时抛出ValueError"""
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return json.loads(data)
+
+    def decode_events(self, data: Union[bytes, str]) -> List[Event]:
+        """解码一个事件数组，每个元素必须是对象"""
+        events = self.loads(data)
+        if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+            raise ValueError("数据不是事件数组")
+        return events
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson实现"""
+
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            # 与标准库一样把非字符串键转换为字符串
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # 超出64位的整数等orjson不支持的对象
+            return super().dumps(obj)
+
+    def dumps_pretty(self, obj: Any) -> bytes:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+        except TypeError:
+            return super().dumps_pretty(obj)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+class MsgspecCodec(JsonCodec):
+    """msgspec实现，事件数组在解码时直接校验结构"""
+
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        # 按列表-对象结构解码；不使用Event结构体，以免丢弃附加字段
+        self._events_decoder = msgspec.json.Decoder(List[Dict[str, Any]])
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._encoder.encode(obj)
+        except (TypeError, OverflowError):
+            return super().dumps(obj)
+
+    def dumps_pretty(self, obj: Any) -> bytes:
+        return msgspec.json.format(self.dumps(obj), indent=2)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+    def decode_events(self, data: Union[bytes, str]) -> List[Event]:
+        try:
+            return self._events_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+
+_CODEC_CLASSES = {"orjson": OrjsonCodec, "msgspec": MsgspecCodec, "json": JsonCodec}
+_AVAILABLE = {"orjson": ORJSON_AVAILABLE, "msgspec": MSGSPEC_AVAILABLE, "json": True}
+_instances: Dict[str, JsonCodec] = {}
+
+
+def available_codecs() -> List[str]:
+    """当前环境可用的实现，按优先顺序排列"""
+    return [name for name in CODEC_PREFERENCE if _AVAILABLE[name]]
+
+
+def get_codec(name: Optional[str] = None) -> JsonCodec:
+    """
+    获取编解码器
+
+    Args:
+        name: 实现名称，为None时使用最快的可用实现
+
+    Raises:
+        ValueError: 指定的实现不存在或未安装
+    """
+    if name is None:
+        name = available_codecs()[0]
+    if name not in _CODEC_CLASSES:
+        raise ValueError(f"未知的JSON实现: {name}")
+    if not _AVAILABLE[name]:
+        raise ValueError(f"JSON实现未安装: {name}")
+    if name not in _instances:
+        _instances[name] = _CODEC_CLASSES[name]()
+    return _instances[name]
+
+
+def _default_codec() -> JsonCodec:
+    name = os.environ.get(CODEC_ENV) or None
+    try:
+        return get_codec(name)
+    except ValueError as e:
+        logger.warning(f"{e}，使用自动选择的实现")
+        return get_codec()
+
+
+# 进程内默认编解码器
+CODEC = _default_codec()
@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件收集服务
+
+该模块让多个监控器把刷新的事件批次通过Unix套接字或TCP发送给一个收集器，
+由收集器统一追加写入共享的事件存储：
+1. 长度前缀的二进制协议，每个批次都需要收集器确认（ACK）后才算送达；
+2. 收集器的待写入队列有上限，队列满时连接线程停止读取，发送方随之阻塞，
+   等待超时后返回BUSY，由发送方转存本地；
+3. 写入线程把同一时间到达的多个批次合并为一次追加和一次fsync（组提交）；
+4. 收集器不可用时监控器把批次写入本地缓存（spool），恢复连接后按顺序重放。
+
+消息格式（小端）:
+    length   uint32 消息体长度
+    type     uint8  消息类型，HELLO/BATCH/ACK
+    status   uint8  ACK的状态码，其他消息为0
+    batch_id uint64 批次号，ACK与对应的BATCH相同
+    body     HELLO为JSON，BATCH为zlib压缩的JSON事件数组，ACK为空
+
+用法:
+    python collector.py --listen unix:/tmp/behavior-collector.sock -o fleet.json
+    python collector.py --listen 0.0.0.0:7878 -o fleet.json --encrypted
+    python run.py --test_mode --collector unix:/tmp/behavior-collector.sock
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import signal
+import socket
+import struct
+import logging
+import argparse
+import itertools
+import threading
+from typing import Dict, List, Any, Optional, Tuple, Union
+from event_store import EventStore
+from metrics import REGISTRY
+from codec import CODEC
+
+logger = logging.getLogger("collector")
+
+PROTOCOL_VERSION = 1
+
+# 消息头：消息体长度(I) 类型(B) 状态(B) 批次号(Q)
+HEADER = struct.Struct("<IBBQ")
+
+MSG_HELLO = 1
+MSG_BATCH = 2
+MSG_ACK = 3
+
+STATUS_OK = 0
+STATUS_BUSY = 1
+STATUS_ERROR = 2
+
+# 单条消息的最大长度（字节）
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+# 待写入队列的最大批次数，以及队列满时连接线程等待的时间（秒）
+DEFAULT_MAX_PENDING = 64
+DEFAULT_BACKPRESSURE_TIMEOUT = 2.0
+
+# 组提交：第一个批次到达后最多再等待的时间（秒），以及一次提交的最大事件数
+DEFAULT_GROUP_COMMIT_DELAY = 0.005
+DEFAULT_GROUP_COMMIT_MAX_EVENTS = 20000
+
+# 本地缓存文件后缀，以及记录已重放帧数的文件后缀
+SPOOL_SUFFIX = ".spool"
+SPOOL_POS_SUFFIX = ".pos"
+
+COLLECTOR_BATCHES = REGISTRY.counter("collector_batches_total", "收集器处理的批次数", ("status",))
+COLLECTOR_EVENTS = REGISTRY.counter("collector_events_total", "收集器写入的事件数")
+COLLECTOR_QUEUE_DEPTH = REGISTRY.gauge("collector_queue_depth", "收集器待写入队列中的批次数")
+COLLECTOR_CONNECTIONS = REGISTRY.gauge("collector_connections", "收集器当前的连接数")
+COLLECTOR_COMMIT_DURATION = REGISTRY.histogram("collector_commit_duration_seconds", "一次组提交的耗时（秒）")
+COLLECTOR_GROUP_SIZE = REGISTRY.histogram("collector_group_batches", "一次组提交合并的批次数",
+                                          buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CLIENT_SPOOLED = REGISTRY.counter("collector_client_spooled_events_total", "收集器不可用时写入本地缓存的事件数")
+CLIENT_REPLAYED = REGISTRY.counter("collector_client_replayed_events_total", "从本地缓存重放到收集器的事件数")
+
+
+class ProtocolError(ConnectionError):
+    """收到不符合协议的消息"""
+
+
+def parse_address(address: str) -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """
+    解析收集器地址
+
+    支持"unix:/path/to.sock"、"host:port"和"tcp://host:port"，省略主机时为127.0.0.1
+
+    Returns:
+        (地址族, 套接字地址)
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    text = address[4:].lstrip("/") if address.startswith("tcp:") else address
+    host, sep, port = text.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"无效的收集器地址: {address}")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def format_address(family: int, address: Union[str, Tuple[str, int]]) -> str:
+    """将套接字地址格式化为parse_address可解析的字符串"""
+    if family == socket.AF_UNIX:
+        return f"unix:{address}"
+    return f"{address[0]}:{address[1]}"
+
+
+def encode_events(events: List[Dict[str, Any]]) -> bytes:
+    """编码BATCH消息体"""
+    return zlib.compress(CODEC.dumps(events), 1)
+
+
+def decode_events(body: bytes) -> List[Dict[str, Any]]:
+    """解码BATCH消息体"""
+    try:
+        return CODEC.decode_events(zlib.decompress(body))
+    except (zlib.error, ValueError) as e:
+        raise ValueError(f"无效的批次数据: {e}")
+
+
+def send_message(sock: socket.socket, msg_type: int, batch_id: int = 0, body: bytes = b"", status: int = 0):
+    """发送一条消息"""
+    sock.sendall(HEADER.pack(len(body), msg_type, status, batch_id) + body)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    """读取指定长度的数据，连接在开始前关闭时返回None"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            if received == 0:
+                return None
+            raise ProtocolError("连接在消息中途关闭")
+        received += n
+    return bytes(buffer)
+
+
+def recv_message(sock: socket.socket) -> Optional[Tuple[int, int, int, bytes]]:
+    """
+    读取一条消息
+
+    Returns:
+        (类型, 状态, 批次号, 消息体)，对端关闭连接时返回None
+    """
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    length, msg_type, status, batch_id = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ProtocolError(f"消息过长: {length}字节")
+    body = _recv_exact(sock, length) if length else b""
+    if body is None:
+        raise ProtocolError("连接在消息中途关闭")
+    return msg_type, status, batch_id, body
+
+
+class _Connection:
+    """收集器端的一个客户端连接"""
+
+    def __init__(self, sock: socket.socket, peer: str):
+        self.sock = sock
+        self.peer = peer
+        self.host = peer
+        # 连接线程和写入线程都会发送ACK
+        self._send_lock = threading.Lock()
+
+    def send(self, msg_type: int, batch_id: int = 0, body: bytes = b"", status: int = 0):
+        with self._send_lock:
+            send_message(self.sock, msg_type, batch_id, body, status)
+
+
+class CollectorServer:
+    """接收多个监控器的事件批次，并以组提交的方式写入共享事件存储"""
+
+    def __init__(self,
+                 store: EventStore,
+                 address: str,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 backpressure_timeout: float = DEFAULT_BACKPRESSURE_TIMEOUT,
+                 group_commit_delay: float = DEFAULT_GROUP_COMMIT_DELAY,
+                 group_commit_max_events: int = DEFAULT_GROUP_COMMIT_MAX_EVENTS,
+                 sync: bool = True):
+        """
+        初始化收集器
+
+        Args:
+            store: 共享的事件存储
+            address: 监听地址，格式见parse_address，TCP端口为0时自动分配
+            max_pending: 待写入队列的最大批次数
+            backpressure_timeout: 队列满时等待的时间（秒），超时后向发送方返回BUSY
+            group_commit_delay: 组提交时等待更多批次的最长时间（秒）
+            group_commit_max_events: 一次组提交的最大事件数
+            sync: 确认前是否将数据同步到磁盘
+        """
+        self.store = store
+        self.family, self._bind_address = parse_address(address)
+        self.address = address
+        self.backpressure_timeout = backpressure_timeout
+        self.group_commit_delay = group_commit_delay
+        self.group_commit_max_events = max(1, group_commit_max_events)
+        self.sync = sync
+
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._stopping = threading.Event()
+        self._listener: Optional[socket.socket] = None
+        self._connections: Dict[int, _Connection] = {}
+        self._connections_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._writer_thread = None
+
+    def start(self):
+        """开始监听并启动写入线程"""
+        if self.family == socket.AF_UNIX and os.path.exists(self._bind_address):
+            # 上次异常退出留下的套接字文件
+            os.remove(self._bind_address)
+        listener = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self._bind_address)
+        listener.listen(128)
+        # 定期检查停止标志
+        listener.settimeout(0.2)
+        self._listener = listener
+        self.address = format_address(self.family, listener.getsockname())
+
+        self._stopping.clear()
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="collector-writer", daemon=True)
+        self._writer_thread.start()
+        accept_thread = threading.Thread(target=self._accept_loop, name="collector-accept", daemon=True)
+        accept_thread.start()
+        self._threads.append(accept_thread)
+        logger.info(f"收集器已启动，监听地址: {self.address}")
+
+    def stop(self, timeout: float = 5.0):
+        """停止接收新数据，写完队列中已接收的批次后返回"""
+        self._stopping.set()
+        with self._connections_lock:
+            connections = list(self._connections.values())
+        for conn in connections:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._writer_thread:
+            self._writer_thread.join(timeout)
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if self.family == socket.AF_UNIX and os.path.exists(self._bind_address):
+                os.remove(self._bind_address)
+        logger.info("收集器已停止")
+
+    def _accept_loop(self):
+        """接受新连接，每个连接由单独的线程读取"""
+        while not self._stopping.is_set():
+            try:
+                sock, peer = self._listener.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if not self._stopping.is_set():
+                    logger.error(f"接受连接失败: {e}")
+                break
+            sock.settimeout(None)
+            conn = _Connection(sock, format_address(self.family, peer) if peer else "local")
+            thread = threading.Thread(target=self._serve, args=(conn,), name="collector-conn", daemon=True)
+            # 去掉已结束的连接线程，长时间运行时不随重连次数增长
+            self._threads = [t for t in self._threads if t.is_alive()]
+            self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, conn: _Connection):
+        """读取一个连接上的握手和批次"""
+        with self._connections_lock:
+            self._connections[id(conn)] = conn
+            COLLECTOR_CONNECTIONS.set(len(self._connections))
+        try:
+            message = recv_message(conn.sock)
+            if message is None:
+                return
+            msg_type, _, _, body = message
+            if msg_type != MSG_HELLO:
+                raise ProtocolError(f"需要HELLO消息，收到类型{msg_type}")
+            hello = json.loads(body.decode("utf-8"))
+            if hello.get("version") != PROTOCOL_VERSION:
+                conn.send(MSG_ACK, status=STATUS_ERROR)
+                raise ProtocolError(f"不支持的协议版本: {hello.get('version')}")
+            conn.host = hello.get("host") or conn.peer
+            conn.send(MSG_ACK)
+            logger.info(f"监控器已连接: {conn.host}")
+
+            while not self._stopping.is_set():
+                message = recv_message(conn.sock)
+                if message is None:
+                    break
+                msg_type, _, batch_id, body = message
+                if msg_type != MSG_BATCH:
+                    raise ProtocolError(f"需要BATCH消息，收到类型{msg_type}")
+                try:
+                    events = decode_events(body)
+                except ValueError as e:
+                    logger.error(f"来自{conn.host}的批次无法解码: {e}")
+                    COLLECTOR_BATCHES.inc(labels=("error",))
+                    conn.send(MSG_ACK, batch_id, status=STATUS_ERROR)
+                    continue
+                for event in events:
+                    event.setdefault("host", conn.host)
+                try:
+                    # 队列满时在这里阻塞，不再读取该连接，发送方的写入随之阻塞
+                    self._queue.put((conn, batch_id, events), timeout=self.backpressure_timeout)
+                except queue.Full:
+                    COLLECTOR_BATCHES.inc(labels=("busy",))
+                    conn.send(MSG_ACK, batch_id, status=STATUS_BUSY)
+                    continue
+                COLLECTOR_QUEUE_DEPTH.set(self._queue.qsize())
+        except (OSError, ValueError) as e:
+            if not self._stopping.is_set():
+                logger.warning(f"连接{conn.host}异常: {e}")
+        finally:
+            conn.sock.close()
+            with self._connections_lock:
+                self._connections.pop(id(conn), None)
+                COLLECTOR_CONNECTIONS.set(len(self._connections))
+            logger.info(f"监控器已断开: {conn.host}")
+
+    def _writer_loop(self):
+        """从队列取出批次，合并后写入存储"""
+        while True:
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+            group = [first]
+            count = len(first[2])
+            deadline = time.monotonic() + self.group_commit_delay
+            while count < self.group_commit_max_events:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(item)
+                count += len(item[2])
+            self._commit(group)
+            COLLECTOR_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def _commit(self, group: List[Tuple[_Connection, int, List[Dict[str, Any]]]]):
+        """一次追加写入整组批次，完成后逐个确认"""
+        events = [event for _, _, batch in group for event in batch]
+        commit_start = time.perf_counter()
+        try:
+            self.store.append(events, sync=self.sync)
+            status = STATUS_OK
+            COLLECTOR_EVENTS.inc(len(events))
+        except Exception as e:
+            logger.error(f"写入共享存储失败: {e}")
+            status = STATUS_ERROR
+        COLLECTOR_COMMIT_DURATION.observe(time.perf_counter() - commit_start)
+        COLLECTOR_GROUP_SIZE.observe(len(group))
+        logger.debug("组提交%d个批次，共%d个事件", len(group), len(events))
+
+        for conn, batch_id, _ in group:
+            COLLECTOR_BATCHES.inc(labels=("ok" if status == STATUS_OK else "error",))
+            try:
+                conn.send(MSG_ACK, batch_id, status=status)
+            except OSError:
+                # 发送方收不到确认会重发，收集器端可能出现重复批次
+                logger.debug("连接已关闭，无法确认批次%d", batch_id)
+
+
+class CollectorClient:
+    """
+    监控器端的收集器客户端
+
+    与EventStore提供相同的append()接口；收集器不可用或返回BUSY时写入本地缓存，
+    之后每次发送前先按顺序重放缓存，保证同一监控器的批次顺序不变。
+    """
+
+    def __init__(self,
+                 address: str,
+                 host: Optional[str] = None,
+                 spool_path: Optional[str] = None,
+                 encryption_key: Optional[bytes] = None,
+                 timeout: float = 5.0,
+                 retry_interval: float = 5.0):
+        """
+        初始化客户端
+
+        Args:
+            address: 收集器地址，格式见parse_address
+            host: 本机标识，收集器据此为事件添加host字段，默认为主机名
+            spool_path: 本地缓存文件路径，为None时收集器不可用会直接抛出异常
+            encryption_key: 本地缓存的Fernet密钥
+            timeout: 连接、发送和等待确认的超时（秒）
+            retry_interval: 连接失败后再次尝试的间隔（秒）
+        """
+        self.address = address
+        self.family, self._address = parse_address(address)
+        self.host = host or os.uname().nodename
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.spool = EventStore(spool_path, encryption_key) if spool_path else None
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._batch_ids = itertools.count(1)
+        self._next_attempt = 0.0
+        self._unavailable = False
+
+    def append(self, events: List[Dict[str, Any]]) -> int:
+        """
+        发送一批事件，收集器不可用时写入本地缓存
+
+        Returns:
+            发送或写入缓存的字节数
+        """
+        if not events:
+            return 0
+        with self._lock:
+            if self._connect() and self._replay_spool():
+                body = encode_events(events)
+                try:
+                    status = self._send(body)
+                    if status == STATUS_OK:
+                        return len(body)
+                    logger.warning(f"收集器暂时无法接收（状态{status}），事件已写入本地缓存")
+                except OSError as e:
+                    logger.warning(f"发送到收集器失败: {e}")
+                    self._disconnect()
+            return self._spool(events)
+
+    def spooled_frames(self) -> int:
+        """本地缓存中尚未重放的帧数"""
+        with self._lock:
+            if self.spool is None or not os.path.exists(self.spool.path):
+                return 0
+            return self.spool.frame_count() - self._read_spool_pos()
+
+    def close(self):
+        """尝试重放本地缓存后断开连接"""
+        with self._lock:
+            if self._connect():
+                self._replay_spool()
+            self._disconnect()
+
+    def _connect(self) -> bool:
+        """连接并握手，失败后在retry_interval内不再尝试"""
+        if self._sock is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        sock = None
+        try:
+            sock = socket.socket(self.family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self._address)
+            hello = {"version": PROTOCOL_VERSION, "host": self.host}
+            send_message(sock, MSG_HELLO, body=json.dumps(hello).encode("utf-8"))
+            reply = recv_message(sock)
+            if reply is None or reply[0] != MSG_ACK or reply[1] != STATUS_OK:
+                raise ProtocolError("握手失败")
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            self._next_attempt = now + self.retry_interval
+            if not self._unavailable:
+                logger.warning(f"无法连接收集器{self.address}: {e}，事件将写入本地缓存")
+                self._unavailable = True
+            return False
+        self._sock = sock
+        if self._unavailable:
+            logger.info(f"已重新连接收集器: {self.address}")
+            self._unavailable = False
+        return True
+
+    def _disconnect(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, body: bytes) -> int:
+        """发送一个批次并等待确认，返回状态码"""
+        batch_id = next(self._batch_ids)
+        send_message(self._sock, MSG_BATCH, batch_id, body)
+        reply = recv_message(self._sock)
+        if reply is None:
+            raise ProtocolError("收集器关闭了连接")
+        msg_type, status, reply_id, _ = reply
+        if msg_type != MSG_ACK or reply_id != batch_id:
+            raise ProtocolError(f"意外的确认: 类型{msg_type}, 批次{reply_id}")
+        return status
+
+    def _spool(self, events: List[Dict[str, Any]]) -> int:
+        if self.spool is None:
+            raise ConnectionError(f"收集器{self.address}不可用，且未配置本地缓存")
+        CLIENT_SPOOLED.inc(len(events))
+        return self.spool.append(events)
+
+    def _read_spool_pos(self) -> int:
+        try:
+            with open(self.spool.path + SPOOL_POS_SUFFIX, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_spool_pos(self, frame_no: int):
+        pos_path = self.spool.path + SPOOL_POS_SUFFIX
+        with open(pos_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(frame_no))
+        os.replace(pos_path + ".tmp", pos_path)
+
+    def _replay_spool(self) -> bool:
+        """
+        按顺序重放本地缓存，每帧确认后记录进度
+
+        Returns:
+            缓存是否已全部送达
+        """
+        if self.spool is None or not os.path.exists(self.spool.path):
+            return True
+        replayed = 0
+        try:
+            for frame_no, events in self.spool.iter_frames(self._read_spool_pos()):
+                if self._send(encode_events(events)) != STATUS_OK:
+                    return False
+                self._write_spool_pos(frame_no + 1)
+                CLIENT_REPLAYED.inc(len(events))
+                replayed += len(events)
+        except OSError as e:
+            logger.warning(f"重放本地缓存失败: {e}")
+            self._disconnect()
+            return False
+        self.spool.delete()
+        if os.path.exists(self.spool.path + SPOOL_POS_SUFFIX):
+            os.remove(self.spool.path + SPOOL_POS_SUFFIX)
+        logger.info(f"已将本地缓存中的{replayed}个事件重放到收集器")
+        return True
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 事件收集服务",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--listen", type=str, default="unix:/tmp/behavior-collector.sock",
+                        help="监听地址，unix:/路径 或 主机:端口")
+    parser.add_argument("-o", "--output_path", type=str, default="./fleet.json", help="共享事件存储路径")
+    parser.add_argument("--encrypted", action="store_true", help="使用本机派生的密钥加密共享存储")
+    parser.add_argument("--max_pending", type=int, default=DEFAULT_MAX_PENDING, help="待写入队列的最大批次数")
+    parser.add_argument("--group_commit_ms", type=float, default=DEFAULT_GROUP_COMMIT_DELAY * 1000,
+                        help="组提交等待更多批次的最长时间（毫秒）")
+    parser.add_argument("--no_sync", action="store_true", help="确认前不调用fsync")
+    parser.add_argument("--log_level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+                        default="INFO", help="日志级别")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from log_setup import configure_logging
+
+    args = parse_args()
+    configure_logging(args.log_level, log_file='collector.log')
+
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    try:
+        server = CollectorServer(EventStore(args.output_path, key), args.listen,
+                                 max_pending=args.max_pending,
+                                 group_commit_delay=args.group_commit_ms / 1000.0,
+                                 sync=not args.no_sync)
+        server.start()
+    except (ValueError, OSError) as e:
+        logger.error(f"启动收集器失败: {e}")
+        return 1
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    print(f"收集器已启动，监听地址: {server.address}，写入: {args.output_path}")
+    print("按Ctrl+C停止...")
+    try:
+        while not stopped.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
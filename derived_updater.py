@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 派生数据的后台更新
+
+刷新只负责把事件写入存储；会话切分、时间汇总、搜索索引等派生数据由该模块
+在单独的线程中按写入顺序更新，不占用刷新锁，缓冲区满时在采集线程中刷新也不会
+被这些计算拖慢。
+
+线程只在有待处理的帧时运行，处理完后退出；待处理的帧数有上限，派生数据的
+更新跟不上写入时，提交的一方等待（背压），内存占用不会无限增长。
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Callable
+from metrics import REGISTRY
+
+logger = logging.getLogger("derived_updater")
+
+# 默认最多等待处理的帧数
+MAX_PENDING_FRAMES = 16
+
+DERIVED_PENDING = REGISTRY.gauge("monitor_derived_pending_frames", "等待更新派生数据的已写入帧数")
+DERIVED_ERRORS = REGISTRY.counter("monitor_derived_errors_total", "更新派生数据失败的次数")
+
+Handler = Callable[[List[Dict[str, Any]], Optional[int]], None]
+
+
+class DerivedUpdater:
+    """按提交顺序在后台线程中处理已写入的帧，线程安全"""
+
+    def __init__(self, handler: Handler, name: str = "derived-updater", max_pending: int = MAX_PENDING_FRAMES):
+        """
+        Args:
+            handler: 处理一帧的函数，参数为(事件列表, 帧号)
+            name: 后台线程名称
+            max_pending: 最多等待处理的帧数，超过时submit阻塞
+        """
+        self.handler = handler
+        self.name = name
+        self.max_pending = max(1, max_pending)
+        # 待处理的帧，正在处理的帧处理完才移出
+        self._pending = deque()
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def submit(self, events: List[Dict[str, Any]], frame: Optional[int] = None):
+        """提交一帧已写入的事件，待处理的帧过多时等待"""
+        with self._cond:
+            while len(self._pending) >= self.max_pending:
+                self._cond.wait()
+            self._pending.append((events, frame))
+            DERIVED_PENDING.set(len(self._pending))
+            if not self._busy:
+                self._busy = True
+                threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待已提交的帧全部处理完（停止监控、查询派生数据前调用）
+
+        Returns:
+            是否在超时前处理完
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._busy, timeout)
+
+    @property
+    def pending(self) -> int:
+        """尚未处理完的帧数"""
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._busy = False
+                    self._cond.notify_all()
+                    return
+                events, frame = self._pending[0]
+            try:
+                self.handler(events, frame)
+            except Exception as e:
+                DERIVED_ERRORS.inc()
+                logger.error(f"更新派生数据失败: {str(e)}")
+            with self._cond:
+                self._pending.popleft()
+                DERIVED_PENDING.set(len(self._pending))
+                self._cond.notify_all()
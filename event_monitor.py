@@ -9,25 +9,36 @@ MacOS用户行为实时记录工具 - 事件监控模块
 """
 
 import os
+import math
 import time
-import json
 import random
-import datetime
 import threading
 import logging
 import base64
 import hashlib
+import itertools
 import subprocess
+from collections import deque
 from typing import Dict, List, Any, Optional, Tuple, Union
-from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from event_store import EventStore
+from heatmap import HeatmapAggregator, HEATMAP_SUFFIX
+from metrics import REGISTRY
+from tracing import TRACER
+from clock import SYSTEM_CLOCK
+from collector import CollectorClient, SPOOL_SUFFIX
+from store_writer import WriterProcess
+from sessionizer import Sessionizer, DERIVED_SUFFIX
+from rollups import RollupAggregator, ROLLUP_SUFFIX
+from search_index import SearchIndex, SEARCH_SUFFIX
+from derived_updater import DerivedUpdater
+from memory_governor import MemoryGovernor, SPILL_SUFFIX, DEFAULT_BUDGET_MB, budget_to_bytes, estimate_event_size
+from keystrokes import (
+    KeystrokeAggregator, KEY_EVENT_TYPES, MODE_RAW, DEFAULT_INTERVAL as KEYSTROKE_INTERVAL, validate_mode
 )
+
+# 日志处理器由入口程序通过log_setup配置
 logger = logging.getLogger("event_monitor")
 
 # 检查是否可以导入必要的库
@@ -42,6 +53,167 @@ except ImportError as e:
     logger.warning(f"无法导入 pyobjc 库: {e}")
     logger.warning("将使用测试模式或有限功能模式")
 
+# 流水线指标
+EVENTS_CAPTURED = REGISTRY.counter("monitor_events_captured_total", "捕获到的原始事件数", ("type",))
+EVENTS_SAMPLED = REGISTRY.counter("monitor_events_sampled_total", "通过采样并写入缓冲区的事件数", ("type",))
+EVENTS_DROPPED = REGISTRY.counter("monitor_events_dropped_total", "被采样丢弃的事件数", ("type", "reason"))
+BUFFER_DEPTH = REGISTRY.gauge("monitor_buffer_depth", "缓冲区中等待写入的事件数")
+FLUSH_DURATION = REGISTRY.histogram("monitor_flush_duration_seconds", "刷新缓冲区的耗时（秒）")
+FLUSH_ERRORS = REGISTRY.counter("monitor_flush_errors_total", "刷新缓冲区失败的次数")
+WINDOW_LOOKUP_DURATION = REGISTRY.histogram("monitor_window_lookup_seconds", "获取活动窗口信息的耗时（秒）")
+KEYSTROKES_AGGREGATED = REGISTRY.counter("monitor_keystrokes_aggregated_total", "汇总为typing_summary而未单独记录的按键事件数")
+
+# 内存中保留的最近事件数，供Web界面推送和查看
+RECENT_EVENTS_SIZE = 1000
+
+# 时间汇总和热力图的保存间隔（秒），停止时也会保存；时间汇总重启后从存储补齐未保存的部分
+AGGREGATE_SAVE_INTERVAL = 60.0
+
+# 写入失败后，缓冲区满或超出内存预算时至少等待该时间（秒）再重试，避免每个事件都触发一次写入
+FLUSH_RETRY_DELAY = 1.0
+
+# 测试模式生成的事件类型、按键和假设的屏幕尺寸
+TEST_EVENT_TYPES = ["mouse_move", "mouse_click", "key_press", "key_release", "mouse_scroll"]
+TEST_BUTTONS = ["left", "right", "middle"]
+TEST_KEY_NAMES = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m",
+                  "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z",
+                  "space", "enter", "esc", "tab", "shift", "ctrl", "alt", "cmd"]
+TEST_SCREEN_SIZE = (1920, 1080)
+
+# 可以在运行中通过reconfigure()修改的配置项
+RECONFIGURABLE_OPTIONS = (
+    "sampling_rate", "sample_interval", "filter_sensitive", "buffer_size",
+    "flush_interval", "keystroke_mode", "keystroke_app_modes", "memory_budget_mb"
+)
+
+
+def _finite(key: str, value: Any) -> float:
+    """转换为有限的浮点数，拒绝nan和inf"""
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError(f"{key}必须是有限的数值")
+    return value
+
+
+def validate_config(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    检查并规范化可在运行中修改的配置项
+
+    Args:
+        changes: 配置项名称到新值的映射
+
+    Returns:
+        规范化后的配置（所有转换都在这里完成，应用时不会再失败）
+
+    Raises:
+        ValueError: 配置项不支持在运行中修改，或值无效
+    """
+    unknown = set(changes) - set(RECONFIGURABLE_OPTIONS)
+    if unknown:
+        raise ValueError(f"不支持在运行中修改的配置: {', '.join(sorted(unknown))}")
+    config = {}
+    for key, value in changes.items():
+        try:
+            if key == "sampling_rate":
+                value = _finite(key, value)
+                if not 0.01 <= value <= 1.0:
+                    raise ValueError("采样率必须在0.01到1.0之间")
+            elif key == "sample_interval":
+                value = None if value is None else _finite(key, value)
+                if value is not None and value < 0:
+                    raise ValueError("采样间隔不能为负数")
+            elif key == "filter_sensitive":
+                if not isinstance(value, bool):
+                    raise ValueError("filter_sensitive必须是布尔值")
+            elif key == "buffer_size":
+                value = int(value)
+                if value < 10:
+                    raise ValueError("缓冲区大小必须至少为10")
+            elif key == "flush_interval":
+                value = _finite(key, value)
+                if value < 1.0:
+                    raise ValueError("刷新间隔必须至少为1.0秒")
+            elif key == "keystroke_mode":
+                value = validate_mode(value)
+            elif key == "keystroke_app_modes":
+                value = {str(app): validate_mode(mode) for app, mode in dict(value or {}).items()}
+            elif key == "memory_budget_mb":
+                value = _finite(key, value)
+                if value < 1.0:
+                    raise ValueError("内存预算必须至少为1MB")
+                budget_to_bytes(value)
+        except (TypeError, OverflowError):
+            raise ValueError(f"无效的配置值: {key}")
+        config[key] = value
+    return config
+
+
+def random_test_event() -> Tuple[str, Dict[str, Any]]:
+    """生成一个随机的模拟事件，返回(事件类型, 事件数据)"""
+    event_type = random.choice(TEST_EVENT_TYPES)
+    
+    # 生成随机位置
+    x = random.uniform(0, TEST_SCREEN_SIZE[0])
+    y = random.uniform(0, TEST_SCREEN_SIZE[1])
+    
+    if event_type == "mouse_move":
+        return event_type, {"position": {"x": x, "y": y}}
+    if event_type == "mouse_click":
+        return event_type, {
+            "position": {"x": x, "y": y},
+            "button": random.choice(TEST_BUTTONS),
+            "state": random.choice(["pressed", "released"])
+        }
+    if event_type == "mouse_scroll":
+        return event_type, {
+            "position": {"x": x, "y": y},
+            "scroll_dx": random.uniform(-10, 10),
+            "scroll_dy": random.uniform(-10, 10)
+        }
+    return event_type, {
+        "key_code": random.randint(1, 100),
+        "key_name": random.choice(TEST_KEY_NAMES),
+        "state": "pressed" if event_type == "key_press" else "released",
+        "modifiers": []
+    }
+
+
+def parse_cliclick_position(text: str) -> Optional[Tuple[float, float]]:
+    """
+    解析"cliclick p"输出的鼠标位置
+
+    Returns:
+        (x, y)，输出中没有位置时返回None
+
+    Raises:
+        ValueError: 坐标无法解析
+    """
+    text = text.strip()
+    if "," not in text:
+        return None
+    x_str, y_str = text.split(",")
+    return float(x_str), float(y_str)
+
+
+def derive_encryption_key(hostname: Optional[str] = None) -> bytes:
+    """
+    根据主机名派生Fernet密钥，读取加密的输出文件时使用相同的派生方式
+
+    Args:
+        hostname: 主机名，为None时使用本机主机名
+    """
+    # 使用机器特定信息生成密钥
+    salt = b'macos_behavior_tracker_salt'
+    password = hashlib.md5((hostname or os.uname().nodename).encode()).hexdigest().encode()
+    
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(password))
+
 
 class EventMonitor:
     """事件监控类，负责捕获和处理用户行为事件"""
@@ -53,7 +225,17 @@ class EventMonitor:
                  filter_sensitive: bool = True,
                  buffer_size: int = 1000,
                  flush_interval: float = 10.0,
-                 sampling_rate: float = 1.0):
+                 sampling_rate: float = 1.0,
+                 sample_interval: Optional[float] = None,
+                 clock=None,
+                 collector_address: Optional[str] = None,
+                 compression: bool = False,
+                 writer_process: bool = False,
+                 keystroke_mode: str = MODE_RAW,
+                 keystroke_app_modes: Optional[Dict[str, str]] = None,
+                 keystroke_interval: float = KEYSTROKE_INTERVAL,
+                 flush_pool=None,
+                 memory_budget_mb: float = DEFAULT_BUDGET_MB):
         """
         初始化事件监控器
         
@@ -65,17 +247,44 @@ class EventMonitor:
             buffer_size: 事件缓冲区大小
             flush_interval: 写入文件的间隔时间（秒）
             sampling_rate: 事件采样率 (0.01-1.0)
+            sample_interval: 两次记录事件之间的最小间隔（秒），为None时与flush_interval相同，0表示不限制
+            clock: 读取时间和等待使用的时钟，默认为真实时间，测试时可传入SimulatedClock
+            collector_address: 收集器地址，设置后刷新的事件发送给收集器，不可用时写入本地缓存
+            compression: 是否压缩写入的帧
+            writer_process: 是否由单独的写入进程完成序列化、压缩、加密和写入
+            keystroke_mode: 按键事件的记录模式（raw、summary或anonymous）
+            keystroke_app_modes: 按应用指定的按键记录模式
+            keystroke_interval: 按键汇总的时间窗口（秒）
+            flush_pool: 多个监控器共享的刷新线程池（monitor_registry.FlushPool），设置后不创建单独的刷新线程
+            memory_budget_mb: 缓冲区和最近事件的内存预算（MB），超出时降低采样率并把旧事件溢出到磁盘
         """
         self.test_mode = test_mode
         self.output_path = output_path
         self.encryption = encryption
+        self.compression = compression
         self.filter_sensitive = filter_sensitive
         self.buffer_size = max(10, buffer_size)
         self.flush_interval = max(1.0, flush_interval)
         self.sampling_rate = max(0.01, min(1.0, sampling_rate))
+        self._sample_interval = None if sample_interval is None else max(0.0, sample_interval)
+        self.clock = clock or SYSTEM_CLOCK
+        self._stop_event = threading.Event()  # 停止时唤醒等待中的后台线程
+        self._wake_event = threading.Event()  # 停止或修改刷新间隔时唤醒刷新线程
+        self._config_lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 刷新线程、缓冲区满和手动刷新不会同时写入
+        self._buffer_lock = threading.Lock()  # 缓冲区及其估算字节数：采集线程追加，刷新时取走或移除开头
+        self.flush_pool = flush_pool
+        self.keystrokes = KeystrokeAggregator(keystroke_mode, keystroke_app_modes, keystroke_interval)
         
         self.event_buffer: List[Dict[str, Any]] = []
+        self.recent_events = deque(maxlen=RECENT_EVENTS_SIZE)
+        # 缓冲区和最近事件的估算字节数，两者引用同一批事件对象
+        self._buffer_bytes = 0
+        self._recent_sizes = deque(maxlen=RECENT_EVENTS_SIZE)
+        self._recent_bytes = 0
+        self._flush_retry_at = 0.0
         self.event_count = 0
+        self._seq_counter = itertools.count(1)  # next()是原子操作，多个采集线程也不会产生重复序号
         self.running = False
         self.flush_thread = None
         self.test_thread = None
@@ -92,24 +301,98 @@ class EventMonitor:
         if self.encryption:
             self._setup_encryption()
         
+        # 追加写入的事件存储
+        self.store = EventStore(
+            self.output_path,
+            self.encryption_key if self.encryption else None,
+            self.compression
+        )
+        
+        # 内存预算：超出时降低采样率，把最旧的待写入事件溢出到本地临时存储
+        self.memory_budget_mb = memory_budget_mb
+        self.memory = MemoryGovernor(
+            memory_budget_mb,
+            self.output_path + SPILL_SUFFIX,
+            self.encryption_key if self.encryption else None,
+            self.compression
+        )
+        
+        # 写入进程模式：主进程只读取存储，写入由子进程完成
+        self.writer = None
+        if writer_process:
+            self.writer = WriterProcess(
+                self.output_path,
+                self.encryption_key if self.encryption else None,
+                self.compression
+            )
+        
+        # 收集器模式：由收集器统一写入共享存储，本地只保留缓存
+        self.collector_address = collector_address
+        self.collector = None
+        if collector_address:
+            self.collector = CollectorClient(
+                collector_address,
+                spool_path=self.output_path + SPOOL_SUFFIX,
+                encryption_key=self.encryption_key if self.encryption else None
+            )
+        
+        # 会话切分：活动会话、应用专注区间和连续输入，写入本地的派生记录文件
+        self.sessionizer = Sessionizer()
+        self.derived_store = EventStore(
+            self.output_path + DERIVED_SUFFIX,
+            self.encryption_key if self.encryption else None,
+            self.compression
+        )
+        
+        # 鼠标热力图，与时间汇总一起定期保存
+        screen_width, screen_height = self._get_screen_size()
+        self.heatmap = HeatmapAggregator(screen_width, screen_height)
+        self.heatmap_path = self.output_path + HEATMAP_SUFFIX
+        self.heatmap.load(self.heatmap_path, self._derived_key())
+        
+        # 分钟、小时和天的时间汇总；收集器模式下本地存储不包含刷新的事件，无法补齐
+        self.rollups = RollupAggregator()
+        self.rollup_path = self.output_path + ROLLUP_SUFFIX
+        self.rollups.load(self.rollup_path, self._derived_key())
+        if not self.collector:
+            try:
+                frames = self.rollups.catch_up(self.store)
+                if frames:
+                    logger.info(f"已补齐{frames}帧的时间汇总")
+            except Exception as e:
+                logger.error(f"补齐时间汇总失败: {str(e)}")
+        self._aggregates_saved_at = self.clock.time()
+        
+        # 窗口标题和应用名称的倒排索引，按存储的帧分段；收集器模式下本地存储为空，不建立索引
+        self.search_index = None
+        if not self.collector:
+            self.search_index = SearchIndex(self.output_path + SEARCH_SUFFIX,
+                                            self.encryption_key if self.encryption else None)
+            try:
+                self.search_index.load()
+                frames = self.search_index.catch_up(self.store)
+                if frames:
+                    logger.info(f"已补齐{frames}帧的搜索索引")
+            except Exception as e:
+                logger.error(f"补齐搜索索引失败: {str(e)}")
+        
+        # 会话、时间汇总和搜索索引在后台线程中按写入顺序更新，不占用刷新锁
+        self.derived = DerivedUpdater(self._update_derived)
+        
         logger.info(f"事件监控器初始化完成，{'测试' if test_mode else '正常'}模式")
         logger.info(f"输出路径: {output_path}, 采样间隔: {flush_interval}秒")
     
+    @property
+    def sample_interval(self) -> float:
+        """两次记录事件之间的最小间隔，未单独设置时跟随flush_interval"""
+        if self._sample_interval is None:
+            return self.flush_interval
+        return self._sample_interval
+    
     def _setup_encryption(self):
         """设置加密密钥"""
         try:
-            # 使用机器特定信息生成密钥
-            salt = b'macos_behavior_tracker_salt'
-            password = hashlib.md5(os.uname().nodename.encode()).hexdigest().encode()
-            
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(password))
-            self.encryption_key = key
+            self.encryption_key = derive_encryption_key()
             logger.info("加密设置完成")
         except Exception as e:
             logger.error(f"设置加密失败: {e}")
@@ -117,20 +400,43 @@ class EventMonitor:
 
     def _add_event(self, event_type: str, event_data: Dict[str, Any]):
         """添加事件到缓冲区"""
-        # 检查是否到达采样时间
-        current_time = time.time()
-        if current_time - self.last_sample_time < self.flush_interval:
-            return
-            
-        # 更新上次采样时间
-        self.last_sample_time = current_time
+        labels = (event_type,)
+        EVENTS_CAPTURED.inc(labels=labels)
         
-        # 应用采样率
-        if random.random() > self.sampling_rate:
-            return
+        # 需要汇总的按键事件不经过采样，全部计入汇总
+        window_info = None
+        if event_type in KEY_EVENT_TYPES and self.keystrokes.active:
+            window_info = self._lookup_window()
+            if self.keystrokes.mode_for(window_info.get("app_name", "")) != MODE_RAW:
+                KEYSTROKES_AGGREGATED.inc()
+                for summary in self.keystrokes.add(event_type, event_data, window_info, self.clock.time()):
+                    self._record(summary)
+                return
+        
+        with TRACER.span("sampling"):
+            # 缓冲区超出内存预算的上限时（例如磁盘长时间不可用）不再接收新事件
+            buffer_bytes = self._buffer_bytes
+            if self.memory.over_hard_limit(buffer_bytes):
+                EVENTS_DROPPED.inc(labels=(event_type, "memory_budget"))
+                return
             
-        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        window_info = self._get_window_info()
+            # 检查是否到达采样时间
+            current_time = self.clock.time()
+            if current_time - self.last_sample_time < self.sample_interval:
+                EVENTS_DROPPED.inc(labels=(event_type, "interval"))
+                return
+                
+            # 更新上次采样时间
+            self.last_sample_time = current_time
+            
+            # 应用采样率，内存压力较高时按比例降低
+            if random.random() > self.sampling_rate * self.memory.sampling_factor(buffer_bytes):
+                EVENTS_DROPPED.inc(labels=(event_type, "sampling_rate"))
+                return
+            
+        timestamp = self.clock.now().isoformat()
+        if window_info is None:
+            window_info = self._lookup_window()
         
         event = {
             "type": event_type,
@@ -140,14 +446,59 @@ class EventMonitor:
         }
         
         event.update(event_data)
-        self.event_buffer.append(event)
+        self._record(event)
+    
+    def _lookup_window(self) -> Dict[str, Any]:
+        lookup_start = time.perf_counter()
+        with TRACER.span("window_lookup"):
+            window_info = self._get_window_info()
+        WINDOW_LOOKUP_DURATION.observe(time.perf_counter() - lookup_start)
+        return window_info
+    
+    def _record(self, event: Dict[str, Any], flush_when_full: bool = True):
+        """为事件分配序号并写入缓冲区"""
+        event["seq"] = next(self._seq_counter)
         self.event_count += 1
+        size = estimate_event_size(event)
+        with self._buffer_lock:
+            self.event_buffer.append(event)
+            self._buffer_bytes += size
+            buffer_len = len(self.event_buffer)
+            buffer_bytes = self._buffer_bytes
+        self.recent_events.append(event)
+        if len(self._recent_sizes) == RECENT_EVENTS_SIZE:
+            self._recent_bytes -= self._recent_sizes[0]
+        self._recent_sizes.append(size)
+        self._recent_bytes += size
+        EVENTS_SAMPLED.inc(labels=(event["type"],))
+        BUFFER_DEPTH.set(buffer_len)
         
-        logger.info(f"记录事件: {event_type}, 时间: {timestamp}")
+        # 每个事件都会执行，使用DEBUG级别和延迟格式化
+        logger.debug("记录事件: %s, 时间: %s", event["type"], event["timestamp"])
         
-        if len(self.event_buffer) >= self.buffer_size:
+        if flush_when_full and (buffer_len >= self.buffer_size or self.memory.over_budget(buffer_bytes)):
+            if self.clock.time() >= self._flush_retry_at:
+                self._buffer_full()
+    
+    def _buffer_full(self):
+        """缓冲区已满：交给共享线程池尽快刷新，否则在当前线程中刷新"""
+        if self.flush_pool:
+            self.flush_pool.submit(self)
+        else:
             self._flush_buffer()
 
+    def _get_screen_size(self) -> Tuple[float, float]:
+        """获取主屏幕尺寸（点）"""
+        if self.test_mode or not NATIVE_API_AVAILABLE:
+            return 1920.0, 1080.0  # 与测试事件生成使用的屏幕尺寸一致
+        
+        try:
+            bounds = Quartz.CGDisplayBounds(Quartz.CGMainDisplayID())
+            return float(bounds.size.width), float(bounds.size.height)
+        except Exception as e:
+            logger.error(f"获取屏幕尺寸失败: {str(e)}")
+            return 1920.0, 1080.0
+
     def _get_window_info(self) -> Dict[str, Any]:
         """获取当前活动窗口信息"""
         if self.test_mode or not NATIVE_API_AVAILABLE:
@@ -219,14 +570,14 @@ class EventMonitor:
             logger.warning("监控器已经在运行中")
             return False
         
-        self.running = True
-        self.event_buffer = []
-        self.event_count = 0
-        self.last_sample_time = 0  # 重置上次采样时间
+        self._reset()
         
-        # 启动刷新线程
-        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
-        self.flush_thread.start()
+        # 启动刷新线程，使用共享线程池时由线程池定期刷新
+        if self.flush_pool:
+            self.flush_pool.register(self)
+        else:
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
         
         if self.test_mode:
             # 测试模式：生成模拟事件
@@ -262,6 +613,40 @@ class EventMonitor:
         logger.info("事件监控器启动成功")
         return True
     
+    def _reset(self):
+        """启动前重置运行状态，并启动写入进程"""
+        self.running = True
+        self._stop_event.clear()
+        self._wake_event.clear()
+        with self._buffer_lock:
+            self.event_buffer = []
+            self._buffer_bytes = 0
+        self.recent_events.clear()
+        self._recent_sizes.clear()
+        self._recent_bytes = 0
+        self._flush_retry_at = 0.0
+        self.event_count = 0
+        self._seq_counter = itertools.count(1)
+        self.last_sample_time = 0  # 重置上次采样时间
+        
+        if self.writer and not self.collector:
+            try:
+                self.writer.start()
+            except Exception as e:
+                # 第一次刷新时会再次尝试启动
+                logger.error(f"启动写入进程失败: {str(e)}")
+    
+    def _close_outputs(self):
+        """最后一次刷新之后保存派生记录、时间汇总和热力图，关闭收集器和写入进程"""
+        self.derived.drain()
+        self._save_derived(self.sessionizer.close())
+        self._save_aggregates()
+        
+        if self.collector:
+            self.collector.close()
+        if self.writer:
+            self.writer.close()
+    
     def _start_event_monitoring(self):
         """启动事件监听（使用原生API）"""
         try:
@@ -280,29 +665,25 @@ class EventMonitor:
             try:
                 # 获取当前鼠标位置
                 result = subprocess.run(["cliclick", "p"], capture_output=True, text=True, check=True)
-                pos_str = result.stdout.strip()
                 
                 # 解析位置
-                if "," in pos_str:
-                    x_str, y_str = pos_str.split(",")
-                    try:
-                        x = float(x_str)
-                        y = float(y_str)
-                        
-                        # 记录鼠标位置（采样间隔由_add_event控制）
-                        if last_pos is None or (x != last_pos[0] or y != last_pos[1]):
-                            self._add_event("mouse_move", {
-                                "position": {"x": x, "y": y}
-                            })
-                            last_pos = (x, y)
-                    except ValueError as e:
-                        logger.error(f"解析鼠标位置失败: {str(e)}, 原始数据: {pos_str}")
+                try:
+                    pos = parse_cliclick_position(result.stdout)
+                    
+                    # 记录鼠标位置（采样间隔由_add_event控制）
+                    if pos is not None and pos != last_pos:
+                        self._add_event("mouse_move", {
+                            "position": {"x": pos[0], "y": pos[1]}
+                        })
+                        last_pos = pos
+                except ValueError as e:
+                    logger.error(f"解析鼠标位置失败: {str(e)}, 原始数据: {result.stdout.strip()}")
                 
                 # 等待一小段时间
-                time.sleep(1.0)  # 降低检查频率，减少CPU使用
+                self.clock.wait(self._stop_event, 1.0)  # 降低检查频率，减少CPU使用
             except Exception as e:
                 logger.error(f"监听鼠标位置失败: {str(e)}")
-                time.sleep(2.0)  # 出错后等待较长时间再重试
+                self.clock.wait(self._stop_event, 2.0)  # 出错后等待较长时间再重试
     
     def stop(self):
         """停止事件监控"""
@@ -311,11 +692,21 @@ class EventMonitor:
             return False
         
         self.running = False
+        self._stop_event.set()
+        self._wake_event.set()
+        
+        # 未结束的按键汇总窗口随最后一次刷新写入
+        for summary in self.keystrokes.close(self.clock.time()):
+            self._record(summary, flush_when_full=False)
         
         # 等待线程结束
-        if self.flush_thread:
+        if self.flush_pool:
+            self.flush_pool.unregister(self)
+            self._flush_buffer()  # 最后一次刷新
+        elif self.flush_thread:
             self._flush_buffer()  # 最后一次刷新
             self.flush_thread.join(timeout=2.0)
+        self._close_outputs()
         
         if self.test_thread:
             self.test_thread.join(timeout=2.0)
@@ -334,134 +725,289 @@ class EventMonitor:
             "event_count": self.event_count,
             "buffer_size": len(self.event_buffer),
             "output_path": self.output_path,
+            "collector": self.collector_address,
             "flush_interval": self.flush_interval,
+            "sample_interval": self.sample_interval,
             "filter_sensitive": self.filter_sensitive,
             "encryption": self.encryption,
-            "sampling_rate": self.sampling_rate
+            "compression": self.compression,
+            "writer_process": self.writer is not None,
+            "keystroke_mode": self.keystrokes.default_mode,
+            "keystroke_app_modes": self.keystrokes.app_modes,
+            "sampling_rate": self.sampling_rate,
+            "memory_budget_mb": self.memory_budget_mb,
+            "memory": self._memory_status()
         }
     
+    def _memory_status(self) -> Dict[str, Any]:
+        self._update_memory_usage()
+        return self.memory.snapshot()
+    
+    def _update_memory_usage(self):
+        buffer_bytes = self._buffer_bytes
+        self.memory.set_usage("buffer", buffer_bytes)
+        # 最近事件中尚未写入的部分已计入缓冲区
+        self.memory.set_usage("recent", max(0, self._recent_bytes - buffer_bytes))
+    
     def get_events(self, limit: int = 10) -> List[Dict[str, Any]]:
         """获取最新事件"""
-        return self.event_buffer[-limit:] if self.event_buffer else []
+        return list(self.recent_events)[-limit:] if self.recent_events else []
+    
+    def get_events_since(self, seq: int, limit: int = RECENT_EVENTS_SIZE) -> List[Dict[str, Any]]:
+        """获取序号大于seq的最新事件，按序号升序返回"""
+        events = []
+        # 先复制快照，避免采集线程追加时迭代出错
+        for event in reversed(list(self.recent_events)):
+            if event["seq"] <= seq or len(events) >= limit:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+    
+    def reconfigure(self, **changes) -> Dict[str, Any]:
+        """
+        修改运行中的配置，线程、缓冲区和已记录的事件保持不变
+
+        所有配置项先全部校验，有效后在锁内一起生效；修改刷新间隔时立即唤醒
+        刷新线程，按新的间隔重新计算距上次刷新的等待时间。
+
+        Args:
+            changes: 配置项，见RECONFIGURABLE_OPTIONS
+
+        Returns:
+            生效的配置项
+
+        Raises:
+            ValueError: 配置项不支持在运行中修改，或值无效
+        """
+        config = validate_config(changes)
+        with self._config_lock:
+            if "keystroke_mode" in config or "keystroke_app_modes" in config:
+                self.keystrokes.configure(
+                    config.get("keystroke_mode", self.keystrokes.default_mode),
+                    config.get("keystroke_app_modes", self.keystrokes.app_modes)
+                )
+            for key in ("sampling_rate", "filter_sensitive", "buffer_size", "flush_interval"):
+                if key in config:
+                    setattr(self, key, config[key])
+            if "sample_interval" in config:
+                self._sample_interval = config["sample_interval"]
+            if "memory_budget_mb" in config:
+                self.memory_budget_mb = config["memory_budget_mb"]
+                self.memory.set_budget(self.memory_budget_mb)
+        if "flush_interval" in config:
+            self._wake_event.set()
+            if self.flush_pool:
+                self.flush_pool.reschedule(self)
+        logger.info(f"已更新配置: {config}")
+        return config
     
     def _flush_loop(self):
         """定期刷新缓冲区的循环"""
+        last_flush = self.clock.time()
+        timeout = self.flush_interval
         while self.running:
-            time.sleep(self.flush_interval)
+            # 停止时立即返回，不必等满一个刷新间隔
+            if self.clock.wait(self._wake_event, timeout):
+                self._wake_event.clear()
+                if not self.running:
+                    break
+                # 刷新间隔已修改，按新的间隔计算剩余的等待时间
+                timeout = last_flush + self.flush_interval - self.clock.time()
+                if timeout > 0:
+                    continue
             if self.running:  # 再次检查，避免在睡眠期间状态改变
                 self._flush_buffer()
+            last_flush = self.clock.time()
+            timeout = self.flush_interval
     
     def _flush_buffer(self):
         """将缓冲区内容写入文件"""
-        if not self.event_buffer:
+        with self._flush_lock:
+            self._write_buffer()
+    
+    def _write_buffer(self):
+        # 溢出到磁盘的事件比缓冲区中的早，先按顺序写回
+        if not self._write_spilled():
+            return
+        events = self._take_buffer()
+        if events is None:
             return
+        flush_start = time.perf_counter()
         
         try:
-            # 准备数据
-            data = {"events": self.event_buffer.copy()}
-            self.event_buffer = []
-            
-            # 确保输出目录存在
-            output_dir = os.path.dirname(os.path.abspath(self.output_path))
-            if output_dir and not os.path.exists(output_dir):
-                os.makedirs(output_dir, exist_ok=True)
-            
-            # 读取现有数据（如果有）
-            existing_data = {"events": []}
-            if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
-                try:
-                    with open(self.output_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if self.encryption and self.encryption_key:
-                            # 解密内容
-                            fernet = Fernet(self.encryption_key)
-                            content = fernet.decrypt(content.encode()).decode('utf-8')
-                        existing_data = json.loads(content)
-                except Exception as e:
-                    logger.error(f"读取现有数据失败: {str(e)}")
-            
-            # 合并数据
-            existing_data["events"].extend(data["events"])
-            
-            # 写入文件
-            content = json.dumps(existing_data, ensure_ascii=False, indent=2)
-            
-            if self.encryption and self.encryption_key:
-                # 加密内容
-                fernet = Fernet(self.encryption_key)
-                content = fernet.encrypt(content.encode()).decode('utf-8')
-            
-            with open(self.output_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            logger.info(f"已写入{len(data['events'])}个事件到{self.output_path}")
+            # 追加一帧到输出文件或发送给收集器，无需读取和重写已有数据
+            with TRACER.span("flush"):
+                self._output().append(events)
+            logger.debug("已写入%d个事件到%s", len(events), self.collector_address or self.output_path)
         except Exception as e:
             logger.error(f"写入文件失败: {str(e)}")
-            # 恢复缓冲区
-            self.event_buffer.extend(data["events"])
+            self._restore_buffer(events)
+            return
+        finally:
+            FLUSH_DURATION.observe(time.perf_counter() - flush_start)
+        self._after_write(events)
+    
+    def _write_spilled(self) -> bool:
+        """
+        逐帧写回溢出到磁盘的事件
+
+        Returns:
+            是否已全部写回（没有溢出的事件时为True）
+        """
+        while True:
+            events = self.memory.peek_spilled()
+            if events is None:
+                return True
+            try:
+                with TRACER.span("flush"):
+                    self._output().append(events)
+            except Exception as e:
+                logger.error(f"写回溢出的事件失败: {str(e)}")
+                self._flush_failed()
+                return False
+            self.memory.consume_spilled()
+            logger.info(f"已写回{len(events)}个溢出的事件")
+            self._after_write(events)
+    
+    def _output(self):
+        """刷新的事件写入的目标：收集器、写入进程或本地存储"""
+        return self.collector or self.writer or self.store
+    
+    def _take_buffer(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        结束已过去的按键汇总窗口并交换缓冲区
+
+        Returns:
+            待写入的事件，没有新事件时返回None
+        """
+        # 已结束的按键汇总窗口随本次刷新写入
+        for summary in self.keystrokes.flush(self.clock.time()):
+            self._record(summary, flush_when_full=False)
+        
+        # 交换缓冲区
+        with self._buffer_lock:
+            events = self.event_buffer
+            if events:
+                self.event_buffer = []
+                self._buffer_bytes = 0
+        if not events:
+            # 没有新事件时也检查空闲，及时结束会话；与已写入的帧一起按顺序交给后台线程
+            self.derived.submit([], None)
+            return None
+        return events
+    
+    def _restore_buffer(self, events: List[Dict[str, Any]]):
+        """写入失败时把事件放回缓冲区开头，下次刷新重试"""
+        size = sum(estimate_event_size(event) for event in events)
+        with self._buffer_lock:
+            self.event_buffer[:0] = events
+            self._buffer_bytes += size
+        self._flush_failed()
+    
+    def _flush_failed(self):
+        """写入失败：推迟下次缓冲区满时的重试，超出内存预算时溢出或丢弃最旧的事件"""
+        FLUSH_ERRORS.inc()
+        self._flush_retry_at = self.clock.time() + FLUSH_RETRY_DELAY
+        self._enforce_budget()
+        BUFFER_DEPTH.set(len(self.event_buffer))
+    
+    def _enforce_budget(self):
+        """
+        缓冲区超出内存预算时把开头（最旧）的事件溢出到磁盘，降到预算的LOW_WATERMARK以下
+
+        只在持有刷新锁时调用，采集线程只在缓冲区末尾追加，开头的事件在两次加锁之间不变，
+        溢出的磁盘写入不持有缓冲区锁。溢出也失败时丢弃这些事件。最近事件环的大小固定，不参与溢出。
+        """
+        with self._buffer_lock:
+            if not self.memory.over_budget(self._buffer_bytes):
+                return
+            excess = self.memory.excess(self._buffer_bytes)
+            removed = count = 0
+            for event in self.event_buffer:
+                if removed >= excess:
+                    break
+                removed += estimate_event_size(event)
+                count += 1
+            cold = self.event_buffer[:count]
+        if not count:
+            return
+        if self.memory.spill_events(cold):
+            logger.warning(f"超出内存预算，已将{count}个事件溢出到磁盘")
+        else:
+            for event in cold:
+                EVENTS_DROPPED.inc(labels=(event.get("type", ""), "memory_budget"))
+            logger.error(f"超出内存预算且无法溢出到磁盘，丢弃了{count}个最旧的事件")
+        with self._buffer_lock:
+            del self.event_buffer[:count]
+            self._buffer_bytes -= removed
+        self._update_memory_usage()
+    
+    def _after_write(self, events: List[Dict[str, Any]]):
+        """事件写入后更新指标，派生数据交给后台线程"""
+        BUFFER_DEPTH.set(len(self.event_buffer))
+        self._update_memory_usage()
+        # 刷新依次进行，刚写入的帧是存储的最后一帧；段号取自存储，索引文件写入失败也不会错位
+        frame = self.store.frame_count() - 1 if self.search_index is not None else None
+        self.derived.submit(events, frame)
+    
+    def _update_derived(self, events: List[Dict[str, Any]], frame: Optional[int]):
+        """后台线程：更新会话、时间汇总、热力图和搜索索引，按保存间隔保存时间汇总和热力图；空的帧只检查空闲"""
+        self._update_sessions(events)
+        if not events:
+            return
+        with TRACER.span("rollups"):
+            self.rollups.add(events)
+        with TRACER.span("heatmap"):
+            for event in events:
+                self.heatmap.update(event)
+        if self.clock.time() - self._aggregates_saved_at >= AGGREGATE_SAVE_INTERVAL:
+            self._save_aggregates()
+        
+        if self.search_index is not None:
+            try:
+                with TRACER.span("search_index"):
+                    self.search_index.add(events, frame)
+            except Exception as e:
+                logger.error(f"更新搜索索引失败: {str(e)}")
+    
+    def _save_aggregates(self):
+        """保存时间汇总和热力图"""
+        self._aggregates_saved_at = self.clock.time()
+        try:
+            self.rollups.save(self.rollup_path, self._derived_key())
+        except Exception as e:
+            logger.error(f"保存时间汇总失败: {str(e)}")
+        try:
+            with TRACER.span("heatmap_save"):
+                self.heatmap.save(self.heatmap_path, self._derived_key())
+        except Exception as e:
+            logger.error(f"保存热力图失败: {str(e)}")
+    
+    def _derived_key(self) -> Optional[bytes]:
+        """派生文件（时间汇总、热力图）与存储使用相同的密钥"""
+        return self.encryption_key if self.encryption else None
+    
+    def _update_sessions(self, events: List[Dict[str, Any]]):
+        """把已写入的事件交给会话切分引擎，保存已结束的派生记录"""
+        with TRACER.span("sessionize"):
+            records = self.sessionizer.feed(events, now=self.clock.time())
+        self._save_derived(records)
+    
+    def _save_derived(self, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        try:
+            self.derived_store.append(records)
+        except Exception as e:
+            logger.error(f"写入派生记录失败: {str(e)}")
     
     # 测试模式事件生成
     def _generate_test_events(self):
         """生成测试事件"""
-        event_types = ["mouse_move", "mouse_click", "key_press", "key_release", "mouse_scroll"]
-        buttons = ["left", "right", "middle"]
-        key_names = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j", "k", "l", "m", 
-                    "n", "o", "p", "q", "r", "s", "t", "u", "v", "w", "x", "y", "z",
-                    "space", "enter", "esc", "tab", "shift", "ctrl", "alt", "cmd"]
-        
-        screen_width, screen_height = 1920, 1080  # 假设的屏幕尺寸
-        
         while self.running:
-            # 随机选择事件类型
-            event_type = random.choice(event_types)
-            
-            # 生成随机位置
-            x = random.uniform(0, screen_width)
-            y = random.uniform(0, screen_height)
-            
-            if event_type == "mouse_move":
-                self._add_event("mouse_move", {
-                    "position": {"x": x, "y": y}
-                })
-            
-            elif event_type == "mouse_click":
-                button = random.choice(buttons)
-                state = random.choice(["pressed", "released"])
-                self._add_event("mouse_click", {
-                    "position": {"x": x, "y": y},
-                    "button": button,
-                    "state": state
-                })
-            
-            elif event_type == "mouse_scroll":
-                dx = random.uniform(-10, 10)
-                dy = random.uniform(-10, 10)
-                self._add_event("mouse_scroll", {
-                    "position": {"x": x, "y": y},
-                    "scroll_dx": dx,
-                    "scroll_dy": dy
-                })
-            
-            elif event_type == "key_press":
-                key_name = random.choice(key_names)
-                key_code = random.randint(1, 100)
-                self._add_event("key_press", {
-                    "key_code": key_code,
-                    "key_name": key_name,
-                    "state": "pressed",
-                    "modifiers": []
-                })
-            
-            elif event_type == "key_release":
-                key_name = random.choice(key_names)
-                key_code = random.randint(1, 100)
-                self._add_event("key_release", {
-                    "key_code": key_code,
-                    "key_name": key_name,
-                    "state": "released",
-                    "modifiers": []
-                })
+            self._add_event(*random_test_event())
             
             # 等待一段时间，与采样间隔相同
-            time.sleep(self.flush_interval)
+            self.clock.wait(self._stop_event, self.flush_interval)
     
\ No newline at end of file
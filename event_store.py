@@ -0,0 +1,717 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件存储模块
+
+该模块负责事件数据的磁盘存储。每次刷新缓冲区时向输出文件追加一帧（一行），
+并在旁路索引文件中记录该帧的偏移、长度、事件数和时间范围，
+从而支持按时间范围定位、流式读取和基于游标的分页查询。
+帧的时间范围不随写入顺序递增时（收集器合并多台主机的批次、重放缓存的旧批次），
+写入无序标记文件，读取时逐帧过滤，不再按时间提前停止或二分查找。
+帧可选zlib压缩，读取时自动识别。
+兼容旧版本写出的单个JSON文档格式（可加密）。
+"""
+
+import os
+import zlib
+import base64
+import struct
+import datetime
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Iterator, Iterable, Tuple, Union
+from cryptography.fernet import Fernet
+from metrics import REGISTRY
+from tracing import TRACER
+from codec import CODEC
+
+logger = logging.getLogger("event_store")
+
+# 存储指标
+BYTES_WRITTEN = REGISTRY.counter("store_bytes_written_total", "写入数据文件的字节数")
+FRAMES_WRITTEN = REGISTRY.counter("store_frames_written_total", "写入数据文件的帧数")
+ENCRYPTION_DURATION = REGISTRY.histogram("store_encryption_seconds", "加密一帧数据的耗时（秒）")
+
+# 索引记录格式：偏移(Q) 长度(I) 事件数(I) 最早时间(d) 最晚时间(d)
+INDEX_RECORD = struct.Struct("<QIIdd")
+INDEX_SUFFIX = ".idx"
+
+# 无序标记：存在时帧的时间范围不保证随帧号递增
+UNORDERED_SUFFIX = ".unordered"
+
+# 迁移旧格式文件时每帧包含的事件数
+LEGACY_MIGRATION_FRAME_SIZE = 1000
+
+# 压缩帧：明文时以该前缀加base64编码写入（保证一帧一行），加密时先压缩再加密
+COMPRESSED_PREFIX = b"z"
+COMPRESSION_LEVEL = 6
+
+# 单次查询返回的最大事件数
+MAX_QUERY_LIMIT = 1000
+
+# 并行解码时每个任务包含的帧数据量（字节），以及每个工作进程允许的在途任务数
+PARALLEL_CHUNK_BYTES = 1024 * 1024
+PARALLEL_INFLIGHT_PER_WORKER = 2
+
+
+def parse_timestamp(value: Union[str, float, int, None]) -> Optional[float]:
+    """将ISO时间字符串或数字转换为Unix时间戳（秒）"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    text = value.strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    dt = datetime.datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.timestamp()
+
+
+def encode_cursor(frame_no: int, event_idx: int) -> str:
+    """生成分页游标"""
+    return f"{frame_no}-{event_idx}"
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """解析分页游标"""
+    try:
+        frame_str, idx_str = cursor.split("-", 1)
+        frame_no, event_idx = int(frame_str), int(idx_str)
+    except (ValueError, AttributeError):
+        raise ValueError(f"无效的游标: {cursor}")
+    if frame_no < 0 or event_idx < 0:
+        raise ValueError(f"无效的游标: {cursor}")
+    return frame_no, event_idx
+
+
+class EventStore:
+    """追加写入的事件存储，每次刷新写入一帧"""
+
+    def __init__(self, path: str, encryption_key: Optional[bytes] = None, compress: bool = False):
+        """
+        初始化事件存储
+
+        Args:
+            path: 数据文件路径
+            encryption_key: Fernet密钥，为None时以明文存储
+            compress: 写入的帧是否压缩，读取时不论该参数都能识别压缩帧
+        """
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.unordered_path = path + UNORDERED_SUFFIX
+        self.encryption_key = encryption_key
+        self.compress = compress
+        self._fernet = Fernet(encryption_key) if encryption_key else None
+        self._write_lock = threading.Lock()
+        self._checked = False
+
+    # ------------------------------------------------------------------
+    # 编解码
+    # ------------------------------------------------------------------
+
+    def _encode_frame(self, events: List[Dict[str, Any]]) -> bytes:
+        """将一批事件编码为一行帧数据"""
+        with TRACER.span("serialize"):
+            payload = CODEC.dumps(events)
+        if self.compress:
+            with TRACER.span("compress"):
+                payload = zlib.compress(payload, COMPRESSION_LEVEL)
+        if self._fernet:
+            encrypt_start = time.perf_counter()
+            with TRACER.span("encrypt"):
+                payload = self._fernet.encrypt(payload)
+            ENCRYPTION_DURATION.observe(time.perf_counter() - encrypt_start)
+        elif self.compress:
+            payload = COMPRESSED_PREFIX + base64.b64encode(payload)
+        return payload + b"\n"
+
+    def _decode_frame(self, raw: bytes) -> List[Dict[str, Any]]:
+        """解码一行帧数据"""
+        return _decode_raw(self._fernet, raw)
+
+    @staticmethod
+    def _time_range(events: List[Dict[str, Any]]) -> Tuple[float, float]:
+        """计算一批事件的时间范围"""
+        times = []
+        for event in events:
+            try:
+                ts = parse_timestamp(event.get("timestamp"))
+            except (ValueError, TypeError):
+                ts = None
+            if ts is not None:
+                times.append(ts)
+        if not times:
+            return 0.0, 0.0
+        return min(times), max(times)
+
+    # ------------------------------------------------------------------
+    # 格式检测与恢复
+    # ------------------------------------------------------------------
+
+    def _data_size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def is_legacy(self) -> bool:
+        """判断数据文件是否为旧版本的单个JSON文档格式"""
+        if os.path.exists(self.index_path) or self._data_size() == 0:
+            return False
+        with open(self.path, "rb") as f:
+            head = f.readline().strip()
+        if not head:
+            return False
+        if head.startswith(b"{"):
+            return True
+        if head.startswith(b"["):
+            return False
+        if self._fernet:
+            try:
+                return self._fernet.decrypt(head).lstrip().startswith(b"{")
+            except Exception:
+                return False
+        return False
+
+    def _load_legacy(self) -> List[Dict[str, Any]]:
+        """读取旧格式文件的全部事件（旧格式无法流式读取）"""
+        with open(self.path, "rb") as f:
+            content = f.read()
+        if self._fernet and not content.lstrip().startswith(b"{"):
+            content = self._fernet.decrypt(content.strip())
+        return CODEC.loads(content).get("events", [])
+
+    def _scan_records(self) -> Iterator[Tuple[int, int, int, float, float]]:
+        """扫描数据文件重建索引记录，忽略末尾不完整的行"""
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    events = self._decode_frame(line)
+                except Exception as e:
+                    logger.error(f"解析第{offset}字节处的帧失败: {str(e)}")
+                    offset += len(line)
+                    continue
+                t_min, t_max = self._time_range(events)
+                yield (offset, len(line), len(events), t_min, t_max)
+                offset += len(line)
+
+    def _complete_size(self) -> int:
+        """返回数据文件中最后一个完整行的结束位置"""
+        size = self._data_size()
+        with open(self.path, "rb") as f:
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                block = f.read(step)
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    return pos - step + newline + 1
+                pos -= step
+        return 0
+
+    def _last_record(self) -> Optional[Tuple[int, int, int, float, float]]:
+        """读取索引文件中最后一条完整的记录，没有记录时返回None"""
+        try:
+            count = os.path.getsize(self.index_path) // INDEX_RECORD.size
+        except OSError:
+            return None
+        if count == 0:
+            return None
+        with open(self.index_path, "rb") as f:
+            f.seek((count - 1) * INDEX_RECORD.size)
+            return INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))
+
+    def _index_consistent(self) -> bool:
+        """检查索引文件与数据文件是否一致"""
+        if not os.path.exists(self.index_path):
+            return self._data_size() == 0
+        if os.path.getsize(self.index_path) % INDEX_RECORD.size:
+            return False
+        last = self._last_record()
+        if last is None:
+            return self._data_size() == 0
+        offset, length, _, _, _ = last
+        return offset + length == self._data_size()
+
+    def _index_readable(self) -> bool:
+        """检查索引是否可供读取（写入过程中数据文件可能领先于索引）"""
+        if not os.path.exists(self.index_path):
+            return self._data_size() == 0
+        last = self._last_record()
+        if last is None:
+            return True
+        offset, length, _, _, _ = last
+        return offset + length <= self._data_size()
+
+    def is_ordered(self) -> bool:
+        """帧的时间范围是否随帧号递增（可以按时间提前停止和二分查找）"""
+        return not os.path.exists(self.unordered_path)
+
+    def _mark_unordered(self):
+        if self.is_ordered():
+            logger.info(f"帧不再按时间顺序写入，读取时将逐帧过滤: {self.path}")
+            with open(self.unordered_path, "wb"):
+                pass
+
+    def _check_order(self, records: List[Tuple[int, int, int, float, float]]):
+        """重建索引后检查帧的顺序，必要时写入无序标记"""
+        if not _records_ordered(records):
+            self._mark_unordered()
+
+    def _prepare_for_append(self):
+        """首次写入前迁移旧格式文件并修复索引"""
+        output_dir = os.path.dirname(os.path.abspath(self.path))
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+        if self.is_legacy():
+            self._migrate_legacy()
+        elif not self._index_consistent():
+            logger.warning(f"索引文件与数据不一致，正在重建: {self.index_path}")
+            records = list(self._scan_records())
+            end = self._complete_size()
+            if end != self._data_size():
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+            with open(self.index_path, "wb") as f:
+                for record in records:
+                    f.write(INDEX_RECORD.pack(*record))
+            self._check_order(records)
+        self._checked = True
+
+    def _migrate_legacy(self):
+        """将旧格式文件转换为分帧格式"""
+        events = self._load_legacy()
+        tmp_path = self.path + ".migrating"
+        tmp_index = tmp_path + INDEX_SUFFIX
+        offset = 0
+        records = []
+        with open(tmp_path, "wb") as data_file, open(tmp_index, "wb") as index_file:
+            for i in range(0, len(events), LEGACY_MIGRATION_FRAME_SIZE):
+                chunk = events[i:i + LEGACY_MIGRATION_FRAME_SIZE]
+                line = self._encode_frame(chunk)
+                t_min, t_max = self._time_range(chunk)
+                data_file.write(line)
+                records.append((offset, len(line), len(chunk), t_min, t_max))
+                index_file.write(INDEX_RECORD.pack(*records[-1]))
+                offset += len(line)
+        self._check_order(records)
+        os.replace(tmp_index, self.index_path)
+        os.replace(tmp_path, self.path)
+        logger.info(f"已将旧格式文件迁移为分帧格式，共{len(events)}个事件")
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def append(self, events: List[Dict[str, Any]], sync: bool = False) -> int:
+        """
+        追加一帧事件
+
+        Args:
+            events: 事件列表
+            sync: 返回前是否将数据和索引同步到磁盘
+
+        Returns:
+            写入的字节数
+        """
+        if not events:
+            return 0
+        line = self._encode_frame(events)
+        t_min, t_max = self._time_range(events)
+
+        with self._write_lock:
+            if not self._checked:
+                self._prepare_for_append()
+            offset = self._data_size()
+            # 无序标记先于该帧写入，读取方看到该帧时一定也能看到标记
+            last = self._last_record()
+            if last is not None and not _records_ordered([last, (offset, 0, 0, t_min, t_max)]):
+                self._mark_unordered()
+            # 先写数据再写索引，索引中出现的帧一定是完整的
+            with TRACER.span("disk_write"):
+                with open(self.path, "ab") as f:
+                    f.write(line)
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                with open(self.index_path, "ab") as f:
+                    f.write(INDEX_RECORD.pack(offset, len(line), len(events), t_min, t_max))
+                    if sync:
+                        f.flush()
+                        os.fsync(f.fileno())
+        BYTES_WRITTEN.inc(len(line))
+        FRAMES_WRITTEN.inc()
+        return len(line)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def _index(self) -> "_FrameIndex":
+        """获取当前索引的只读视图"""
+        if self.is_legacy():
+            return _LegacyIndex(self)
+        if not os.path.exists(self.index_path) and self._data_size() == 0:
+            return _ScannedIndex(self, [])
+        if not self._index_readable():
+            return _ScannedIndex(self, list(self._scan_records()))
+        return _FileIndex(self)
+
+    def delete(self):
+        """删除数据文件、索引和无序标记，之后仍可继续追加写入"""
+        with self._write_lock:
+            for path in (self.path, self.index_path, self.unordered_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._checked = False
+
+    def recover(self) -> int:
+        """迁移旧格式文件、修复索引并截掉末尾不完整的写入，返回完整的帧数"""
+        with self._write_lock:
+            self._prepare_for_append()
+        return self.frame_count()
+
+    def frame_count(self) -> int:
+        """返回已写入的帧数"""
+        with self._index() as index:
+            return len(index)
+
+    def event_count(self) -> int:
+        """返回已写入的事件总数（只读取索引）"""
+        with self._index() as index:
+            return sum(index.record(i)[2] for i in range(len(index)))
+
+    def read_frame(self, frame_no: int, data_file=None) -> List[Dict[str, Any]]:
+        """读取指定帧的全部事件"""
+        with self._index() as index:
+            return index.read(frame_no, data_file)
+
+    def iter_frames(self, start_frame: int = 0, workers: int = 1) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """
+        按写入顺序逐帧读取，返回(帧号, 事件列表)
+
+        Args:
+            start_frame: 起始帧号
+            workers: 解码（解密）使用的进程数，大于1时并行解码，结果顺序不变
+        """
+        if _effective_workers(workers) > 1:
+            yield from self._iter_parallel(None, None, None, workers, start_frame)
+            return
+        with self._index() as index:
+            if start_frame >= len(index):
+                return
+            with open(self.path, "rb") as data_file:
+                for frame_no in range(start_frame, len(index)):
+                    yield frame_no, index.read(frame_no, data_file)
+
+    def iter_events(self,
+                    start: Optional[float] = None,
+                    end: Optional[float] = None,
+                    types: Optional[Iterable[str]] = None,
+                    workers: int = 1) -> Iterator[Dict[str, Any]]:
+        """
+        按时间范围和类型流式读取事件
+
+        workers大于1时由进程池并行解码和过滤，按写入顺序返回
+        """
+        if _effective_workers(workers) > 1:
+            for _, events in self._iter_parallel(start, end, types, workers):
+                yield from events
+            return
+        for _, event in self._scan(start, end, types, None, None, 0, 0):
+            yield event
+
+    def _iter_parallel(self, start, end, types, workers, start_frame=0):
+        """
+        用进程池解码匹配时间范围的帧，返回(帧号, 匹配的事件)
+
+        按数据量把连续的帧分组提交，在途任务数有上限，
+        读取速度超过消费速度时暂停读取，内存占用保持有界。
+        """
+        types = set(types) if types else None
+        workers = _effective_workers(workers)
+        with self._index() as index:
+            if isinstance(index, _LegacyIndex):
+                # 旧格式只有一个文档，无法拆分
+                if start_frame == 0:
+                    yield 0, [e for e in index.read(0) if _matches(e, start, end, types, None, None)]
+                return
+            if start is not None:
+                start_frame = max(start_frame, index.first_frame_ending_after(start))
+            if start_frame >= len(index):
+                return
+
+            max_inflight = workers * PARALLEL_INFLIGHT_PER_WORKER
+            with open(self.path, "rb") as data_file, ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                frame_nos, raws, size = [], [], 0
+                for current in range(start_frame, len(index)):
+                    offset, length, _, t_min, t_max = index.record(current)
+                    if end is not None and t_min >= end:
+                        if index.ordered:
+                            break
+                        continue
+                    if start is not None and t_max < start:
+                        continue
+                    data_file.seek(offset)
+                    raws.append(data_file.read(length))
+                    frame_nos.append(current)
+                    size += length
+                    if size < PARALLEL_CHUNK_BYTES:
+                        continue
+                    pending.append((frame_nos, pool.submit(_decode_chunk, self.encryption_key, raws,
+                                                           start, end, types)))
+                    frame_nos, raws, size = [], [], 0
+                    while len(pending) >= max_inflight:
+                        chunk_frames, future = pending.popleft()
+                        yield from zip(chunk_frames, future.result())
+                if raws:
+                    pending.append((frame_nos, pool.submit(_decode_chunk, self.encryption_key, raws,
+                                                           start, end, types)))
+                while pending:
+                    chunk_frames, future = pending.popleft()
+                    yield from zip(chunk_frames, future.result())
+
+    def query(self,
+              start: Optional[float] = None,
+              end: Optional[float] = None,
+              types: Optional[Iterable[str]] = None,
+              app: Optional[str] = None,
+              title: Optional[str] = None,
+              cursor: Optional[str] = None,
+              limit: int = 100) -> Dict[str, Any]:
+        """
+        分页查询历史事件
+
+        Args:
+            start: 起始时间（含），Unix时间戳
+            end: 结束时间（不含），Unix时间戳
+            types: 事件类型集合
+            app: 应用名称（不区分大小写的精确匹配）
+            title: 窗口标题子串（不区分大小写）
+            cursor: 上一页返回的游标
+            limit: 每页事件数
+
+        Returns:
+            包含events和next_cursor的字典，next_cursor为None表示没有更多数据
+        """
+        limit = max(1, min(int(limit), MAX_QUERY_LIMIT))
+        frame_no, event_idx = decode_cursor(cursor) if cursor else (None, 0)
+
+        events = []
+        next_cursor = None
+        for position, event in self._scan(start, end, types, app, title, frame_no, event_idx):
+            if len(events) == limit:
+                next_cursor = encode_cursor(*position)
+                break
+            events.append(event)
+        return {"events": events, "next_cursor": next_cursor}
+
+    def _scan(self, start, end, types, app, title, frame_no, event_idx):
+        """扫描匹配的事件，返回((帧号, 帧内序号), 事件)"""
+        types = set(types) if types else None
+        app = app.lower() if app else None
+        title = title.lower() if title else None
+
+        with self._index() as index:
+            if frame_no is None:
+                frame_no = index.first_frame_ending_after(start) if start is not None else 0
+                event_idx = 0
+            if frame_no >= len(index):
+                return
+            with open(self.path, "rb") as data_file:
+                for current in range(frame_no, len(index)):
+                    _, _, _, t_min, t_max = index.record(current)
+                    # 帧按写入时间递增时，超过结束时间即可停止
+                    if end is not None and t_min >= end:
+                        if index.ordered:
+                            break
+                        continue
+                    if start is not None and t_max < start:
+                        continue
+                    frame = index.read(current, data_file)
+                    for i in range(event_idx if current == frame_no else 0, len(frame)):
+                        event = frame[i]
+                        if _matches(event, start, end, types, app, title):
+                            yield (current, i), event
+
+
+def _records_ordered(records: List[Tuple[int, int, int, float, float]]) -> bool:
+    """检查索引记录的最早时间和最晚时间是否都随帧号递增（不减）"""
+    for previous, record in zip(records, records[1:]):
+        if record[3] < previous[3] or record[4] < previous[4]:
+            return False
+    return True
+
+
+def _effective_workers(workers: int) -> int:
+    """解码进程数不超过CPU核数，多出的进程只会增加调度和传输开销"""
+    return max(1, min(int(workers), os.cpu_count() or 1))
+
+
+def _decode_raw(fernet: Optional[Fernet], raw: bytes) -> List[Dict[str, Any]]:
+    """解码（解密）一行帧数据"""
+    raw = raw.strip()
+    if fernet:
+        raw = fernet.decrypt(raw)
+    elif raw.startswith(COMPRESSED_PREFIX):
+        raw = base64.b64decode(raw[len(COMPRESSED_PREFIX):])
+    if not raw.startswith(b"["):
+        # JSON帧以"["开头，其余为zlib压缩的帧
+        raw = zlib.decompress(raw)
+    return CODEC.decode_events(raw)
+
+
+def _decode_chunk(encryption_key: Optional[bytes], raws: List[bytes], start, end, types) -> List[List[Dict[str, Any]]]:
+    """在工作进程中解码一组帧，只返回满足过滤条件的事件"""
+    fernet = Fernet(encryption_key) if encryption_key else None
+    filtered = start is not None or end is not None or types is not None
+    frames = []
+    for raw in raws:
+        events = _decode_raw(fernet, raw)
+        if filtered:
+            events = [e for e in events if _matches(e, start, end, types, None, None)]
+        frames.append(events)
+    return frames
+
+
+def _matches(event, start, end, types, app, title) -> bool:
+    """判断事件是否满足过滤条件"""
+    if types is not None and event.get("type") not in types:
+        return False
+    if start is not None or end is not None:
+        try:
+            ts = parse_timestamp(event.get("timestamp"))
+        except (ValueError, TypeError):
+            return False
+        if ts is None:
+            return False
+        if start is not None and ts < start:
+            return False
+        if end is not None and ts >= end:
+            return False
+    if app is not None or title is not None:
+        window = event.get("window") or {}
+        if app is not None and str(window.get("app_name", "")).lower() != app:
+            return False
+        if title is not None and title not in str(window.get("window_title", "")).lower():
+            return False
+    return True
+
+
+class _FrameIndex:
+    """帧索引的只读视图基类"""
+
+    # 帧的时间范围是否随帧号递增
+    ordered = True
+
+    def __init__(self, store: EventStore):
+        self.store = store
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def record(self, frame_no: int) -> Tuple[int, int, int, float, float]:
+        raise NotImplementedError
+
+    def first_frame_ending_after(self, start: float) -> int:
+        """二分查找第一个最晚时间不早于start的帧，帧无序时从头开始"""
+        if not self.ordered:
+            return 0
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.record(mid)[4] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def read(self, frame_no: int, data_file=None) -> List[Dict[str, Any]]:
+        offset, length, _, _, _ = self.record(frame_no)
+        if data_file is None:
+            with open(self.store.path, "rb") as f:
+                f.seek(offset)
+                return self.store._decode_frame(f.read(length))
+        data_file.seek(offset)
+        return self.store._decode_frame(data_file.read(length))
+
+
+class _FileIndex(_FrameIndex):
+    """基于索引文件的视图，记录定长，可随机访问"""
+
+    def __init__(self, store: EventStore):
+        super().__init__(store)
+        self._file = open(store.index_path, "rb")
+        # 只读取打开时已完整写入的记录，保证与并发写入隔离
+        self._count = os.fstat(self._file.fileno()).st_size // INDEX_RECORD.size
+        # 在确定记录数之后检查标记：标记先于帧写入
+        self.ordered = store.is_ordered()
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, frame_no: int) -> Tuple[int, int, int, float, float]:
+        self._file.seek(frame_no * INDEX_RECORD.size)
+        return INDEX_RECORD.unpack(self._file.read(INDEX_RECORD.size))
+
+
+class _ScannedIndex(_FrameIndex):
+    """索引文件缺失或损坏时由扫描数据文件得到的内存索引"""
+
+    def __init__(self, store: EventStore, records: List[Tuple[int, int, int, float, float]]):
+        super().__init__(store)
+        self._records = records
+        self.ordered = store.is_ordered() and _records_ordered(records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def record(self, frame_no: int) -> Tuple[int, int, int, float, float]:
+        return self._records[frame_no]
+
+
+class _LegacyIndex(_FrameIndex):
+    """旧格式文件视为仅包含一帧"""
+
+    def __init__(self, store: EventStore):
+        super().__init__(store)
+        self._events = store._load_legacy()
+        t_min, t_max = EventStore._time_range(self._events)
+        self._record = (0, 0, len(self._events), t_min, t_max)
+
+    def __len__(self) -> int:
+        return 1
+
+    def record(self, frame_no: int) -> Tuple[int, int, int, float, float]:
+        return self._record
+
+    def read(self, frame_no: int, data_file=None) -> List[Dict[str, Any]]:
+        return self._events
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件传输编码模块
+
+该模块将一批事件编码为紧凑的列式二进制帧，用于通过Socket.IO推送到浏览器。
+相同的字符串（事件类型、应用名、窗口标题等）在一帧内只存储一次，
+可选对帧体进行zlib压缩。对应的JavaScript解码器位于index.html。
+
+帧格式（小端）:
+    magic   4字节 b"MBE1"
+    flags   uint8，bit0表示帧体经过zlib压缩
+    帧体:
+        count       uint32 事件数
+        n_strings   uint32 字符串表长度
+        strings     n_strings × (uint16 长度 + UTF-8字节)
+        seq         uint32[count]
+        timestamp   float64[count] Unix时间戳（秒）
+        type        uint16[count] 字符串表下标
+        app_name    uint16[count]
+        window_title uint16[count]
+        window_id   uint16[count]
+        x, y        float32[count] 无位置时为NaN
+        extra       uint16[count] 其余字段的紧凑JSON，NO_STRING表示没有
+"""
+
+import json
+import math
+import struct
+import zlib
+import datetime
+from typing import Dict, List, Any
+from event_store import parse_timestamp
+
+MAGIC = b"MBE1"
+FLAG_ZLIB = 0x01
+
+# 字符串表中表示“无”的下标
+NO_STRING = 0xFFFF
+
+# 单帧最多包含的事件数，保证字符串下标不会超过uint16
+MAX_BATCH_SIZE = 4096
+
+# 已经单独成列的字段，其余字段放入extra
+_COLUMN_FIELDS = ("type", "timestamp", "seq", "window", "position", "screen_id")
+
+
+class _StringTable:
+    """帧内字符串去重表"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def add(self, value: Any) -> int:
+        if value is None:
+            return NO_STRING
+        value = str(value)
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self.index[value] = idx
+            raw = value.encode("utf-8")
+            if len(raw) > 0xFFFF:
+                # 超长字符串按UTF-8字节截断
+                raw = raw[:0xFFFF].decode("utf-8", "ignore").encode("utf-8")
+            self.strings.append(raw)
+        return idx
+
+
+def encode_batch(events: List[Dict[str, Any]], compress: bool = False) -> bytes:
+    """
+    将一批事件编码为二进制帧
+
+    Args:
+        events: 事件列表，长度不能超过MAX_BATCH_SIZE
+        compress: 是否压缩帧体
+
+    Returns:
+        二进制帧
+    """
+    if len(events) > MAX_BATCH_SIZE:
+        raise ValueError(f"单帧事件数不能超过{MAX_BATCH_SIZE}")
+
+    table = _StringTable()
+    count = len(events)
+    seqs, stamps, types, apps, titles, window_ids, xs, ys, extras = ([] for _ in range(9))
+
+    for event in events:
+        window = event.get("window") or {}
+        position = event.get("position") or {}
+        seqs.append(int(event.get("seq", 0)) & 0xFFFFFFFF)
+        try:
+            stamps.append(parse_timestamp(event.get("timestamp")) or 0.0)
+        except (ValueError, TypeError):
+            stamps.append(0.0)
+        types.append(table.add(event.get("type")))
+        apps.append(table.add(window.get("app_name")))
+        titles.append(table.add(window.get("window_title")))
+        window_ids.append(table.add(window.get("window_id")))
+        xs.append(float(position.get("x", math.nan)))
+        ys.append(float(position.get("y", math.nan)))
+        extra = {k: v for k, v in event.items() if k not in _COLUMN_FIELDS}
+        extras.append(table.add(json.dumps(extra, ensure_ascii=False, separators=(",", ":")))
+                      if extra else NO_STRING)
+
+    parts = [struct.pack("<II", count, len(table.strings))]
+    for raw in table.strings:
+        parts.append(struct.pack("<H", len(raw)))
+        parts.append(raw)
+    parts.append(struct.pack(f"<{count}I", *seqs))
+    parts.append(struct.pack(f"<{count}d", *stamps))
+    for column in (types, apps, titles, window_ids):
+        parts.append(struct.pack(f"<{count}H", *column))
+    parts.append(struct.pack(f"<{count}f", *xs))
+    parts.append(struct.pack(f"<{count}f", *ys))
+    parts.append(struct.pack(f"<{count}H", *extras))
+    body = b"".join(parts)
+
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+    return MAGIC + struct.pack("<B", flags) + body
+
+
+def decode_batch(data: bytes) -> List[Dict[str, Any]]:
+    """将二进制帧解码为事件列表（与index.html中的解码器一致）"""
+    if data[:4] != MAGIC:
+        raise ValueError("无效的事件帧")
+    flags = data[4]
+    body = data[5:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    count, n_strings = struct.unpack_from("<II", body, 0)
+    offset = 8
+    strings = []
+    for _ in range(n_strings):
+        (length,) = struct.unpack_from("<H", body, offset)
+        offset += 2
+        strings.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    def column(fmt, size):
+        nonlocal offset
+        values = struct.unpack_from(f"<{count}{fmt}", body, offset)
+        offset += size * count
+        return values
+
+    def lookup(idx):
+        return None if idx == NO_STRING else strings[idx]
+
+    seqs = column("I", 4)
+    stamps = column("d", 8)
+    types, apps, titles, window_ids = (column("H", 2) for _ in range(4))
+    xs = column("f", 4)
+    ys = column("f", 4)
+    extras = column("H", 2)
+
+    events = []
+    for i in range(count):
+        event = {
+            "type": lookup(types[i]),
+            "timestamp": datetime.datetime.fromtimestamp(stamps[i], datetime.timezone.utc).isoformat(),
+            "seq": seqs[i],
+            "screen_id": 0,
+            "window": {
+                "window_id": lookup(window_ids[i]),
+                "app_name": lookup(apps[i]),
+                "window_title": lookup(titles[i])
+            }
+        }
+        if not math.isnan(xs[i]):
+            event["position"] = {"x": xs[i], "y": ys[i]}
+        if extras[i] != NO_STRING:
+            event.update(json.loads(strings[extras[i]]))
+        events.append(event)
+    return events
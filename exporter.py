@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 数据导出模块
+
+该模块把事件存储中的数据流式导出为JSON、JSONL或CSV格式，可选gzip压缩。
+导出时逐帧读取、逐块输出，内存占用与历史数据的大小无关，
+既可写入文件，也可作为HTTP分块响应的数据源。
+
+用法:
+    python exporter.py output.json -o events.csv.gz
+    python exporter.py output.json -o events.jsonl --from 2026-01-01T00:00:00 --types mouse_click,key_press
+    python exporter.py output.json -o - --format jsonl --encrypted > events.jsonl
+    python exporter.py output.json -o events.json --pretty
+"""
+
+import io
+import os
+import sys
+import csv
+import zlib
+import logging
+import argparse
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple, BinaryIO
+from codec import CODEC
+
+logger = logging.getLogger("exporter")
+
+# 支持的导出格式
+EXPORT_FORMATS = ("json", "jsonl", "csv")
+
+# 输出块大小（字节），累积到该大小后才编码、压缩并输出
+CHUNK_SIZE = 64 * 1024
+
+# CSV固定列，其余字段以JSON形式放入extra列；host为合并多机记录时添加的来源主机
+CSV_COLUMNS = ["seq", "timestamp", "type", "app_name", "window_title", "window_id", "screen_id",
+               "x", "y", "button", "state", "key_name", "key_code", "modifiers",
+               "scroll_dx", "scroll_dy", "host", "extra"]
+_CSV_KNOWN_KEYS = {"seq", "timestamp", "type", "window", "screen_id", "position", "button", "state",
+                   "key_name", "key_code", "modifiers", "scroll_dx", "scroll_dy", "host"}
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8"
+}
+
+
+def format_from_filename(filename: str) -> Tuple[str, bool]:
+    """
+    根据文件名推断导出格式
+
+    Returns:
+        (格式, 是否gzip压缩)
+
+    Raises:
+        ValueError: 扩展名不是支持的导出格式
+    """
+    name = filename.lower()
+    compress = name.endswith(".gz")
+    if compress:
+        name = name[:-3]
+    ext = os.path.splitext(name)[1].lstrip(".")
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {filename}")
+    return ext, compress
+
+
+def content_type(fmt: str, compress: bool = False) -> str:
+    """导出数据的Content-Type"""
+    return "application/gzip" if compress else CONTENT_TYPES[fmt]
+
+
+def csv_row(event: Dict[str, Any]) -> List[Any]:
+    """将一个事件展开为CSV行"""
+    window = event.get("window") or {}
+    position = event.get("position") or {}
+    modifiers = event.get("modifiers")
+    extra = {k: v for k, v in event.items() if k not in _CSV_KNOWN_KEYS}
+    return [
+        event.get("seq", ""), event.get("timestamp", ""), event.get("type", ""),
+        window.get("app_name", ""), window.get("window_title", ""), window.get("window_id", ""),
+        event.get("screen_id", ""), position.get("x", ""), position.get("y", ""),
+        event.get("button", ""), event.get("state", ""), event.get("key_name", ""), event.get("key_code", ""),
+        "+".join(modifiers) if modifiers else "",
+        event.get("scroll_dx", ""), event.get("scroll_dy", ""), event.get("host", ""),
+        CODEC.dumps(extra).decode("utf-8") if extra else ""
+    ]
+
+
+def iter_text(events: Iterable[Dict[str, Any]], fmt: str, pretty: bool = False) -> Iterator[str]:
+    """逐个事件生成导出文本片段，pretty只对json格式有效"""
+    if fmt == "jsonl":
+        for event in events:
+            yield CODEC.dumps(event).decode("utf-8") + "\n"
+    elif fmt == "json":
+        # 与/api/save原有的{"events": [...]}结构相同，默认每行一个紧凑的事件
+        dumps = CODEC.dumps_pretty if pretty else CODEC.dumps
+        yield '{"events": [\n'
+        separator = ""
+        for event in events:
+            yield separator + dumps(event).decode("utf-8")
+            separator = ",\n"
+        yield "\n]}\n"
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for event in events:
+            writer.writerow(csv_row(event))
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def iter_export(events: Iterable[Dict[str, Any]], fmt: str = "jsonl", compress: bool = False,
+                chunk_size: int = CHUNK_SIZE, pretty: bool = False) -> Iterator[bytes]:
+    """
+    将事件流编码为导出数据块
+
+    Args:
+        events: 事件迭代器，逐个消费
+        fmt: 导出格式，json、jsonl或csv
+        compress: 是否输出gzip格式
+        chunk_size: 每个输出块的目标大小（字节）
+        pretty: json格式是否缩进，供人直接阅读的导出使用
+
+    Returns:
+        字节块迭代器
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    # wbits=31 输出带gzip头的数据流
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending: List[str] = []
+    size = 0
+    for text in iter_text(events, fmt, pretty):
+        pending.append(text)
+        size += len(text)
+        if size >= chunk_size:
+            data = "".join(pending).encode("utf-8")
+            pending, size = [], 0
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = "".join(pending).encode("utf-8")
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+class _Counted:
+    """统计已消费事件数的迭代器包装"""
+
+    def __init__(self, events: Iterable[Dict[str, Any]]):
+        self._events = iter(events)
+        self.count = 0
+
+    def __iter__(self):
+        for event in self._events:
+            self.count += 1
+            yield event
+
+
+def write_export(events: Iterable[Dict[str, Any]], output: BinaryIO, fmt: str = "jsonl",
+                 compress: bool = False, pretty: bool = False) -> int:
+    """将事件流写入二进制文件对象，返回导出的事件数"""
+    counted = _Counted(events)
+    for chunk in iter_export(counted, fmt, compress, pretty=pretty):
+        output.write(chunk)
+    return counted.count
+
+
+def export_store(store, path: str, fmt: Optional[str] = None, compress: Optional[bool] = None,
+                 start: Optional[float] = None, end: Optional[float] = None,
+                 types: Optional[Iterable[str]] = None, workers: int = 1, pretty: bool = False) -> int:
+    """
+    将事件存储导出到文件，先写临时文件再替换，中途失败不会留下不完整的文件
+
+    Args:
+        store: EventStore实例
+        path: 输出文件路径
+        fmt: 导出格式，为None时根据文件名推断
+        compress: 是否gzip压缩，为None时根据文件名推断
+        start: 起始时间（含），Unix时间戳
+        end: 结束时间（不含），Unix时间戳
+        types: 事件类型过滤
+        workers: 解码（解密）使用的进程数
+        pretty: json格式是否缩进
+
+    Returns:
+        导出的事件数
+    """
+    if fmt is None or compress is None:
+        inferred_fmt, inferred_compress = format_from_filename(path)
+        fmt = fmt or inferred_fmt
+        compress = inferred_compress if compress is None else compress
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            count = write_export(store.iter_events(start, end, types, workers=workers), f, fmt, compress, pretty)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info(f"已导出{count}个事件到: {path}")
+    return count
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 数据导出",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", type=str, help="事件数据文件路径")
+    parser.add_argument("-o", "--output", type=str, required=True, help="输出文件路径，-表示标准输出")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="导出格式，默认根据输出文件名推断")
+    parser.add_argument("--gzip", action="store_true", help="使用gzip压缩（输出文件名以.gz结尾时自动启用）")
+    parser.add_argument("--from", dest="start", type=str, help="起始时间（ISO格式或Unix时间戳）")
+    parser.add_argument("--to", dest="end", type=str, help="结束时间（ISO格式或Unix时间戳）")
+    parser.add_argument("--types", type=str, help="只导出指定类型的事件，逗号分隔")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件由本机加密写入")
+    parser.add_argument("--workers", type=int, default=1, help="并行解码（解密）使用的进程数")
+    parser.add_argument("--pretty", action="store_true", help="json格式缩进输出，便于阅读")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import EventStore, parse_timestamp
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        start = parse_timestamp(args.start)
+        end = parse_timestamp(args.end)
+    except ValueError:
+        logger.error("无效的时间范围")
+        return 1
+    types = [t.strip() for t in (args.types or "").split(",") if t.strip()] or None
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    store = EventStore(args.input, key)
+
+    if args.output == "-":
+        if not args.format:
+            logger.error("输出到标准输出时需要指定--format")
+            return 1
+        count = write_export(store.iter_events(start, end, types, workers=args.workers), sys.stdout.buffer,
+                             args.format, args.gzip, args.pretty)
+        sys.stdout.buffer.flush()
+        logger.info(f"已导出{count}个事件")
+        return 0
+
+    try:
+        inferred_fmt, inferred_compress = format_from_filename(args.output)
+    except ValueError:
+        if not args.format:
+            logger.error("无法根据输出文件名推断格式，请指定--format")
+            return 1
+        inferred_fmt, inferred_compress = args.format, False
+    export_store(store, args.output, args.format or inferred_fmt, args.gzip or inferred_compress,
+                 start, end, types, workers=args.workers, pretty=args.pretty)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 鼠标热力图模块
+
+该模块在服务端增量维护鼠标位置的二维直方图，按事件类型和应用分别统计。
+每个事件只需一次计数，返回给前端的数据大小与记录的事件数量无关。
+安装NumPy时使用NumPy数组，否则回退到标准库array。
+"""
+
+import os
+import sys
+import base64
+import logging
+import threading
+from array import array
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from cryptography.fernet import Fernet
+from codec import CODEC
+
+logger = logging.getLogger("heatmap")
+
+NUMPY_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+
+# 默认网格分辨率（16:9）
+DEFAULT_GRID_SIZE = (64, 36)
+
+# 热力图文件后缀
+HEATMAP_SUFFIX = ".heatmap.json"
+
+
+class HeatmapAggregator:
+    """固定分辨率的鼠标位置直方图，按(事件类型, 应用)分组"""
+
+    def __init__(self,
+                 screen_width: float = 1920,
+                 screen_height: float = 1080,
+                 grid_width: int = DEFAULT_GRID_SIZE[0],
+                 grid_height: int = DEFAULT_GRID_SIZE[1],
+                 use_numpy: Optional[bool] = None):
+        """
+        初始化热力图聚合器
+
+        Args:
+            screen_width: 屏幕宽度（点）
+            screen_height: 屏幕高度（点）
+            grid_width: 水平方向的格子数
+            grid_height: 垂直方向的格子数
+            use_numpy: 是否使用NumPy，为None时自动检测
+        """
+        self.screen_width = max(1.0, float(screen_width))
+        self.screen_height = max(1.0, float(screen_height))
+        self.grid_width = max(1, int(grid_width))
+        self.grid_height = max(1, int(grid_height))
+        self.use_numpy = NUMPY_AVAILABLE if use_numpy is None else (use_numpy and NUMPY_AVAILABLE)
+
+        self._bins: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._x_scale = self.grid_width / self.screen_width
+        self._y_scale = self.grid_height / self.screen_height
+
+    def _new_bins(self):
+        """创建一个全零的直方图"""
+        size = self.grid_width * self.grid_height
+        if self.use_numpy:
+            return np.zeros(size, dtype=np.uint32)
+        return array('I', bytes(size * array('I').itemsize))
+
+    def update(self, event: Dict[str, Any]) -> bool:
+        """
+        将一个事件计入热力图
+
+        Returns:
+            事件是否包含位置信息并被计入
+        """
+        position = event.get("position")
+        if not position:
+            return False
+        try:
+            x = int(float(position["x"]) * self._x_scale)
+            y = int(float(position["y"]) * self._y_scale)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        # 超出屏幕的坐标计入边缘格子
+        x = min(max(x, 0), self.grid_width - 1)
+        y = min(max(y, 0), self.grid_height - 1)
+
+        key = (event.get("type", ""), (event.get("window") or {}).get("app_name", ""))
+        bins = self._bins.get(key)
+        if bins is None:
+            with self._lock:
+                bins = self._bins.setdefault(key, self._new_bins())
+        bins[y * self.grid_width + x] += 1
+        return True
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """返回已有的(事件类型, 应用)组合"""
+        with self._lock:
+            return list(self._bins.keys())
+
+    def get(self,
+            event_types: Optional[Iterable[str]] = None,
+            apps: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        获取合并后的热力图
+
+        Args:
+            event_types: 事件类型过滤，为None时包含全部
+            apps: 应用过滤，为None时包含全部
+
+        Returns:
+            包含网格尺寸和按行展开的计数数组的字典
+        """
+        event_types = set(event_types) if event_types else None
+        apps = set(apps) if apps else None
+        with self._lock:
+            selected = [bins for (event_type, app), bins in self._bins.items()
+                        if (event_types is None or event_type in event_types)
+                        and (apps is None or app in apps)]
+
+        if self.use_numpy:
+            total_bins = np.zeros(self.grid_width * self.grid_height, dtype=np.uint64)
+            for bins in selected:
+                total_bins += bins
+            values = total_bins.tolist()
+        else:
+            values = [0] * (self.grid_width * self.grid_height)
+            for bins in selected:
+                for i, count in enumerate(bins):
+                    if count:
+                        values[i] += count
+
+        return {
+            "grid_width": self.grid_width,
+            "grid_height": self.grid_height,
+            "screen_width": self.screen_width,
+            "screen_height": self.screen_height,
+            "total": sum(values),
+            "max": max(values) if values else 0,
+            "bins": values
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可写入JSON的字典，计数以base64编码的小端uint32存储"""
+        with self._lock:
+            items = list(self._bins.items())
+        groups = []
+        for (event_type, app), bins in items:
+            if self.use_numpy:
+                raw = bins.astype('<u4').tobytes()
+            else:
+                copied = array('I', bins)
+                if sys.byteorder == 'big':
+                    copied.byteswap()
+                raw = copied.tobytes()
+            groups.append({
+                "type": event_type,
+                "app": app,
+                "bins": base64.b64encode(raw).decode('ascii')
+            })
+        return {
+            "grid_width": self.grid_width,
+            "grid_height": self.grid_height,
+            "screen_width": self.screen_width,
+            "screen_height": self.screen_height,
+            "groups": groups
+        }
+
+    def load_dict(self, data: Dict[str, Any]) -> bool:
+        """从字典恢复计数，网格尺寸不一致时忽略"""
+        if data.get("grid_width") != self.grid_width or data.get("grid_height") != self.grid_height:
+            logger.warning("热力图网格尺寸不一致，忽略已保存的数据")
+            return False
+        size = self.grid_width * self.grid_height
+        loaded = {}
+        for group in data.get("groups", []):
+            raw = base64.b64decode(group["bins"])
+            if len(raw) != size * 4:
+                continue
+            if self.use_numpy:
+                bins = np.frombuffer(raw, dtype='<u4').astype(np.uint32)
+            else:
+                bins = array('I')
+                bins.frombytes(raw)
+                if sys.byteorder == 'big':
+                    bins.byteswap()
+            loaded[(group.get("type", ""), group.get("app", ""))] = bins
+        with self._lock:
+            self._bins = loaded
+        return True
+
+    def save(self, path: str, encryption_key: Optional[bytes] = None):
+        """原子地写入热力图文件，指定密钥时与事件存储一样加密（分组中包含应用名称）"""
+        data = CODEC.dumps(self.to_dict())
+        if encryption_key:
+            data = Fernet(encryption_key).encrypt(data)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, encryption_key: Optional[bytes] = None) -> bool:
+        """读取热力图文件（如果存在）"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if encryption_key:
+                data = Fernet(encryption_key).decrypt(data)
+            return self.load_dict(CODEC.loads(data))
+        except Exception as e:
+            logger.error(f"读取热力图失败: {str(e)}")
+            return False
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 按键汇总模块
+
+该模块把按键事件（key_press、key_release）按应用和固定时间窗口汇总为
+typing_summary事件，代替逐个记录按键，大幅减少打字时写入和推送的事件数，
+也不再保存按下的具体按键序列。
+
+汇总模式：
+1. raw：原样记录每个按键事件（默认）；
+2. summary：汇总，保留各按键和快捷键的次数；
+3. anonymous：汇总，不保留按键身份，只记录次数、节奏和修饰键使用情况。
+
+可以为不同应用指定不同的模式，例如默认anonymous，Terminal使用raw。
+"""
+
+import bisect
+import datetime
+import threading
+from typing import Dict, List, Any, Optional
+
+KEY_EVENT_TYPES = ("key_press", "key_release")
+TYPING_SUMMARY = "typing_summary"
+
+MODE_RAW = "raw"
+MODE_SUMMARY = "summary"
+MODE_ANONYMOUS = "anonymous"
+KEYSTROKE_MODES = (MODE_RAW, MODE_SUMMARY, MODE_ANONYMOUS)
+
+# 默认汇总窗口（秒）
+DEFAULT_INTERVAL = 60.0
+
+# 相邻按下间隔分布的分桶上界（毫秒），最后一桶为超过最大上界的间隔
+INTER_KEY_BOUNDS_MS = (50, 100, 200, 400, 800, 1600)
+
+# 与其他按键组合时视为快捷键的修饰键
+SHORTCUT_MODIFIERS = ("cmd", "ctrl", "alt", "option")
+
+
+def parse_app_modes(values: List[str]) -> Dict[str, str]:
+    """
+    解析"应用=模式"形式的配置
+
+    Raises:
+        ValueError: 格式错误或模式无效
+    """
+    modes = {}
+    for value in values:
+        app, sep, mode = value.rpartition("=")
+        if not sep or not app:
+            raise ValueError(f"按键模式配置格式应为 应用=模式: {value}")
+        modes[app] = validate_mode(mode)
+    return modes
+
+
+def validate_mode(mode: str) -> str:
+    """检查汇总模式，无效时抛出ValueError"""
+    if mode not in KEYSTROKE_MODES:
+        raise ValueError(f"无效的按键模式: {mode}，可选: {', '.join(KEYSTROKE_MODES)}")
+    return mode
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+class _TypingWindow:
+    """一个应用在一个时间窗口内的按键统计"""
+
+    def __init__(self, start: float, window: Dict[str, Any], mode: str):
+        self.start = start
+        self.window = window
+        self.mode = mode
+        self.presses = 0
+        self.releases = 0
+        self.first_ts: Optional[float] = None
+        self.last_ts = start
+        self.last_press: Optional[float] = None
+        self.intervals = [0] * (len(INTER_KEY_BOUNDS_MS) + 1)
+        self.modifiers: Dict[str, int] = {}
+        self.shortcuts: Dict[str, int] = {}
+        self.shortcut_count = 0
+        self.keys: Dict[str, int] = {}
+
+    def add(self, event_type: str, data: Dict[str, Any], ts: float):
+        self.last_ts = max(self.last_ts, ts)
+        if event_type != "key_press":
+            self.releases += 1
+            return
+        self.presses += 1
+        if self.first_ts is None:
+            self.first_ts = ts
+        if self.last_press is not None:
+            gap_ms = max(ts - self.last_press, 0.0) * 1000
+            self.intervals[bisect.bisect_left(INTER_KEY_BOUNDS_MS, gap_ms)] += 1
+        self.last_press = ts
+
+        modifiers = [str(m).lower() for m in data.get("modifiers") or []]
+        for modifier in modifiers:
+            self.modifiers[modifier] = self.modifiers.get(modifier, 0) + 1
+        key_name = str(data.get("key_name", ""))
+        if any(m in SHORTCUT_MODIFIERS for m in modifiers):
+            self.shortcut_count += 1
+            if self.mode == MODE_SUMMARY:
+                shortcut = "+".join(sorted(set(modifiers)) + [key_name])
+                self.shortcuts[shortcut] = self.shortcuts.get(shortcut, 0) + 1
+        if self.mode == MODE_SUMMARY and key_name:
+            self.keys[key_name] = self.keys.get(key_name, 0) + 1
+
+    def to_event(self, interval: float, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        生成汇总事件，timestamp为窗口结束时间
+
+        Args:
+            interval: 汇总窗口（秒）
+            now: 提前结束未满的窗口时的当前时间，结束时间不晚于now也不早于最后一次按键，
+                速率按实际经过的时间计算
+        """
+        end = self.start + interval
+        if now is not None:
+            end = max(min(now, end), self.last_ts)
+        elapsed = max(end - self.start, 1.0)
+        event = {
+            "type": TYPING_SUMMARY,
+            "timestamp": _iso(end),
+            "start": _iso(self.start),
+            "screen_id": 0,
+            "window": self.window,
+            "mode": self.mode,
+            "interval": interval,
+            "key_count": self.presses,
+            "release_count": self.releases,
+            "rate_per_minute": round(self.presses * 60.0 / elapsed, 2),
+            "active_seconds": round((self.last_press - self.first_ts) if self.presses else 0.0, 3),
+            "active_start": _iso(self.first_ts) if self.presses else None,
+            "inter_key_ms_bounds": list(INTER_KEY_BOUNDS_MS),
+            "inter_key_ms_counts": self.intervals,
+            "modifiers": self.modifiers,
+            "shortcut_count": self.shortcut_count
+        }
+        if self.mode == MODE_SUMMARY:
+            event["keys"] = self.keys
+            event["shortcuts"] = self.shortcuts
+        return event
+
+
+class KeystrokeAggregator:
+    """按应用和时间窗口汇总按键事件，线程安全"""
+
+    def __init__(self,
+                 default_mode: str = MODE_RAW,
+                 app_modes: Optional[Dict[str, str]] = None,
+                 interval: float = DEFAULT_INTERVAL):
+        """
+        初始化按键汇总
+
+        Args:
+            default_mode: 未单独配置的应用使用的模式
+            app_modes: 应用名称到模式的映射
+            interval: 汇总窗口（秒）
+
+        Raises:
+            ValueError: 模式无效
+        """
+        self.default_mode = validate_mode(default_mode)
+        self.app_modes = {app: validate_mode(mode) for app, mode in (app_modes or {}).items()}
+        self.interval = max(1.0, float(interval))
+        self._windows: Dict[str, _TypingWindow] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, default_mode: str, app_modes: Optional[Dict[str, str]] = None):
+        """
+        修改汇总模式，已开始的窗口保持原模式直到结束
+
+        Raises:
+            ValueError: 模式无效
+        """
+        default_mode = validate_mode(default_mode)
+        app_modes = {app: validate_mode(mode) for app, mode in (app_modes or {}).items()}
+        with self._lock:
+            self.default_mode = default_mode
+            self.app_modes = app_modes
+
+    @property
+    def active(self) -> bool:
+        """是否有应用需要汇总"""
+        return self.default_mode != MODE_RAW or any(mode != MODE_RAW for mode in self.app_modes.values())
+
+    def mode_for(self, app: str) -> str:
+        """应用使用的模式"""
+        return self.app_modes.get(app, self.default_mode)
+
+    def add(self, event_type: str, data: Dict[str, Any], window: Dict[str, Any], ts: float) -> List[Dict[str, Any]]:
+        """
+        计入一个按键事件
+
+        Args:
+            event_type: key_press或key_release
+            data: 按键事件数据（key_name、modifiers等）
+            window: 当前窗口信息
+            ts: 事件时间
+
+        Returns:
+            因进入新窗口而结束的汇总事件
+        """
+        app = window.get("app_name", "")
+        start = ts - ts % self.interval
+        closed = []
+        with self._lock:
+            current = self._windows.get(app)
+            if current is not None and current.start != start:
+                closed.append(current.to_event(self.interval))
+                current = None
+            if current is None:
+                current = self._windows[app] = _TypingWindow(start, window, self.mode_for(app))
+            current.add(event_type, data, ts)
+        return closed
+
+    def flush(self, now: float) -> List[Dict[str, Any]]:
+        """结束所有已过去的窗口，返回汇总事件"""
+        with self._lock:
+            expired = [app for app, window in self._windows.items() if window.start + self.interval <= now]
+            return [self._windows.pop(app).to_event(self.interval) for app in expired]
+
+    def close(self, now: float) -> List[Dict[str, Any]]:
+        """结束所有窗口（停止监控时调用），未满的窗口在now结束，不会写出未来的时间"""
+        with self._lock:
+            windows = list(self._windows.values())
+            self._windows.clear()
+        return [window.to_event(self.interval, now) for window in windows]
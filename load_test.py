@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - Web应用负载测试
+
+该模块在本机启动一个web_app服务进程（使用模拟或回放的事件源），
+再启动N个Socket.IO客户端和M个REST轮询线程，统计端到端推送延迟分位数、
+丢失或重复的事件、REST接口延迟与错误，以及服务进程的CPU和内存占用。
+全部流量只经过localhost，不需要网络连接。
+
+用法:
+    python load_test.py --clients 20 --pollers 5 --duration 30
+    python load_test.py --transport binary_zlib --rate 500 --push-interval 0.2
+    python load_test.py --replay-path ./output.json --output report.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from typing import Dict, List, Any, Optional
+
+logger = logging.getLogger("load_test")
+
+# REST轮询的接口
+REST_ENDPOINTS = ("/api/status", "/api/events", "/api/config")
+
+# 事件推送的传输模式
+TRANSPORTS = ("json", "binary", "binary_zlib")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """计算p50/p95/p99/max（毫秒）"""
+    if not values:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": ordered[-1] * 1000}
+
+
+class PushStats:
+    """统计一个Socket.IO客户端收到的事件：延迟、丢失和重复"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.seen = set()
+        self.duplicates = 0
+        self.batches = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def record(self, events: List[Dict[str, Any]], received_at: float, size: int = 0):
+        """记录一批事件，received_at为收到时的Unix时间戳"""
+        with self.lock:
+            self.batches += 1
+            self.bytes += size
+            for event in events:
+                seq = event.get("seq")
+                if seq in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(seq)
+                timestamp = datetime.datetime.fromisoformat(event["timestamp"]).timestamp()
+                self.latencies.append(max(0.0, received_at - timestamp))
+
+    @property
+    def missed(self) -> int:
+        """首个和最后一个收到的序号之间缺失的事件数"""
+        if not self.seen:
+            return 0
+        return max(self.seen) - min(self.seen) + 1 - len(self.seen)
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "events": len(self.seen),
+                "batches": self.batches,
+                "bytes": self.bytes,
+                "missed": self.missed,
+                "duplicates": self.duplicates,
+                "latency": percentiles(self.latencies)
+            }
+
+
+class RestStats:
+    """统计REST轮询的延迟和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in REST_ENDPOINTS}
+        self.errors: Dict[str, int] = {endpoint: 0 for endpoint in REST_ENDPOINTS}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, elapsed: float, ok: bool):
+        with self.lock:
+            if ok:
+                self.latencies[endpoint].append(elapsed)
+            else:
+                self.errors[endpoint] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {endpoint: dict(requests=len(self.latencies[endpoint]) + self.errors[endpoint],
+                                   errors=self.errors[endpoint],
+                                   **percentiles(self.latencies[endpoint]))
+                    for endpoint in REST_ENDPOINTS}
+
+
+class ProcessSampler:
+    """周期性采样服务进程的CPU和RSS，优先使用psutil，否则读取/proc"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu: List[float] = []
+        self.rss: List[int] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+            self._process.cpu_percent(None)
+        except ImportError:
+            self._process = None
+
+    def _proc_times(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat", 'r') as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime和stime位于第14、15个字段
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def _proc_rss(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def _run(self):
+        last_times, last_wall = self._proc_times(), time.monotonic()
+        while not self._stop.wait(self.interval):
+            try:
+                if self._process is not None:
+                    self.cpu.append(self._process.cpu_percent(None))
+                    self.rss.append(self._process.memory_info().rss)
+                    continue
+                times, wall = self._proc_times(), time.monotonic()
+                if times is not None and last_times is not None:
+                    self.cpu.append((times - last_times) / (wall - last_wall) * 100)
+                last_times, last_wall = times, wall
+                rss = self._proc_rss()
+                if rss is not None:
+                    self.rss.append(rss)
+            except Exception:
+                # 进程已退出
+                break
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Any]:
+        self._stop.set()
+        self._thread.join()
+        return {
+            "cpu_percent_avg": sum(self.cpu) / len(self.cpu) if self.cpu else None,
+            "cpu_percent_max": max(self.cpu) if self.cpu else None,
+            "rss_mb_max": max(self.rss) / 1024 / 1024 if self.rss else None,
+            "samples": len(self.cpu)
+        }
+
+
+# ---------------------------------------------------------------------------
+# 服务进程
+# ---------------------------------------------------------------------------
+
+def synthetic_events():
+    """与测试模式结构一致的模拟事件"""
+    key_names = ["a", "e", "s", "space", "enter"]
+    while True:
+        event_type = random.choice(["mouse_move", "mouse_click", "mouse_scroll", "key_press", "key_release"])
+        if event_type.startswith("key"):
+            state = "pressed" if event_type == "key_press" else "released"
+            yield event_type, {"key_code": random.randint(1, 100), "key_name": random.choice(key_names),
+                               "state": state, "modifiers": []}
+        else:
+            yield event_type, {"position": {"x": random.uniform(0, 1920), "y": random.uniform(0, 1080)}}
+
+
+def replay_events(path: str, encryption_key: Optional[bytes] = None):
+    """循环回放已记录的事件，保留窗口信息，时间戳和序号由监控器重新生成"""
+    from event_store import EventStore
+    store = EventStore(path, encryption_key=encryption_key)
+    if not store.event_count():
+        raise ValueError(f"回放文件中没有事件: {path}")
+    while True:
+        for event in store.iter_events():
+            data = {k: v for k, v in event.items() if k not in ("type", "timestamp", "seq", "screen_id")}
+            yield event["type"], data
+
+
+def drive_events(monitor, source, rate: float):
+    """按指定速率向监控器注入事件"""
+    interval = 1.0 / rate
+    next_time = time.perf_counter()
+    while monitor.running:
+        event_type, data = next(source)
+        monitor._add_event(event_type, data)
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0:
+            # 落后太多时不再追赶
+            next_time = time.perf_counter()
+
+
+def serve(args):
+    """子进程：启动web_app并注入事件"""
+    import web_app
+    from event_monitor import EventMonitor
+    from log_setup import configure_logging
+
+    configure_logging(logging.WARNING)
+    # 不记录每个请求的访问日志，避免日志开销影响测量结果
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    monitor = EventMonitor(test_mode=True, output_path=os.path.join(os.getcwd(), "output.json"),
+                           buffer_size=args.buffer_size, sample_interval=0)
+    if not monitor.start():
+        return 1
+    web_app.registry.attach(web_app.DEFAULT_MONITOR, monitor)
+    web_app.PUSH_INTERVAL = args.push_interval
+    web_app.socketio.start_background_task(web_app.push_events)
+
+    key = args.replay_key.encode() if args.replay_key else None
+    source = replay_events(args.replay_path, key) if args.replay_path else synthetic_events()
+    threading.Thread(target=drive_events, args=(monitor, source, args.rate), daemon=True).start()
+
+    options = {}
+    if web_app.socketio.async_mode == "threading":
+        options["allow_unsafe_werkzeug"] = True
+    web_app.socketio.run(web_app.app, host="127.0.0.1", port=args.port, **options)
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# 负载进程
+# ---------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    """等待服务进程开始响应"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程已退出，退出码: {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + "/api/status", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("等待服务进程启动超时")
+
+
+def start_client(base_url: str, transport: str, stats: PushStats):
+    """连接一个Socket.IO客户端"""
+    import socketio
+    from event_transport import decode_batch
+
+    client = socketio.Client(reconnection=False)
+
+    @client.on('events_update')
+    def on_events_update(data):
+        stats.record(data["events"], time.time())
+
+    @client.on('events_batch')
+    def on_events_batch(data):
+        received_at = time.time()
+        stats.record(decode_batch(data), received_at, len(data))
+
+    client.connect(base_url, transports=["websocket"])
+    if transport != "json":
+        result = client.call('set_transport', {"mode": transport}, timeout=10)
+        if not result or not result.get("success"):
+            raise RuntimeError(f"切换传输模式失败: {result}")
+    return client
+
+
+def poll_rest(base_url: str, stats: RestStats, stop: threading.Event, interval: float):
+    """轮询REST接口"""
+    while not stop.is_set():
+        for endpoint in REST_ENDPOINTS:
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + endpoint, timeout=10) as response:
+                    response.read()
+                    ok = response.status == 200
+            except OSError:
+                ok = False
+            stats.record(endpoint, time.perf_counter() - start, ok)
+        if interval:
+            stop.wait(interval)
+
+
+def run_load(args) -> Dict[str, Any]:
+    """启动服务进程和客户端，运行指定时长后返回报告"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    script = os.path.abspath(__file__)
+    command = [sys.executable, script, "--serve", "--port", str(port), "--rate", str(args.rate),
+               "--push-interval", str(args.push_interval), "--buffer-size", str(args.buffer_size)]
+    if args.replay_path:
+        command += ["--replay-path", os.path.abspath(args.replay_path)]
+        if args.replay_key:
+            command += ["--replay-key", args.replay_key]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # 在临时目录中运行，服务进程的日志和输出文件不会留在当前目录
+        stderr_path = os.path.join(temp_dir, "server.err")
+        stderr_file = open(stderr_path, 'wb')
+        process = subprocess.Popen(command, cwd=temp_dir, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        clients = []
+        try:
+            wait_ready(base_url, process)
+            sampler = ProcessSampler(process.pid)
+            client_stats = [PushStats() for _ in range(args.clients)]
+            for stats in client_stats:
+                clients.append(start_client(base_url, args.transport, stats))
+
+            rest_stats = RestStats()
+            stop = threading.Event()
+            pollers = [threading.Thread(target=poll_rest, args=(base_url, rest_stats, stop, args.poll_interval),
+                                        daemon=True) for _ in range(args.pollers)]
+            sampler.start()
+            for poller in pollers:
+                poller.start()
+
+            time.sleep(args.duration)
+
+            # 测量窗口结束时立即汇总，断开连接期间收到的事件不计入
+            summaries = [stats.summary() for stats in client_stats]
+            latencies = [latency for stats in client_stats for latency in list(stats.latencies)]
+            stop.set()
+            for poller in pollers:
+                poller.join()
+            server = sampler.stop()
+            with urllib.request.urlopen(base_url + "/api/status", timeout=10) as response:
+                generated = json.loads(response.read())["event_count"]
+        finally:
+            for client in clients:
+                try:
+                    client.disconnect()
+                except Exception:
+                    pass
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            stderr_file.close()
+            if process.returncode not in (0, -15):
+                with open(stderr_path, 'r', encoding='utf-8', errors='replace') as f:
+                    logger.error(f"服务进程输出:\n{f.read()[-2000:]}")
+
+    return {
+        "config": {
+            "clients": args.clients, "pollers": args.pollers, "duration": args.duration,
+            "transport": args.transport, "rate": args.rate, "push_interval": args.push_interval,
+            "source": args.replay_path or "synthetic"
+        },
+        "events_generated": generated,
+        "push": {
+            "events_received": sum(s["events"] for s in summaries),
+            "bytes_received": sum(s["bytes"] for s in summaries),
+            "missed": sum(s["missed"] for s in summaries),
+            "duplicates": sum(s["duplicates"] for s in summaries),
+            "clients_without_events": sum(1 for s in summaries if not s["events"]),
+            "latency": percentiles(latencies)
+        },
+        "rest": rest_stats.summary(),
+        "server": server
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """打印报告摘要"""
+    push = report["push"]
+    latency = push["latency"]
+    print(f"生成事件: {report['events_generated']}，客户端收到: {push['events_received']}，"
+          f"丢失: {push['missed']}，重复: {push['duplicates']}")
+    print(f"推送延迟: p50 {latency['p50_ms']:.1f}ms  p95 {latency['p95_ms']:.1f}ms  "
+          f"p99 {latency['p99_ms']:.1f}ms  max {latency['max_ms']:.1f}ms")
+    for endpoint, stats in report["rest"].items():
+        print(f"{endpoint}: {stats['requests']}次请求，{stats['errors']}次错误，"
+              f"p50 {stats['p50_ms']:.1f}ms  p99 {stats['p99_ms']:.1f}ms")
+    server = report["server"]
+    if server["samples"]:
+        print(f"服务进程: CPU平均 {server['cpu_percent_avg']:.1f}%  最高 {server['cpu_percent_max']:.1f}%  "
+              f"RSS最高 {server['rss_mb_max']:.1f}MB")
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - Web应用负载测试",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--clients", type=int, default=10, help="Socket.IO客户端数量")
+    parser.add_argument("--pollers", type=int, default=2, help="REST轮询线程数量")
+    parser.add_argument("--duration", type=float, default=10.0, help="测试时长（秒）")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="json", help="客户端使用的推送传输模式")
+    parser.add_argument("--rate", type=float, default=100.0, help="每秒注入的事件数")
+    parser.add_argument("--push-interval", type=float, default=1.0, help="服务端推送间隔（秒）")
+    parser.add_argument("--poll-interval", type=float, default=0.0, help="每个轮询线程两轮请求之间的间隔（秒）")
+    parser.add_argument("--buffer-size", type=int, default=1000, help="监控器缓冲区大小")
+    parser.add_argument("--replay-path", type=str, help="回放已记录的事件文件，而不是生成模拟事件")
+    parser.add_argument("--replay-key", type=str, help="回放文件的解密密钥")
+    parser.add_argument("--output", type=str, help="报告JSON文件路径")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate必须大于0")
+    if args.push_interval <= 0:
+        parser.error("--push-interval必须大于0")
+    return args
+
+
+def main():
+    """主函数"""
+    args = parse_args()
+    if args.serve:
+        return serve(args)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = run_load(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 日志配置模块
+
+该模块把日志记录和日志输出分开：记录日志的线程只把日志记录放入内存队列，
+格式化和写入终端、文件由后台线程完成，采集线程不会因为磁盘写入而阻塞。
+队列满时直接丢弃并计数；同一位置反复出现的警告和错误会被限流，
+被抑制的条数在下一条放行的消息或退出时汇总输出。
+"""
+
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Any, Optional, Tuple, Union
+from metrics import REGISTRY
+
+logger = logging.getLogger("log_setup")
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 日志队列的最大长度，超过后丢弃新的日志记录
+DEFAULT_QUEUE_SIZE = 10000
+
+LOG_DROPPED = REGISTRY.counter("log_records_dropped_total", "日志队列已满而丢弃的日志记录数")
+LOG_SUPPRESSED = REGISTRY.counter("log_records_suppressed_total", "被限流抑制的重复日志记录数")
+
+
+class RateLimitFilter(logging.Filter):
+    """对同一代码位置的重复警告和错误限流"""
+
+    def __init__(self, interval: float = 60.0, burst: int = 5, min_level: int = logging.WARNING):
+        """
+        初始化限流过滤器
+
+        Args:
+            interval: 限流窗口（秒）
+            burst: 每个窗口内同一位置最多放行的记录数
+            min_level: 只对不低于该级别的记录限流
+        """
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.min_level = min_level
+        # (日志器名称, 文件, 行号) -> [窗口开始时间, 窗口内记录数, 被抑制数]
+        self._state: Dict[Tuple[str, str, int], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.interval:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg}（此前{suppressed}条相似消息已被抑制）"
+                return True
+            state[1] += 1
+            if state[1] <= self.burst:
+                return True
+            state[2] += 1
+        LOG_SUPPRESSED.inc()
+        return False
+
+    def pending(self) -> List[Tuple[str, str, int, int]]:
+        """取出尚未汇总的抑制计数，返回(日志器名称, 文件, 行号, 被抑制数)列表"""
+        with self._lock:
+            result = [key + (state[2],) for key, state in self._state.items() if state[2]]
+            for state in self._state.values():
+                state[2] = 0
+        return result
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """只把日志记录放入队列的处理器，队列满时丢弃而不是等待"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 同一进程内的队列不需要序列化，格式化留给后台线程
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+_listener: Optional[QueueListener] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def configure_logging(level: Union[int, str] = logging.INFO, log_file: Optional[str] = None,
+                      queue_size: int = DEFAULT_QUEUE_SIZE, rate_limit_interval: float = 60.0,
+                      rate_limit_burst: int = 5) -> QueueListener:
+    """
+    配置异步日志，替换根日志器上已有的处理器
+
+    Args:
+        level: 日志级别
+        log_file: 日志文件路径，为None时只输出到终端
+        queue_size: 日志队列最大长度
+        rate_limit_interval: 重复日志限流窗口（秒）
+        rate_limit_burst: 每个窗口内同一位置最多输出的警告和错误数
+
+    Returns:
+        后台日志线程
+    """
+    global _listener, _rate_limit
+    shutdown_logging()
+
+    if isinstance(level, str):
+        level = getattr(logging, level.upper())
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.setLevel(level)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    _rate_limit = RateLimitFilter(rate_limit_interval, rate_limit_burst)
+    queue_handler.addFilter(_rate_limit)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """输出被抑制日志的汇总，等待队列中的日志写完并停止后台线程"""
+    global _listener, _rate_limit
+    if _rate_limit is not None:
+        for name, pathname, lineno, suppressed in _rate_limit.pending():
+            logger.warning(f"{name}（{pathname}:{lineno}）另有{suppressed}条相似消息已被抑制")
+        _rate_limit = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+
+
+atexit.register(shutdown_logging)
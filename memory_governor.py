@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 内存预算
+
+该模块按近似字节数统计监控器在内存中保留的事件（待写入的缓冲区和最近事件环）。
+最近事件环的长度固定，只统计不处理；待写入的缓冲区超出预算时逐级处理：
+
+1. 超过预算的HIGH_WATERMARK时按压力降低采样率，减少新事件；
+2. 写入失败、缓冲区超过预算时，把最旧的事件溢出到本地的临时存储
+   `<输出路径>.spill`，下一次成功刷新时按顺序先写回；
+3. 溢出也失败（例如磁盘不可用）时丢弃最旧的事件，超过预算的HARD_LIMIT倍时
+   直接丢弃新事件。
+
+因此磁盘长时间不可用时进程内存也有上限。事件大小按字段数和字符串长度估算，
+不遍历对象图，可以在每个事件上调用。
+"""
+
+import os
+import math
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+from event_store import EventStore
+from metrics import REGISTRY
+
+logger = logging.getLogger("memory_governor")
+
+# 溢出文件后缀
+SPILL_SUFFIX = ".spill"
+SPILL_POS_SUFFIX = ".pos"
+
+# 默认内存预算（MB）
+DEFAULT_BUDGET_MB = 256.0
+
+# 超过预算的该比例时开始降低采样率，达到预算时降到MIN_SAMPLING_FACTOR
+HIGH_WATERMARK = 0.75
+MIN_SAMPLING_FACTOR = 0.1
+
+# 溢出后内存占用降到预算的该比例以下
+LOW_WATERMARK = 0.5
+
+# 超过预算的该倍数时新事件直接丢弃
+HARD_LIMIT = 1.5
+
+# 估算事件大小：字典本身的开销和每个字段的开销（字节），与CPython中实测的平均值接近
+EVENT_OVERHEAD_BYTES = 400
+FIELD_BYTES = 64
+
+MEMORY_USED = REGISTRY.gauge("monitor_memory_bytes", "内存中保留的事件的估算字节数", ("part",))
+MEMORY_BUDGET = REGISTRY.gauge("monitor_memory_budget_bytes", "内存预算（字节）")
+SPILLED_EVENTS = REGISTRY.counter("monitor_spilled_events_total", "超出内存预算时溢出到磁盘的事件数")
+SPILL_ERRORS = REGISTRY.counter("monitor_spill_errors_total", "溢出到磁盘失败的次数")
+
+
+def budget_to_bytes(budget_mb: float) -> int:
+    """
+    把以MB为单位的预算换算为字节数
+
+    Raises:
+        ValueError: 预算不是有限的正数
+    """
+    nbytes = float(budget_mb) * 1024 * 1024
+    if not math.isfinite(nbytes) or nbytes <= 0:
+        raise ValueError("内存预算必须是有限的正数")
+    return int(nbytes)
+
+
+def estimate_event_size(event: Dict[str, Any]) -> int:
+    """估算一个事件在内存中占用的字节数（不含共享的键字符串）"""
+    size = EVENT_OVERHEAD_BYTES
+    for value in event.values():
+        size += FIELD_BYTES
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, dict):
+            size += EVENT_OVERHEAD_BYTES // 2
+            for item in value.values():
+                size += FIELD_BYTES + (len(item) if isinstance(item, str) else 0)
+        elif isinstance(value, (list, tuple)):
+            size += FIELD_BYTES * len(value)
+    return size
+
+
+class MemoryGovernor:
+    """统计内存中的事件字节数，按预算调整采样率，并管理溢出到磁盘的事件"""
+
+    def __init__(self,
+                 budget_mb: float = DEFAULT_BUDGET_MB,
+                 spill_path: Optional[str] = None,
+                 encryption_key: Optional[bytes] = None,
+                 compress: bool = False):
+        """
+        Args:
+            budget_mb: 内存预算（MB）
+            spill_path: 溢出文件路径，为None时超出预算的事件直接丢弃
+            encryption_key: 溢出文件的加密密钥，与输出文件相同
+            compress: 是否压缩溢出的帧
+        """
+        self.budget_bytes = 0
+        self.set_budget(budget_mb)
+        self.usage: Dict[str, int] = {}
+        self.spill = EventStore(spill_path, encryption_key, compress) if spill_path else None
+        self._lock = threading.Lock()
+        # 已写回的溢出帧数，持久化后重启时从该位置继续写回
+        self._spill_pos = self._read_pos()
+
+    def set_budget(self, budget_mb: float):
+        self.budget_bytes = budget_to_bytes(budget_mb)
+        MEMORY_BUDGET.set(self.budget_bytes)
+
+    def set_usage(self, part: str, nbytes: int):
+        """更新一部分内存（例如缓冲区、最近事件环）的估算字节数"""
+        self.usage[part] = nbytes
+        MEMORY_USED.set(nbytes, labels=(part,))
+
+    def used(self) -> int:
+        return sum(self.usage.values())
+
+    def pressure(self, used: Optional[int] = None) -> float:
+        """内存占用与预算之比"""
+        return (self.used() if used is None else used) / self.budget_bytes
+
+    def sampling_factor(self, used: int) -> float:
+        """采样率的系数：低于HIGH_WATERMARK时为1，达到预算时降到MIN_SAMPLING_FACTOR"""
+        pressure = used / self.budget_bytes
+        if pressure <= HIGH_WATERMARK:
+            return 1.0
+        if pressure >= 1.0:
+            return MIN_SAMPLING_FACTOR
+        fraction = (pressure - HIGH_WATERMARK) / (1.0 - HIGH_WATERMARK)
+        return 1.0 - fraction * (1.0 - MIN_SAMPLING_FACTOR)
+
+    def over_budget(self, used: int) -> bool:
+        return used > self.budget_bytes
+
+    def over_hard_limit(self, used: int) -> bool:
+        return used > self.budget_bytes * HARD_LIMIT
+
+    def excess(self, used: int) -> int:
+        """降到预算的LOW_WATERMARK以下需要移出内存的字节数"""
+        return max(0, used - int(self.budget_bytes * LOW_WATERMARK))
+
+    # ------------------------------------------------------------------
+    # 溢出到磁盘
+    # ------------------------------------------------------------------
+
+    def spill_events(self, events: List[Dict[str, Any]]) -> bool:
+        """
+        把事件作为一帧追加到溢出文件
+
+        Returns:
+            是否写入成功
+        """
+        if self.spill is None or not events:
+            return False
+        try:
+            with self._lock:
+                self.spill.append(events, sync=True)
+        except Exception as e:
+            SPILL_ERRORS.inc()
+            logger.error(f"溢出到磁盘失败: {str(e)}")
+            return False
+        SPILLED_EVENTS.inc(len(events))
+        return True
+
+    def spilled_frames(self) -> int:
+        """尚未写回的溢出帧数"""
+        if self.spill is None or not os.path.exists(self.spill.path):
+            return 0
+        with self._lock:
+            try:
+                return max(0, self.spill.frame_count() - self._spill_pos)
+            except Exception as e:
+                logger.error(f"读取溢出文件失败: {str(e)}")
+                return 0
+
+    def spilled_events(self) -> int:
+        """尚未写回的溢出事件数（只读取索引）"""
+        if not self.spilled_frames():
+            return 0
+        with self._lock:
+            with self.spill._index() as index:
+                return sum(index.record(i)[2] for i in range(self._spill_pos, len(index)))
+
+    def peek_spilled(self) -> Optional[List[Dict[str, Any]]]:
+        """读取最早的一帧未写回的溢出事件"""
+        if not self.spilled_frames():
+            return None
+        try:
+            with self._lock:
+                return self.spill.read_frame(self._spill_pos)
+        except Exception as e:
+            logger.error(f"读取溢出的事件失败: {str(e)}")
+            return None
+
+    def consume_spilled(self):
+        """最早的一帧已写回，全部写回后删除溢出文件"""
+        with self._lock:
+            self._spill_pos += 1
+            if self._spill_pos < self.spill.frame_count():
+                self._write_pos()
+                return
+            self._spill_pos = 0
+            self.spill.delete()
+            if os.path.exists(self.spill.path + SPILL_POS_SUFFIX):
+                os.remove(self.spill.path + SPILL_POS_SUFFIX)
+        logger.info("已写回全部溢出的事件")
+
+    def _read_pos(self) -> int:
+        if self.spill is None:
+            return 0
+        try:
+            with open(self.spill.path + SPILL_POS_SUFFIX, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_pos(self):
+        pos_path = self.spill.path + SPILL_POS_SUFFIX
+        with open(pos_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(str(self._spill_pos))
+        os.replace(pos_path + ".tmp", pos_path)
+
+    def snapshot(self, governed: str = "buffer") -> Dict[str, Any]:
+        """当前内存占用，用于状态接口；采样率系数按governed部分计算"""
+        used = self.used()
+        return {
+            "budget_bytes": self.budget_bytes,
+            "used_bytes": used,
+            "parts": dict(self.usage),
+            "pressure": round(self.pressure(used), 4),
+            "sampling_factor": round(self.sampling_factor(self.usage.get(governed, 0)), 4),
+            "spilled_events": self.spilled_events()
+        }
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 多机记录合并工具
+
+该模块把多台机器的记录文件按时间戳合并为一个有序的事件流，
+每个事件带上来源主机标记。合并使用基于堆的k路归并，
+每个输入同时只解码一帧，内存占用只与输入文件数有关，与数据总量无关。
+
+用法:
+    python merge_tool.py mac-a.json mac-b.json -o merged.jsonl.gz
+    python merge_tool.py a/output.json=mac-a b/output.json=mac-b -o merged.csv --from 2026-01-01
+    python merge_tool.py *.json --encrypted -o merged.json --format store
+"""
+
+import os
+import sys
+import heapq
+import logging
+import argparse
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+
+logger = logging.getLogger("merge_tool")
+
+# 输出为事件存储格式时每帧包含的事件数
+STORE_FRAME_SIZE = 1000
+
+# 输出格式：导出器支持的格式，以及可再次查询和合并的事件存储格式
+OUTPUT_FORMATS = ("json", "jsonl", "csv", "store")
+
+
+def parse_input(spec: str) -> Tuple[str, str]:
+    """
+    解析输入参数
+
+    格式为"路径=主机名"，省略主机名时使用文件名（不含扩展名）
+    """
+    path, sep, host = spec.rpartition("=")
+    if not sep or not path:
+        path, host = spec, ""
+    if not host:
+        host = os.path.splitext(os.path.basename(path))[0]
+    return path, host
+
+
+def _tagged(store, host: str, start: Optional[float], end: Optional[float],
+            types: Optional[Iterable[str]], order: int) -> Iterator[Tuple[float, int, Dict[str, Any]]]:
+    """读取一个输入的事件，附加主机标记，返回(时间戳, 输入序号, 事件)供堆排序"""
+    from event_store import parse_timestamp
+    for event in store.iter_events(start, end, types):
+        try:
+            ts = parse_timestamp(event.get("timestamp"))
+        except (ValueError, TypeError):
+            ts = None
+        event["host"] = host
+        # 输入序号保证时间相同时的顺序稳定，且不会比较事件字典
+        yield (ts if ts is not None else 0.0), order, event
+
+
+def merge_recordings(inputs: List[Tuple[str, str]], encrypted: bool = False,
+                     start: Optional[float] = None, end: Optional[float] = None,
+                     types: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    按时间戳k路归并多个记录文件
+
+    Args:
+        inputs: (文件路径, 主机名)列表，支持旧版单文档格式和追加写入格式
+        encrypted: 输入是否加密，密钥由各自的主机名派生
+        start: 起始时间（含），Unix时间戳
+        end: 结束时间（不含），Unix时间戳
+        types: 事件类型过滤
+
+    Returns:
+        按时间排序、带host字段的事件迭代器
+    """
+    from event_store import EventStore
+    if encrypted:
+        from event_monitor import derive_encryption_key
+
+    streams = []
+    try:
+        for order, (path, host) in enumerate(inputs):
+            key = derive_encryption_key(host) if encrypted else None
+            streams.append(_tagged(EventStore(path, key), host, start, end, types, order))
+        for _, _, event in heapq.merge(*streams):
+            yield event
+    finally:
+        # 提前结束时关闭各输入的读取，释放打开的数据文件和索引文件
+        for stream in streams:
+            stream.close()
+
+
+def write_store(events: Iterable[Dict[str, Any]], path: str, frame_size: int = STORE_FRAME_SIZE) -> int:
+    """将事件流以追加写入格式写入新的事件存储，返回事件数"""
+    from event_store import EventStore
+    store = EventStore(path)
+    batch = []
+    count = 0
+    for event in events:
+        batch.append(event)
+        if len(batch) >= frame_size:
+            store.append(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        store.append(batch)
+        count += len(batch)
+    return count
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 多机记录合并",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("inputs", nargs="+", help="记录文件，可写为\"路径=主机名\"，默认以文件名作为主机名")
+    parser.add_argument("-o", "--output", type=str, required=True, help="输出文件路径，-表示标准输出")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="输出格式，默认根据输出文件名推断")
+    parser.add_argument("--gzip", action="store_true", help="使用gzip压缩（输出文件名以.gz结尾时自动启用）")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件已加密，密钥由各自的主机名派生")
+    parser.add_argument("--from", dest="start", type=str, help="起始时间（ISO格式或Unix时间戳）")
+    parser.add_argument("--to", dest="end", type=str, help="结束时间（ISO格式或Unix时间戳）")
+    parser.add_argument("--types", type=str, help="只合并指定类型的事件，逗号分隔")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import parse_timestamp
+    from exporter import write_export, format_from_filename
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        start = parse_timestamp(args.start)
+        end = parse_timestamp(args.end)
+    except ValueError:
+        logger.error("无效的时间范围")
+        return 1
+    types = [t.strip() for t in (args.types or "").split(",") if t.strip()] or None
+
+    inputs = [parse_input(spec) for spec in args.inputs]
+    missing = [path for path, _ in inputs if not os.path.exists(path)]
+    if missing:
+        logger.error(f"输入文件不存在: {', '.join(missing)}")
+        return 1
+    hosts = [host for _, host in inputs]
+    if len(set(hosts)) != len(hosts):
+        logger.warning("多个输入使用了相同的主机名，可用\"路径=主机名\"区分")
+
+    fmt, compress = args.format, args.gzip
+    if not fmt:
+        try:
+            fmt, compress = format_from_filename(args.output)
+            compress = compress or args.gzip
+        except ValueError:
+            logger.error("无法根据输出文件名推断格式，请指定--format")
+            return 1
+    if fmt == "store" and (args.output == "-" or compress):
+        logger.error("事件存储格式只能写入未压缩的文件")
+        return 1
+
+    events = merge_recordings(inputs, args.encrypted, start, end, types)
+    if fmt == "store":
+        if os.path.exists(args.output):
+            logger.error(f"输出文件已存在: {args.output}")
+            return 1
+        count = write_store(events, args.output)
+    elif args.output == "-":
+        count = write_export(events, sys.stdout.buffer, fmt, compress)
+        sys.stdout.buffer.flush()
+    else:
+        tmp_path = args.output + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                count = write_export(events, f, fmt, compress)
+            os.replace(tmp_path, args.output)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    logger.info(f"已合并{len(inputs)}个输入，共{count}个事件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 指标模块
+
+该模块提供一个轻量的进程内指标注册表，并以Prometheus文本格式导出。
+计数器和直方图按线程分片累加，记录时不加锁，只在采集（scrape）时合并，
+记录一次指标的开销远小于被测量的工作本身。
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Any, Optional, Callable, Sequence, Tuple
+
+# 默认直方图分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    """格式化样本值"""
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """指标基类"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _label_str(self, labels: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(f'{extra[0]}="{extra[1]}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Sharded(_Metric):
+    """按线程分片存储数据的指标"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._shards: Dict[int, Dict[Tuple, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple, Any]:
+        """获取当前线程的分片，只有首次访问时加锁"""
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _snapshot(self) -> List[List[Tuple[Tuple, Any]]]:
+        with self._lock:
+            shards = list(self._shards.values())
+        return [list(shard.items()) for shard in shards]
+
+
+class Counter(_Sharded):
+    """单调递增的计数器"""
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, labels: Tuple = ()):
+        """增加计数"""
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def values(self) -> Dict[Tuple, float]:
+        """合并各线程分片后的计数"""
+        merged: Dict[Tuple, float] = {}
+        for items in self._snapshot():
+            for labels, value in items:
+                merged[labels] = merged.get(labels, 0) + value
+        return merged
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self.values().get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{self._label_str(labels)} {_format_value(value)}"
+                for labels, value in sorted(self.values().items())]
+
+
+class Histogram(_Sharded):
+    """分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Tuple = ()):
+        """记录一个观测值"""
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # 各桶计数（最后一个为+Inf）、总和、次数
+            state = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def values(self) -> Dict[Tuple, Tuple[List[int], float, int]]:
+        """合并各线程分片后的(各桶计数, 总和, 次数)"""
+        merged: Dict[Tuple, list] = {}
+        for items in self._snapshot():
+            for labels, (counts, total, count) in items:
+                target = merged.get(labels)
+                if target is None:
+                    target = merged[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for i, c in enumerate(counts):
+                    target[0][i] += c
+                target[1] += total
+                target[2] += count
+        return {labels: tuple(state) for labels, state in merged.items()}
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self.values().items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{self._label_str(labels, ('le', _format_value(float(bound))))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._label_str(labels)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，可设置为采集时调用的函数"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, labels: Tuple = ()):
+        """设置当前值"""
+        self._values[labels] = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """设置采集时调用的取值函数（仅适用于无标签的指标）"""
+        self._function = function
+
+    def value(self, labels: Tuple = ()) -> float:
+        if self._function is not None and not labels:
+            return float(self._function())
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            return [f"{self.name} {_format_value(float(self._function()))}"]
+        return [f"{self.name}{self._label_str(labels)} {_format_value(value)}"
+                for labels, value in sorted(list(self._values.items()))]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # 重复注册时返回已有指标，避免模块重新加载时丢失数据
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """以Prometheus文本格式导出全部指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# 进程内全局注册表
+REGISTRY = MetricsRegistry()
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
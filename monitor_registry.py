@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 监控器注册表
+
+该模块在一个进程中管理多个具名的监控器（例如不同的采集配置或输出目标）：
+1. 每个监控器有独立的锁，启动、停止和查询不同监控器时互不阻塞；
+2. 所有监控器共享一个固定大小的刷新线程池，按各自的刷新间隔调度，
+   同一监控器同一时间只有一次刷新，线程数与监控器数量无关。
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, Any, Optional
+from clock import SYSTEM_CLOCK
+from event_monitor import EventMonitor
+from metrics import REGISTRY
+
+logger = logging.getLogger("monitor_registry")
+
+# 未指定名称时使用的监控器，对应原有的不带名称的接口
+DEFAULT_MONITOR = "default"
+
+# 默认刷新线程数
+DEFAULT_FLUSH_WORKERS = 2
+
+# 没有待刷新的监控器时，刷新线程重新检查的间隔（秒）
+IDLE_WAIT = 60.0
+
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_\-]{1,64}$')
+
+POOL_FLUSHES = REGISTRY.counter("flush_pool_flushes_total", "刷新线程池完成的刷新次数")
+POOL_DELAY = REGISTRY.histogram("flush_pool_delay_seconds", "刷新实际开始时间相对计划时间的延迟（秒）")
+
+
+def validate_name(name: str) -> str:
+    """检查监控器名称（字母、数字、下划线和连字符，最长64个字符），无效时抛出ValueError"""
+    if not isinstance(name, str) or not _NAME_PATTERN.match(name):
+        raise ValueError(f"无效的监控器名称: {name}")
+    return name
+
+
+def default_output_path(name: str) -> str:
+    """监控器的默认输出路径，默认监控器沿用原有路径"""
+    return "./output.json" if name == DEFAULT_MONITOR else f"./output-{name}.json"
+
+
+class FlushPool:
+    """多个监控器共享的刷新线程池"""
+
+    def __init__(self, workers: int = DEFAULT_FLUSH_WORKERS, clock=None):
+        """
+        初始化刷新线程池，线程在第一个监控器注册时启动
+
+        Args:
+            workers: 刷新线程数
+            clock: 计时使用的时钟，应与监控器使用的时钟相同
+        """
+        self.workers = max(1, int(workers))
+        self.clock = clock or SYSTEM_CLOCK
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)  # 刷新完成时通知unregister()
+        self._wake = threading.Event()  # 计划变化时唤醒等待中的刷新线程
+        self._monitors: Dict[int, EventMonitor] = {}
+        self._due: Dict[int, float] = {}
+        self._last: Dict[int, float] = {}
+        self._busy = set()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+
+    def register(self, monitor: EventMonitor):
+        """开始按监控器的刷新间隔定期刷新"""
+        key = id(monitor)
+        with self._lock:
+            now = self.clock.time()
+            self._monitors[key] = monitor
+            self._last[key] = now
+            self._due[key] = now + monitor.flush_interval
+            if not self._running:
+                self._running = True
+                self._threads = [
+                    threading.Thread(target=self._worker, name=f"flush-pool-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+            self._wake.set()
+
+    def unregister(self, monitor: EventMonitor):
+        """停止刷新监控器，等待其正在进行的刷新完成"""
+        key = id(monitor)
+        with self._lock:
+            self._monitors.pop(key, None)
+            self._due.pop(key, None)
+            self._last.pop(key, None)
+            while key in self._busy:
+                self._done.wait()
+
+    def submit(self, monitor: EventMonitor):
+        """尽快刷新监控器（例如缓冲区已满），不阻塞调用线程"""
+        key = id(monitor)
+        with self._lock:
+            if key in self._monitors:
+                self._due[key] = 0.0
+                self._wake.set()
+
+    def reschedule(self, monitor: EventMonitor):
+        """刷新间隔修改后，按新的间隔重新计算距上次刷新的时间"""
+        key = id(monitor)
+        with self._lock:
+            if key in self._monitors:
+                self._due[key] = self._last[key] + monitor.flush_interval
+                self._wake.set()
+
+    def close(self):
+        """停止刷新线程，已注册的监控器不再刷新"""
+        with self._lock:
+            self._running = False
+            self._wake.set()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout=2.0)
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+                # 在锁内清除并重新计算，之后的计划变化会再次设置
+                self._wake.clear()
+                now = self.clock.time()
+                ready = [key for key, due in self._due.items() if due <= now and key not in self._busy]
+                if ready:
+                    key = min(ready, key=self._due.__getitem__)
+                    monitor = self._monitors[key]
+                    due = self._due[key]
+                    self._busy.add(key)
+                    self._last[key] = now
+                    self._due[key] = now + monitor.flush_interval
+                    if len(ready) > 1:
+                        # 还有到期的监控器，交给其他线程
+                        self._wake.set()
+                else:
+                    monitor = None
+                    waiting = [due for key, due in self._due.items() if key not in self._busy]
+                    timeout = max(0.0, min(waiting) - now) if waiting else IDLE_WAIT
+            if monitor is None:
+                self.clock.wait(self._wake, timeout)
+                continue
+
+            POOL_DELAY.observe(max(0.0, now - due) if due else 0.0)
+            try:
+                monitor._flush_buffer()
+                POOL_FLUSHES.inc()
+            except Exception as e:
+                logger.error(f"刷新监控器失败: {str(e)}")
+            finally:
+                with self._lock:
+                    self._busy.discard(key)
+                    self._done.notify_all()
+                    # 刷新期间到期的计划需要重新检查
+                    self._wake.set()
+
+
+class MonitorEntry:
+    """注册表中的一个具名监控器，启动、停止和修改配置在各自的锁内进行"""
+
+    def __init__(self, name: str, config: Dict[str, Any]):
+        self.name = name
+        self.config = config  # 下次启动使用的配置
+        self.monitor: Optional[EventMonitor] = None
+        self.lock = threading.Lock()
+
+
+class MonitorRegistry:
+    """具名监控器的注册表，注册表锁只保护名称到条目的映射"""
+
+    def __init__(self, defaults: Dict[str, Any], flush_workers: int = DEFAULT_FLUSH_WORKERS, clock=None):
+        """
+        初始化注册表
+
+        Args:
+            defaults: 新建条目的默认配置（output_path按名称生成）
+            flush_workers: 共享刷新线程池的线程数
+            clock: 监控器和刷新线程池使用的时钟
+        """
+        self.defaults = defaults
+        self.clock = clock or SYSTEM_CLOCK
+        self.flush_pool = FlushPool(flush_workers, self.clock)
+        self._entries: Dict[str, MonitorEntry] = {}
+        self._lock = threading.Lock()
+
+    def entry(self, name: str = DEFAULT_MONITOR, create: bool = True) -> Optional[MonitorEntry]:
+        """
+        获取条目，不存在时按默认配置创建
+
+        Raises:
+            ValueError: 名称无效
+        """
+        validate_name(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None and create:
+                config = dict(self.defaults, output_path=default_output_path(name))
+                entry = self._entries[name] = MonitorEntry(name, config)
+            return entry
+
+    def get(self, name: str = DEFAULT_MONITOR) -> Optional[EventMonitor]:
+        """名称对应的监控器，未创建时返回None"""
+        entry = self.entry(name, create=False)
+        return entry.monitor if entry else None
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._entries)
+
+    def start(self, name: str, config: Dict[str, Any]) -> EventMonitor:
+        """
+        按配置创建并启动监控器，同名的监控器先停止
+
+        Args:
+            name: 监控器名称
+            config: 已校验的完整配置
+
+        Raises:
+            ValueError: 名称无效，或输出路径已被其他运行中的监控器使用
+            RuntimeError: 启动失败
+        """
+        entry = self.entry(name)
+        with entry.lock:
+            self._check_output_path(name, config["output_path"])
+            if entry.monitor and entry.monitor.running:
+                entry.monitor.stop()
+                logger.info(f"已停止现有监控器: {name}")
+            monitor = EventMonitor(clock=self.clock, flush_pool=self.flush_pool, **config)
+            if not monitor.start():
+                raise RuntimeError("启动监控器失败")
+            entry.monitor = monitor
+        logger.info(f"监控器{name}已启动，配置: {config}")
+        return monitor
+
+    def attach(self, name: str, monitor: Optional[EventMonitor]):
+        """使用外部创建的监控器（例如负载测试和基准测试），为None时解除关联"""
+        entry = self.entry(name)
+        with entry.lock:
+            entry.monitor = monitor
+
+    def stop(self, name: str) -> Optional[EventMonitor]:
+        """停止监控器，未运行时返回None"""
+        entry = self.entry(name, create=False)
+        if entry is None:
+            return None
+        with entry.lock:
+            monitor = entry.monitor
+            if not monitor or not monitor.running:
+                return None
+            monitor.stop()
+        return monitor
+
+    def remove(self, name: str) -> bool:
+        """停止并移除监控器，默认监控器只停止不移除"""
+        self.stop(name)
+        if name == DEFAULT_MONITOR:
+            return True
+        with self._lock:
+            return self._entries.pop(name, None) is not None
+
+    def close(self):
+        """停止所有监控器和刷新线程池"""
+        for name in self.names():
+            self.stop(name)
+        self.flush_pool.close()
+
+    def _check_output_path(self, name: str, output_path: str):
+        path = os.path.abspath(output_path)
+        with self._lock:
+            entries = list(self._entries.values())
+        for other in entries:
+            monitor = other.monitor
+            if other.name != name and monitor and monitor.running and os.path.abspath(monitor.output_path) == path:
+                raise ValueError(f"输出路径已被监控器{other.name}使用: {output_path}")
@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 时间汇总模块
+
+该模块在刷新路径上增量维护分钟、小时和天三级汇总：每个时间桶内按
+(事件类型, 应用)计数，并按应用累计鼠标移动距离和按键次数。
+每次刷新的事件先按分钟聚合，再合并到三个级别；较细的级别只保留最近一段时间，
+超出保留期的桶已经合并在较粗的级别中，直接丢弃。
+
+查询长时间范围时选择满足粒度要求的最粗级别，返回的数据量与事件数量无关。
+时间桶按UTC对齐。
+
+用法:
+    python rollups.py output.json      # 从原始事件重建汇总
+"""
+
+import os
+import sys
+import math
+import logging
+import argparse
+import datetime
+import threading
+from typing import Dict, Any, Optional, Iterable, Tuple, Union
+from cryptography.fernet import Fernet
+from event_store import parse_timestamp
+from codec import CODEC
+from keystrokes import TYPING_SUMMARY
+
+logger = logging.getLogger("rollups")
+
+# 汇总文件后缀
+ROLLUP_SUFFIX = ".rollups.json"
+
+# 汇总级别：(名称, 桶大小（秒）, 保留时长（秒），None表示永久保留)
+TIERS = (
+    ("minute", 60, 3 * 86400),
+    ("hour", 3600, 90 * 86400),
+    ("day", 86400, None)
+)
+
+# 未指定粒度时，返回的桶数量不超过该值
+MAX_POINTS = 1000
+
+POINTER_TYPES = {"mouse_move", "mouse_click", "mouse_scroll"}
+KEYSTROKE_TYPE = "key_press"
+
+FORMAT_VERSION = 1
+
+
+class _Bucket:
+    """一个时间桶：按(事件类型, 应用)的计数，以及按应用的鼠标距离和按键数"""
+
+    __slots__ = ("counts", "distance", "keys")
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.distance: Dict[str, float] = {}
+        self.keys: Dict[str, int] = {}
+
+    def merge(self, other: "_Bucket"):
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        for app, distance in other.distance.items():
+            self.distance[app] = self.distance.get(app, 0.0) + distance
+        for app, keys in other.keys.items():
+            self.keys[app] = self.keys.get(app, 0) + keys
+
+
+class _Tier:
+    """一个汇总级别"""
+
+    def __init__(self, name: str, size: int, retention: Optional[int]):
+        self.name = name
+        self.size = size
+        self.retention = retention
+        self.buckets: Dict[int, _Bucket] = {}
+        # 早于该时间的桶已被丢弃
+        self.trimmed_before: Optional[int] = None
+
+    def merge(self, start: int, bucket: _Bucket):
+        key = start - start % self.size
+        target = self.buckets.get(key)
+        if target is None:
+            target = self.buckets[key] = _Bucket()
+        target.merge(bucket)
+
+    def trim(self):
+        """丢弃超出保留期的桶（以最新的桶为基准）"""
+        if self.retention is None or not self.buckets:
+            return
+        cutoff = max(self.buckets) - self.retention
+        cutoff -= cutoff % self.size
+        expired = [key for key in self.buckets if key < cutoff]
+        for key in expired:
+            del self.buckets[key]
+        if expired:
+            self.trimmed_before = max(self.trimmed_before or cutoff, cutoff)
+
+    def covers(self, start: Optional[float]) -> bool:
+        """是否保留了start之后的全部数据"""
+        if self.trimmed_before is None:
+            return True
+        return start is not None and start >= self.trimmed_before
+
+
+class RollupAggregator:
+    """分钟、小时和天三级汇总，线程安全"""
+
+    def __init__(self):
+        self.tiers = [_Tier(name, size, retention) for name, size, retention in TIERS]
+        # 已汇总的存储帧数，用于重启后补齐
+        self.frames = 0
+        self._last_pointer: Optional[Tuple[float, float]] = None
+        self._lock = threading.Lock()
+
+    def add(self, events: Iterable[Dict[str, Any]]) -> int:
+        """
+        汇总一批（通常是刚写入的一帧）事件
+
+        Returns:
+            计入的事件数
+        """
+        minutes: Dict[int, _Bucket] = {}
+        count = 0
+        last_pointer = self._last_pointer
+        for event in events:
+            try:
+                ts = parse_timestamp(event.get("timestamp"))
+            except (ValueError, TypeError):
+                continue
+            if ts is None:
+                continue
+            minute = int(ts // 60) * 60
+            bucket = minutes.get(minute)
+            if bucket is None:
+                bucket = minutes[minute] = _Bucket()
+            event_type = event.get("type", "")
+            app = (event.get("window") or {}).get("app_name", "")
+            key = (event_type, app)
+            bucket.counts[key] = bucket.counts.get(key, 0) + 1
+            if event_type == KEYSTROKE_TYPE:
+                bucket.keys[app] = bucket.keys.get(app, 0) + 1
+            elif event_type == TYPING_SUMMARY:
+                # 汇总模式下按键次数记录在typing_summary中
+                bucket.keys[app] = bucket.keys.get(app, 0) + int(event.get("key_count") or 0)
+            elif event_type in POINTER_TYPES:
+                position = event.get("position")
+                if position:
+                    x, y = position.get("x"), position.get("y")
+                    if x is not None and y is not None:
+                        if last_pointer is not None:
+                            bucket.distance[app] = bucket.distance.get(app, 0.0) + math.hypot(
+                                x - last_pointer[0], y - last_pointer[1])
+                        last_pointer = (x, y)
+            count += 1
+
+        with self._lock:
+            self._last_pointer = last_pointer
+            self.frames += 1
+            for start, bucket in minutes.items():
+                for tier in self.tiers:
+                    tier.merge(start, bucket)
+            for tier in self.tiers:
+                tier.trim()
+        return count
+
+    def catch_up(self, store) -> int:
+        """
+        汇总存储中尚未汇总的帧（上次保存后写入的帧）
+
+        Returns:
+            补齐的帧数
+        """
+        total = store.frame_count()
+        if total < self.frames:
+            # 存储被替换过，重新汇总全部数据
+            logger.warning("汇总记录的帧数多于存储，重新汇总")
+            self.reset()
+        start_frame = self.frames
+        for _, events in store.iter_frames(start_frame):
+            self.add(events)
+        return self.frames - start_frame
+
+    def reset(self):
+        """清空全部汇总"""
+        with self._lock:
+            self.tiers = [_Tier(name, size, retention) for name, size, retention in TIERS]
+            self.frames = 0
+            self._last_pointer = None
+
+    def choose_tier(self, start: Optional[float], end: Optional[float],
+                    granularity: Optional[Union[str, int]] = None) -> Tuple[str, int]:
+        """
+        选择满足粒度要求的最粗级别
+
+        Args:
+            start: 起始时间
+            end: 结束时间（不含）
+            granularity: 级别名称或秒数，为None时按时间范围选择，使桶数不超过MAX_POINTS
+
+        Returns:
+            (级别名称, 实际粒度（秒）)
+
+        Raises:
+            ValueError: 粒度无效
+        """
+        sizes = {name: size for name, size, _ in TIERS}
+        with self._lock:
+            tiers = list(self.tiers)
+            if granularity is None:
+                first, last = self._extent(start, end)
+                span = max(last - first, 1.0)
+                seconds = next((size for _, size, _ in TIERS if span / size <= MAX_POINTS), TIERS[-1][1])
+            elif isinstance(granularity, str) and granularity in sizes:
+                seconds = sizes[granularity]
+            else:
+                try:
+                    seconds = int(granularity)
+                except (TypeError, ValueError):
+                    raise ValueError(f"无效的粒度: {granularity}")
+                if seconds <= 0 or seconds % TIERS[0][1]:
+                    raise ValueError(f"粒度必须是{TIERS[0][1]}秒的正整数倍")
+
+            candidates = [tier for tier in tiers if seconds % tier.size == 0]
+            tier = candidates[-1]
+            # 细级别已丢弃了起始时间的数据时改用更粗的级别，粒度相应放大
+            for coarser in tiers[tiers.index(tier):]:
+                tier = coarser
+                if coarser.covers(start):
+                    break
+        seconds = int(math.ceil(seconds / tier.size)) * tier.size
+        return tier.name, seconds
+
+    def _extent(self, start: Optional[float], end: Optional[float]) -> Tuple[float, float]:
+        day = self.tiers[-1]
+        if day.buckets:
+            first = min(day.buckets)
+            last = max(day.buckets) + day.size
+        else:
+            first = last = 0.0
+        return (first if start is None else start), (last if end is None else end)
+
+    def query(self,
+              start: Optional[float] = None,
+              end: Optional[float] = None,
+              granularity: Optional[Union[str, int]] = None,
+              types: Optional[Iterable[str]] = None,
+              app: Optional[str] = None) -> Dict[str, Any]:
+        """
+        查询时间范围内的汇总
+
+        Args:
+            start: 起始时间，所在的桶包含在结果中
+            end: 结束时间（不含）
+            granularity: 级别名称或秒数
+            types: 只统计这些事件类型
+            app: 只统计该应用（不区分大小写）
+
+        Returns:
+            包含级别、粒度和非空桶列表的字典，桶按时间升序
+        """
+        tier_name, seconds = self.choose_tier(start, end, granularity)
+        types = set(types) if types else None
+        app = app.lower() if app else None
+        grouped: Dict[int, _Bucket] = {}
+        with self._lock:
+            tier = next(t for t in self.tiers if t.name == tier_name)
+            for key, bucket in tier.buckets.items():
+                if start is not None and key + tier.size <= start:
+                    continue
+                if end is not None and key >= end:
+                    continue
+                group = key - key % seconds
+                target = grouped.get(group)
+                if target is None:
+                    target = grouped[group] = _Bucket()
+                target.merge(bucket)
+
+        buckets = []
+        for key in sorted(grouped):
+            bucket = grouped[key]
+            type_counts: Dict[str, int] = {}
+            app_counts: Dict[str, int] = {}
+            for (event_type, event_app), count in bucket.counts.items():
+                if types is not None and event_type not in types:
+                    continue
+                if app is not None and event_app.lower() != app:
+                    continue
+                type_counts[event_type] = type_counts.get(event_type, 0) + count
+                app_counts[event_app] = app_counts.get(event_app, 0) + count
+            distance = sum(d for a, d in bucket.distance.items() if app is None or a.lower() == app)
+            keys = sum(k for a, k in bucket.keys.items() if app is None or a.lower() == app)
+            if not type_counts and not distance and not keys:
+                continue
+            buckets.append({
+                "start": datetime.datetime.fromtimestamp(key, datetime.timezone.utc).isoformat(),
+                "total": sum(type_counts.values()),
+                "types": type_counts,
+                "apps": app_counts,
+                "mouse_distance": round(distance, 1),
+                "keystrokes": keys
+            })
+        return {"tier": tier_name, "granularity": seconds, "buckets": buckets}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        序列化为可写入JSON的字典
+
+        类型和应用名称存入字符串表，每个桶为
+        [开始时间, [类型序号, 应用序号, 计数, ...], [应用序号, 距离, ...], [应用序号, 按键数, ...]]
+        """
+        strings: Dict[str, int] = {}
+
+        def ref(name: str) -> int:
+            index = strings.get(name)
+            if index is None:
+                index = strings[name] = len(strings)
+            return index
+
+        with self._lock:
+            tiers = {}
+            for tier in self.tiers:
+                rows = []
+                for key in sorted(tier.buckets):
+                    bucket = tier.buckets[key]
+                    counts = []
+                    for (event_type, app), count in bucket.counts.items():
+                        counts.extend((ref(event_type), ref(app), count))
+                    distance = []
+                    for app, value in bucket.distance.items():
+                        distance.extend((ref(app), round(value, 1)))
+                    keys = []
+                    for app, value in bucket.keys.items():
+                        keys.extend((ref(app), value))
+                    rows.append([key, counts, distance, keys])
+                tiers[tier.name] = {"trimmed_before": tier.trimmed_before, "buckets": rows}
+            return {
+                "version": FORMAT_VERSION,
+                "frames": self.frames,
+                "last_pointer": self._last_pointer,
+                "strings": list(strings),
+                "tiers": tiers
+            }
+
+    def load_dict(self, data: Dict[str, Any]) -> bool:
+        """从字典恢复汇总，格式版本不一致时忽略"""
+        if data.get("version") != FORMAT_VERSION:
+            logger.warning("汇总文件格式版本不一致，忽略已保存的数据")
+            return False
+        strings = data.get("strings", [])
+        tiers = [_Tier(name, size, retention) for name, size, retention in TIERS]
+        for tier in tiers:
+            saved = data.get("tiers", {}).get(tier.name, {})
+            tier.trimmed_before = saved.get("trimmed_before")
+            for key, counts, distance, keys in saved.get("buckets", []):
+                bucket = tier.buckets[int(key)] = _Bucket()
+                for i in range(0, len(counts), 3):
+                    bucket.counts[(strings[counts[i]], strings[counts[i + 1]])] = counts[i + 2]
+                for i in range(0, len(distance), 2):
+                    bucket.distance[strings[distance[i]]] = distance[i + 1]
+                for i in range(0, len(keys), 2):
+                    bucket.keys[strings[keys[i]]] = keys[i + 1]
+        with self._lock:
+            self.tiers = tiers
+            self.frames = int(data.get("frames", 0))
+            last_pointer = data.get("last_pointer")
+            self._last_pointer = tuple(last_pointer) if last_pointer else None
+        return True
+
+    def save(self, path: str, encryption_key: Optional[bytes] = None):
+        """原子地写入汇总文件，指定密钥时与事件存储一样加密（汇总中包含应用名称）"""
+        data = CODEC.dumps(self.to_dict())
+        if encryption_key:
+            data = Fernet(encryption_key).encrypt(data)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, encryption_key: Optional[bytes] = None) -> bool:
+        """读取汇总文件（如果存在）"""
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if encryption_key:
+                data = Fernet(encryption_key).decrypt(data)
+            return self.load_dict(CODEC.loads(data))
+        except Exception as e:
+            logger.error(f"读取汇总文件失败: {str(e)}")
+            return False
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 重建时间汇总",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", type=str, help="事件数据文件路径")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件由本机加密写入")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import EventStore
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.input):
+        logger.error(f"输入文件不存在: {args.input}")
+        return 1
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    rollups = RollupAggregator()
+    frames = rollups.catch_up(EventStore(args.input, key))
+    path = args.input + ROLLUP_SUFFIX
+    rollups.save(path, key)
+    logger.info(f"已汇总{frames}帧到: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,21 +10,21 @@ MacOS用户行为实时记录工具 - 主程序
 
 import os
 import sys
+import json
+import time
+import signal
 import argparse
 import logging
 import platform
 import subprocess
+import threading
 from event_monitor import EventMonitor
+from async_core import AsyncEventMonitor, SQLiteSink
+from keystrokes import KEYSTROKE_MODES, MODE_RAW, DEFAULT_INTERVAL as KEYSTROKE_INTERVAL, parse_app_modes
+from memory_governor import DEFAULT_BUDGET_MB
+from tracing import TRACER, profile_process
+from log_setup import configure_logging
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('monitor.log', encoding='utf-8')
-    ]
-)
 logger = logging.getLogger("run")
 
 
@@ -82,6 +82,83 @@ def parse_args():
         help="写入文件的间隔时间（秒）"
     )
     
+    parser.add_argument(
+        "--compression",
+        action="store_true",
+        help="压缩写入的帧"
+    )
+    
+    parser.add_argument(
+        "--writer_process",
+        action="store_true",
+        help="由单独的写入进程完成序列化、压缩、加密和写入"
+    )
+    
+    parser.add_argument(
+        "--async_core",
+        action="store_true",
+        help="使用asyncio事件核心：事件源、队列、定时刷新和写入都在同一个事件循环中完成"
+    )
+    
+    parser.add_argument(
+        "--sqlite_sink",
+        type=str,
+        default=None,
+        help="同时把刷新的事件写入指定的SQLite数据库（需要--async_core）"
+    )
+    
+    parser.add_argument(
+        "--keystroke_mode",
+        type=str,
+        choices=KEYSTROKE_MODES,
+        default=MODE_RAW,
+        help="按键记录模式：raw逐个记录，summary按时间窗口汇总，anonymous汇总且不保留按键身份"
+    )
+    
+    parser.add_argument(
+        "--keystroke_app_mode",
+        type=str,
+        action="append",
+        default=[],
+        metavar="应用=模式",
+        help="为指定应用单独设置按键记录模式，可重复"
+    )
+    
+    parser.add_argument(
+        "--keystroke_interval",
+        type=float,
+        default=KEYSTROKE_INTERVAL,
+        help="按键汇总的时间窗口（秒）"
+    )
+    
+    parser.add_argument(
+        "--memory_budget_mb",
+        type=float,
+        default=DEFAULT_BUDGET_MB,
+        help="缓冲区和最近事件的内存预算（MB），超出时降低采样率并把旧事件溢出到磁盘"
+    )
+    
+    parser.add_argument(
+        "--collector",
+        type=str,
+        default=None,
+        help="收集器地址（unix:/路径 或 主机:端口），设置后事件发送给收集器，不可用时写入本地缓存"
+    )
+    
+    parser.add_argument(
+        "--trace_sample_rate",
+        type=float,
+        default=0.0,
+        help="分阶段耗时追踪的采样率 (0-1.0)，0表示禁用"
+    )
+    
+    parser.add_argument(
+        "--profile_seconds",
+        type=float,
+        default=10.0,
+        help="收到SIGUSR1信号时栈采样分析的时长（秒）"
+    )
+    
     parser.add_argument(
         "--log_level",
         type=str,
@@ -102,6 +179,20 @@ def parse_args():
     if args.flush_interval < 1.0:
         parser.error("刷新间隔必须至少为1.0秒")
     
+    if args.memory_budget_mb < 1.0:
+        parser.error("内存预算必须至少为1MB")
+    
+    if args.sqlite_sink and not args.async_core:
+        parser.error("--sqlite_sink 需要同时指定 --async_core")
+    
+    if args.trace_sample_rate < 0.0 or args.trace_sample_rate > 1.0:
+        parser.error("追踪采样率必须在0到1.0之间")
+    
+    try:
+        args.keystroke_app_modes = parse_app_modes(args.keystroke_app_mode)
+    except ValueError as e:
+        parser.error(str(e))
+    
     return args
 
 
@@ -196,13 +287,28 @@ def print_permission_instructions():
     print("=" * 80 + "\n")
 
 
+def install_profile_signal(seconds, output_dir):
+    """安装SIGUSR1处理函数：收到信号时对本进程进行栈采样，并写出结果文件"""
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    
+    def capture():
+        result = profile_process(seconds)
+        path = os.path.join(output_dir, f"profile-{time.strftime('%Y%m%d%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"栈采样结果已写入: {path}")
+    
+    def handler(signum, frame):
+        threading.Thread(target=capture, daemon=True).start()
+    
+    signal.signal(signal.SIGUSR1, handler)
+    logger.info(f"发送SIGUSR1信号（kill -USR1 {os.getpid()}）可进行{seconds}秒的栈采样分析")
+
+
 def setup_logging(log_level):
-    """设置日志级别"""
-    level = getattr(logging, log_level)
-    for handler in logging.root.handlers:
-        handler.setLevel(level)
-    logging.root.setLevel(level)
-    logger.setLevel(level)
+    """配置异步日志并设置日志级别"""
+    configure_logging(log_level, log_file='monitor.log')
     logger.info(f"日志级别设置为: {log_level}")
 
 
@@ -239,16 +345,33 @@ def main():
             logger.error(f"创建输出目录失败: {str(e)}")
             return 1
     
+    # 分阶段耗时追踪与按需栈采样
+    TRACER.set_sample_rate(args.trace_sample_rate)
+    install_profile_signal(args.profile_seconds, output_dir or os.getcwd())
+    
     # 创建并启动事件监控器
     try:
-        monitor = EventMonitor(
+        monitor_class = EventMonitor
+        extra = {}
+        if args.async_core:
+            monitor_class = AsyncEventMonitor
+            extra["sinks"] = [SQLiteSink(args.sqlite_sink)] if args.sqlite_sink else []
+        monitor = monitor_class(
             test_mode=args.test_mode,
             output_path=args.output_path,
             sampling_rate=args.sampling_rate,
             encryption=args.encryption,
             filter_sensitive=args.filter_sensitive,
             buffer_size=args.buffer_size,
-            flush_interval=args.flush_interval
+            flush_interval=args.flush_interval,
+            collector_address=args.collector,
+            compression=args.compression,
+            writer_process=args.writer_process,
+            keystroke_mode=args.keystroke_mode,
+            keystroke_app_modes=args.keystroke_app_modes,
+            keystroke_interval=args.keystroke_interval,
+            memory_budget_mb=args.memory_budget_mb,
+            **extra
         )
         
         if not monitor.start():
@@ -259,6 +382,8 @@ def main():
         mode = "测试" if args.test_mode else "正常"
         print(f"\n事件监控器已启动（{mode}模式）")
         print(f"输出文件: {args.output_path}")
+        if args.collector:
+            print(f"收集器: {args.collector}")
         print(f"刷新间隔: {args.flush_interval}秒")
         print(f"采样率: {args.sampling_rate}")
         if args.encryption:
@@ -268,7 +393,6 @@ def main():
         # 保持程序运行，直到用户按下Ctrl+C
         try:
             while True:
-                import time
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\n接收到停止信号，正在停止监控器...")
@@ -277,6 +401,11 @@ def main():
             monitor.stop()
             print(f"已记录{monitor.event_count}个事件")
             print(f"数据已保存到: {args.output_path}")
+            if TRACER.enabled:
+                print("各阶段耗时（毫秒）:")
+                for stage, stats in sorted(TRACER.summary().items()):
+                    print(f"  {stage}: 次数={stats['count']} 平均={stats['mean_ms']:.3f} "
+                          f"p99<={stats['p99_ms']:.3f} 最大={stats['max_ms']:.3f}")
         
         return 0
     except Exception as e:
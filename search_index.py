@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 窗口标题和应用名称的倒排索引
+
+该模块在刷新路径上为每个写入的帧（段）建立索引：把帧内事件的窗口标题和应用名称
+切分为词，记录每个词出现在哪些段以及这些段的时间范围。按标题或应用搜索时
+先在内存中求出包含所有查询词的段，只读取和解密这些段，查询耗时与匹配的段数有关，
+而与历史总量无关。
+
+索引以每段一行的形式追加写入 `<输出路径>.search`，重启时读入并从存储补齐。
+存储加密时索引中只保存词的HMAC摘要，不保存标题原文，此时不支持通配符查询。
+
+用法:
+    python search_index.py output.json      # 从原始事件重建索引
+"""
+
+import os
+import re
+import sys
+import hmac
+import bisect
+import heapq
+import hashlib
+import logging
+import argparse
+import fnmatch
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from event_store import parse_timestamp
+from codec import CODEC
+
+logger = logging.getLogger("search_index")
+
+# 索引文件后缀
+SEARCH_SUFFIX = ".search"
+
+# 字段前缀：窗口标题和应用名称的词分开索引
+TITLE_FIELD = "t"
+APP_FIELD = "a"
+
+# 加密时词摘要的长度（十六进制字符数）
+DIGEST_LENGTH = 16
+
+# 一次搜索最多返回的段数
+MAX_SEGMENTS = 1000
+
+WORD_PATTERN = re.compile(r"\w+")
+CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+WILDCARD_CHARS = set("*?[")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    把文本切分为小写的词
+
+    连续的字母数字为一个词；中日韩文字没有分隔符，按相邻两个字切分（单字的词保留单字）。
+    """
+    if not text:
+        return []
+    tokens = []
+    for word in WORD_PATTERN.findall(str(text).lower()):
+        if not CJK_PATTERN.search(word):
+            tokens.append(word)
+            continue
+        # 按文字类别拆开，中日韩部分切成二元组
+        for part in re.findall(r"[぀-ヿ㐀-䶿一-鿿가-힯]+|[^぀-ヿ㐀-䶿一-鿿가-힯]+", word):
+            if not CJK_PATTERN.match(part):
+                tokens.append(part)
+            elif len(part) == 1:
+                tokens.append(part)
+            else:
+                tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+def _is_pattern(word: str) -> bool:
+    return any(c in WILDCARD_CHARS for c in word)
+
+
+def parse_query(text: Optional[str]) -> List[str]:
+    """
+    解析查询文本
+
+    以空白分隔，含 `*`、`?` 的词作为通配符模式整体保留（例如 `*invoice*`），
+    其他部分按tokenize切分。所有词都需要匹配。
+    """
+    terms = []
+    for word in (text or "").lower().split():
+        if _is_pattern(word):
+            terms.append(word)
+        else:
+            terms.extend(tokenize(word))
+    return terms
+
+
+def _event_terms(event: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    window = event.get("window") or {}
+    return tokenize(window.get("window_title")), tokenize(window.get("app_name"))
+
+
+def _window_key(event: Dict[str, Any]) -> Tuple[Any, Any]:
+    window = event.get("window") or {}
+    return window.get("window_title"), window.get("app_name")
+
+
+def _terms_match(tokens: List[str], terms: List[str]) -> bool:
+    for term in terms:
+        if _is_pattern(term):
+            if not any(fnmatch.fnmatchcase(token, term) for token in tokens):
+                return False
+        elif term not in tokens:
+            return False
+    return True
+
+
+def event_matches(event: Dict[str, Any], title_terms: List[str], app_terms: List[str]) -> bool:
+    """判断单个事件是否包含所有标题词和应用词"""
+    titles, apps = _event_terms(event)
+    return _terms_match(titles, title_terms) and _terms_match(apps, app_terms)
+
+
+class SearchIndex:
+    """按段（存储中的帧）记录词出现位置的倒排索引，线程安全"""
+
+    def __init__(self, path: Optional[str] = None, encryption_key: Optional[bytes] = None):
+        """
+        Args:
+            path: 索引文件路径，为None时只保存在内存中
+            encryption_key: 存储的加密密钥，设置后只保存词的摘要
+        """
+        self.path = path
+        self.encryption_key = encryption_key
+        # 词 -> 按段号递增的段号列表
+        self.postings: Dict[str, List[int]] = {}
+        # 段号（存储中的帧号） -> (最早时间, 最晚时间)
+        self.ranges: Dict[int, Tuple[float, float]] = {}
+        self._next_frame = 0
+        self._lock = threading.Lock()
+
+    @property
+    def frames(self) -> int:
+        """已索引到的帧数（最大段号加1），中间未索引的帧由catch_up补齐"""
+        return self._next_frame
+
+    def _key(self, field: str, term: str) -> str:
+        key = f"{field}:{term}"
+        if self.encryption_key is None:
+            return key
+        return hmac.new(self.encryption_key, key.encode("utf-8"), hashlib.sha256).hexdigest()[:DIGEST_LENGTH]
+
+    # ------------------------------------------------------------------
+    # 建立索引
+    # ------------------------------------------------------------------
+
+    def add(self, events: Iterable[Dict[str, Any]], frame: Optional[int] = None) -> int:
+        """
+        索引一批事件（刚写入存储的一帧）
+
+        先更新内存中的索引再追加索引文件；追加失败时抛出异常，重启后由catch_up补齐该帧。
+
+        Args:
+            events: 该帧的事件
+            frame: 该帧在存储中的帧号，作为段号；默认为已索引的最后一段之后
+
+        Returns:
+            该段的段号
+        """
+        keys = set()
+        t_min = t_max = None
+        for event in events:
+            try:
+                ts = parse_timestamp(event.get("timestamp"))
+            except (ValueError, TypeError):
+                ts = None
+            if ts is not None:
+                t_min = ts if t_min is None else min(t_min, ts)
+                t_max = ts if t_max is None else max(t_max, ts)
+            titles, apps = _event_terms(event)
+            keys.update(self._key(TITLE_FIELD, term) for term in titles)
+            keys.update(self._key(APP_FIELD, term) for term in apps)
+        record = {"start": t_min or 0.0, "end": t_max or 0.0, "terms": sorted(keys)}
+
+        with self._lock:
+            record["segment"] = segment = self._next_frame if frame is None else frame
+            if segment in self.ranges:
+                return segment
+            self._apply(record)
+            if self.path:
+                with open(self.path, "ab") as f:
+                    f.write(CODEC.dumps(record) + b"\n")
+        return segment
+
+    def _apply(self, record: Dict[str, Any]):
+        segment = int(record["segment"])
+        self.ranges[segment] = (float(record["start"]), float(record["end"]))
+        self._next_frame = max(self._next_frame, segment + 1)
+        for key in record["terms"]:
+            postings = self.postings.get(key)
+            if postings is None:
+                self.postings[key] = [segment]
+            elif postings[-1] < segment:
+                postings.append(segment)
+            else:
+                # 补齐的帧早于已索引的段
+                bisect.insort(postings, segment)
+
+    def catch_up(self, store) -> int:
+        """
+        索引存储中尚未索引的帧
+
+        Returns:
+            补齐的帧数
+        """
+        total = store.frame_count()
+        if total < self.frames:
+            # 存储被替换过，重新建立索引
+            logger.warning("索引记录的段数多于存储，重新建立索引")
+            self.reset()
+        # 追加索引文件失败时留下的空缺
+        with self._lock:
+            missing = [frame for frame in range(self._next_frame) if frame not in self.ranges]
+        for frame in missing:
+            self.add(store.read_frame(frame), frame)
+        start_frame = self.frames
+        for frame, events in store.iter_frames(start_frame):
+            self.add(events, frame)
+        return len(missing) + self.frames - start_frame
+
+    def reset(self):
+        """清空索引和索引文件"""
+        with self._lock:
+            self.postings = {}
+            self.ranges = {}
+            self._next_frame = 0
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def load(self, path: Optional[str] = None) -> int:
+        """
+        读取索引文件（如果存在）
+
+        读取自己的索引文件时，末尾不完整的记录（写入时中断）被截掉；损坏的记录被跳过，
+        缺少的段由catch_up补齐。
+
+        Args:
+            path: 只读地读入其他索引文件（例如另一个进程正在写入的索引），默认读取self.path
+
+        Returns:
+            读入的段数
+        """
+        source = path or self.path
+        if not source or not os.path.exists(source):
+            return 0
+        valid_size = size = 0
+        with self._lock:
+            self.postings, self.ranges, self._next_frame = {}, {}, 0
+            with open(source, "rb") as f:
+                for line in f:
+                    size += len(line)
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("记录不完整")
+                        record = CODEC.loads(line)
+                        segment = record["segment"]
+                        if not isinstance(segment, int) or segment < 0:
+                            raise ValueError("段号无效")
+                    except Exception:
+                        logger.warning(f"索引文件在偏移{size - len(line)}处的记录损坏，已跳过")
+                        continue
+                    valid_size = size
+                    if segment not in self.ranges:
+                        self._apply(record)
+            if source == self.path and valid_size < size:
+                # 只截掉末尾的损坏部分，中间跳过的记录保留在文件中
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_size)
+            return len(self.ranges)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def _lookup(self, field: str, term: str) -> List[int]:
+        """返回包含该词的段号列表；通配符模式合并词表中所有匹配的词"""
+        if not _is_pattern(term):
+            return self.postings.get(self._key(field, term), [])
+        if self.encryption_key is not None:
+            raise ValueError("加密存储的索引不支持通配符查询")
+        prefix = f"{field}:"
+        pattern = prefix + term
+        lists = [postings for key, postings in self.postings.items()
+                 if key.startswith(prefix) and fnmatch.fnmatchcase(key, pattern)]
+        if len(lists) == 1:
+            return lists[0]
+        merged = []
+        for segment in heapq.merge(*lists):
+            if not merged or merged[-1] != segment:
+                merged.append(segment)
+        return merged
+
+    def segments(self,
+                 title: Optional[str] = None,
+                 app: Optional[str] = None,
+                 start: Optional[float] = None,
+                 end: Optional[float] = None) -> List[int]:
+        """
+        查找可能包含匹配事件的段
+
+        Args:
+            title: 窗口标题查询，见parse_query
+            app: 应用名称查询
+            start: 起始时间（含）
+            end: 结束时间（不含）
+
+        Returns:
+            按段号递增的段号列表
+
+        Raises:
+            ValueError: 查询为空，或对加密索引使用通配符
+        """
+        lookups = [(TITLE_FIELD, term) for term in parse_query(title)]
+        lookups += [(APP_FIELD, term) for term in parse_query(app)]
+        if not lookups:
+            raise ValueError("查询词不能为空")
+
+        with self._lock:
+            lists = sorted((self._lookup(field, term) for field, term in lookups), key=len)
+            # 从最短的列表出发，在其他列表中二分查找
+            result = []
+            for segment in lists[0]:
+                if all(_contains(other, segment) for other in lists[1:]):
+                    t_min, t_max = self.ranges[segment]
+                    if start is not None and t_max < start:
+                        continue
+                    if end is not None and t_min >= end:
+                        continue
+                    result.append(segment)
+            return result
+
+    def time_range(self, segment: int) -> Tuple[float, float]:
+        """返回段的(最早时间, 最晚时间)"""
+        with self._lock:
+            return self.ranges[segment]
+
+
+def _contains(postings: List[int], segment: int) -> bool:
+    i = bisect.bisect_left(postings, segment)
+    return i < len(postings) and postings[i] == segment
+
+
+def search_events(store, index: SearchIndex,
+                  title: Optional[str] = None,
+                  app: Optional[str] = None,
+                  start: Optional[float] = None,
+                  end: Optional[float] = None,
+                  position: Tuple[int, int] = (0, 0)) -> Iterator[Tuple[Tuple[int, int], Dict[str, Any]]]:
+    """
+    只读取索引给出的段，逐个校验事件，返回((段号, 段内序号), 事件)
+
+    Args:
+        position: 从该(段号, 段内序号)开始，用于分页
+
+    Raises:
+        ValueError: 查询无效
+    """
+    title_terms, app_terms = parse_query(title), parse_query(app)
+    segments = index.segments(title, app, start, end)
+    segments = segments[bisect.bisect_left(segments, position[0]):]
+    if not segments:
+        return
+    # 同一窗口的事件很多，每个(标题, 应用)只校验一次
+    matched: Dict[Tuple[Any, Any], bool] = {}
+    total = store.frame_count()
+    with open(store.path, "rb") as data_file:
+        for segment in segments:
+            if segment >= total:
+                break
+            events = store.read_frame(segment, data_file)
+            for i in range(position[1] if segment == position[0] else 0, len(events)):
+                event = events[i]
+                if start is not None or end is not None:
+                    try:
+                        ts = parse_timestamp(event.get("timestamp"))
+                    except (ValueError, TypeError):
+                        continue
+                    if ts is None or (start is not None and ts < start) or (end is not None and ts >= end):
+                        continue
+                key = _window_key(event)
+                found = matched.get(key)
+                if found is None:
+                    found = matched[key] = event_matches(event, title_terms, app_terms)
+                if found:
+                    yield (segment, i), event
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 重建搜索索引",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", type=str, help="事件数据文件路径")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件由本机加密写入")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import EventStore
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.input):
+        logger.error(f"输入文件不存在: {args.input}")
+        return 1
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    index = SearchIndex(args.input + SEARCH_SUFFIX, key)
+    index.reset()
+    frames = index.catch_up(EventStore(args.input, key))
+    logger.info(f"已索引{frames}段到: {index.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
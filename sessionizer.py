@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 会话切分模块
+
+该模块流式消费事件，生成派生记录：
+1. activity_session：活动会话，相邻事件间隔超过idle_gap时切分；
+2. app_focus：应用专注区间，前台应用变化或进入空闲时结束；
+3. typing_burst / pointing_burst：连续的键盘或鼠标输入，间隔超过burst_gap时结束。
+
+按键汇总模式下的typing_summary事件按窗口内实际打字的区间（active_start起
+active_seconds秒）计入，按键次数计入事件数，不使用窗口结束时间。
+
+每种记录同一时间最多只有一个未结束的区间，状态大小与事件数量无关。
+派生记录与原始事件使用相同的存储格式，保存在输出文件旁的.derived文件中：
+timestamp为结束时间，start为开始时间，app_focus带window.app_name，
+因此可以直接用EventStore.query按时间、类型和应用查询。
+
+用法:
+    python sessionizer.py output.json                # 从原始事件重建派生记录
+    python sessionizer.py output.json --idle_gap 600 --encrypted
+"""
+
+import os
+import sys
+import heapq
+import logging
+import argparse
+import datetime
+import itertools
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+from event_store import parse_timestamp
+from keystrokes import TYPING_SUMMARY
+
+logger = logging.getLogger("sessionizer")
+
+# 派生记录文件后缀
+DERIVED_SUFFIX = ".derived"
+
+# 默认空闲阈值（秒）：相邻事件间隔超过该值视为离开
+DEFAULT_IDLE_GAP = 300.0
+
+# 默认连续输入阈值（秒），以及一次连续输入至少包含的事件数
+DEFAULT_BURST_GAP = 2.0
+MIN_BURST_EVENTS = 3
+
+ACTIVITY_SESSION = "activity_session"
+APP_FOCUS = "app_focus"
+TYPING_BURST = "typing_burst"
+POINTING_BURST = "pointing_burst"
+RECORD_TYPES = (ACTIVITY_SESSION, APP_FOCUS, TYPING_BURST, POINTING_BURST)
+
+KEYBOARD_TYPES = {"key_press", "key_release"}
+POINTER_TYPES = {"mouse_move", "mouse_click", "mouse_scroll"}
+
+# 重建派生记录时每帧包含的记录数
+REBUILD_FRAME_SIZE = 1000
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+class _Span:
+    """一个未结束的区间"""
+
+    __slots__ = ("kind", "start", "end", "count", "app")
+
+    def __init__(self, kind: str, ts: float, app: Optional[str] = None, end: Optional[float] = None, count: int = 1):
+        self.kind = kind
+        self.start = ts
+        self.end = ts if end is None else end
+        self.count = count
+        self.app = app
+
+    def extend(self, ts: float, count: int = 1):
+        self.end = max(self.end, ts)
+        self.count += count
+
+    def to_record(self, is_open: bool = False) -> Dict[str, Any]:
+        record = {
+            "type": self.kind,
+            "timestamp": _iso(self.end),
+            "start": _iso(self.start),
+            "duration": round(self.end - self.start, 3),
+            "event_count": self.count
+        }
+        if self.app is not None:
+            record["window"] = {"app_name": self.app}
+        if is_open:
+            record["open"] = True
+        return record
+
+
+class Sessionizer:
+    """流式会话切分引擎，线程安全"""
+
+    def __init__(self,
+                 idle_gap: float = DEFAULT_IDLE_GAP,
+                 burst_gap: float = DEFAULT_BURST_GAP,
+                 min_burst_events: int = MIN_BURST_EVENTS):
+        """
+        初始化会话切分引擎
+
+        Args:
+            idle_gap: 空闲阈值（秒）
+            burst_gap: 连续输入阈值（秒）
+            min_burst_events: 连续输入至少包含的事件数，更少的不输出
+        """
+        self.idle_gap = idle_gap
+        self.burst_gap = burst_gap
+        self.min_burst_events = max(1, min_burst_events)
+        self._activity: Optional[_Span] = None
+        self._focus: Optional[_Span] = None
+        self._bursts: Dict[str, Optional[_Span]] = {TYPING_BURST: None, POINTING_BURST: None}
+        self._last_ts: Optional[float] = None
+        # 已结束但尚未输出的记录：(结束时间, 序号, 记录)，保证输出按结束时间递增
+        self._pending: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def feed(self, events: Iterable[Dict[str, Any]], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        处理一批事件
+
+        Args:
+            events: 按时间顺序的事件
+            now: 当前时间，距最后一个事件超过idle_gap时结束所有区间
+
+        Returns:
+            已结束的派生记录，按结束时间递增
+        """
+        with self._lock:
+            for event in events:
+                self._process(event)
+            if now is not None and self._last_ts is not None and now - self._last_ts > self.idle_gap:
+                self._close_all()
+            return self._release(self._watermark())
+
+    def close(self) -> List[Dict[str, Any]]:
+        """结束所有区间并返回剩余的记录（停止监控时调用）"""
+        with self._lock:
+            self._close_all()
+            return self._release(None)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """尚未写入的记录，包括未结束的区间（open为True，结束时间为最后一个事件的时间）"""
+        with self._lock:
+            records = [record for _, _, record in sorted(self._pending)]
+            for span in self._open_spans():
+                if span.kind in self._bursts and span.count < self.min_burst_events:
+                    continue
+                records.append(span.to_record(is_open=True))
+            return records
+
+    def _open_spans(self) -> List[_Span]:
+        spans = [self._activity, self._focus] + list(self._bursts.values())
+        return [span for span in spans if span is not None]
+
+    def _process(self, event: Dict[str, Any]):
+        event_type = event.get("type")
+        count = 1
+        try:
+            if event_type == TYPING_SUMMARY:
+                # 汇总事件的timestamp是窗口结束时间，按窗口内实际打字的区间处理
+                count = int(event.get("key_count") or 0)
+                if count <= 0:
+                    return
+                ts = parse_timestamp(event.get("active_start") or event.get("start"))
+                end = None if ts is None else ts + float(event.get("active_seconds") or 0.0)
+            else:
+                ts = end = parse_timestamp(event.get("timestamp"))
+        except (ValueError, TypeError):
+            ts = None
+        if ts is None:
+            return
+        if self._last_ts is not None:
+            # 乱序到达的事件按上一个事件的时间处理
+            ts = max(ts, self._last_ts)
+            end = max(end, ts)
+            if ts - self._last_ts > self.idle_gap:
+                self._close_all()
+
+        if event_type in KEYBOARD_TYPES or event_type == TYPING_SUMMARY:
+            kind = TYPING_BURST
+        else:
+            kind = POINTING_BURST if event_type in POINTER_TYPES else None
+        for burst_kind, span in self._bursts.items():
+            if span is not None and ts - span.end > self.burst_gap:
+                self._close(span)
+                self._bursts[burst_kind] = None
+        if kind is not None:
+            if self._bursts[kind] is None:
+                self._bursts[kind] = _Span(kind, ts, end=end, count=count)
+            else:
+                self._bursts[kind].extend(end, count)
+
+        if self._activity is None:
+            self._activity = _Span(ACTIVITY_SESSION, ts, end=end, count=count)
+        else:
+            self._activity.extend(end, count)
+
+        app = (event.get("window") or {}).get("app_name")
+        if app and self._focus is not None and self._focus.app != app:
+            # 切换应用的时刻即上一个专注区间的结束时间
+            self._focus.end = ts
+            self._close(self._focus)
+            self._focus = None
+        if self._focus is None:
+            if app:
+                self._focus = _Span(APP_FOCUS, ts, app, end=end, count=count)
+        else:
+            self._focus.extend(end, count)
+        self._last_ts = end
+
+    def _close(self, span: _Span):
+        if span.kind in self._bursts and span.count < self.min_burst_events:
+            return
+        heapq.heappush(self._pending, (span.end, next(self._order), span.to_record()))
+
+    def _close_all(self):
+        for span in self._open_spans():
+            self._close(span)
+        self._activity = None
+        self._focus = None
+        self._bursts = {kind: None for kind in self._bursts}
+
+    def _watermark(self) -> Optional[float]:
+        """之后结束的区间的最早可能结束时间，为None表示没有未结束的区间"""
+        spans = self._open_spans()
+        if not spans:
+            return None
+        return min(min(span.end for span in spans), self._last_ts)
+
+    def _release(self, watermark: Optional[float]) -> List[Dict[str, Any]]:
+        records = []
+        while self._pending and (watermark is None or self._pending[0][0] <= watermark):
+            records.append(heapq.heappop(self._pending)[2])
+        return records
+
+
+def summarize(records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    汇总派生记录
+
+    Returns:
+        活动总时长、各应用专注时长（秒）以及连续输入的次数和时长
+    """
+    summary = {
+        "activity_seconds": 0.0,
+        "sessions": 0,
+        "app_seconds": {},
+        "typing_bursts": 0,
+        "typing_seconds": 0.0,
+        "pointing_bursts": 0,
+        "pointing_seconds": 0.0
+    }
+    for record in records:
+        kind = record.get("type")
+        duration = float(record.get("duration") or 0.0)
+        if kind == ACTIVITY_SESSION:
+            summary["sessions"] += 1
+            summary["activity_seconds"] += duration
+        elif kind == APP_FOCUS:
+            app = (record.get("window") or {}).get("app_name", "")
+            summary["app_seconds"][app] = summary["app_seconds"].get(app, 0.0) + duration
+        elif kind == TYPING_BURST:
+            summary["typing_bursts"] += 1
+            summary["typing_seconds"] += duration
+        elif kind == POINTING_BURST:
+            summary["pointing_bursts"] += 1
+            summary["pointing_seconds"] += duration
+    return summary
+
+
+def rebuild(store, derived_store, idle_gap: float = DEFAULT_IDLE_GAP, burst_gap: float = DEFAULT_BURST_GAP) -> int:
+    """
+    从原始事件重建派生记录
+
+    Args:
+        store: 原始事件的EventStore
+        derived_store: 派生记录的EventStore，已有内容会被删除
+
+    Returns:
+        写入的记录数
+    """
+    derived_store.delete()
+    sessionizer = Sessionizer(idle_gap, burst_gap)
+    batch: List[Dict[str, Any]] = []
+    count = 0
+    for _, events in store.iter_frames():
+        batch.extend(sessionizer.feed(events))
+        if len(batch) >= REBUILD_FRAME_SIZE:
+            derived_store.append(batch)
+            count += len(batch)
+            batch = []
+    batch.extend(sessionizer.close())
+    if batch:
+        derived_store.append(batch)
+        count += len(batch)
+    return count
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(
+        description="MacOS用户行为实时记录工具 - 从原始事件重建会话记录",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("input", type=str, help="事件数据文件路径")
+    parser.add_argument("--idle_gap", type=float, default=DEFAULT_IDLE_GAP, help="空闲阈值（秒）")
+    parser.add_argument("--burst_gap", type=float, default=DEFAULT_BURST_GAP, help="连续输入阈值（秒）")
+    parser.add_argument("--encrypted", action="store_true", help="输入文件由本机加密写入")
+    return parser.parse_args()
+
+
+def main():
+    """主函数"""
+    from event_store import EventStore
+
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.input):
+        logger.error(f"输入文件不存在: {args.input}")
+        return 1
+    key = None
+    if args.encrypted:
+        from event_monitor import derive_encryption_key
+        key = derive_encryption_key()
+    store = EventStore(args.input, key)
+    derived = EventStore(args.input + DERIVED_SUFFIX, key)
+    count = rebuild(store, derived, args.idle_gap, args.burst_gap)
+    logger.info(f"已写入{count}条派生记录到: {derived.path}")
+
+    summary = summarize(derived.iter_events())
+    print(f"活动会话: {summary['sessions']}个，共{summary['activity_seconds'] / 60:.1f}分钟")
+    for app, seconds in sorted(summary["app_seconds"].items(), key=lambda item: -item[1]):
+        print(f"  {app}: {seconds / 60:.1f}分钟")
+    print(f"连续打字: {summary['typing_bursts']}次，共{summary['typing_seconds'] / 60:.1f}分钟")
+    print(f"连续操作鼠标: {summary['pointing_bursts']}次，共{summary['pointing_seconds'] / 60:.1f}分钟")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 写入进程模块
+
+JSON序列化、压缩和Fernet加密都是CPU密集型操作，在主进程中执行时会占用GIL，
+影响采集线程和Web服务线程的响应。该模块把这些工作交给单独的写入进程：
+主进程通过管道发送原始事件批次，写入进程编码、压缩、加密并追加到事件存储，
+写完后回复确认。主进程等待确认时不持有GIL。
+
+写入进程崩溃时自动重启。新进程启动时先修复存储并报告已完整写入的帧数，
+主进程据此丢弃崩溃前已经写入的批次，重发其余批次，不丢失也不重复。
+"""
+
+import time
+import logging
+import threading
+import multiprocessing
+from typing import Dict, List, Any, Optional, Tuple
+from metrics import REGISTRY
+
+logger = logging.getLogger("store_writer")
+
+# 等待写入进程启动或确认的最长时间（秒）
+DEFAULT_TIMEOUT = 30.0
+
+# 同一批次导致写入进程连续崩溃的最大次数，超过后放弃并报错
+MAX_RESTARTS_PER_BATCH = 3
+
+# 批次分块发送，每块单独序列化，避免一次序列化整个大批次时长时间持有GIL
+SEND_CHUNK_EVENTS = 2000
+
+# 检查写入进程是否存活的间隔（秒）
+POLL_INTERVAL = 0.1
+
+# 主进程中有采集、刷新和Web服务线程，fork可能复制被其他线程持有的锁，写入进程一律用spawn启动
+_CONTEXT = multiprocessing.get_context("spawn")
+
+WRITER_RESTARTS = REGISTRY.counter("store_writer_restarts_total", "写入进程崩溃后重启的次数")
+WRITER_DURATION = REGISTRY.histogram("store_writer_append_seconds", "从发送批次到收到写入进程确认的耗时（秒）")
+
+
+class WriterCrashed(RuntimeError):
+    """写入进程在确认前退出"""
+
+
+def _writer_main(conn, path: str, encryption_key: Optional[bytes], compress: bool):
+    """写入进程入口：修复存储后逐个处理批次"""
+    from event_store import EventStore
+    store = EventStore(path, encryption_key, compress)
+    try:
+        conn.send(("ready", store.recover()))
+    except Exception as e:
+        conn.send(("failed", str(e)))
+        return
+    pending: List[Dict[str, Any]] = []
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+        kind, batch_id, events = message
+        pending.extend(events)
+        if kind == "part":
+            continue
+        try:
+            conn.send(("ack", batch_id, store.append(pending)))
+        except Exception as e:
+            conn.send(("error", batch_id, str(e)))
+        pending = []
+
+
+class WriterProcess:
+    """
+    在子进程中写入事件存储
+
+    与EventStore提供相同的append()接口，由监控器的刷新线程调用。
+    同一时间只有一个批次在途，确认前批次保留在主进程中。
+    """
+
+    def __init__(self, path: str, encryption_key: Optional[bytes] = None, compress: bool = False,
+                 timeout: float = DEFAULT_TIMEOUT):
+        """
+        初始化写入进程（首次写入时才启动子进程）
+
+        Args:
+            path: 事件存储路径，写入进程运行期间不应有其他写入者
+            encryption_key: Fernet密钥，为None时以明文存储
+            compress: 是否压缩写入的帧
+            timeout: 等待启动或确认的最长时间（秒）
+        """
+        self.path = path
+        self.encryption_key = encryption_key
+        self.compress = compress
+        self.timeout = timeout
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+        self._batch_id = 0
+        # 已写入的帧数，用于崩溃后判断在途批次是否已经写入
+        self._frames: Optional[int] = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        """写入进程的PID，未启动时为None"""
+        return self._process.pid if self._process is not None else None
+
+    def start(self):
+        """提前启动写入进程，避免第一次刷新时等待进程启动"""
+        with self._lock:
+            if self._process is None:
+                self._start()
+
+    def append(self, events: List[Dict[str, Any]]) -> int:
+        """
+        交给写入进程追加一帧事件，等待写入完成
+
+        Returns:
+            写入的字节数
+
+        Raises:
+            OSError: 写入进程报告写入失败
+            WriterCrashed: 写入进程反复崩溃
+        """
+        if not events:
+            return 0
+        with self._lock:
+            self._batch_id += 1
+            batch_id = self._batch_id
+            append_start = time.perf_counter()
+            crashes = 0
+            while True:
+                try:
+                    if self._process is None:
+                        frames = self._start()
+                        if frames > self._frames:
+                            # 崩溃前已经写入，只是没来得及确认
+                            logger.warning(f"写入进程崩溃前已写入批次{batch_id}，不再重发")
+                            self._frames = frames
+                            return 0
+                    for i in range(0, len(events) - SEND_CHUNK_EVENTS, SEND_CHUNK_EVENTS):
+                        self._conn.send(("part", batch_id, events[i:i + SEND_CHUNK_EVENTS]))
+                    last = (len(events) - 1) // SEND_CHUNK_EVENTS * SEND_CHUNK_EVENTS
+                    self._conn.send(("append", batch_id, events[last:]))
+                    reply = self._recv()
+                except (WriterCrashed, OSError, EOFError) as e:
+                    crashes += 1
+                    self._kill()
+                    if crashes > MAX_RESTARTS_PER_BATCH:
+                        raise WriterCrashed(f"写入进程连续崩溃{crashes}次: {e}")
+                    WRITER_RESTARTS.inc()
+                    logger.error(f"写入进程异常退出，正在重启: {e}")
+                    continue
+                break
+            WRITER_DURATION.observe(time.perf_counter() - append_start)
+            kind, reply_id, result = reply
+            if reply_id != batch_id:
+                self._kill()
+                raise WriterCrashed(f"写入进程确认了错误的批次: {reply_id}")
+            if kind == "error":
+                raise OSError(result)
+            self._frames += 1
+            return result
+
+    def close(self, timeout: float = 5.0):
+        """通知写入进程退出并等待"""
+        with self._lock:
+            if self._process is None:
+                return
+            try:
+                self._conn.send(("stop",))
+            except OSError:
+                pass
+            self._process.join(timeout)
+            self._kill()
+
+    def _start(self) -> int:
+        """启动写入进程，返回存储中已完整写入的帧数"""
+        parent_conn, child_conn = _CONTEXT.Pipe()
+        process = _CONTEXT.Process(
+            target=_writer_main,
+            args=(child_conn, self.path, self.encryption_key, self.compress),
+            name="store-writer",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._process, self._conn = process, parent_conn
+        kind, frames = self._recv()
+        if kind != "ready":
+            raise OSError(f"写入进程启动失败: {frames}")
+        if self._frames is None:
+            self._frames = frames
+        logger.info(f"写入进程已启动，PID: {process.pid}")
+        return frames
+
+    def _recv(self) -> Tuple:
+        """等待写入进程的回复，期间检查进程是否存活"""
+        deadline = time.monotonic() + self.timeout
+        while not self._conn.poll(POLL_INTERVAL):
+            if not self._process.is_alive():
+                raise WriterCrashed(f"退出码{self._process.exitcode}")
+            if time.monotonic() > deadline:
+                raise WriterCrashed("等待确认超时")
+        return self._conn.recv()
+
+    def _kill(self):
+        """结束写入进程并释放管道"""
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.kill()
+            self._process.join(1.0)
+            self._process = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 离线分析单元测试
+
+该模块包含对列式加载和向量化统计的单元测试。
+"""
+
+import os
+import datetime
+import tempfile
+import unittest
+from event_store import EventStore
+from analytics import NUMPY_AVAILABLE, ActivityStats, iter_columns, parse_timestamps, analyze
+from benchmark import naive_analyze, make_events
+
+START = datetime.datetime(2026, 1, 5, 9, tzinfo=datetime.timezone.utc)  # 周一9点
+
+
+def event(seconds, event_type="mouse_move", app="Safari", x=0.0, y=0.0):
+    """生成距START指定秒数的事件"""
+    result = {
+        "type": event_type,
+        "timestamp": (START + datetime.timedelta(seconds=seconds)).isoformat(),
+        "window": {"app_name": app}
+    }
+    if event_type.startswith("mouse"):
+        result["position"] = {"x": x, "y": y}
+    return result
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "需要NumPy")
+class TestAnalytics(unittest.TestCase):
+    """离线分析的测试用例"""
+
+    def _analyze(self, events, chunk_size=100000, idle_gap=300.0):
+        stats = ActivityStats(idle_gap=idle_gap, tz_offset=0.0)
+        for columns in iter_columns(events, chunk_size):
+            stats.update(columns)
+        return stats.result()
+
+    def test_small_session(self):
+        """测试手工构造事件的各项统计"""
+        events = [
+            event(0, x=0, y=0),
+            event(0.5, x=300, y=400),              # 移动500像素，1000像素/秒
+            event(1, "mouse_click", x=300, y=400),
+            event(2, "key_press", app="VSCode"),
+            event(1000, "key_press", app="VSCode"),  # 空闲后的事件
+            event(3600, x=300, y=410, app="VSCode")
+        ]
+        result = self._analyze(events, idle_gap=600)
+
+        self.assertEqual(result["event_count"], 6)
+        self.assertEqual(result["type_counts"], {"mouse_move": 3, "mouse_click": 1, "key_press": 2})
+        self.assertEqual(result["clicks"], 1)
+        self.assertEqual(result["active_seconds"], 2.0)
+        self.assertEqual(result["app_seconds"], {"Safari": 2.0})
+        self.assertEqual(result["mouse"]["distance_px"], 510.0)
+        self.assertEqual(result["mouse"]["max_speed_px_per_sec"], 1000.0)
+        self.assertEqual(result["intervals"]["max"], 2600.0)
+        self.assertEqual(result["hourly_activity"][0][9], 5)
+        self.assertEqual(result["hourly_activity"][0][10], 1)
+
+    def test_matches_naive_across_chunks(self):
+        """测试分块统计与逐个遍历事件字典的结果一致"""
+        events = make_events(5000)
+        expected = naive_analyze(events)
+        for chunk_size in (100000, 777):
+            result = self._analyze(events, chunk_size=chunk_size)
+            self.assertEqual(result["intervals"]["counts"], expected["intervals"])
+            self.assertEqual(result["clicks"], expected["clicks"])
+            self.assertEqual(result["mouse"]["speed_counts"], expected["speed_counts"])
+            self.assertEqual(result["hourly_activity"], expected["hourly_activity"])
+            self.assertAlmostEqual(result["active_seconds"], expected["active_seconds"], places=6)
+            self.assertAlmostEqual(result["mouse"]["distance_px"], expected["distance_px"], delta=1.0)
+            for app, seconds in expected["app_seconds"].items():
+                self.assertAlmostEqual(result["app_seconds"][app], seconds, places=6)
+
+    def test_parse_timestamps(self):
+        """测试批量解析UTC时间，以及其他格式和无效值的逐个解析"""
+        utc = ["2026-01-01T00:00:00+00:00", "2026-01-01T00:00:00.250000+00:00"]
+        self.assertEqual(parse_timestamps(utc).tolist(), [1767225600.0, 1767225600.25])
+        mixed = parse_timestamps(["2026-01-01T08:00:00+08:00", 1767225600, "bad", None])
+        self.assertEqual(mixed[:2].tolist(), [1767225600.0, 1767225600.0])
+        self.assertTrue(all(value != value for value in mixed[2:]))
+
+    def test_analyze_store(self):
+        """测试从EventStore按时间范围分析"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = EventStore(os.path.join(temp_dir, "output.json"))
+            store.append([event(i) for i in range(100)])
+            result = analyze(store, start=START.timestamp() + 50, chunk_size=16, tz_offset=0.0)
+            self.assertEqual(result["event_count"], 50)
+            self.assertEqual(result["active_seconds"], 49.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
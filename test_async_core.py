@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - asyncio事件核心单元测试
+
+该模块包含对异步事件源、有界队列、定时刷新和各个sink的单元测试。
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+from async_core import AsyncEventMonitor, SQLiteSink, SocketSink
+from collector import CollectorServer
+from event_store import EventStore
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestAsyncEventMonitor(unittest.TestCase):
+    """asyncio事件核心的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "output.json")
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def _monitor(self, **kwargs):
+        kwargs.setdefault("flush_interval", 60.0)
+        return AsyncEventMonitor(test_mode=True, output_path=self.output_path, sample_interval=0, **kwargs)
+
+    def test_sinks_and_clean_stop(self):
+        """测试缓冲区满时刷新到所有sink，停止时不必等满刷新间隔"""
+        db_path = os.path.join(self.temp_dir.name, "events.db")
+        monitor = self._monitor(buffer_size=10, sinks=[SQLiteSink(db_path)])
+        self.assertTrue(monitor.start())
+        for i in range(25):
+            self.assertTrue(monitor.submit("mouse_move", {"position": {"x": i, "y": i}}))
+        # 缓冲区满时由定时器协程立即刷新
+        self.assertTrue(wait_until(lambda: monitor.store.event_count() >= 20))
+
+        stop_start = time.perf_counter()
+        self.assertTrue(monitor.stop())
+        self.assertLess(time.perf_counter() - stop_start, 5.0)
+        self.assertFalse(monitor._loop_thread.is_alive())
+        self.assertFalse(monitor.submit("mouse_move", {}))
+
+        # 模拟事件源在启动时产生一个事件
+        self.assertEqual(monitor.event_count, 26)
+        self.assertEqual(monitor.store.event_count(), 26)
+        with sqlite3.connect(db_path) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM events").fetchone()[0], 26)
+        self.assertEqual(monitor.rollups.query(granularity="day")["buckets"][0]["total"], 26)
+
+    def test_stop_during_flush(self):
+        """测试刷新进行中停止时等待该次刷新完成，汇总包含所有已写入的事件"""
+        monitor = self._monitor(buffer_size=10)
+        started = threading.Event()
+        finished = []
+        after_write = monitor._after_write
+
+        def slow_after_write(events):
+            started.set()
+            time.sleep(0.2)
+            after_write(events)
+            finished.append(len(events))
+
+        monitor._after_write = slow_after_write
+        monitor.start()
+        for i in range(10):
+            monitor.submit("mouse_move", {"position": {"x": i, "y": i}})
+        self.assertTrue(started.wait(5))
+        monitor.stop()
+        self.assertEqual(sum(finished), monitor.store.event_count())
+        self.assertEqual(monitor.rollups.query(granularity="day")["buckets"][0]["total"],
+                         monitor.store.event_count())
+
+    def test_reconfigure_wakes_timer(self):
+        """测试修改刷新间隔后定时器立即按新的间隔刷新"""
+        monitor = self._monitor()
+        monitor.start()
+        try:
+            for i in range(3):
+                monitor.submit("mouse_click", {"position": {"x": i, "y": i}, "button": "left"})
+            self.assertTrue(wait_until(lambda: len(monitor.event_buffer) == 4))
+            monitor.reconfigure(flush_interval=1.0)
+            self.assertTrue(wait_until(lambda: monitor.store.event_count() == 4))
+
+            # 其他线程的同步刷新交给事件循环
+            monitor.submit("mouse_click", {"position": {"x": 0, "y": 0}, "button": "left"})
+            self.assertTrue(wait_until(lambda: len(monitor.event_buffer) == 1))
+            monitor._flush_buffer()
+            self.assertEqual(monitor.store.event_count(), 5)
+        finally:
+            monitor.stop()
+
+    def test_custom_source_backpressure(self):
+        """测试异步事件源在有界队列满时等待，不丢失事件"""
+        async def burst():
+            for i in range(200):
+                yield "mouse_move", {"position": {"x": i, "y": i}}
+
+        monitor = self._monitor(sources=[burst], queue_size=4)
+        monitor.start()
+        self.assertTrue(wait_until(lambda: monitor.event_count == 200))
+        monitor.stop()
+        self.assertEqual([e["position"]["x"] for e in monitor.store.iter_events()], list(range(200)))
+
+    def test_socket_sink(self):
+        """测试按收集器协议发送到收集器"""
+        fleet = EventStore(os.path.join(self.temp_dir.name, "fleet.json"))
+        server = CollectorServer(fleet, "unix:" + os.path.join(self.temp_dir.name, "c.sock"), sync=False)
+        server.start()
+        try:
+            monitor = self._monitor(sinks=[SocketSink(server.address, host="mac-a")])
+            monitor.start()
+            monitor.submit("mouse_move", {"position": {"x": 1, "y": 1}})
+            monitor.stop()
+        finally:
+            server.stop()
+        events = list(fleet.iter_events())
+        self.assertEqual(len(events), monitor.event_count)
+        self.assertEqual({e["host"] for e in events}, {"mac-a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 基准测试工具单元测试
+
+该模块包含对基准结果比较逻辑的单元测试。
+"""
+
+import unittest
+from benchmark import compare, metric
+
+
+class TestBenchmarkCompare(unittest.TestCase):
+    """基准结果比较的测试用例"""
+
+    def test_compare_flags_regressions(self):
+        """测试按指标方向判断回退"""
+        baseline = {"results": {"flush": {
+            "latency_ms": metric(10.0, "ms"),
+            "events_per_sec": metric(1000.0, "events/s", "higher"),
+            "size_mb": metric(5.0, "MB")
+        }}}
+        current = {"results": {"flush": {
+            "latency_ms": metric(16.0, "ms"),
+            "events_per_sec": metric(600.0, "events/s", "higher"),
+            "size_mb": metric(4.0, "MB"),
+            "new_metric": metric(1.0, "ms")
+        }}}
+
+        rows = {row["metric"]: row for row in compare(current, baseline, threshold=0.5)}
+        self.assertEqual(set(rows), {"latency_ms", "events_per_sec", "size_mb"})
+        self.assertTrue(rows["latency_ms"]["regression"])
+        self.assertFalse(rows["events_per_sec"]["regression"])
+        self.assertFalse(rows["size_mb"]["regression"])
+
+        rows = {row["metric"]: row for row in compare(current, baseline, threshold=0.3)}
+        self.assertTrue(rows["events_per_sec"]["regression"])
+
+    def test_compare_requires_same_scale(self):
+        """测试数据规模不同的结果拒绝比较"""
+        baseline = {"meta": {"quick": True}, "results": {"flush": {"latency_ms": metric(10.0, "ms")}}}
+        current = {"meta": {"quick": False}, "results": {"flush": {"latency_ms": metric(30.0, "ms")}}}
+        with self.assertRaises(ValueError):
+            compare(current, baseline, threshold=0.5)
+        current["meta"]["quick"] = True
+        self.assertEqual(len(compare(current, baseline, threshold=0.5)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 时钟单元测试
+
+该模块包含对虚拟时钟的单元测试。
+"""
+
+import threading
+import unittest
+from clock import SimulatedClock, SystemClock
+
+
+class TestSimulatedClock(unittest.TestCase):
+    """虚拟时钟的测试用例"""
+
+    def test_advance_wakes_sleepers_in_order(self):
+        """测试推进时间时按截止时间顺序唤醒等待的线程"""
+        clock = SimulatedClock(start=1000.0)
+        wakeups = []
+
+        def sleeper(name, interval, count):
+            for _ in range(count):
+                clock.sleep(interval)
+                wakeups.append((clock.time(), name))
+
+        threads = [threading.Thread(target=sleeper, args=("fast", 10, 6)),
+                   threading.Thread(target=sleeper, args=("slow", 25, 2))]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(clock.wait_for_sleepers(2))
+
+        clock.advance(60)
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(clock.time(), 1060.0)
+        self.assertEqual([t for t, _ in wakeups], sorted(t for t, _ in wakeups))
+        self.assertEqual([t for t, name in wakeups if name == "slow"], [1025.0, 1050.0])
+        self.assertEqual(len(wakeups), 8)
+
+    def test_wait_returns_when_event_set(self):
+        """测试停止事件被设置时等待立即返回"""
+        clock = SimulatedClock()
+        event = threading.Event()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(clock.wait(event, 3600)))
+        thread.start()
+        clock.wait_for_sleepers(1)
+        event.set()
+        thread.join(timeout=5)
+        self.assertEqual(result, [True])
+
+    def test_system_clock_wait(self):
+        """测试真实时钟的等待"""
+        event = threading.Event()
+        event.set()
+        self.assertTrue(SystemClock().wait(event, 1.0))
+        self.assertFalse(SystemClock().wait(None, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
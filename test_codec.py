@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - JSON编解码单元测试
+
+该模块对每个可用的JSON实现运行相同的编解码测试。
+"""
+
+import json
+import unittest
+from codec import get_codec, available_codecs, JsonCodec, ORJSON_AVAILABLE
+from test_event_transport import make_events
+
+
+class TestCodec(unittest.TestCase):
+    """JSON编解码的测试用例"""
+
+    def test_roundtrip_all_codecs(self):
+        """测试各实现的编码结果一致且可互相解码"""
+        events = make_events(50)
+        events[0]["window"]["window_title"] = "中文标题"
+        events[1]["host"] = "mac-a"
+        expected = JsonCodec().dumps(events)
+        for name in available_codecs():
+            with self.subTest(codec=name):
+                codec = get_codec(name)
+                data = codec.dumps(events)
+                self.assertNotIn(b"\n", data)
+                self.assertIn("中文标题".encode("utf-8"), data)
+                self.assertEqual(json.loads(data), json.loads(expected))
+                self.assertEqual(codec.decode_events(expected), events)
+                self.assertEqual(codec.loads(codec.dumps_pretty({"a": [1]})), {"a": [1]})
+                self.assertIn(b"\n  ", codec.dumps_pretty({"a": [1]}))
+
+    def test_decode_events_rejects_other_shapes(self):
+        """测试事件数组之外的数据被拒绝"""
+        for name in available_codecs():
+            codec = get_codec(name)
+            for data in (b'{"events": []}', b'[1, 2]', b'[{"type": '):
+                with self.subTest(codec=name, data=data), self.assertRaises(ValueError):
+                    codec.decode_events(data)
+
+    def test_selection(self):
+        """测试实现的选择与回退"""
+        self.assertEqual(available_codecs()[-1], "json")
+        self.assertEqual(get_codec().name, available_codecs()[0])
+        with self.assertRaises(ValueError):
+            get_codec("yaml")
+
+    @unittest.skipUnless(ORJSON_AVAILABLE, "未安装orjson")
+    def test_orjson_fallback(self):
+        """测试orjson不支持的对象回退到标准库"""
+        codec = get_codec("orjson")
+        self.assertEqual(codec.loads(codec.dumps({"n": 2 ** 70, 1: "a"})), {"n": 2 ** 70, "1": "a"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件收集服务单元测试
+
+该模块在本机通过Unix套接字端到端测试收集器、确认、背压和本地缓存重放。
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from event_store import EventStore, parse_timestamp
+from event_monitor import EventMonitor
+from collector import (CollectorServer, CollectorClient, parse_address, SPOOL_SUFFIX,
+                       send_message, recv_message, MSG_HELLO)
+from test_event_transport import make_events
+
+
+class _BlockingStore:
+    """写入时阻塞直到被放行的存储，用于制造背压"""
+
+    def __init__(self, store):
+        self.store = store
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def append(self, events, sync=False):
+        self.entered.set()
+        self.release.wait(10)
+        return self.store.append(events, sync=sync)
+
+
+class TestCollector(unittest.TestCase):
+    """收集器的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.address = "unix:" + self._path("collector.sock")
+        self.store = EventStore(self._path("fleet.json"))
+        self.servers = []
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        for server in self.servers:
+            server.stop()
+        self.temp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def _start_server(self, store=None, **kwargs):
+        server = CollectorServer(store or self.store, self.address, **kwargs)
+        server.start()
+        self.servers.append(server)
+        return server
+
+    def test_parse_address(self):
+        """测试地址解析"""
+        self.assertEqual(parse_address("unix:/tmp/a.sock"), (socket.AF_UNIX, "/tmp/a.sock"))
+        self.assertEqual(parse_address("tcp://10.0.0.2:7878"), (socket.AF_INET, ("10.0.0.2", 7878)))
+        self.assertEqual(parse_address(":7878"), (socket.AF_INET, ("127.0.0.1", 7878)))
+        with self.assertRaises(ValueError):
+            parse_address("localhost")
+
+    def test_many_clients(self):
+        """测试多个客户端并发发送，事件带主机标记且各自顺序不变"""
+        self._start_server()
+        events = make_events(400)
+
+        def ship(host, batch):
+            client = CollectorClient(self.address, host=host)
+            for i in range(0, len(batch), 10):
+                client.append(batch[i:i + 10])
+            client.close()
+
+        threads = [threading.Thread(target=ship, args=(f"mac-{n}", events[n * 100:(n + 1) * 100]))
+                   for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        stored = list(self.store.iter_events())
+        self.assertEqual(len(stored), 400)
+        for n in range(4):
+            seqs = [e["seq"] for e in stored if e["host"] == f"mac-{n}"]
+            self.assertEqual(seqs, [e["seq"] for e in events[n * 100:(n + 1) * 100]])
+
+    def test_spool_and_replay(self):
+        """测试收集器不可用时写入本地缓存，恢复后按顺序重放"""
+        events = make_events(30)
+        client = CollectorClient(self.address, host="mac-a", spool_path=self._path("a.json" + SPOOL_SUFFIX),
+                                 retry_interval=0)
+        client.append(events[:10])
+        client.append(events[10:20])
+        self.assertEqual(client.spooled_frames(), 2)
+
+        self._start_server()
+        client.append(events[20:])
+        self.assertEqual(client.spooled_frames(), 0)
+        self.assertFalse(os.path.exists(client.spool.path))
+        self.assertEqual([e["seq"] for e in self.store.iter_events()], [e["seq"] for e in events])
+        client.close()
+
+        # 没有本地缓存时直接报错，由监控器保留缓冲区
+        self.servers.pop().stop()
+        with self.assertRaises(ConnectionError):
+            CollectorClient(self.address).append(events[:1])
+
+    def test_replayed_batch_after_newer_frame(self):
+        """测试重放的旧批次写在较新的帧之后，按时间范围查询仍能找到"""
+        events = make_events(30)
+        late = CollectorClient(self.address, host="mac-b", spool_path=self._path("b.json" + SPOOL_SUFFIX),
+                               retry_interval=0)
+        late.append(events[:10])
+        self.assertEqual(late.spooled_frames(), 1)
+
+        self._start_server()
+        CollectorClient(self.address, host="mac-a").append(events[20:])
+        late.append(events[10:20])
+        late.close()
+        self.assertFalse(self.store.is_ordered())
+
+        end = parse_timestamp(events[15]["timestamp"])
+        self.assertEqual(sorted(e["seq"] for e in self.store.iter_events(end=end)), list(range(1, 16)))
+        page = self.store.query(start=parse_timestamp(events[5]["timestamp"]), end=end, limit=100)
+        self.assertEqual(sorted(e["seq"] for e in page["events"]), list(range(6, 16)))
+
+    def test_backpressure_and_group_commit(self):
+        """测试写入阻塞时队列满，发送方收到BUSY并转存本地；排队的批次合并为一次提交"""
+        blocking = _BlockingStore(self.store)
+        self._start_server(blocking, max_pending=2, backpressure_timeout=0.1)
+        events = make_events(4)
+        clients = [CollectorClient(self.address, host=f"mac-{n}", spool_path=self._path(f"{n}{SPOOL_SUFFIX}"))
+                   for n in range(4)]
+        # 第一个批次占住写入线程，后两个占满队列
+        senders = [threading.Thread(target=clients[n].append, args=([events[n]],)) for n in range(3)]
+        senders[0].start()
+        self.assertTrue(blocking.entered.wait(5))
+        senders[1].start()
+        senders[2].start()
+        self.assertTrue(self._wait(lambda: self.servers[0]._queue.full()))
+        clients[3].append([events[3]])
+        self.assertEqual(clients[3].spooled_frames(), 1)
+
+        blocking.release.set()
+        for sender in senders:
+            sender.join(5)
+        self.assertEqual(self.store.frame_count(), 2)
+        clients[3].close()
+        self.assertEqual(self.store.frame_count(), 3)
+        self.assertEqual(sorted(e["seq"] for e in self.store.iter_events()), [1, 2, 3, 4])
+
+    def test_protocol_version(self):
+        """测试不支持的协议版本被拒绝"""
+        self._start_server()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(parse_address(self.address)[1])
+        send_message(sock, MSG_HELLO, body=b'{"version": 99}')
+        self.assertNotEqual(recv_message(sock)[1], 0)
+        sock.close()
+
+    def test_reconnect_threads_pruned(self):
+        """测试反复重连时已结束的连接线程不会累积"""
+        server = self._start_server()
+        for i in range(20):
+            client = CollectorClient(self.address, host="mac-a")
+            client.append(make_events(1))
+            client.close()
+        self.assertLessEqual(len(server._threads), 3)
+
+    def test_monitor_collector_mode(self):
+        """测试监控器刷新时发送给收集器"""
+        self._start_server()
+        monitor = EventMonitor(test_mode=True, output_path=self._path("output.json"), collector_address=self.address)
+        monitor.event_buffer = make_events(5)
+        monitor._flush_buffer()
+        monitor.derived.drain(5)
+        monitor.collector.close()
+        self.assertEqual(len(list(self.store.iter_events())), 5)
+        self.assertFalse(os.path.exists(monitor.output_path))
+        self.assertEqual(monitor.get_status()["collector"], self.address)
+
+    def _wait(self, predicate, timeout=5.0):
+        event = threading.Event()
+        for _ in range(int(timeout / 0.01)):
+            if predicate():
+                return True
+            event.wait(0.01)
+        return False
+
+
+if __name__ == '__main__':
+    unittest.main()
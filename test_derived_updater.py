@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 派生数据后台更新单元测试
+
+该模块包含对按顺序处理、背压、出错后继续处理和等待处理完成的单元测试。
+"""
+
+import threading
+import unittest
+from derived_updater import DerivedUpdater
+
+
+class TestDerivedUpdater(unittest.TestCase):
+    """派生数据后台更新的测试用例"""
+
+    def test_order_and_drain(self):
+        """测试按提交顺序处理，drain返回时所有帧已处理完"""
+        handled = []
+        updater = DerivedUpdater(lambda events, frame: handled.append((frame, len(events))))
+        for frame in range(50):
+            updater.submit([{}] * frame, frame)
+        self.assertTrue(updater.drain(5))
+        self.assertEqual(handled, [(frame, frame) for frame in range(50)])
+        self.assertEqual(updater.pending, 0)
+
+    def test_backpressure(self):
+        """测试待处理的帧达到上限时提交的一方等待"""
+        release = threading.Event()
+        updater = DerivedUpdater(lambda events, frame: release.wait(5), max_pending=2)
+        updater.submit([], 0)
+        updater.submit([], 1)
+        blocked = threading.Thread(target=updater.submit, args=([], 2), daemon=True)
+        blocked.start()
+        blocked.join(0.1)
+        self.assertTrue(blocked.is_alive())
+        self.assertFalse(updater.drain(0.05))
+
+        release.set()
+        blocked.join(5)
+        self.assertFalse(blocked.is_alive())
+        self.assertTrue(updater.drain(5))
+
+    def test_error_does_not_stop_updates(self):
+        """测试处理某一帧出错时记录错误并继续处理后面的帧"""
+        handled = []
+
+        def handler(events, frame):
+            if frame == 1:
+                raise ValueError("损坏的事件")
+            handled.append(frame)
+
+        updater = DerivedUpdater(handler)
+        with self.assertLogs("derived_updater", level="ERROR"):
+            for frame in range(3):
+                updater.submit([], frame)
+            self.assertTrue(updater.drain(5))
+        self.assertEqual(handled, [0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,12 +8,13 @@ MacOS用户行为实时记录工具 - 单元测试
 """
 
 import os
-import json
 import time
+import threading
 import unittest
 import tempfile
 from unittest.mock import patch, MagicMock
 from event_monitor import EventMonitor
+from clock import SimulatedClock
 
 
 class TestEventMonitor(unittest.TestCase):
@@ -39,6 +40,8 @@ class TestEventMonitor(unittest.TestCase):
         # 停止监控器
         if self.monitor.running:
             self.monitor.stop()
+        # 等待后台线程更新完派生数据，再删除其中的文件
+        self.monitor.derived.drain(5)
         
         # 清理临时文件
         self.temp_dir.cleanup()
@@ -86,6 +89,7 @@ class TestEventMonitor(unittest.TestCase):
         """测试刷新缓冲区功能"""
         # 添加多个测试事件
         for i in range(5):
+            self.monitor.last_sample_time = 0  # 跳过采样间隔
             self.monitor._add_event("test_event", {"index": i})
         
         # 手动刷新缓冲区
@@ -98,18 +102,66 @@ class TestEventMonitor(unittest.TestCase):
         self.assertTrue(os.path.exists(self.output_path))
         
         # 验证文件内容
-        with open(self.output_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            self.assertIn("events", data)
-            self.assertEqual(len(data["events"]), 5)
-            for i, event in enumerate(data["events"]):
-                self.assertEqual(event["type"], "test_event")
-                self.assertEqual(event["index"], i)
+        events = list(self.monitor.store.iter_events())
+        self.assertEqual(len(events), 5)
+        for i, event in enumerate(events):
+            self.assertEqual(event["type"], "test_event")
+            self.assertEqual(event["index"], i)
+
+    def test_idle_check_runs_in_updater(self):
+        """测试没有新事件的刷新也在后台线程中按顺序检查空闲，刷新线程不切分会话"""
+        clock = SimulatedClock()
+        monitor = EventMonitor(test_mode=True, output_path=self.output_path, sample_interval=0, clock=clock)
+        threads = []
+        feed = monitor.sessionizer.feed
+
+        def recording_feed(events, now=None):
+            threads.append(threading.current_thread().name)
+            return feed(events, now=now)
+
+        monitor.sessionizer.feed = recording_feed
+        for i in range(3):
+            monitor._add_event("mouse_move", {"position": {"x": i, "y": i}})
+        monitor._flush_buffer()
+        clock.advance(600)
+        monitor._flush_buffer()
+        self.assertTrue(monitor.derived.drain(5))
+
+        self.assertEqual(threads, [monitor.derived.name] * 2)
+        sessions = [r for r in monitor.derived_store.iter_events() if r["type"] == "activity_session"]
+        self.assertEqual([r["event_count"] for r in sessions], [3])
+
+    def test_heatmap_persisted(self):
+        """测试热力图按保存间隔和停止时保存，并在重新创建时恢复"""
+        self.monitor._add_event("mouse_move", {"position": {"x": 10, "y": 10}})
+        self.monitor._flush_buffer()
+        # 不在每次刷新时重写
+        self.assertFalse(os.path.exists(self.monitor.heatmap_path))
+        self.monitor._close_outputs()
+        self.assertTrue(os.path.exists(self.monitor.heatmap_path))
+        
+        restored = EventMonitor(test_mode=True, output_path=self.output_path)
+        self.assertEqual(restored.heatmap.get()["total"], 1)
+    
+    def test_aggregates_encrypted(self):
+        """测试启用加密时热力图和时间汇总文件不包含应用名称"""
+        monitor = EventMonitor(test_mode=True, output_path=self.output_path, encryption=True)
+        monitor._get_window_info = lambda: {"window_id": "1", "app_name": "SecretApp", "window_title": "x"}
+        monitor._add_event("mouse_click", {"position": {"x": 10, "y": 10}, "button": "left"})
+        monitor._flush_buffer()
+        monitor._close_outputs()
+        for path in (monitor.heatmap_path, monitor.rollup_path):
+            with open(path, "rb") as f:
+                self.assertNotIn(b"SecretApp", f.read())
+        
+        restored = EventMonitor(test_mode=True, output_path=self.output_path, encryption=True)
+        self.assertEqual(restored.heatmap.get(apps=["SecretApp"])["total"], 1)
 
     def test_get_events(self):
         """测试获取事件功能"""
         # 添加多个测试事件
         for i in range(20):
+            self.monitor.last_sample_time = 0  # 跳过采样间隔
             self.monitor._add_event("test_event", {"index": i})
         
         # 获取最新的10个事件
@@ -122,6 +174,85 @@ class TestEventMonitor(unittest.TestCase):
         for i, event in enumerate(events):
             self.assertEqual(event["index"], i + 10)
 
+    def test_get_events_since(self):
+        """测试按序号获取新事件"""
+        for i in range(5):
+            self.monitor.last_sample_time = 0  # 跳过采样间隔
+            self.monitor._add_event("test_event", {"index": i})
+        
+        # 刷新后仍可从最近事件中获取
+        self.monitor._flush_buffer()
+        events = self.monitor.get_events_since(3)
+        self.assertEqual([e["seq"] for e in events], [4, 5])
+        self.assertEqual(self.monitor.get_events_since(5), [])
+
+    def test_simulated_clock(self):
+        """测试在虚拟时钟下运行一小时的刷新和事件生成"""
+        clock = SimulatedClock()
+        monitor = EventMonitor(test_mode=True, output_path=self.output_path,
+                               flush_interval=10.0, clock=clock)
+        self.assertTrue(monitor.start())
+        self.assertTrue(clock.wait_for_sleepers(2))
+        clock.advance(3600)
+        monitor.stop()
+        
+        # 事件生成线程每10秒产生一个事件，刷新线程每10秒写入一次
+        self.assertEqual(monitor.event_count, 361)
+        self.assertEqual(monitor.store.event_count(), 361)
+        # 两个线程在同一时刻被唤醒，先后顺序不定：刷新可能早于该时刻的事件，
+        # 该事件在下一次刷新写入，但每次刷新最多包含两个事件
+        frames = [events for _, events in monitor.store.iter_frames()]
+        self.assertGreaterEqual(len(frames), 181)
+        self.assertLessEqual(max(len(events) for events in frames), 2)
+        events = list(monitor.store.iter_events())
+        self.assertEqual(events[0]["timestamp"], "2026-01-01T00:00:00+00:00")
+        self.assertEqual(events[-1]["timestamp"], "2026-01-01T01:00:00+00:00")
+    
+    def test_reconfigure(self):
+        """测试运行中修改配置：线程和缓冲区保持不变，刷新间隔立即生效"""
+        clock = SimulatedClock()
+        monitor = EventMonitor(test_mode=True, output_path=self.output_path,
+                               flush_interval=10.0, clock=clock)
+        self.assertTrue(monitor.start())
+        self.assertTrue(clock.wait_for_sleepers(2))
+        threads = (monitor.flush_thread, monitor.test_thread)
+
+        applied = monitor.reconfigure(flush_interval="100", sampling_rate=0.5, keystroke_mode="summary")
+        self.assertEqual(applied["flush_interval"], 100.0)
+        # 等待刷新线程按新的间隔重新进入等待
+        deadline = time.monotonic() + 5
+        while monitor._wake_event.is_set() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(clock.wait_for_sleepers(2))
+
+        clock.advance(50)
+        self.assertEqual(monitor.store.frame_count(), 0)
+        self.assertGreater(len(monitor.event_buffer), 0)
+        clock.advance(60)
+        self.assertEqual(monitor.store.frame_count(), 1)
+        self.assertEqual((monitor.flush_thread, monitor.test_thread), threads)
+        self.assertTrue(all(t.is_alive() for t in threads))
+
+        # 任一配置无效时全部不生效
+        with self.assertRaises(ValueError):
+            monitor.reconfigure(buffer_size=500, sampling_rate=2)
+        with self.assertRaises(ValueError):
+            monitor.reconfigure(output_path="other.json")
+        # 非有限的数值被拒绝，不会部分生效
+        for value in ("nan", "inf", 1e308):
+            with self.assertRaises(ValueError):
+                monitor.reconfigure(sampling_rate=0.8, memory_budget_mb=value)
+        with self.assertRaises(ValueError):
+            monitor.reconfigure(flush_interval="nan")
+        with self.assertRaises(ValueError):
+            monitor.reconfigure(sample_interval=float("inf"))
+        status = monitor.get_status()
+        self.assertEqual(status["sampling_rate"], 0.5)
+        self.assertEqual(status["keystroke_mode"], "summary")
+        self.assertEqual(monitor.buffer_size, 1000)
+        monitor.stop()
+        self.assertEqual(monitor.store.event_count(), monitor.event_count)
+
     def test_get_status(self):
         """测试获取状态功能"""
         status = self.monitor.get_status()
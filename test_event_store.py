@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件存储单元测试
+
+该模块包含对EventStore类的单元测试。
+"""
+
+import os
+import json
+import base64
+import unittest
+import tempfile
+import datetime
+from unittest.mock import patch
+from cryptography.fernet import Fernet
+from event_store import EventStore, parse_timestamp, INDEX_RECORD
+
+
+def make_event(ts, event_type="mouse_move", app="Safari", title="Google - Safari", **extra):
+    """构造测试事件"""
+    event = {
+        "type": event_type,
+        "timestamp": datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat(),
+        "screen_id": 0,
+        "window": {"window_id": "1", "app_name": app, "window_title": title}
+    }
+    event.update(extra)
+    return event
+
+
+class TestEventStore(unittest.TestCase):
+    """EventStore类的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "output.json")
+        self.store = EventStore(self.path)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_append_and_iterate(self):
+        """测试追加写入和流式读取"""
+        self.store.append([make_event(100 + i, index=i) for i in range(3)])
+        self.store.append([make_event(200 + i, index=3 + i) for i in range(2)])
+
+        self.assertEqual(self.store.frame_count(), 2)
+        self.assertEqual(self.store.event_count(), 5)
+        self.assertEqual([e["index"] for e in self.store.iter_events()], list(range(5)))
+        self.assertEqual(os.path.getsize(self.store.index_path), 2 * INDEX_RECORD.size)
+
+    def test_encrypted_roundtrip(self):
+        """测试加密存储"""
+        key = base64.urlsafe_b64encode(os.urandom(32))
+        store = EventStore(self.path, key)
+        store.append([make_event(100, index=0)])
+
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b"mouse_move", f.read())
+        self.assertEqual(next(store.iter_events())["index"], 0)
+
+    def test_compressed_frames(self):
+        """测试压缩帧可与未压缩帧混合读取"""
+        events = [make_event(100 + i, index=i) for i in range(200)]
+        self.store.append(events[:100])
+        plain_size = os.path.getsize(self.path)
+        EventStore(self.path, compress=True).append(events[100:])
+        self.assertLess((os.path.getsize(self.path) - plain_size) * 3, plain_size)
+        self.assertEqual(list(self.store.iter_events()), events)
+
+        key = base64.urlsafe_b64encode(os.urandom(32))
+        path = os.path.join(self.temp_dir.name, "encrypted.json")
+        EventStore(path, key, compress=True).append(events)
+        self.assertEqual(list(EventStore(path, key).iter_events()), events)
+
+    def test_query_filters_and_pagination(self):
+        """测试过滤条件和游标分页"""
+        for frame in range(5):
+            self.store.append([
+                make_event(frame * 100 + i, "mouse_click" if i % 2 else "mouse_move",
+                           app="VSCode" if i % 3 == 0 else "Safari",
+                           title=f"invoice-{frame}" if i == 0 else "other",
+                           index=frame * 10 + i)
+                for i in range(10)
+            ])
+
+        # 时间范围 + 类型
+        result = self.store.query(start=200, end=300, types=["mouse_click"], limit=100)
+        self.assertEqual([e["index"] for e in result["events"]], [21, 23, 25, 27, 29])
+        self.assertIsNone(result["next_cursor"])
+
+        # 应用和标题
+        result = self.store.query(app="vscode", title="INVOICE", limit=100)
+        self.assertEqual([e["index"] for e in result["events"]], [0, 10, 20, 30, 40])
+
+        # 分页遍历全部事件
+        seen = []
+        cursor = None
+        while True:
+            page = self.store.query(cursor=cursor, limit=7)
+            seen.extend(e["index"] for e in page["events"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(range(50)))
+
+        with self.assertRaises(ValueError):
+            self.store.query(cursor="bad")
+
+    def test_legacy_file_migration(self):
+        """测试旧格式文件的读取与迁移"""
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"events": [make_event(100 + i, index=i) for i in range(3)]}, f, indent=2)
+
+        self.assertTrue(self.store.is_legacy())
+        self.assertEqual(len(list(self.store.iter_events())), 3)
+
+        self.store.append([make_event(200, index=3)])
+        self.assertFalse(self.store.is_legacy())
+        self.assertEqual([e["index"] for e in self.store.iter_events()], [0, 1, 2, 3])
+
+    def test_encrypted_legacy_file_migration(self):
+        """测试加密旧格式文件的迁移"""
+        key = base64.urlsafe_b64encode(os.urandom(32))
+        content = json.dumps({"events": [make_event(100, index=0)]}, indent=2)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(Fernet(key).encrypt(content.encode()).decode('utf-8'))
+
+        store = EventStore(self.path, key)
+        self.assertTrue(store.is_legacy())
+        store.append([make_event(200, index=1)])
+        self.assertEqual([e["index"] for e in store.iter_events()], [0, 1])
+
+    def test_index_rebuilt_after_partial_write(self):
+        """测试索引缺失和末尾不完整写入后的恢复"""
+        self.store.append([make_event(100, index=0)])
+        self.store.append([make_event(200, index=1)])
+        os.remove(self.store.index_path)
+        with open(self.path, 'ab') as f:
+            f.write(b'[{"type":"trunc')
+
+        # 读取时通过扫描得到索引
+        self.assertEqual([e["index"] for e in EventStore(self.path).iter_events()], [0, 1])
+
+        # 写入时修复索引并截断不完整的行
+        store = EventStore(self.path)
+        store.append([make_event(300, index=2)])
+        self.assertEqual([e["index"] for e in store.iter_events()], [0, 1, 2])
+
+    def test_unordered_frames(self):
+        """测试晚到的旧帧写入无序标记，按时间范围读取时不会提前停止"""
+        self.store.append([make_event(300 + i, index=i) for i in range(3)])
+        self.assertTrue(self.store.is_ordered())
+        self.store.append([make_event(100 + i, index=3 + i) for i in range(3)])
+        self.store.append([make_event(400, index=6)])
+        self.assertFalse(self.store.is_ordered())
+
+        self.assertEqual([e["index"] for e in self.store.iter_events(end=250)], [3, 4, 5])
+        self.assertEqual([e["index"] for e in self.store.iter_events(start=101, end=350)], [0, 1, 2, 4, 5])
+        self.assertEqual([e["index"] for e in self.store.query(start=101, limit=10)["events"]], [0, 1, 2, 4, 5, 6])
+        with patch("event_store.PARALLEL_CHUNK_BYTES", 1), patch("event_store.os.cpu_count", return_value=4):
+            self.assertEqual(list(self.store.iter_events(end=250, workers=2)),
+                             list(self.store.iter_events(end=250)))
+
+        # 重建索引时重新检查顺序
+        self.store.delete()
+        self.assertFalse(os.path.exists(self.store.unordered_path))
+        self.store.append([make_event(300, index=0)])
+        self.store.append([make_event(100, index=1)])
+        os.remove(self.store.unordered_path)
+        os.remove(self.store.index_path)
+        EventStore(self.path).recover()
+        self.assertFalse(self.store.is_ordered())
+        self.assertEqual([e["index"] for e in self.store.iter_events(end=200)], [1])
+
+    def test_parallel_decode(self):
+        """测试多进程解码的结果与顺序读取一致"""
+        key = Fernet.generate_key()
+        store = EventStore(self.path, key)
+        for frame in range(6):
+            store.append([make_event(100 * frame + i, "mouse_click" if i % 2 else "key_press", index=frame * 10 + i)
+                          for i in range(10)])
+
+        # 每帧单独成为一个任务，并假定有多个CPU核
+        with patch("event_store.PARALLEL_CHUNK_BYTES", 1), patch("event_store.os.cpu_count", return_value=4):
+            self.assertEqual(list(store.iter_events(workers=3)), list(store.iter_events()))
+            self.assertEqual(list(store.iter_events(start=205, end=405, types=["mouse_click"], workers=2)),
+                             list(store.iter_events(start=205, end=405, types=["mouse_click"])))
+            self.assertEqual([n for n, _ in store.iter_frames(start_frame=4, workers=2)], [4, 5])
+
+    def test_parse_timestamp(self):
+        """测试时间戳解析"""
+        self.assertEqual(parse_timestamp("1970-01-01T00:01:40+00:00"), 100.0)
+        self.assertEqual(parse_timestamp("1970-01-01T00:01:40Z"), 100.0)
+        self.assertEqual(parse_timestamp("100"), 100.0)
+        self.assertIsNone(parse_timestamp(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
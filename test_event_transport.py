@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 事件传输编码单元测试
+
+该模块包含对二进制事件帧编解码的单元测试。
+"""
+
+import json
+import random
+import datetime
+import unittest
+from event_transport import encode_batch, decode_batch, MAX_BATCH_SIZE
+
+
+def make_events(count, seed=1):
+    """生成与测试模式相似的事件"""
+    rng = random.Random(seed)
+    apps = [("Safari", "Google - Safari"), ("VSCode", "event_monitor.py - Project"), ("Slack", "Team Channel - Slack")]
+    start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    events = []
+    for i in range(count):
+        app, title = apps[rng.randrange(len(apps))]
+        event = {
+            "type": rng.choice(["mouse_move", "mouse_click", "key_press"]),
+            "timestamp": (start + datetime.timedelta(milliseconds=i * 10)).isoformat(),
+            "screen_id": 0,
+            "window": {"window_id": str(1000 + rng.randrange(3)), "app_name": app, "window_title": title},
+            "seq": i + 1
+        }
+        if event["type"] == "key_press":
+            event.update({"key_code": rng.randint(1, 100), "key_name": "a", "state": "pressed", "modifiers": []})
+        else:
+            event["position"] = {"x": float(rng.randint(0, 1919)), "y": float(rng.randint(0, 1079))}
+        events.append(event)
+    return events
+
+
+class TestEventTransport(unittest.TestCase):
+    """二进制事件帧的测试用例"""
+
+    def test_roundtrip(self):
+        """测试编码后解码得到相同的事件"""
+        events = make_events(50)
+        events[0]["window"]["window_title"] = "中文标题"
+        for compress in (False, True):
+            self.assertEqual(decode_batch(encode_batch(events, compress=compress)), events)
+
+    def test_empty_batch(self):
+        """测试空批次"""
+        self.assertEqual(decode_batch(encode_batch([])), [])
+
+    def test_bytes_per_event(self):
+        """测试二进制帧明显小于JSON"""
+        events = make_events(500)
+        json_size = len(json.dumps({"events": events}, ensure_ascii=False).encode("utf-8"))
+        self.assertLess(len(encode_batch(events)) * 3, json_size)
+        self.assertLess(len(encode_batch(events, compress=True)) * 5, json_size)
+
+    def test_invalid_input(self):
+        """测试非法输入"""
+        with self.assertRaises(ValueError):
+            decode_batch(b"XXXX\x00")
+        with self.assertRaises(ValueError):
+            encode_batch([{}] * (MAX_BATCH_SIZE + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
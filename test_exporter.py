@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 数据导出单元测试
+
+该模块包含对流式导出的单元测试。
+"""
+
+import io
+import os
+import csv
+import gzip
+import json
+import tempfile
+import unittest
+from event_store import EventStore, parse_timestamp
+from exporter import iter_export, export_store, format_from_filename, CSV_COLUMNS
+from test_event_transport import make_events
+
+
+class TestExporter(unittest.TestCase):
+    """流式导出的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = EventStore(os.path.join(self.temp_dir.name, "output.json"))
+        self.events = make_events(300)
+        for i in range(0, 300, 100):
+            self.store.append(self.events[i:i + 100])
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_format_from_filename(self):
+        """测试根据文件名推断导出格式"""
+        self.assertEqual(format_from_filename("a.json"), ("json", False))
+        self.assertEqual(format_from_filename("a.CSV.gz"), ("csv", True))
+        with self.assertRaises(ValueError):
+            format_from_filename("a.txt")
+
+    def test_formats_roundtrip(self):
+        """测试各格式导出的内容"""
+        jsonl = b"".join(iter_export(self.events, "jsonl")).decode("utf-8")
+        self.assertEqual([json.loads(line) for line in jsonl.splitlines()], self.events)
+
+        data = json.loads(b"".join(iter_export(self.events, "json")))
+        self.assertEqual(data["events"], self.events)
+        self.assertEqual(json.loads(b"".join(iter_export([], "json"))), {"events": []})
+        pretty = b"".join(iter_export(self.events[:3], "json", pretty=True))
+        self.assertEqual(json.loads(pretty)["events"], self.events[:3])
+        self.assertGreater(pretty.count(b"\n"), 10)
+
+        rows = list(csv.reader(io.StringIO(b"".join(iter_export(self.events, "csv")).decode("utf-8"))))
+        self.assertEqual(rows[0], CSV_COLUMNS)
+        self.assertEqual(len(rows), len(self.events) + 1)
+        self.assertEqual(rows[1][CSV_COLUMNS.index("app_name")], self.events[0]["window"]["app_name"])
+
+    def test_chunked_gzip(self):
+        """测试分块输出的gzip数据可以完整解压"""
+        chunks = list(iter_export(self.events, "jsonl", compress=True, chunk_size=1024))
+        self.assertGreater(len(chunks), 1)
+        lines = gzip.decompress(b"".join(chunks)).decode("utf-8").splitlines()
+        self.assertEqual(len(lines), len(self.events))
+
+    def test_export_store_with_filters(self):
+        """测试按时间范围和类型导出到文件"""
+        path = os.path.join(self.temp_dir.name, "export.jsonl.gz")
+        start = parse_timestamp(self.events[50]["timestamp"])
+        end = parse_timestamp(self.events[250]["timestamp"])
+        count = export_store(self.store, path, start=start, end=end, types=["mouse_click"])
+
+        expected = [e for e in self.events[50:250] if e["type"] == "mouse_click"]
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            exported = [json.loads(line) for line in f]
+        self.assertEqual(count, len(expected))
+        self.assertEqual(exported, expected)
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 热力图单元测试
+
+该模块包含对HeatmapAggregator类的单元测试。
+"""
+
+import os
+import unittest
+import tempfile
+from heatmap import HeatmapAggregator, NUMPY_AVAILABLE
+
+
+def make_event(event_type, x, y, app="Safari"):
+    """构造带位置的测试事件"""
+    return {
+        "type": event_type,
+        "position": {"x": x, "y": y},
+        "window": {"app_name": app}
+    }
+
+
+class TestHeatmapAggregator(unittest.TestCase):
+    """HeatmapAggregator类的测试用例"""
+
+    def _check_binning(self, use_numpy):
+        heatmap = HeatmapAggregator(100, 100, 10, 10, use_numpy=use_numpy)
+        self.assertTrue(heatmap.update(make_event("mouse_move", 5, 5)))
+        self.assertTrue(heatmap.update(make_event("mouse_move", 95, 15)))
+        self.assertTrue(heatmap.update(make_event("mouse_click", 500, -3, app="VSCode")))
+        self.assertFalse(heatmap.update({"type": "key_press"}))
+
+        result = heatmap.get()
+        self.assertEqual(len(result["bins"]), 100)
+        self.assertEqual(result["total"], 3)
+        self.assertEqual(result["bins"][0], 1)
+        self.assertEqual(result["bins"][1 * 10 + 9], 1)
+        # 超出屏幕的坐标落在边缘格子
+        self.assertEqual(result["bins"][9], 1)
+
+        self.assertEqual(heatmap.get(event_types=["mouse_click"])["total"], 1)
+        self.assertEqual(heatmap.get(apps=["Safari"])["total"], 2)
+        self.assertEqual(heatmap.get(event_types=["mouse_click"], apps=["Safari"])["total"], 0)
+
+    def test_binning_without_numpy(self):
+        """测试标准库实现的计数和过滤"""
+        self._check_binning(False)
+
+    @unittest.skipUnless(NUMPY_AVAILABLE, "未安装NumPy")
+    def test_binning_with_numpy(self):
+        """测试NumPy实现的计数和过滤"""
+        self._check_binning(True)
+
+    def test_persistence_roundtrip(self):
+        """测试热力图的保存和恢复"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "output.json.heatmap.json")
+            heatmap = HeatmapAggregator(100, 100, 10, 10, use_numpy=False)
+            for i in range(5):
+                heatmap.update(make_event("mouse_move", i * 20, 50))
+            heatmap.save(path)
+
+            for use_numpy in (False, NUMPY_AVAILABLE):
+                restored = HeatmapAggregator(100, 100, 10, 10, use_numpy=use_numpy)
+                self.assertTrue(restored.load(path))
+                self.assertEqual(restored.get()["bins"], heatmap.get()["bins"])
+
+            # 网格尺寸不一致时不加载
+            other = HeatmapAggregator(100, 100, 20, 20)
+            self.assertFalse(other.load(path))
+            self.assertEqual(other.get()["total"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 按键汇总单元测试
+
+该模块包含对按键事件按应用和时间窗口汇总的单元测试。
+"""
+
+import os
+import tempfile
+import unittest
+from clock import SimulatedClock
+from event_monitor import EventMonitor
+from keystrokes import KeystrokeAggregator, parse_app_modes, TYPING_SUMMARY
+
+START = 1767225600.0
+SAFARI = {"app_name": "Safari", "window_title": "Google - Safari", "window_id": "1"}
+TERMINAL = {"app_name": "Terminal", "window_title": "bash", "window_id": "2"}
+
+
+def press(key_name="a", modifiers=None):
+    return {"key_name": key_name, "key_code": 0, "state": "pressed", "modifiers": modifiers or []}
+
+
+class TestKeystrokeAggregator(unittest.TestCase):
+    """按键汇总的测试用例"""
+
+    def test_summary_window(self):
+        """测试窗口内的次数、节奏、快捷键统计，以及进入新窗口时输出汇总"""
+        aggregator = KeystrokeAggregator("summary", interval=60)
+        self.assertEqual(aggregator.add("key_press", press("a"), SAFARI, START + 1), [])
+        aggregator.add("key_release", press("a"), SAFARI, START + 1.05)
+        aggregator.add("key_press", press("b"), SAFARI, START + 1.15)
+        aggregator.add("key_press", press("c", ["cmd"]), SAFARI, START + 2.0)
+
+        closed = aggregator.add("key_press", press("a"), SAFARI, START + 61)
+        self.assertEqual(len(closed), 1)
+        summary = closed[0]
+        self.assertEqual(summary["type"], TYPING_SUMMARY)
+        self.assertEqual(summary["window"]["app_name"], "Safari")
+        self.assertEqual(summary["key_count"], 3)
+        self.assertEqual(summary["release_count"], 1)
+        self.assertEqual(summary["rate_per_minute"], 3.0)
+        self.assertEqual(summary["inter_key_ms_counts"], [0, 0, 1, 0, 0, 1, 0])
+        self.assertEqual(summary["keys"], {"a": 1, "b": 1, "c": 1})
+        self.assertEqual(summary["shortcuts"], {"cmd+c": 1})
+        self.assertEqual(summary["modifiers"], {"cmd": 1})
+        self.assertEqual(summary["timestamp"], "2026-01-01T00:01:00+00:00")
+
+        self.assertEqual(aggregator.flush(START + 90), [])
+        self.assertEqual([s["key_count"] for s in aggregator.flush(START + 120)], [1])
+
+    def test_anonymous_and_app_modes(self):
+        """测试匿名模式不保留按键身份，以及按应用设置模式"""
+        aggregator = KeystrokeAggregator("anonymous", parse_app_modes(["Terminal=raw"]))
+        self.assertTrue(aggregator.active)
+        self.assertEqual(aggregator.mode_for("Terminal"), "raw")
+        aggregator.add("key_press", press("c", ["ctrl"]), SAFARI, START)
+        summary = aggregator.close(START + 1)[0]
+        self.assertNotIn("keys", summary)
+        self.assertNotIn("shortcuts", summary)
+        self.assertEqual(summary["shortcut_count"], 1)
+        self.assertEqual(summary["modifiers"], {"ctrl": 1})
+
+        self.assertFalse(KeystrokeAggregator("raw", {"Safari": "raw"}).active)
+        with self.assertRaises(ValueError):
+            parse_app_modes(["Terminal"])
+        with self.assertRaises(ValueError):
+            KeystrokeAggregator("hidden")
+
+    def test_close_partial_window(self):
+        """测试停止时未满的窗口在当前时间结束，速率按实际经过的时间计算"""
+        aggregator = KeystrokeAggregator("anonymous", interval=60)
+        for i in range(10):
+            aggregator.add("key_press", press(), SAFARI, START + 1 + i)
+        aggregator.add("key_release", press(), SAFARI, START + 10.5)
+        summary = aggregator.close(START + 15)[0]
+        self.assertEqual(summary["timestamp"], "2026-01-01T00:00:15+00:00")
+        self.assertEqual(summary["rate_per_minute"], 40.0)
+
+        # 时钟落后于最后一个按键时以最后一个按键为结束时间
+        aggregator.add("key_press", press(), SAFARI, START + 20)
+        summary = aggregator.close(START + 5)[0]
+        self.assertEqual(summary["timestamp"], "2026-01-01T00:00:20+00:00")
+
+    def test_monitor_records_summaries(self):
+        """测试监控器只写入汇总事件，按键事件不单独记录"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            clock = SimulatedClock(start=START)
+            monitor = EventMonitor(test_mode=True, output_path=os.path.join(temp_dir, "output.json"),
+                                   sample_interval=0, clock=clock, keystroke_mode="anonymous")
+            for _ in range(50):
+                monitor._add_event("key_press", press())
+                monitor._add_event("key_release", press())
+                clock.advance(0.1)
+            monitor._add_event("mouse_move", {"position": {"x": 1, "y": 1}})
+            self.assertEqual([e["type"] for e in monitor.event_buffer], ["mouse_move"])
+
+            clock.advance(60)
+            monitor._flush_buffer()
+            events = list(monitor.store.iter_events())
+            summaries = [e for e in events if e["type"] == TYPING_SUMMARY]
+            self.assertEqual(sum(s["key_count"] for s in summaries), 50)
+            self.assertEqual(sum(s["release_count"] for s in summaries), 50)
+            self.assertTrue(monitor.derived.drain(5))
+            hour = monitor.rollups.query(granularity="hour")["buckets"][0]
+            self.assertEqual(hour["keystrokes"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
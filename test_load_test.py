@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 负载测试工具单元测试
+
+该模块包含对推送事件统计逻辑的单元测试。
+"""
+
+import datetime
+import unittest
+from load_test import PushStats, percentiles
+
+
+class TestPushStats(unittest.TestCase):
+    """推送事件统计的测试用例"""
+
+    def _events(self, seqs, timestamp):
+        iso = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+        return [{"seq": seq, "timestamp": iso} for seq in seqs]
+
+    def test_missed_and_duplicates(self):
+        """测试按序号统计丢失和重复的事件"""
+        stats = PushStats()
+        stats.record(self._events([5, 6, 7], 1000.0), 1000.2)
+        stats.record(self._events([7, 10], 1000.0), 1000.5)
+
+        summary = stats.summary()
+        self.assertEqual(summary["events"], 4)
+        self.assertEqual(summary["duplicates"], 1)
+        self.assertEqual(summary["missed"], 2)
+        self.assertEqual(summary["batches"], 2)
+        self.assertAlmostEqual(summary["latency"]["max_ms"], 500.0, places=3)
+
+    def test_percentiles(self):
+        """测试延迟分位数"""
+        result = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertAlmostEqual(result["p50_ms"], 51.0)
+        self.assertAlmostEqual(result["p99_ms"], 100.0)
+        self.assertEqual(percentiles([])["max_ms"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
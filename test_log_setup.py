@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 日志配置单元测试
+
+该模块包含对异步日志和重复日志限流的单元测试。
+"""
+
+import os
+import queue
+import logging
+import tempfile
+import unittest
+from log_setup import (RateLimitFilter, NonBlockingQueueHandler, configure_logging, shutdown_logging,
+                       LOG_DROPPED)
+
+
+def make_record(msg, level=logging.ERROR, lineno=10):
+    return logging.LogRecord("poller", level, "event_monitor.py", lineno, msg, None, None)
+
+
+class TestLogSetup(unittest.TestCase):
+    """日志配置的测试用例"""
+
+    def test_rate_limit(self):
+        """测试同一位置的重复错误被限流并汇总"""
+        rate_limit = RateLimitFilter(interval=60.0, burst=2)
+        results = [rate_limit.filter(make_record(f"失败 {i}")) for i in range(5)]
+        self.assertEqual(results, [True, True, False, False, False])
+
+        # 其他位置和低级别的记录不受影响
+        self.assertTrue(rate_limit.filter(make_record("其他", lineno=20)))
+        self.assertTrue(rate_limit.filter(make_record("信息", level=logging.INFO)))
+
+        self.assertEqual(rate_limit.pending(), [("poller", "event_monitor.py", 10, 3)])
+        self.assertEqual(rate_limit.pending(), [])
+
+        # 窗口过期后放行，并附带被抑制的条数
+        rate_limit = RateLimitFilter(interval=0.0, burst=1)
+        rate_limit._state[("poller", "event_monitor.py", 10)] = [0.0, 5, 4]
+        record = make_record("失败")
+        self.assertTrue(rate_limit.filter(record))
+        self.assertIn("4条相似消息已被抑制", record.getMessage())
+
+    def test_queue_full_drops(self):
+        """测试队列满时丢弃日志而不阻塞"""
+        handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+        before = LOG_DROPPED.value()
+        handler.handle(make_record("第一条"))
+        handler.handle(make_record("第二条"))
+        self.assertEqual(LOG_DROPPED.value() - before, 1)
+
+    def test_configure_writes_file(self):
+        """测试后台线程把日志写入文件"""
+        root = logging.getLogger()
+        saved_handlers, saved_level = list(root.handlers), root.level
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_file = os.path.join(temp_dir, "test.log")
+            try:
+                configure_logging(logging.INFO, log_file=log_file)
+                logging.getLogger("test").debug("不应写入")
+                logging.getLogger("test").info("写入文件")
+            finally:
+                shutdown_logging()
+                root.handlers[:] = saved_handlers
+                root.setLevel(saved_level)
+            with open(log_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+        self.assertIn("test - INFO - 写入文件", content)
+        self.assertNotIn("不应写入", content)
+
+
+if __name__ == '__main__':
+    unittest.main()
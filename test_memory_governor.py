@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 内存预算单元测试
+
+该模块包含对事件大小估算、采样率系数、溢出文件以及监控器在磁盘不可用时
+内存占用有上限的单元测试。
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from clock import SimulatedClock
+from event_monitor import EventMonitor, FLUSH_RETRY_DELAY
+from memory_governor import (
+    MemoryGovernor, estimate_event_size, MIN_SAMPLING_FACTOR, HARD_LIMIT, SPILL_SUFFIX, SPILL_POS_SUFFIX
+)
+
+
+def make_event(i):
+    return {"type": "mouse_click", "timestamp": f"2026-01-01T00:00:{i % 60:02d}", "screen_id": 0,
+            "window": {"window_id": "1", "app_name": "Safari", "window_title": "Google - Safari"},
+            "position": {"x": i, "y": i}, "button": "left"}
+
+
+class TestMemoryGovernor(unittest.TestCase):
+    """内存预算和溢出文件的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.temp_dir.name, "output.json" + SPILL_SUFFIX)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_estimate_and_sampling_factor(self):
+        """测试事件大小随字符串长度增长，采样率系数随内存压力降低"""
+        small = estimate_event_size(make_event(1))
+        event = make_event(1)
+        event["window"]["window_title"] = "x" * 1000
+        large = estimate_event_size(event)
+        self.assertGreater(small, 500)
+        self.assertGreater(large, small + 900)
+
+        governor = MemoryGovernor(1.0)
+        budget = governor.budget_bytes
+        self.assertEqual(governor.sampling_factor(budget // 2), 1.0)
+        self.assertLess(governor.sampling_factor(int(budget * 0.9)), 1.0)
+        self.assertEqual(governor.sampling_factor(budget), MIN_SAMPLING_FACTOR)
+        self.assertTrue(governor.over_hard_limit(int(budget * HARD_LIMIT) + 1))
+        self.assertFalse(governor.spill_events([make_event(1)]))
+
+    def test_spill_and_consume(self):
+        """测试溢出的帧按顺序读回，写回位置在重启后保留，全部写回后删除溢出文件"""
+        governor = MemoryGovernor(1.0, self.spill_path)
+        self.assertIsNone(governor.peek_spilled())
+        self.assertTrue(governor.spill_events([make_event(0), make_event(1)]))
+        self.assertTrue(governor.spill_events([make_event(2)]))
+        self.assertEqual(governor.spilled_frames(), 2)
+        self.assertEqual(governor.spilled_events(), 3)
+
+        self.assertEqual([e["position"]["x"] for e in governor.peek_spilled()], [0, 1])
+        governor.consume_spilled()
+
+        # 重启后从已保存的位置继续
+        reopened = MemoryGovernor(1.0, self.spill_path)
+        self.assertEqual(reopened.snapshot()["spilled_events"], 1)
+        self.assertEqual([e["position"]["x"] for e in reopened.peek_spilled()], [2])
+        reopened.consume_spilled()
+        self.assertIsNone(reopened.peek_spilled())
+        self.assertFalse(os.path.exists(self.spill_path))
+        self.assertFalse(os.path.exists(self.spill_path + SPILL_POS_SUFFIX))
+
+        # 删除后可以再次溢出
+        self.assertTrue(reopened.spill_events([make_event(3)]))
+        self.assertEqual(reopened.spilled_events(), 1)
+
+
+class TestMonitorMemoryBudget(unittest.TestCase):
+    """监控器在写入失败时内存占用有上限的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "output.json")
+        self.clock = SimulatedClock()
+        # 约50个事件的预算，缓冲区大小不会先触发刷新
+        self.monitor = EventMonitor(test_mode=True, output_path=self.output_path, buffer_size=100000,
+                                    clock=self.clock, memory_budget_mb=0.05)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.monitor.derived.drain(5)
+        self.temp_dir.cleanup()
+
+    def _record(self, count, start=0):
+        for i in range(start, start + count):
+            self.monitor._record(make_event(i))
+            if i % 20 == 0:
+                self.clock.advance(FLUSH_RETRY_DELAY)
+
+    def test_spill_while_disk_unavailable(self):
+        """测试写入失败时缓冲区有上限，旧事件溢出到磁盘，恢复后按顺序全部写回"""
+        budget = self.monitor.memory.budget_bytes
+        with mock.patch.object(self.monitor.store, "append", side_effect=OSError("磁盘已满")):
+            self._record(500)
+            self.assertLessEqual(self.monitor._buffer_bytes, budget * HARD_LIMIT)
+        self.assertGreater(self.monitor.memory.spilled_events(), 0)
+
+        status = self.monitor.get_status()["memory"]
+        self.assertEqual(status["budget_bytes"], budget)
+        self.assertEqual(status["spilled_events"], self.monitor.memory.spilled_events())
+        self.assertIn("buffer", status["parts"])
+
+        self.monitor._flush_buffer()
+        self.assertEqual(self.monitor.memory.spilled_events(), 0)
+        self.assertFalse(os.path.exists(self.output_path + SPILL_SUFFIX))
+        self.assertEqual([e["seq"] for e in self.monitor.store.iter_events()], list(range(1, 501)))
+
+    def test_drop_when_spill_fails(self):
+        """测试溢出也失败时丢弃最旧的事件，缓冲区仍有上限"""
+        budget = self.monitor.memory.budget_bytes
+        with mock.patch.object(self.monitor.store, "append", side_effect=OSError("磁盘已满")), \
+                mock.patch.object(self.monitor.memory.spill, "append", side_effect=OSError("磁盘已满")):
+            self._record(500)
+            self.assertLessEqual(self.monitor._buffer_bytes, budget * HARD_LIMIT)
+        self.assertEqual(self.monitor.memory.spilled_events(), 0)
+
+        # 保留的是最新的事件
+        self.monitor._flush_buffer()
+        seqs = [e["seq"] for e in self.monitor.store.iter_events()]
+        self.assertLess(len(seqs), 500)
+        self.assertEqual(seqs, sorted(seqs))
+        self.assertEqual(seqs[-1], 500)
+        # 被丢弃的事件不计入热力图
+        self.assertTrue(self.monitor.derived.drain(5))
+        self.assertEqual(self.monitor.heatmap.get()["total"], len(seqs))
+
+    def test_accounting_with_concurrent_capture(self):
+        """测试采集线程追加与刷新时取走、放回、溢出同时进行，估算字节数与缓冲区一致且不丢事件"""
+        def capture():
+            for i in range(2000):
+                self.monitor._record(make_event(i), flush_when_full=False)
+
+        thread = threading.Thread(target=capture)
+        with mock.patch.object(self.monitor.store, "append", side_effect=OSError("磁盘已满")):
+            thread.start()
+            while thread.is_alive():
+                self.monitor._flush_buffer()
+            thread.join()
+        self.assertEqual(self.monitor._buffer_bytes,
+                         sum(estimate_event_size(event) for event in self.monitor.event_buffer))
+
+        self.monitor._flush_buffer()
+        self.assertEqual([e["seq"] for e in self.monitor.store.iter_events()], list(range(1, 2001)))
+
+    def test_sampling_under_pressure(self):
+        """测试缓冲区超出预算的上限时丢弃新事件，并可以在运行中修改预算"""
+        with mock.patch.object(self.monitor, "_buffer_full"):
+            self._record(100)
+            self.monitor._add_event("mouse_click", {"position": {"x": 0, "y": 0}, "button": "left"})
+        self.assertEqual(len(self.monitor.event_buffer), 100)
+
+        self.monitor.reconfigure(memory_budget_mb=64)
+        self.assertEqual(self.monitor.memory.budget_bytes, 64 * 1024 * 1024)
+        self.assertEqual(self.monitor.get_status()["memory"]["sampling_factor"], 1.0)
+        with self.assertRaises(ValueError):
+            self.monitor.reconfigure(memory_budget_mb=0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
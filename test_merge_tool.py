@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 多机记录合并单元测试
+
+该模块包含对k路归并和来源主机标记的单元测试。
+"""
+
+import os
+import io
+import csv
+import json
+import tempfile
+import unittest
+from event_store import EventStore, parse_timestamp
+from event_monitor import derive_encryption_key
+from exporter import iter_export, CSV_COLUMNS
+from merge_tool import parse_input, merge_recordings, write_store
+from test_event_transport import make_events
+
+
+class TestMergeTool(unittest.TestCase):
+    """多机记录合并的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        # 三台机器的事件交错分布在同一时间段内
+        self.events = make_events(300)
+        self.by_host = {host: self.events[i::3] for i, host in enumerate(["mac-a", "mac-b", "mac-c"])}
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def _path(self, name):
+        return os.path.join(self.temp_dir.name, name)
+
+    def test_parse_input(self):
+        """测试输入参数解析"""
+        self.assertEqual(parse_input("/data/mac-a.json"), ("/data/mac-a.json", "mac-a"))
+        self.assertEqual(parse_input("/data/output.json=office-1"), ("/data/output.json", "office-1"))
+        self.assertEqual(parse_input("/data/output.json="), ("/data/output.json", "output"))
+
+    def test_merge_mixed_formats(self):
+        """测试合并追加格式、旧版格式和加密文件"""
+        inputs = []
+        store = EventStore(self._path("a.json"))
+        for i in range(0, len(self.by_host["mac-a"]), 25):
+            store.append(self.by_host["mac-a"][i:i + 25])
+        inputs.append((store.path, "mac-a"))
+
+        with open(self._path("b.json"), 'w', encoding='utf-8') as f:
+            json.dump({"events": self.by_host["mac-b"]}, f)
+        inputs.append((self._path("b.json"), "mac-b"))
+
+        merged = list(merge_recordings(inputs))
+        expected = sorted(self.by_host["mac-a"] + self.by_host["mac-b"], key=lambda e: e["timestamp"])
+        self.assertEqual([e["seq"] for e in merged], [e["seq"] for e in expected])
+        self.assertEqual({e["host"] for e in merged if e["seq"] % 3 == 1}, {"mac-a"})
+
+        # 加密输入使用各自主机名派生的密钥
+        for host in ("mac-b", "mac-c"):
+            EventStore(self._path(f"enc-{host}.json"), derive_encryption_key(host)).append(self.by_host[host])
+        encrypted = [(self._path(f"enc-{host}.json"), host) for host in ("mac-b", "mac-c")]
+        start = parse_timestamp(self.events[100]["timestamp"])
+        merged = list(merge_recordings(encrypted, encrypted=True, start=start, types=["key_press"]))
+        expected = [e for e in self.events[100:] if e["seq"] % 3 != 1 and e["type"] == "key_press"]
+        self.assertEqual([e["seq"] for e in merged], [e["seq"] for e in expected])
+
+    def test_output_formats(self):
+        """测试合并结果写入CSV和事件存储"""
+        inputs = []
+        for host, events in self.by_host.items():
+            EventStore(self._path(f"{host}.json")).append(events)
+            inputs.append((self._path(f"{host}.json"), host))
+
+        rows = list(csv.reader(io.StringIO(b"".join(iter_export(merge_recordings(inputs), "csv")).decode("utf-8"))))
+        self.assertEqual(len(rows), len(self.events) + 1)
+        self.assertEqual(rows[1][CSV_COLUMNS.index("host")], "mac-a")
+        self.assertEqual(rows[2][CSV_COLUMNS.index("host")], "mac-b")
+
+        count = write_store(merge_recordings(inputs), self._path("merged.json"), frame_size=64)
+        merged = EventStore(self._path("merged.json"))
+        self.assertEqual(count, len(self.events))
+        self.assertEqual(merged.frame_count(), 5)
+        self.assertEqual([e["seq"] for e in merged.iter_events()], [e["seq"] for e in self.events])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 指标单元测试
+
+该模块包含对指标注册表和Prometheus文本导出的单元测试。
+"""
+
+import threading
+import unittest
+from metrics import MetricsRegistry
+
+
+class TestMetrics(unittest.TestCase):
+    """指标注册表的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.registry = MetricsRegistry()
+
+    def test_counter_merges_thread_shards(self):
+        """测试多线程计数在采集时合并"""
+        counter = self.registry.counter("events_total", "事件数", ("type",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc(labels=("mouse_move",))
+            counter.inc(5, labels=("key_press",))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(counter.value(("mouse_move",)), 4000)
+        self.assertEqual(counter.value(("key_press",)), 20)
+        self.assertIs(self.registry.counter("events_total", "事件数", ("type",)), counter)
+
+    def test_histogram(self):
+        """测试直方图分桶"""
+        histogram = self.registry.histogram("flush_seconds", "耗时", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        counts, total, count = histogram.values()[()]
+        self.assertEqual(counts, [2, 1, 1])
+        self.assertAlmostEqual(total, 2.65)
+        self.assertEqual(count, 4)
+
+    def test_render_prometheus_text(self):
+        """测试Prometheus文本格式"""
+        self.registry.counter("c_total", "计数", ("type",)).inc(labels=('a"b',))
+        gauge = self.registry.gauge("g", "瞬时值")
+        gauge.set_function(lambda: 3)
+        self.registry.histogram("h_seconds", "耗时", buckets=(1.0,)).observe(0.5)
+
+        text = self.registry.render()
+        self.assertIn("# TYPE c_total counter", text)
+        self.assertIn('c_total{type="a\\"b"} 1', text)
+        self.assertIn("g 3", text)
+        self.assertIn('h_seconds_bucket{le="1"} 1', text)
+        self.assertIn('h_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn("h_seconds_count 1", text)
+        self.assertTrue(text.endswith("\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 监控器注册表单元测试
+
+该模块包含对具名监控器注册表和共享刷新线程池的单元测试。
+"""
+
+import os
+import time
+import tempfile
+import unittest
+from clock import SimulatedClock
+from event_monitor import EventMonitor
+from monitor_registry import FlushPool, MonitorRegistry, validate_name, DEFAULT_MONITOR
+
+
+class TestFlushPool(unittest.TestCase):
+    """共享刷新线程池的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.clock = SimulatedClock()
+        self.pool = FlushPool(workers=2, clock=self.clock)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.pool.close()
+        self.temp_dir.cleanup()
+
+    def _monitor(self, name, flush_interval, buffer_size=1000):
+        return EventMonitor(test_mode=True, output_path=os.path.join(self.temp_dir.name, f"{name}.json"),
+                            flush_interval=flush_interval, buffer_size=buffer_size, sample_interval=0,
+                            clock=self.clock, flush_pool=self.pool)
+
+    def _record(self, monitor, count):
+        for i in range(count):
+            monitor._add_event("mouse_move", {"position": {"x": i, "y": i}})
+
+    def test_flushes_each_monitor_on_its_interval(self):
+        """测试按各自的刷新间隔刷新，线程数与监控器数量无关"""
+        fast, slow, idle = self._monitor("fast", 10), self._monitor("slow", 30), self._monitor("idle", 10)
+        for monitor in (fast, slow, idle):
+            self.pool.register(monitor)
+        self.assertTrue(self.clock.wait_for_sleepers(2))
+
+        for _ in range(6):
+            self._record(fast, 1)
+            self._record(slow, 1)
+            self.clock.advance(10)
+        self.assertEqual(fast.store.frame_count(), 6)
+        self.assertEqual(slow.store.frame_count(), 2)
+        self.assertEqual(slow.store.event_count(), 6)
+        self.assertEqual(idle.store.frame_count(), 0)
+
+        # 修改刷新间隔后按上次刷新时间重新计算
+        slow.flush_interval = 15
+        self.pool.reschedule(slow)
+        self._record(slow, 1)
+        self.clock.advance(15)
+        self.assertEqual(slow.store.frame_count(), 3)
+
+        # 注销后不再刷新
+        self.pool.unregister(fast)
+        self._record(fast, 1)
+        self.clock.advance(30)
+        self.assertEqual(fast.store.frame_count(), 6)
+
+    def test_buffer_full_submits_flush(self):
+        """测试缓冲区满时交给线程池尽快刷新，不在采集线程中写入"""
+        monitor = self._monitor("full", 3600, buffer_size=10)
+        monitor.start()
+        self.assertTrue(self.clock.wait_for_sleepers(3))
+        self.assertIsNone(monitor.flush_thread)
+
+        self._record(monitor, 10)
+        # 刷新在线程池中异步进行，不需要推进时间
+        deadline = time.monotonic() + 5
+        while monitor.store.event_count() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(monitor.store.event_count(), 10)
+        self._record(monitor, 3)
+        monitor.stop()
+        self.assertEqual(monitor.store.event_count(), monitor.event_count)
+
+
+class TestMonitorRegistry(unittest.TestCase):
+    """监控器注册表的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.defaults = {"test_mode": True, "output_path": "./output.json", "flush_interval": 10.0}
+        self.registry = MonitorRegistry(self.defaults, flush_workers=1, clock=SimulatedClock())
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.registry.close()
+        self.temp_dir.cleanup()
+
+    def _config(self, name):
+        return dict(self.defaults, output_path=os.path.join(self.temp_dir.name, f"{name}.json"))
+
+    def test_named_monitors(self):
+        """测试多个具名监控器独立启动、停止和移除"""
+        self.assertEqual(self.registry.entry("work").config["output_path"], "./output-work.json")
+        self.assertEqual(self.registry.entry().config["output_path"], "./output.json")
+
+        work = self.registry.start("work", self._config("work"))
+        home = self.registry.start("home", self._config("home"))
+        self.assertIs(self.registry.get("work"), work)
+        self.assertIs(work.flush_pool, home.flush_pool)
+        self.assertEqual(self.registry.names(), [DEFAULT_MONITOR, "home", "work"])
+
+        # 同一输出路径不能被两个运行中的监控器使用
+        with self.assertRaises(ValueError):
+            self.registry.start("copy", self._config("work"))
+
+        # 重新启动同名监控器时替换原有实例
+        restarted = self.registry.start("work", self._config("work"))
+        self.assertFalse(work.running)
+        self.assertTrue(restarted.running)
+
+        self.assertIs(self.registry.stop("home"), home)
+        self.assertIsNone(self.registry.stop("home"))
+        self.assertTrue(self.registry.remove("work"))
+        self.assertFalse(restarted.running)
+        self.assertIsNone(self.registry.get("work"))
+        self.assertTrue(self.registry.remove(DEFAULT_MONITOR))
+        self.assertIn(DEFAULT_MONITOR, self.registry.names())
+
+    def test_validate_name(self):
+        """测试监控器名称校验"""
+        self.assertEqual(validate_name("profile-1"), "profile-1")
+        for name in ("", "../etc", "a/b", "x" * 65, None):
+            with self.assertRaises(ValueError):
+                validate_name(name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 时间汇总单元测试
+
+该模块包含对分钟、小时和天三级汇总的增量维护、查询和持久化的单元测试。
+"""
+
+import os
+import datetime
+import tempfile
+import unittest
+from cryptography.fernet import Fernet
+from event_store import EventStore
+from rollups import RollupAggregator
+from test_event_transport import make_events
+
+START = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def event(seconds, event_type="mouse_move", app="Safari", x=0.0, y=0.0):
+    """生成距START指定秒数的事件"""
+    result = {
+        "type": event_type,
+        "timestamp": (START + datetime.timedelta(seconds=seconds)).isoformat(),
+        "window": {"app_name": app}
+    }
+    if event_type.startswith("mouse"):
+        result["position"] = {"x": x, "y": y}
+    return result
+
+
+class TestRollups(unittest.TestCase):
+    """时间汇总的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.rollups = RollupAggregator()
+        self.rollups.add([event(0, x=0, y=0), event(30, x=30, y=40), event(70, "key_press", app="VSCode")])
+        # 跨批次的鼠标距离也要计入
+        self.rollups.add([event(3700, "mouse_click", x=30, y=50), event(3710, "key_press", app="VSCode")])
+
+    def test_query_tiers(self):
+        """测试各级别的计数、鼠标距离和按键数"""
+        minute = self.rollups.query(granularity="minute")
+        self.assertEqual(minute["tier"], "minute")
+        self.assertEqual([b["total"] for b in minute["buckets"]], [2, 1, 2])
+        self.assertEqual(minute["buckets"][0]["mouse_distance"], 50.0)
+        self.assertEqual(minute["buckets"][2]["mouse_distance"], 10.0)
+
+        hour = self.rollups.query(granularity="hour")
+        self.assertEqual([b["total"] for b in hour["buckets"]], [3, 2])
+        self.assertEqual([b["keystrokes"] for b in hour["buckets"]], [1, 1])
+
+        day = self.rollups.query(granularity=86400, types=["key_press"])
+        self.assertEqual(day["tier"], "day")
+        self.assertEqual(day["buckets"][0]["types"], {"key_press": 2})
+
+        filtered = self.rollups.query(granularity=1800, app="vscode", start=START.timestamp() + 3600)
+        self.assertEqual(filtered["tier"], "minute")
+        self.assertEqual(filtered["buckets"][0]["apps"], {"VSCode": 1})
+        self.assertEqual(filtered["buckets"][0]["mouse_distance"], 0)
+
+    def test_choose_tier(self):
+        """测试按粒度和保留期选择最粗的级别"""
+        start = START.timestamp()
+        self.assertEqual(self.rollups.choose_tier(start, start + 3600), ("minute", 60))
+        self.assertEqual(self.rollups.choose_tier(start, start + 30 * 86400), ("hour", 3600))
+        self.assertEqual(self.rollups.choose_tier(start, start + 5 * 365 * 86400), ("day", 86400))
+        self.assertEqual(self.rollups.choose_tier(start, None, "7200"), ("hour", 7200))
+        with self.assertRaises(ValueError):
+            self.rollups.choose_tier(start, None, 90)
+
+        # 分钟级别已丢弃的时间段改由小时级别回答
+        self.rollups.add([event(10 * 86400)])
+        self.assertEqual(self.rollups.choose_tier(start, None, "minute"), ("hour", 3600))
+        self.assertEqual(self.rollups.choose_tier(start + 9 * 86400, None, "minute"), ("minute", 60))
+        self.assertEqual(sum(b["total"] for b in self.rollups.query(start, granularity=60)["buckets"]), 6)
+
+    def test_save_load_and_catch_up(self):
+        """测试保存后恢复，以及从存储补齐未保存的帧"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = EventStore(os.path.join(temp_dir, "output.json"))
+            events = make_events(300)
+            rollups = RollupAggregator()
+            for i in range(0, 300, 100):
+                store.append(events[i:i + 100])
+                rollups.add(events[i:i + 100])
+                if i == 100:
+                    rollups.save(os.path.join(temp_dir, "rollups.json"))
+
+            restored = RollupAggregator()
+            self.assertTrue(restored.load(os.path.join(temp_dir, "rollups.json")))
+            self.assertEqual(restored.frames, 2)
+            self.assertEqual(restored.catch_up(store), 1)
+            self.assertEqual(restored.query(granularity="minute")["buckets"],
+                             rollups.query(granularity="minute")["buckets"])
+
+    def test_encrypted_file(self):
+        """测试加密保存时文件中不包含应用名称，用同一密钥可以恢复"""
+        key = Fernet.generate_key()
+        self.rollups.add([event(0, app="SecretApp")])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "rollups.json")
+            self.rollups.save(path, key)
+            with open(path, "rb") as f:
+                self.assertNotIn(b"SecretApp", f.read())
+            self.assertFalse(RollupAggregator().load(path))
+            restored = RollupAggregator()
+            self.assertTrue(restored.load(path, key))
+            self.assertEqual(restored.query(granularity="minute", app="SecretApp")["buckets"][0]["total"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
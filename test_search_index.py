@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 搜索索引单元测试
+
+该模块包含对分词、倒排索引的建立、持久化和按段搜索的单元测试。
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+from event_store import EventStore
+from search_index import SearchIndex, tokenize, parse_query, search_events
+
+
+def make_event(ts, title, app="Preview"):
+    return {"type": "mouse_click", "timestamp": ts,
+            "window": {"window_id": "1", "app_name": app, "window_title": title}}
+
+
+FRAMES = [
+    [make_event(100.0, "Invoice-2031.pdf"), make_event(110.0, "Google - Safari", "Safari")],
+    [make_event(200.0, "Team Channel - Slack", "Slack")],
+    [make_event(300.0, "invoices 2032.xlsx", "Excel"), make_event(310.0, "报销发票 - 邮件", "Mail")],
+]
+
+
+class TestTokenize(unittest.TestCase):
+    """分词的测试用例"""
+
+    def test_tokenize(self):
+        """测试英文按词切分，中文按二元组切分"""
+        self.assertEqual(tokenize("Invoice-2031.pdf — Preview"), ["invoice", "2031", "pdf", "preview"])
+        self.assertEqual(tokenize("报销发票 - 邮件"), ["报销", "销发", "发票", "邮件"])
+        self.assertEqual(tokenize("Q3报告"), ["q3", "报告"])
+        self.assertEqual(tokenize(None), [])
+        self.assertEqual(parse_query("*Invoice* 发票"), ["*invoice*", "发票"])
+
+
+class TestSearchIndex(unittest.TestCase):
+    """倒排索引的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = EventStore(os.path.join(self.temp_dir.name, "output.json"))
+        self.index_path = os.path.join(self.temp_dir.name, "output.json.search")
+        self.index = SearchIndex(self.index_path)
+        for frame in FRAMES:
+            self.store.append(frame)
+            self.index.add(frame)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.temp_dir.cleanup()
+
+    def test_segments(self):
+        """测试按词、通配符、应用和时间范围查找段"""
+        self.assertEqual(self.index.segments("invoice"), [0])
+        self.assertEqual(self.index.segments("*invoice*"), [0, 2])
+        self.assertEqual(self.index.segments("*invoice*", app="excel"), [2])
+        self.assertEqual(self.index.segments("*invoice*", start=250.0), [2])
+        self.assertEqual(self.index.segments("*invoice*", end=250.0), [0])
+        self.assertEqual(self.index.segments("发票"), [2])
+        self.assertEqual(self.index.segments("missing"), [])
+        self.assertEqual(self.index.time_range(2), (300.0, 310.0))
+        with self.assertRaises(ValueError):
+            self.index.segments("  ")
+
+    def test_search_reads_only_matching_segments(self):
+        """测试搜索只读取匹配的段，并逐个校验事件"""
+        with mock.patch.object(self.store, "read_frame", wraps=self.store.read_frame) as read_frame:
+            results = list(search_events(self.store, self.index, "*invoice*"))
+        self.assertEqual([frame for frame, *_ in (c.args for c in read_frame.call_args_list)], [0, 2])
+        self.assertEqual([position for position, _ in results], [(0, 0), (2, 0)])
+
+        # 从游标位置继续
+        results = list(search_events(self.store, self.index, "*invoice*", position=(0, 1)))
+        self.assertEqual([position for position, _ in results], [(2, 0)])
+
+    def test_load_and_catch_up(self):
+        """测试重启后读入索引文件，截掉不完整的记录并从存储补齐"""
+        with open(self.index_path, "ab") as f:
+            f.write(b'{"segment": 3, "sta')
+        index = SearchIndex(self.index_path)
+        self.assertEqual(index.load(), 3)
+        self.assertEqual(index.segments("slack"), [1])
+
+        self.store.append([make_event(400.0, "Invoice-2033.pdf")])
+        self.assertEqual(index.catch_up(self.store), 1)
+        self.assertEqual(index.segments("*invoice*"), [0, 2, 3])
+
+        reloaded = SearchIndex(self.index_path)
+        self.assertEqual(reloaded.load(), 4)
+
+    def test_failed_append_keeps_frame_numbers(self):
+        """测试索引文件追加失败时段号仍与存储的帧号一致，重启后补齐空缺"""
+        frame = [make_event(400.0, "Invoice-2033.pdf")]
+        self.store.append(frame)
+        with mock.patch("builtins.open", side_effect=OSError("磁盘已满")):
+            with self.assertRaises(OSError):
+                self.index.add(frame, 3)
+        self.assertEqual(self.index.segments("*invoice*"), [0, 2, 3])
+
+        self.store.append([make_event(500.0, "Invoice-2034.pdf")])
+        self.assertEqual(self.index.add(self.store.read_frame(4), 4), 4)
+        self.assertEqual(self.index.segments("*invoice*"), [0, 2, 3, 4])
+
+        reloaded = SearchIndex(self.index_path)
+        self.assertEqual(reloaded.load(), 4)
+        self.assertEqual(reloaded.catch_up(self.store), 1)
+        self.assertEqual(reloaded.segments("*invoice*"), [0, 2, 3, 4])
+        self.assertEqual(reloaded.time_range(3), (400.0, 400.0))
+
+    def test_encrypted_terms(self):
+        """测试加密时索引文件不包含标题原文，且不支持通配符"""
+        path = os.path.join(self.temp_dir.name, "encrypted.search")
+        index = SearchIndex(path, encryption_key=b"secret")
+        index.add(FRAMES[0])
+        with open(path, "rb") as f:
+            self.assertNotIn(b"invoice", f.read())
+        self.assertEqual(index.segments("Invoice"), [0])
+        with self.assertRaises(ValueError):
+            index.segments("*invoice*")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 会话切分单元测试
+
+该模块包含对活动会话、应用专注区间和连续输入切分的单元测试。
+"""
+
+import os
+import datetime
+import tempfile
+import unittest
+from event_store import EventStore, parse_timestamp
+from sessionizer import (
+    Sessionizer, summarize, rebuild,
+    ACTIVITY_SESSION, APP_FOCUS, TYPING_BURST, POINTING_BURST
+)
+from keystrokes import KeystrokeAggregator
+from test_event_transport import make_events
+
+START = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def event(seconds, event_type="mouse_move", app="Safari"):
+    """生成距START指定秒数的事件"""
+    return {
+        "type": event_type,
+        "timestamp": (START + datetime.timedelta(seconds=seconds)).isoformat(),
+        "window": {"app_name": app, "window_title": app}
+    }
+
+
+def by_type(records, kind):
+    return [r for r in records if r["type"] == kind]
+
+
+class TestSessionizer(unittest.TestCase):
+    """会话切分的测试用例"""
+
+    def test_idle_gap_splits_sessions(self):
+        """测试空闲间隔切分活动会话，专注区间在空闲时结束"""
+        sessionizer = Sessionizer(idle_gap=60)
+        records = sessionizer.feed([event(0), event(10), event(30), event(200), event(210)])
+        records += sessionizer.close()
+
+        sessions = by_type(records, ACTIVITY_SESSION)
+        self.assertEqual([(s["duration"], s["event_count"]) for s in sessions], [(30.0, 3), (10.0, 2)])
+        focus = by_type(records, APP_FOCUS)
+        self.assertEqual([f["duration"] for f in focus], [30.0, 10.0])
+        self.assertEqual(parse_timestamp(sessions[0]["start"]), START.timestamp())
+
+    def test_app_focus_intervals(self):
+        """测试切换应用时专注区间在切换时刻结束"""
+        sessionizer = Sessionizer()
+        records = sessionizer.feed([event(0, app="Safari"), event(5, app="Safari"),
+                                    event(8, app="VSCode"), event(20, app="VSCode"), event(21, app="Slack")])
+        focus = by_type(records, APP_FOCUS)
+        self.assertEqual([(f["window"]["app_name"], f["duration"]) for f in focus],
+                         [("Safari", 8.0), ("VSCode", 13.0)])
+        # 当前应用的区间尚未结束
+        open_focus = by_type(sessionizer.snapshot(), APP_FOCUS)
+        self.assertEqual(open_focus[0]["window"]["app_name"], "Slack")
+        self.assertTrue(open_focus[0]["open"])
+
+    def test_bursts(self):
+        """测试连续打字和鼠标操作的切分，过短的不输出"""
+        sessionizer = Sessionizer(burst_gap=1.0, min_burst_events=3)
+        events = [event(i * 0.2, "key_press") for i in range(5)]       # 0.0-0.8秒
+        events += [event(3 + i * 0.5, "mouse_move") for i in range(4)]  # 3.0-4.5秒
+        events += [event(10, "key_press"), event(10.5, "key_press")]    # 只有2个事件
+        events += [event(20, "mouse_click")]
+        records = sessionizer.feed(events) + sessionizer.close()
+
+        typing = by_type(records, TYPING_BURST)
+        pointing = by_type(records, POINTING_BURST)
+        self.assertEqual([(t["duration"], t["event_count"]) for t in typing], [(0.8, 5)])
+        self.assertEqual([(p["duration"], p["event_count"]) for p in pointing], [(1.5, 4)])
+
+    def test_typing_summary(self):
+        """测试按键汇总事件按实际打字的区间计入连续打字、活动会话和专注区间"""
+        aggregator = KeystrokeAggregator("anonymous", interval=60)
+        window = {"app_name": "Terminal", "window_title": "bash"}
+        for i in range(100):
+            aggregator.add("key_press", {"key_name": "a"}, window, START.timestamp() + 5 + i * 0.1)
+        summaries = aggregator.flush(START.timestamp() + 60)
+
+        sessionizer = Sessionizer(burst_gap=1.0)
+        records = sessionizer.feed([event(0, app="Terminal")] + summaries) + sessionizer.close()
+        typing = by_type(records, TYPING_BURST)
+        self.assertEqual([(t["duration"], t["event_count"]) for t in typing], [(9.9, 100)])
+        self.assertEqual(parse_timestamp(typing[0]["start"]), START.timestamp() + 5)
+        # 不延伸到汇总窗口的结束时间
+        self.assertEqual([s["duration"] for s in by_type(records, ACTIVITY_SESSION)], [14.9])
+        self.assertEqual([f["duration"] for f in by_type(records, APP_FOCUS)], [14.9])
+
+    def test_records_ordered_by_end(self):
+        """测试输出按结束时间递增，并且在进入空闲后结束所有区间"""
+        sessionizer = Sessionizer(idle_gap=30, burst_gap=1.0, min_burst_events=1)
+        records = sessionizer.feed(make_events(2000))
+        records += sessionizer.feed([], now=START.timestamp() + 3600)
+        ends = [parse_timestamp(r["timestamp"]) for r in records]
+        self.assertEqual(ends, sorted(ends))
+        self.assertEqual(len(by_type(records, ACTIVITY_SESSION)), 1)
+        self.assertEqual(sessionizer.snapshot(), [])
+        self.assertEqual(sessionizer.close(), [])
+
+    def test_rebuild_and_query(self):
+        """测试从原始事件重建派生记录，并按类型和应用查询"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            store = EventStore(os.path.join(temp_dir, "output.json"))
+            derived = EventStore(os.path.join(temp_dir, "output.json.derived"))
+            events = [event(i, app="VSCode" if i < 50 else "Safari") for i in range(100)]
+            for i in range(0, 100, 10):
+                store.append(events[i:i + 10])
+
+            count = rebuild(store, derived, idle_gap=60)
+            self.assertEqual(count, len(list(derived.iter_events())))
+            # 重建会替换已有的派生记录
+            self.assertEqual(rebuild(store, derived, idle_gap=60), count)
+
+            result = derived.query(types=[APP_FOCUS], app="vscode")
+            self.assertEqual([r["duration"] for r in result["events"]], [50.0])
+            summary = summarize(derived.iter_events())
+            self.assertEqual(summary["sessions"], 1)
+            self.assertEqual(summary["activity_seconds"], 99.0)
+            self.assertEqual(summary["app_seconds"], {"VSCode": 50.0, "Safari": 49.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 写入进程单元测试
+
+该模块包含对子进程写入和崩溃恢复的单元测试。
+"""
+
+import os
+import signal
+import tempfile
+import unittest
+from cryptography.fernet import Fernet
+from event_store import EventStore
+from event_monitor import EventMonitor
+from store_writer import WriterProcess
+from test_event_transport import make_events
+
+
+class TestWriterProcess(unittest.TestCase):
+    """写入进程的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "output.json")
+        self.key = Fernet.generate_key()
+        self.writer = WriterProcess(self.path, self.key, compress=True)
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        self.writer.close()
+        self.temp_dir.cleanup()
+
+    def test_append_in_subprocess(self):
+        """测试由子进程编码、压缩、加密并写入"""
+        events = make_events(200)
+        self.writer.append(events[:100])
+        self.writer.append(events[100:])
+        self.assertNotEqual(self.writer.pid, os.getpid())
+
+        store = EventStore(self.path, self.key)
+        self.assertEqual(store.frame_count(), 2)
+        self.assertEqual(list(store.iter_events()), events)
+
+    def test_restart_after_crash(self):
+        """测试写入进程崩溃后重启，在途批次不丢失也不重复"""
+        events = make_events(30)
+        self.writer.append(events[:10])
+
+        # 确认前崩溃：批次尚未写入，重启后重发
+        os.kill(self.writer.pid, signal.SIGKILL)
+        self.writer.append(events[10:20])
+
+        # 写入后、确认前崩溃：重启后发现帧已存在，不再重发
+        EventStore(self.path, self.key).append(events[20:])
+        os.kill(self.writer.pid, signal.SIGKILL)
+        self.assertEqual(self.writer.append(events[20:]), 0)
+
+        self.writer.append(events[:1])
+        store = EventStore(self.path, self.key)
+        self.assertEqual([e["seq"] for e in store.iter_events()], [e["seq"] for e in events + events[:1]])
+
+    def test_monitor_writer_process(self):
+        """测试监控器通过写入进程刷新"""
+        monitor = EventMonitor(test_mode=True, output_path=self.path, compression=True, writer_process=True)
+        monitor.event_buffer = make_events(50)
+        monitor._flush_buffer()
+        monitor.derived.drain(5)
+        monitor.writer.close()
+        self.assertEqual(monitor.event_buffer, [])
+        self.assertEqual(len(list(monitor.store.iter_events())), 50)
+        self.assertTrue(monitor.get_status()["writer_process"])
+
+
+if __name__ == '__main__':
+    unittest.main()
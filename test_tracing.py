@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 追踪单元测试
+
+该模块包含对分阶段追踪和栈采样分析的单元测试。
+"""
+
+import time
+import threading
+import unittest
+from tracing import Tracer, StackSampler, STAGE_DURATION
+
+
+def busy_loop_for_profiler(stop):
+    """供栈采样分析器捕获的忙循环"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestTracing(unittest.TestCase):
+    """追踪功能的测试用例"""
+
+    def test_disabled_tracer_returns_null_span(self):
+        """测试禁用时不记录耗时"""
+        tracer = Tracer()
+        self.assertFalse(tracer.enabled)
+        self.assertIs(tracer.span("a"), tracer.span("b"))
+        before = STAGE_DURATION.values().get(("disabled_stage",))
+        with tracer.span("disabled_stage"):
+            pass
+        self.assertEqual(STAGE_DURATION.values().get(("disabled_stage",)), before)
+
+    def test_enabled_tracer_records_stages(self):
+        """测试启用时记录各阶段耗时"""
+        tracer = Tracer(sample_rate=1.0)
+        for _ in range(3):
+            with tracer.span("test_stage"):
+                time.sleep(0.001)
+        stats = tracer.summary()["test_stage"]
+        self.assertGreaterEqual(stats["count"], 3)
+        self.assertGreater(stats["mean_ms"], 0.5)
+        self.assertGreaterEqual(stats["max_ms"], stats["mean_ms"])
+
+    def test_stack_sampler_sees_other_threads(self):
+        """测试栈采样分析器捕获其他线程的调用栈"""
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop_for_profiler, args=(stop,), daemon=True)
+        worker.start()
+        try:
+            result = StackSampler(interval=0.002).run(0.2)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(result["samples"], 10)
+        frames = [item["frame"] for item in result["top_total"]]
+        self.assertTrue(any("busy_loop_for_profiler" in frame for frame in frames))
+        # 采样线程自身不计入结果
+        self.assertFalse(any("tracing.py:run:" in item["stack"] for item in result["stacks"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
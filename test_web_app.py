@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - Web应用单元测试
+
+该模块包含对web_app中API路由和事件推送的单元测试。
+"""
+
+import os
+import json
+import unittest
+import tempfile
+import web_app
+from event_monitor import EventMonitor
+from event_transport import decode_batch
+
+
+class TestWebApp(unittest.TestCase):
+    """web_app的测试用例"""
+
+    def setUp(self):
+        """测试前的准备工作"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "output.json")
+        self.monitor = EventMonitor(test_mode=True, output_path=self.output_path, sample_interval=0)
+        web_app.registry.attach(web_app.DEFAULT_MONITOR, self.monitor)
+        self.client = web_app.app.test_client()
+
+    def tearDown(self):
+        """测试后的清理工作"""
+        web_app.registry.attach(web_app.DEFAULT_MONITOR, None)
+        # 等待后台线程更新完派生数据，再删除其中的文件
+        self.monitor.derived.drain(5)
+        self.temp_dir.cleanup()
+
+    def _record(self, count):
+        for i in range(count):
+            self.monitor._add_event("mouse_move", {"position": {"x": i, "y": i}})
+
+    def test_query_pagination(self):
+        """测试历史查询接口的分页"""
+        self._record(5)
+        self.monitor._flush_buffer()
+
+        first = self.client.get('/api/query?types=mouse_move&limit=3').get_json()
+        self.assertTrue(first["success"])
+        self.assertEqual([e["seq"] for e in first["events"]], [1, 2, 3])
+
+        second = self.client.get(f'/api/query?limit=3&cursor={first["next_cursor"]}').get_json()
+        self.assertEqual([e["seq"] for e in second["events"]], [4, 5])
+        self.assertIsNone(second["next_cursor"])
+
+        self.assertEqual(self.client.get('/api/query?cursor=bad').status_code, 400)
+
+    def test_sessions(self):
+        """测试派生记录查询接口返回已写入和未结束的会话"""
+        self._record(5)
+        self.monitor._flush_buffer()
+
+        result = self.client.get('/api/sessions?types=activity_session').get_json()
+        self.assertTrue(result["success"])
+        self.assertEqual(result["records"], [])
+        self.assertEqual(len(result["pending"]), 1)
+        self.assertTrue(result["pending"][0]["open"])
+
+        self.monitor._save_derived(self.monitor.sessionizer.close())
+        result = self.client.get('/api/sessions?types=activity_session&summary=1').get_json()
+        self.assertEqual([r["event_count"] for r in result["records"]], [5])
+        self.assertEqual(result["pending"], [])
+        self.assertEqual(result["summary"]["sessions"], 1)
+
+    def test_rollups(self):
+        """测试时间汇总接口"""
+        self._record(5)
+        self.monitor._flush_buffer()
+
+        result = self.client.get('/api/rollups?granularity=minute').get_json()
+        self.assertTrue(result["success"])
+        self.assertEqual(result["tier"], "minute")
+        self.assertEqual(sum(b["total"] for b in result["buckets"]), 5)
+        self.assertEqual(self.client.get('/api/rollups?granularity=90').status_code, 400)
+
+    def test_search(self):
+        """测试按窗口标题搜索只返回匹配的事件和段"""
+        self._record(3)
+        self.monitor._flush_buffer()
+        for title in ("Invoice-2031.pdf", "Invoice-2032.pdf"):
+            self.monitor._add_event("mouse_click", {"position": {"x": 0, "y": 0}, "button": "left",
+                                                    "window": {"app_name": "Preview", "window_title": title}})
+        self.monitor._flush_buffer()
+
+        result = self.client.get('/api/search?q=*invoice*&limit=1').get_json()
+        self.assertTrue(result["success"])
+        self.assertEqual([s["segment"] for s in result["segments"]], [1])
+        self.assertEqual([e["window"]["window_title"] for e in result["events"]], ["Invoice-2031.pdf"])
+        second = self.client.get(f'/api/search?q=*invoice*&cursor={result["next_cursor"]}').get_json()
+        self.assertEqual([e["window"]["window_title"] for e in second["events"]], ["Invoice-2032.pdf"])
+        self.assertIsNone(second["next_cursor"])
+
+        self.assertEqual(self.client.get('/api/search').status_code, 400)
+        self.assertEqual(self.client.get('/api/search?q=x&cursor=bad').status_code, 400)
+
+    def _archive(self):
+        """在没有运行监控器的条目下留下一段加密的历史记录"""
+        output_path = os.path.join(self.temp_dir.name, "archive.json")
+        monitor = EventMonitor(test_mode=True, output_path=output_path, sample_interval=0, encryption=True)
+        for i in range(3):
+            monitor._add_event("mouse_move", {"position": {"x": i, "y": i}})
+        monitor._add_event("mouse_click", {"position": {"x": 0, "y": 0}, "button": "left",
+                                           "window": {"app_name": "Preview", "window_title": "Invoice-2031.pdf"}})
+        monitor._flush_buffer()
+        monitor.derived.drain(5)
+        monitor._close_outputs()
+        entry = web_app.registry.entry("archive", create=True)
+        entry.config.update(output_path=output_path, encryption=True)
+        self.addCleanup(self.client.delete, '/api/monitors/archive')
+        return monitor
+
+    def test_encrypted_history_without_monitor(self):
+        """测试监控器未运行时用派生的密钥读取加密的历史记录"""
+        self._archive()
+        result = self.client.get('/api/monitors/archive/query').get_json()
+        self.assertTrue(result["success"])
+        self.assertEqual(len(result["events"]), 4)
+
+        response = self.client.get('/api/monitors/archive/download/events.jsonl')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 4)
+
+        result = self.client.get('/api/monitors/archive/sessions?types=activity_session').get_json()
+        self.assertEqual([r["event_count"] for r in result["records"]], [4])
+
+        result = self.client.get('/api/monitors/archive/rollups?granularity=minute').get_json()
+        self.assertEqual(sum(b["total"] for b in result["buckets"]), 4)
+
+        result = self.client.get('/api/monitors/archive/heatmap').get_json()
+        self.assertIn({"type": "mouse_click", "app": "Preview"}, result["groups"])
+
+        # 加密的索引只保存词的摘要，不支持通配符
+        result = self.client.get('/api/monitors/archive/search?q=invoice').get_json()
+        self.assertEqual([e["window"]["window_title"] for e in result["events"]], ["Invoice-2031.pdf"])
+
+    def test_config_patch(self):
+        """测试运行中修改配置接口"""
+        self._record(3)
+        response = self.client.patch('/api/config', json={"flush_interval": 30, "keystroke_mode": "anonymous"})
+        result = response.get_json()
+        self.assertTrue(result["success"])
+        self.assertEqual(result["config"]["flush_interval"], 30.0)
+        self.assertEqual(result["config"]["keystroke_mode"], "anonymous")
+        self.assertEqual(len(self.monitor.event_buffer), 3)
+
+        self.assertEqual(self.client.patch('/api/config', json={"buffer_size": 1}).status_code, 400)
+        self.assertEqual(self.client.patch('/api/config', json={"encryption": True}).status_code, 400)
+        self.assertEqual(self.client.patch('/api/config', json=[]).status_code, 400)
+        for changes in ({"flush_interval": "nan"}, {"sampling_rate": 0.5, "memory_budget_mb": "inf"}):
+            self.assertEqual(self.client.patch('/api/config', json=changes).status_code, 400)
+        self.assertEqual(self.monitor.sampling_rate, 1.0)
+        self.assertEqual(self.client.post('/api/update_interval', json={"interval": "nan"}).status_code, 400)
+        response = self.client.post('/api/monitors/other/start', json={"flush_interval": "inf"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_named_monitors(self):
+        """测试按名称启动、查询、推送和移除监控器"""
+        output_path = os.path.join(self.temp_dir.name, "work.json")
+        result = self.client.post('/api/monitors/work/start',
+                                  json={"output_path": output_path, "flush_interval": 60}).get_json()
+        self.assertTrue(result["success"])
+        try:
+            work = web_app.registry.get("work")
+            self.assertIsNone(work.flush_thread)
+            self.assertEqual(self.client.get('/api/monitors/work/status').get_json()["output_path"], output_path)
+            names = [m["name"] for m in self.client.get('/api/monitors').get_json()["monitors"]]
+            self.assertIn("work", names)
+
+            # 输出路径不能与其他运行中的监控器相同
+            response = self.client.post('/api/monitors/copy/start', json={"output_path": output_path})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.client.get('/api/monitors/missing/status').status_code, 404)
+            self.assertEqual(self.client.get('/api/monitors/bad.name/status').status_code, 400)
+
+            # 客户端只收到订阅的监控器的事件
+            client = web_app.socketio.test_client(web_app.app)
+            self.assertTrue(client.emit('set_transport', {"mode": "json", "monitor": "work"}, callback=True)["success"])
+            self._record(2)
+            web_app.emit_events(self.monitor.get_events_since(0))
+            self.assertEqual(client.get_received(), [])
+            web_app.emit_events(self.monitor.get_events_since(0), "work")
+            self.assertEqual([r["name"] for r in client.get_received()], ["events_update"])
+            client.disconnect()
+
+            self.assertTrue(self.client.post('/api/monitors/work/stop').get_json()["success"])
+            self.assertFalse(work.running)
+        finally:
+            self.client.delete('/api/monitors/work')
+            self.client.delete('/api/monitors/copy')
+        self.assertIsNone(web_app.registry.get("work"))
+        self.assertEqual(self.client.get('/api/monitors/work/query').status_code, 404)
+
+    def test_download_streams_export(self):
+        """测试下载接口按文件名格式流式导出"""
+        self._record(3)
+
+        response = self.client.get('/api/download/events.jsonl?types=mouse_move')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertIn("attachment", response.headers["Content-Disposition"])
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)["seq"] for line in lines], [1, 2, 3])
+
+        self.assertEqual(self.client.get('/api/download/events.txt').status_code, 400)
+        self.assertEqual(self.client.get('/api/download/events.csv?from=bad').status_code, 400)
+
+    def test_save_writes_export(self):
+        """测试保存接口写出导出文件"""
+        self._record(2)
+        cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        try:
+            result = self.client.post('/api/save', json={"filename": "saved.csv"}).get_json()
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["event_count"], 2)
+        with open(os.path.join(self.temp_dir.name, "saved.csv"), 'r', encoding='utf-8') as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+
+    def test_metrics_endpoint(self):
+        """测试指标接口"""
+        self._record(2)
+        self.monitor._flush_buffer()
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        text = response.get_data(as_text=True)
+        self.assertIn('monitor_events_sampled_total{type="mouse_move"}', text)
+        self.assertIn("monitor_flush_duration_seconds_count", text)
+        self.assertIn("store_bytes_written_total", text)
+        self.assertIn("web_connected_clients", text)
+
+    def test_trace_and_profile(self):
+        """测试追踪采样率设置和栈采样接口"""
+        response = self.client.post('/api/trace', json={"sample_rate": 1.0})
+        self.assertEqual(response.get_json()["sample_rate"], 1.0)
+        try:
+            self._record(1)
+            stages = self.client.get('/api/trace').get_json()["stages"]
+            self.assertIn("window_lookup", stages)
+        finally:
+            self.client.post('/api/trace', json={"sample_rate": 0.0})
+        self.assertEqual(self.client.post('/api/trace', json={"sample_rate": 2}).status_code, 400)
+
+        result = self.client.post('/api/profile', json={"seconds": 0.1}).get_json()
+        self.assertTrue(result["success"])
+        self.assertGreater(result["samples"], 0)
+        self.assertEqual(self.client.post('/api/profile', json={"seconds": 0}).status_code, 400)
+
+    def test_transport_modes(self):
+        """测试按传输模式推送事件"""
+        json_client = web_app.socketio.test_client(web_app.app)
+        binary_client = web_app.socketio.test_client(web_app.app)
+        result = binary_client.emit('set_transport', {"mode": "binary_zlib"}, callback=True)
+        self.assertTrue(result["success"])
+
+        self._record(3)
+        web_app.emit_events(self.monitor.get_events_since(0))
+
+        json_received = json_client.get_received()
+        self.assertEqual([r["name"] for r in json_received], ["events_update"])
+        self.assertEqual(len(json_received[0]["args"][0]["events"]), 3)
+
+        binary_received = binary_client.get_received()
+        self.assertEqual([r["name"] for r in binary_received], ["events_batch"])
+        events = decode_batch(binary_received[0]["args"][0])
+        self.assertEqual([e["seq"] for e in events], [1, 2, 3])
+
+        json_client.disconnect()
+        binary_client.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+MacOS用户行为实时记录工具 - 热路径追踪模块
+
+该模块提供两种诊断手段：
+1. 按采样率记录的分阶段耗时（窗口查询、采样、序列化、加密、写盘等），
+   结果写入指标注册表，禁用时每个阶段只多一次属性判断；
+2. 限时的栈采样分析器，周期性采集进程内所有线程的调用栈，
+   用于在运行中的进程上定位耗时的函数。
+"""
+
+import os
+import sys
+import time
+import random
+import threading
+import logging
+from collections import Counter as CounterDict
+from typing import Dict, List, Any, Optional
+from metrics import REGISTRY
+
+logger = logging.getLogger("tracing")
+
+# 各阶段耗时直方图分桶（秒），比默认分桶更细
+STAGE_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+STAGE_DURATION = REGISTRY.histogram("trace_stage_seconds", "采样记录的各阶段耗时（秒）",
+                                    ("stage",), buckets=STAGE_BUCKETS)
+
+# 栈采样分析的限制
+MAX_PROFILE_SECONDS = 60.0
+MIN_PROFILE_INTERVAL = 0.001
+
+
+class _NullSpan:
+    """未采样时使用的空操作span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """记录一个阶段的耗时"""
+
+    __slots__ = ("labels", "start", "tracer")
+
+    def __init__(self, tracer: "Tracer", stage: str):
+        self.tracer = tracer
+        self.labels = (stage,)
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        STAGE_DURATION.observe(elapsed, labels=self.labels)
+        if elapsed > self.tracer.max_seen.get(self.labels[0], 0.0):
+            self.tracer.max_seen[self.labels[0]] = elapsed
+        return False
+
+
+class Tracer:
+    """按采样率记录分阶段耗时"""
+
+    def __init__(self, sample_rate: float = 0.0):
+        """
+        初始化追踪器
+
+        Args:
+            sample_rate: 采样率 (0.0-1.0)，为0时禁用
+        """
+        self.sample_rate = 0.0
+        self.max_seen: Dict[str, float] = {}
+        self.set_sample_rate(sample_rate)
+
+    def set_sample_rate(self, sample_rate: float):
+        """设置采样率，为0时禁用"""
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0.0
+
+    def span(self, stage: str):
+        """
+        创建一个阶段span，用于with语句
+
+        未启用或未被采样时返回共享的空操作对象
+        """
+        if not self.sample_rate or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return _NULL_SPAN
+        return _Span(self, stage)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """返回各阶段的耗时统计（毫秒）"""
+        result = {}
+        for (stage,), (counts, total, count) in STAGE_DURATION.values().items():
+            if not count:
+                continue
+            result[stage] = {
+                "count": count,
+                "total_ms": total * 1000,
+                "mean_ms": total / count * 1000,
+                "p50_ms": _bucket_quantile(counts, count, 0.50) * 1000,
+                "p99_ms": _bucket_quantile(counts, count, 0.99) * 1000,
+                "max_ms": self.max_seen.get(stage, 0.0) * 1000
+            }
+        return result
+
+
+def _bucket_quantile(counts: List[int], count: int, q: float) -> float:
+    """根据直方图分桶估计分位数（取所在桶的上界）"""
+    target = q * count
+    cumulative = 0
+    for bound, c in zip(STAGE_BUCKETS, counts):
+        cumulative += c
+        if cumulative >= target:
+            return bound
+    return STAGE_BUCKETS[-1]
+
+
+# 进程内全局追踪器
+TRACER = Tracer()
+
+
+class StackSampler:
+    """限时的栈采样分析器，统计进程内所有线程的调用栈"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        """
+        初始化栈采样分析器
+
+        Args:
+            interval: 采样间隔（秒）
+            max_depth: 每个调用栈保留的最大深度
+        """
+        self.interval = max(MIN_PROFILE_INTERVAL, float(interval))
+        self.max_depth = max_depth
+        self.stacks: CounterDict = CounterDict()
+        self.self_counts: CounterDict = CounterDict()
+        self.total_counts: CounterDict = CounterDict()
+        self.samples = 0
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+    def sample_once(self, exclude_thread: Optional[int] = None):
+        """采集一次所有线程的调用栈"""
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude_thread:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(self._frame_name(frame))
+                frame = frame.f_back
+            if not names:
+                continue
+            names.reverse()
+            self.stacks[";".join(names)] += 1
+            self.self_counts[names[-1]] += 1
+            for name in set(names):
+                self.total_counts[name] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> Dict[str, Any]:
+        """
+        在当前线程采样指定时长
+
+        Args:
+            seconds: 采样时长（秒），最长MAX_PROFILE_SECONDS
+
+        Returns:
+            采样结果
+        """
+        seconds = max(0.0, min(float(seconds), MAX_PROFILE_SECONDS))
+        me = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + seconds
+        while True:
+            self.sample_once(exclude_thread=me)
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(self.interval, deadline - now))
+        return self.result(time.perf_counter() - start)
+
+    def result(self, duration: float, top: int = 30) -> Dict[str, Any]:
+        """整理采样结果，stacks为折叠格式，可直接用于生成火焰图"""
+        return {
+            "duration": duration,
+            "interval": self.interval,
+            "samples": self.samples,
+            "top_self": [{"frame": name, "samples": count}
+                         for name, count in self.self_counts.most_common(top)],
+            "top_total": [{"frame": name, "samples": count}
+                          for name, count in self.total_counts.most_common(top)],
+            "stacks": [{"stack": stack, "samples": count}
+                       for stack, count in self.stacks.most_common(top * 4)]
+        }
+
+
+def profile_process(seconds: float, interval: float = 0.005) -> Dict[str, Any]:
+    """对当前进程进行限时栈采样"""
+    logger.info(f"开始栈采样分析，时长: {seconds}秒，间隔: {interval}秒")
+    return StackSampler(interval=interval).run(seconds)
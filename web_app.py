@@ -9,27 +9,33 @@ MacOS用户行为实时记录工具 - Web应用程序
 """
 
 import os
-import json
 import time
 import uuid
 import logging
 import argparse
 import datetime
 import secrets
-from threading import Lock
-from flask import Flask, render_template, request, jsonify, send_file, session
-from flask_socketio import SocketIO
-from event_monitor import EventMonitor
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('web_app.log', encoding='utf-8')
-    ]
-)
+import itertools
+import functools
+from threading import Thread
+from flask import Flask, Response, render_template, request, jsonify, session, abort, make_response
+from flask_socketio import SocketIO, join_room, leave_room
+from event_monitor import validate_config, derive_encryption_key, RECONFIGURABLE_OPTIONS
+from monitor_registry import MonitorRegistry, DEFAULT_MONITOR, DEFAULT_FLUSH_WORKERS
+from event_store import EventStore, parse_timestamp, encode_cursor, decode_cursor, MAX_QUERY_LIMIT
+from sessionizer import DERIVED_SUFFIX, summarize
+from rollups import RollupAggregator, ROLLUP_SUFFIX
+from search_index import SearchIndex, SEARCH_SUFFIX, MAX_SEGMENTS, search_events
+from keystrokes import MODE_RAW
+from memory_governor import DEFAULT_BUDGET_MB
+from heatmap import HeatmapAggregator, HEATMAP_SUFFIX
+from event_transport import encode_batch, MAX_BATCH_SIZE
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from tracing import TRACER, StackSampler, MAX_PROFILE_SECONDS
+from log_setup import configure_logging
+from exporter import export_store, iter_export, format_from_filename, content_type as export_content_type
+
+# 日志处理器在main()中配置，导入本模块不会创建日志文件
 logger = logging.getLogger("web_app")
 
 # 创建Flask应用
@@ -44,10 +50,29 @@ app.config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(hours=5)
 socketio = SocketIO(app, cors_allowed_origins="*")  # 在生产环境中应限制来源
 
 # 全局变量
-monitor = None
-monitor_lock = Lock()
-latest_events = []
+latest_events = {}  # 监控器名称 -> 停止前最后获取的事件
 client_sessions = {}
+client_transports = {}
+client_monitors = {}  # 客户端订阅的监控器名称
+
+# 事件推送的传输模式，每种模式对应一个Socket.IO房间
+TRANSPORT_JSON = "json"
+TRANSPORT_BINARY = "binary"
+TRANSPORT_BINARY_ZLIB = "binary_zlib"
+TRANSPORT_MODES = (TRANSPORT_JSON, TRANSPORT_BINARY, TRANSPORT_BINARY_ZLIB)
+
+# 推送间隔（秒）
+PUSH_INTERVAL = 1.0
+
+# 查询派生数据前等待后台更新的最长时间（秒）
+DERIVED_WAIT_TIMEOUT = 5.0
+
+# Web层指标
+PUSH_LOOP_LAG = REGISTRY.histogram("web_push_loop_lag_seconds", "事件推送循环相对预期间隔的延迟（秒）")
+EVENTS_PUSHED = REGISTRY.counter("web_events_pushed_total", "推送到客户端的事件数", ("transport",))
+BYTES_PUSHED = REGISTRY.counter("web_bytes_pushed_total", "推送的二进制事件帧字节数", ("transport",))
+CONNECTED_CLIENTS = REGISTRY.gauge("web_connected_clients", "已连接的Socket.IO客户端数")
+CONNECTED_CLIENTS.set_function(lambda: len(client_sessions))
 
 # 默认配置
 default_config = {
@@ -57,9 +82,44 @@ default_config = {
     "filter_sensitive": True,
     "buffer_size": 1000,
     "flush_interval": 10.0,
-    "sampling_rate": 1.0
+    "sampling_rate": 1.0,
+    "sample_interval": None,
+    "keystroke_mode": MODE_RAW,
+    "keystroke_app_modes": {},
+    "memory_budget_mb": DEFAULT_BUDGET_MB
 }
 
+# 具名监控器的注册表，每个监控器有独立的锁，共享刷新线程池
+registry = MonitorRegistry(default_config)
+
+def get_entry(name, create=False):
+    """按名称获取注册表条目，名称无效时返回400，未创建的监控器返回404（默认监控器总是存在）"""
+    try:
+        entry = registry.entry(name, create=create or name == DEFAULT_MONITOR)
+    except ValueError as e:
+        abort(make_response(jsonify({"success": False, "error": str(e)}), 400))
+    if entry is None:
+        abort(make_response(jsonify({"success": False, "error": f"监控器不存在: {name}"}), 404))
+    return entry
+
+@functools.lru_cache(maxsize=1)
+def _host_key() -> bytes:
+    # 密钥派生较慢，由本机主机名派生的密钥在进程内不变
+    return derive_encryption_key()
+
+def stored_key(entry):
+    """监控器未初始化时读取已保存文件的密钥：配置启用加密时与监控器相同，由本机主机名派生"""
+    return _host_key() if entry.config.get("encryption") else None
+
+def stored_events(entry, suffix=""):
+    """监控器未初始化时按配置打开已保存的事件存储（或后缀对应的派生存储）"""
+    return EventStore(entry.config["output_path"] + suffix, stored_key(entry))
+
+def wait_derived(monitor):
+    """等待后台线程把已写入的帧更新到会话、汇总和搜索索引，查询结果包含最近一次刷新"""
+    if not monitor.derived.drain(DERIVED_WAIT_TIMEOUT):
+        logger.warning("派生数据更新未在超时前完成，查询结果可能不包含最近写入的事件")
+
 @app.route('/')
 def index():
     """渲染主页"""
@@ -69,141 +129,141 @@ def index():
     
     return render_template('index.html')
 
+@app.route('/api/monitors', methods=['GET'])
+def list_monitors():
+    """列出注册表中的监控器及其状态"""
+    monitors = []
+    for name in registry.names():
+        monitor = registry.get(name)
+        monitors.append({
+            "name": name,
+            "running": bool(monitor and monitor.running),
+            "event_count": monitor.event_count if monitor else 0,
+            "output_path": monitor.output_path if monitor else registry.entry(name).config["output_path"]
+        })
+    return jsonify({"success": True, "monitors": monitors})
+
+@app.route('/api/monitors/<name>', methods=['DELETE'])
+def remove_monitor(name):
+    """停止并移除监控器，默认监控器只停止"""
+    get_entry(name)
+    registry.remove(name)
+    latest_events.pop(name, None)
+    logger.info(f"已移除监控器: {name}")
+    return jsonify({"success": True, "name": name})
+
 @app.route('/api/status', methods=['GET'])
-def get_status():
+@app.route('/api/monitors/<name>/status', methods=['GET'])
+def get_status(name=DEFAULT_MONITOR):
     """获取监控器状态"""
-    global monitor
-    
-    with monitor_lock:
-        if monitor:
-            return jsonify(monitor.get_status())
-        else:
-            return jsonify({
-                "running": False,
-                "test_mode": default_config["test_mode"],
-                "event_count": 0,
-                "buffer_size": 0,
-                "output_path": default_config["output_path"],
-                "flush_interval": default_config["flush_interval"],
-                "filter_sensitive": default_config["filter_sensitive"],
-                "encryption": default_config["encryption"],
-                "sampling_rate": default_config["sampling_rate"]
-            })
+    entry = get_entry(name)
+    monitor = entry.monitor
+    if monitor:
+        return jsonify(monitor.get_status())
+    else:
+        config = entry.config
+        return jsonify({
+            "running": False,
+            "test_mode": config["test_mode"],
+            "event_count": 0,
+            "buffer_size": 0,
+            "output_path": config["output_path"],
+            "flush_interval": config["flush_interval"],
+            "filter_sensitive": config["filter_sensitive"],
+            "encryption": config["encryption"],
+            "sampling_rate": config["sampling_rate"],
+            "keystroke_mode": config["keystroke_mode"],
+            "keystroke_app_modes": config["keystroke_app_modes"],
+            "memory_budget_mb": config["memory_budget_mb"]
+        })
 
 @app.route('/api/start', methods=['POST'])
-def start_monitor():
-    """启动监控器"""
-    global monitor
+@app.route('/api/monitors/<name>/start', methods=['POST'])
+def start_monitor(name=DEFAULT_MONITOR):
+    """启动监控器，同名的监控器先停止"""
+    entry = get_entry(name, create=True)
     
     # 获取配置参数
     config = request.json or {}
     
     # 合并默认配置和用户配置
-    monitor_config = default_config.copy()
+    monitor_config = entry.config.copy()
     for key in monitor_config:
         if key in config:
             monitor_config[key] = config[key]
     
-    # 验证参数
+    # 验证参数，与运行中修改配置使用相同的规则
     try:
-        monitor_config["flush_interval"] = float(monitor_config["flush_interval"])
-        if monitor_config["flush_interval"] < 1.0:
-            return jsonify({"success": False, "error": "采样间隔必须至少为1.0秒"}), 400
-            
-        monitor_config["buffer_size"] = int(monitor_config["buffer_size"])
-        if monitor_config["buffer_size"] < 10:
-            return jsonify({"success": False, "error": "缓冲区大小必须至少为10"}), 400
-            
-        monitor_config["sampling_rate"] = float(monitor_config["sampling_rate"])
-        if monitor_config["sampling_rate"] < 0.01 or monitor_config["sampling_rate"] > 1.0:
-            return jsonify({"success": False, "error": "采样率必须在0.01到1.0之间"}), 400
-    except (ValueError, TypeError) as e:
+        monitor_config.update(validate_config(
+            {key: monitor_config[key] for key in RECONFIGURABLE_OPTIONS if key in monitor_config}
+        ))
+    except ValueError as e:
         return jsonify({"success": False, "error": f"参数验证失败: {str(e)}"}), 400
     
-    with monitor_lock:
-        # 如果监控器已经在运行，先停止它
-        if monitor and monitor.running:
-            monitor.stop()
-            logger.info("已停止现有监控器")
-        
-        try:
-            # 创建新的监控器
-            monitor = EventMonitor(
-                test_mode=monitor_config["test_mode"],
-                output_path=monitor_config["output_path"],
-                encryption=monitor_config["encryption"],
-                filter_sensitive=monitor_config["filter_sensitive"],
-                buffer_size=monitor_config["buffer_size"],
-                flush_interval=monitor_config["flush_interval"],
-                sampling_rate=monitor_config["sampling_rate"]
-            )
-            
-            # 启动监控器
-            success = monitor.start()
-            
-            if success:
-                # 启动事件推送线程
-                socketio.start_background_task(push_events)
-                logger.info(f"监控器已启动，配置: {monitor_config}")
-                return jsonify({
-                    "success": True, 
-                    "message": "监控器已启动",
-                    "config": monitor_config
-                })
-            else:
-                logger.error("启动监控器失败")
-                return jsonify({"success": False, "error": "启动监控器失败"}), 500
-        except Exception as e:
-            logger.error(f"创建或启动监控器时出错: {str(e)}")
-            return jsonify({"success": False, "error": f"启动失败: {str(e)}"}), 500
+    try:
+        registry.start(name, monitor_config)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"创建或启动监控器{name}时出错: {str(e)}")
+        return jsonify({"success": False, "error": f"启动失败: {str(e)}"}), 500
+    
+    # 启动该监控器的事件推送任务
+    socketio.start_background_task(push_events, name)
+    return jsonify({
+        "success": True, 
+        "message": "监控器已启动",
+        "name": name,
+        "config": monitor_config
+    })
 
 @app.route('/api/stop', methods=['POST'])
-def stop_monitor():
+@app.route('/api/monitors/<name>/stop', methods=['POST'])
+def stop_monitor(name=DEFAULT_MONITOR):
     """停止监控器"""
-    global monitor
-    
-    with monitor_lock:
-        if monitor and monitor.running:
-            try:
-                monitor.stop()
-                event_count = monitor.event_count
-                logger.info(f"监控器已停止，共记录{event_count}个事件")
-                return jsonify({
-                    "success": True, 
-                    "message": "监控器已停止", 
-                    "event_count": event_count
-                })
-            except Exception as e:
-                logger.error(f"停止监控器时出错: {str(e)}")
-                return jsonify({"success": False, "error": f"停止失败: {str(e)}"}), 500
-        else:
-            return jsonify({"success": False, "error": "监控器未运行"}), 400
+    get_entry(name)
+    try:
+        monitor = registry.stop(name)
+    except Exception as e:
+        logger.error(f"停止监控器{name}时出错: {str(e)}")
+        return jsonify({"success": False, "error": f"停止失败: {str(e)}"}), 500
+    if monitor is None:
+        return jsonify({"success": False, "error": "监控器未运行"}), 400
+    
+    event_count = monitor.event_count
+    logger.info(f"监控器{name}已停止，共记录{event_count}个事件")
+    return jsonify({
+        "success": True, 
+        "message": "监控器已停止", 
+        "event_count": event_count
+    })
 
 @app.route('/api/events', methods=['GET'])
-def get_events():
+@app.route('/api/monitors/<name>/events', methods=['GET'])
+def get_events(name=DEFAULT_MONITOR):
     """获取当前事件"""
-    global monitor, latest_events
+    monitor = get_entry(name).monitor
     
     # 获取请求的事件数量
     limit = request.args.get('limit', default=10, type=int)
     limit = max(1, min(limit, 100))  # 限制在1-100之间
     
-    with monitor_lock:
-        if monitor and monitor.running:
-            try:
-                events = monitor.get_events(limit=limit)
-                latest_events = events  # 更新最新事件
-                return jsonify({"success": True, "events": events})
-            except Exception as e:
-                logger.error(f"获取事件时出错: {str(e)}")
-                return jsonify({"success": False, "error": f"获取事件失败: {str(e)}"}), 500
-        else:
-            return jsonify({"success": True, "events": latest_events})
+    if monitor and monitor.running:
+        try:
+            events = monitor.get_events(limit=limit)
+            latest_events[name] = events  # 更新最新事件
+            return jsonify({"success": True, "events": events})
+        except Exception as e:
+            logger.error(f"获取事件时出错: {str(e)}")
+            return jsonify({"success": False, "error": f"获取事件失败: {str(e)}"}), 500
+    else:
+        return jsonify({"success": True, "events": latest_events.get(name, [])})
 
 @app.route('/api/save', methods=['POST'])
-def save_events():
+@app.route('/api/monitors/<name>/save', methods=['POST'])
+def save_events(name=DEFAULT_MONITOR):
     """保存事件数据到文件"""
-    global monitor
+    entry = get_entry(name)
     
     # 获取文件名参数
     data = request.json or {}
@@ -214,8 +274,10 @@ def save_events():
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
         filename = f"{timestamp}-monitor.json"
     
-    # 确保文件名有.json后缀
-    if not filename.endswith(".json"):
+    # 支持.json/.jsonl/.csv及其.gz压缩格式，其他扩展名补上.json后缀
+    try:
+        format_from_filename(filename)
+    except ValueError:
         filename += ".json"
     
     # 验证文件名安全性
@@ -225,97 +287,364 @@ def save_events():
     # 文件路径
     file_path = os.path.join(os.getcwd(), filename)
     
-    with monitor_lock:
-        if monitor:
-            try:
-                # 强制刷新缓冲区
-                monitor._flush_buffer()
-                
-                # 复制输出文件到指定文件名
-                try:
-                    with open(monitor.output_path, 'r', encoding='utf-8') as src:
-                        if monitor.encryption and monitor.encryption_key:
-                            from cryptography.fernet import Fernet
-                            fernet = Fernet(monitor.encryption_key)
-                            content = src.read()
-                            content = fernet.decrypt(content.encode()).decode('utf-8')
-                            data = json.loads(content)
-                        else:
-                            data = json.load(src)
-                    
-                    with open(file_path, 'w', encoding='utf-8') as dst:
-                        json.dump(data, dst, ensure_ascii=False, indent=2)
-                    
-                    logger.info(f"已保存事件数据到: {file_path}")
-                    return jsonify({
-                        "success": True, 
-                        "filename": filename, 
-                        "path": file_path,
-                        "event_count": len(data["events"])
-                    })
-                except Exception as e:
-                    logger.error(f"保存事件数据失败: {str(e)}")
-                    return jsonify({"success": False, "error": f"保存事件数据失败: {str(e)}"}), 500
-            except Exception as e:
-                logger.error(f"刷新缓冲区失败: {str(e)}")
-                return jsonify({"success": False, "error": f"刷新缓冲区失败: {str(e)}"}), 500
-        else:
+    with entry.lock:
+        monitor = entry.monitor
+        if not monitor:
             return jsonify({"success": False, "error": "监控器未初始化"}), 400
+        try:
+            # 强制刷新缓冲区
+            monitor._flush_buffer()
+        except Exception as e:
+            logger.error(f"刷新缓冲区失败: {str(e)}")
+            return jsonify({"success": False, "error": f"刷新缓冲区失败: {str(e)}"}), 500
+        store = monitor.store
+    
+    # 逐帧流式导出，内存占用与历史大小无关，导出期间不阻塞其他请求
+    try:
+        event_count = export_store(store, file_path)
+    except Exception as e:
+        logger.error(f"保存事件数据失败: {str(e)}")
+        return jsonify({"success": False, "error": f"保存事件数据失败: {str(e)}"}), 500
+    
+    logger.info(f"已保存事件数据到: {file_path}")
+    return jsonify({
+        "success": True, 
+        "filename": filename, 
+        "path": file_path,
+        "event_count": event_count
+    })
+
+@app.route('/api/query', methods=['GET'])
+@app.route('/api/monitors/<name>/query', methods=['GET'])
+def query_events(name=DEFAULT_MONITOR):
+    """分页查询已写入磁盘的历史事件"""
+    entry = get_entry(name)
+    
+    # 解析过滤参数
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "无效的时间范围"}), 400
+    
+    types = request.args.get('types', '')
+    types = [t.strip() for t in types.split(',') if t.strip()] or None
+    limit = request.args.get('limit', default=100, type=int)
+    
+    # 查询只读取存储，不持有任何锁
+    monitor = entry.monitor
+    store = monitor.store if monitor else stored_events(entry)
+    
+    try:
+        result = store.query(
+            start=start,
+            end=end,
+            types=types,
+            app=request.args.get('app') or None,
+            title=request.args.get('title') or None,
+            cursor=request.args.get('cursor') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"查询历史事件失败: {str(e)}")
+        return jsonify({"success": False, "error": f"查询失败: {str(e)}"}), 500
+    
+    return jsonify({
+        "success": True,
+        "events": result["events"],
+        "next_cursor": result["next_cursor"]
+    })
+
+@app.route('/api/search', methods=['GET'])
+@app.route('/api/monitors/<name>/search', methods=['GET'])
+def search(name=DEFAULT_MONITOR):
+    """按窗口标题（q）和应用名称（app）搜索，只读取倒排索引给出的段"""
+    entry = get_entry(name)
+    
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "无效的时间范围"}), 400
+    
+    title = request.args.get('q') or None
+    app_name = request.args.get('app') or None
+    limit = max(1, min(request.args.get('limit', default=100, type=int), MAX_QUERY_LIMIT))
+    
+    monitor = entry.monitor
+    if monitor and monitor.search_index is not None:
+        wait_derived(monitor)
+        store, index = monitor.store, monitor.search_index
+    elif monitor:
+        return jsonify({"success": False, "error": "收集器模式下本地没有搜索索引"}), 400
+    else:
+        # 监控器未初始化时读取已保存的索引，在内存中补齐
+        store = stored_events(entry)
+        index = SearchIndex(encryption_key=stored_key(entry))
+        index.load(entry.config["output_path"] + SEARCH_SUFFIX)
+        index.catch_up(store)
+    
+    try:
+        position = decode_cursor(request.args['cursor']) if request.args.get('cursor') else (0, 0)
+        segments = index.segments(title, app_name, start, end)
+        events = []
+        next_cursor = None
+        for found, event in search_events(store, index, title, app_name, start, end, position):
+            if len(events) == limit:
+                next_cursor = encode_cursor(*found)
+                break
+            events.append(event)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"搜索失败: {str(e)}")
+        return jsonify({"success": False, "error": f"搜索失败: {str(e)}"}), 500
+    
+    # 段的时间范围直接来自索引，不需要读取存储
+    ranges = []
+    for segment in segments[:MAX_SEGMENTS]:
+        t_min, t_max = index.time_range(segment)
+        ranges.append({
+            "segment": segment,
+            "from": datetime.datetime.fromtimestamp(t_min, datetime.timezone.utc).isoformat(),
+            "to": datetime.datetime.fromtimestamp(t_max, datetime.timezone.utc).isoformat()
+        })
+    
+    return jsonify({
+        "success": True,
+        "segments": ranges,
+        "segment_count": len(segments),
+        "events": events,
+        "next_cursor": next_cursor
+    })
+
+@app.route('/api/sessions', methods=['GET'])
+@app.route('/api/monitors/<name>/sessions', methods=['GET'])
+def query_sessions(name=DEFAULT_MONITOR):
+    """分页查询派生记录（活动会话、应用专注区间、连续输入），按结束时间过滤"""
+    entry = get_entry(name)
+    
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "无效的时间范围"}), 400
+    
+    types = request.args.get('types', '')
+    types = [t.strip() for t in types.split(',') if t.strip()] or None
+    app_name = request.args.get('app') or None
+    limit = request.args.get('limit', default=100, type=int)
+    
+    monitor = entry.monitor
+    if monitor:
+        wait_derived(monitor)
+        store = monitor.derived_store
+        # 尚未写入的记录（包括未结束的区间）单独返回
+        pending = monitor.sessionizer.snapshot()
+    else:
+        store = stored_events(entry, DERIVED_SUFFIX)
+        pending = []
+    
+    try:
+        result = store.query(
+            start=start,
+            end=end,
+            types=types,
+            app=app_name,
+            cursor=request.args.get('cursor') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"查询派生记录失败: {str(e)}")
+        return jsonify({"success": False, "error": f"查询失败: {str(e)}"}), 500
+    
+    def in_app(record):
+        return not app_name or str((record.get("window") or {}).get("app_name", "")).lower() == app_name.lower()
+    
+    def in_range(record):
+        ts = parse_timestamp(record["timestamp"])
+        return (start is None or ts >= start) and (end is None or ts < end)
+    
+    pending = [r for r in pending if (not types or r["type"] in types) and in_app(r) and in_range(r)]
+    response = {
+        "success": True,
+        "records": result["events"],
+        "next_cursor": result["next_cursor"],
+        "pending": pending
+    }
+    
+    # 汇总所有匹配的记录，而不只是当前页
+    if request.args.get('summary') in ('1', 'true'):
+        records = (r for r in store.iter_events(start=start, end=end, types=types) if in_app(r))
+        response["summary"] = summarize(itertools.chain(records, pending))
+    
+    return jsonify(response)
+
+@app.route('/api/rollups', methods=['GET'])
+@app.route('/api/monitors/<name>/rollups', methods=['GET'])
+def get_rollups(name=DEFAULT_MONITOR):
+    """按分钟、小时或天汇总的事件数、鼠标移动距离和按键数，自动选择最粗的满足粒度的级别"""
+    entry = get_entry(name)
+    
+    try:
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "无效的时间范围"}), 400
+    
+    types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()] or None
+    
+    monitor = entry.monitor
+    rollups = None
+    if monitor:
+        wait_derived(monitor)
+        rollups = monitor.rollups
+    
+    # 监控器未初始化时读取已保存的汇总
+    if rollups is None:
+        rollups = RollupAggregator()
+        rollups.load(entry.config["output_path"] + ROLLUP_SUFFIX, stored_key(entry))
+    
+    try:
+        result = rollups.query(
+            start=start,
+            end=end,
+            granularity=request.args.get('granularity') or None,
+            types=types,
+            app=request.args.get('app') or None
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    result["success"] = True
+    return jsonify(result)
+
+@app.route('/api/heatmap', methods=['GET'])
+@app.route('/api/monitors/<name>/heatmap', methods=['GET'])
+def get_heatmap(name=DEFAULT_MONITOR):
+    """获取鼠标热力图（按行展开的计数数组）"""
+    entry = get_entry(name)
+    
+    types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()] or None
+    apps = [a.strip() for a in request.args.get('apps', '').split(',') if a.strip()] or None
+    
+    monitor = entry.monitor
+    heatmap = None
+    if monitor:
+        wait_derived(monitor)
+        heatmap = monitor.heatmap
+    
+    # 监控器未初始化时读取已保存的热力图
+    if heatmap is None:
+        heatmap = HeatmapAggregator()
+        heatmap.load(entry.config["output_path"] + HEATMAP_SUFFIX, stored_key(entry))
+    
+    result = heatmap.get(event_types=types, apps=apps)
+    result["success"] = True
+    result["groups"] = [{"type": t, "app": a} for t, a in heatmap.keys()]
+    return jsonify(result)
 
 @app.route('/api/download/<filename>', methods=['GET'])
-def download_file(filename):
-    """下载事件数据文件"""
+@app.route('/api/monitors/<name>/download/<filename>', methods=['GET'])
+def download_file(filename, name=DEFAULT_MONITOR):
+    """
+    以分块响应流式导出事件数据
+
+    导出格式由文件名推断（.json/.jsonl/.csv，可加.gz），
+    支持from、to、types过滤参数，pretty=1时json格式缩进输出，不在工作目录中生成副本
+    """
+    entry = get_entry(name)
+    
     # 验证文件名安全性
     if not is_safe_filename(filename):
         return jsonify({"success": False, "error": "不安全的文件名"}), 400
     
-    file_path = os.path.join(os.getcwd(), filename)
+    try:
+        fmt, compress = format_from_filename(filename)
+        start = parse_timestamp(request.args.get('from'))
+        end = parse_timestamp(request.args.get('to'))
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    types = [t.strip() for t in request.args.get('types', '').split(',') if t.strip()] or None
     
-    if os.path.exists(file_path):
-        try:
-            return send_file(file_path, as_attachment=True)
-        except Exception as e:
-            logger.error(f"下载文件失败: {str(e)}")
-            return jsonify({"success": False, "error": f"下载文件失败: {str(e)}"}), 500
-    else:
+    with entry.lock:
+        monitor = entry.monitor
+        if monitor:
+            try:
+                # 先刷新缓冲区，使下载包含最新的事件
+                monitor._flush_buffer()
+            except Exception as e:
+                logger.error(f"刷新缓冲区失败: {str(e)}")
+            store = monitor.store
+        else:
+            store = stored_events(entry)
+    
+    if not os.path.exists(store.path):
         return jsonify({"success": False, "error": "文件不存在"}), 404
+    
+    pretty = request.args.get('pretty') in ('1', 'true')
+    chunks = iter_export(store.iter_events(start, end, types), fmt, compress, pretty=pretty)
+    return Response(chunks, content_type=export_content_type(fmt, compress),
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
 
 @app.route('/api/config', methods=['GET'])
-def get_config():
+@app.route('/api/monitors/<name>/config', methods=['GET'])
+def get_config(name=DEFAULT_MONITOR):
     """获取当前配置"""
-    global monitor, default_config
+    entry = get_entry(name)
+    monitor = entry.monitor
+    return jsonify({
+        "success": True,
+        "config": monitor.get_status() if monitor else entry.config
+    })
+
+@app.route('/api/config', methods=['PATCH'])
+@app.route('/api/monitors/<name>/config', methods=['PATCH'])
+def patch_config(name=DEFAULT_MONITOR):
+    """修改运行中监控器的配置，不停止监控器，线程、缓冲区和已记录的事件保持不变"""
+    entry = get_entry(name, create=True)
     
-    with monitor_lock:
-        if monitor:
-            return jsonify({
-                "success": True,
-                "config": monitor.get_status()
-            })
-        else:
-            return jsonify({
-                "success": True,
-                "config": default_config
-            })
+    changes = request.json
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({"success": False, "error": "请求体必须是包含配置项的JSON对象"}), 400
+    
+    with entry.lock:
+        try:
+            if entry.monitor:
+                applied = entry.monitor.reconfigure(**changes)
+                config = entry.monitor.get_status()
+            else:
+                # 监控器未初始化时修改默认配置，下次启动时生效
+                applied = validate_config(changes)
+                entry.config.update(applied)
+                config = entry.config
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+    
+    return jsonify({"success": True, "applied": applied, "config": config})
 
 @app.route('/api/update_interval', methods=['POST'])
-def update_interval():
+@app.route('/api/monitors/<name>/update_interval', methods=['POST'])
+def update_interval(name=DEFAULT_MONITOR):
     """更新采样间隔"""
-    global monitor
+    entry = get_entry(name)
     
     data = request.json or {}
     new_interval = data.get("interval", 10.0)
     
     try:
-        new_interval = float(new_interval)
-        if new_interval < 1.0:
-            return jsonify({"success": False, "error": "采样间隔必须至少为1.0秒"}), 400
-    except (ValueError, TypeError):
-        return jsonify({"success": False, "error": "无效的采样间隔值"}), 400
-    
-    with monitor_lock:
-        if monitor:
-            # 更新监控器的采样间隔
-            monitor.flush_interval = new_interval
+        new_interval = validate_config({"flush_interval": new_interval})["flush_interval"]
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    with entry.lock:
+        if entry.monitor:
+            # 更新监控器的采样间隔，刷新线程立即按新间隔计时
+            entry.monitor.reconfigure(flush_interval=new_interval)
             logger.info(f"已更新采样间隔为: {new_interval}秒")
             return jsonify({
                 "success": True,
@@ -324,7 +653,7 @@ def update_interval():
             })
         else:
             # 如果监控器未初始化，更新默认配置
-            default_config["flush_interval"] = new_interval
+            entry.config["flush_interval"] = new_interval
             logger.info(f"已更新默认采样间隔为: {new_interval}秒")
             return jsonify({
                 "success": True,
@@ -332,46 +661,152 @@ def update_interval():
                 "interval": new_interval
             })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """以Prometheus文本格式导出指标"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/api/trace', methods=['GET', 'POST'])
+def trace_config():
+    """获取分阶段耗时统计，或设置追踪采样率"""
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            sample_rate = float(data.get("sample_rate", 0.0))
+        except (ValueError, TypeError):
+            return jsonify({"success": False, "error": "无效的追踪采样率"}), 400
+        if sample_rate < 0.0 or sample_rate > 1.0:
+            return jsonify({"success": False, "error": "追踪采样率必须在0到1.0之间"}), 400
+        TRACER.set_sample_rate(sample_rate)
+        logger.info(f"已设置追踪采样率为: {sample_rate}")
+    
+    return jsonify({
+        "success": True,
+        "sample_rate": TRACER.sample_rate,
+        "stages": TRACER.summary()
+    })
+
+@app.route('/api/profile', methods=['POST'])
+def profile():
+    """对运行中的进程进行限时栈采样分析"""
+    data = request.json or {}
+    try:
+        seconds = float(data.get("seconds", 5.0))
+        interval = float(data.get("interval", 0.005))
+    except (ValueError, TypeError):
+        return jsonify({"success": False, "error": "无效的采样参数"}), 400
+    if seconds <= 0 or seconds > MAX_PROFILE_SECONDS:
+        return jsonify({"success": False, "error": f"采样时长必须在0到{MAX_PROFILE_SECONDS}秒之间"}), 400
+    
+    # 在独立线程中采样，请求处理只做可让出的等待，避免阻塞其他请求
+    sampler = StackSampler(interval=interval)
+    result = {}
+    worker = Thread(target=lambda: result.update(sampler.run(seconds)), daemon=True)
+    worker.start()
+    while worker.is_alive():
+        socketio.sleep(0.1)
+    
+    logger.info(f"栈采样完成，共{result.get('samples', 0)}次采样")
+    result["success"] = True
+    return jsonify(result)
+
+def transport_room(name, mode):
+    """订阅某个监控器某种传输模式的Socket.IO房间，默认监控器沿用原有的房间名"""
+    return mode if name == DEFAULT_MONITOR else f"{name}/{mode}"
+
 @socketio.on('connect')
 def handle_connect():
     """处理客户端连接"""
     client_id = request.sid
     session_id = session.get('session_id', str(uuid.uuid4()))
     client_sessions[client_id] = session_id
+    # 默认使用兼容的JSON传输，订阅默认监控器
+    client_transports[client_id] = TRANSPORT_JSON
+    client_monitors[client_id] = DEFAULT_MONITOR
+    join_room(TRANSPORT_JSON)
     logger.debug(f"客户端连接: {client_id}, 会话: {session_id}")
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """处理客户端断开连接"""
     client_id = request.sid
+    client_transports.pop(client_id, None)
+    client_monitors.pop(client_id, None)
     if client_id in client_sessions:
         del client_sessions[client_id]
         logger.debug(f"客户端断开连接: {client_id}")
 
-def push_events():
-    """推送事件到客户端的后台任务"""
-    global monitor
+@socketio.on('set_transport')
+def handle_set_transport(data):
+    """切换客户端的事件传输模式和订阅的监控器"""
+    client_id = request.sid
+    data = data or {}
+    mode = data.get("mode", TRANSPORT_JSON)
+    if mode not in TRANSPORT_MODES:
+        return {"success": False, "error": f"不支持的传输模式: {mode}"}
+    name = data.get("monitor", client_monitors.get(client_id, DEFAULT_MONITOR))
+    try:
+        registry.entry(name, create=False)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    
+    old_room = transport_room(client_monitors.get(client_id, DEFAULT_MONITOR), client_transports.get(client_id))
+    room = transport_room(name, mode)
+    if client_id in client_transports and old_room != room:
+        leave_room(old_room)
+    join_room(room)
+    client_transports[client_id] = mode
+    client_monitors[client_id] = name
+    logger.debug(f"客户端{client_id}切换传输模式: {mode}, 监控器: {name}")
+    return {"success": True, "mode": mode, "monitor": name}
+
+def push_events(name=DEFAULT_MONITOR):
+    """推送一个监控器的事件到订阅的客户端，监控器停止或被替换时结束"""
+    monitor = registry.get(name)
     
-    while True:
-        with monitor_lock:
-            if not monitor or not monitor.running:
-                break
-            
-            try:
-                # 获取最新事件
-                events = monitor.get_events(limit=10)
-                if events:
-                    # 发送事件到客户端
-                    socketio.emit('events_update', {"events": events})
-                    
-                    # 发送状态更新
-                    status = monitor.get_status()
-                    socketio.emit('status_update', status)
-            except Exception as e:
-                logger.error(f"推送事件时出错: {str(e)}")
+    last_seq = 0
+    while monitor and monitor.running and registry.get(name) is monitor:
+        try:
+            # 只获取上次推送之后的新事件
+            events = monitor.get_events_since(last_seq, limit=MAX_BATCH_SIZE)
+            if events:
+                last_seq = events[-1]["seq"]
+                modes = emit_events(events, name)
+                
+                # 发送状态更新
+                status = monitor.get_status()
+                for mode in modes:
+                    socketio.emit('status_update', status, to=transport_room(name, mode))
+        except Exception as e:
+            logger.error(f"推送监控器{name}的事件时出错: {str(e)}")
         
-        # 等待一段时间再次推送
-        socketio.sleep(1)
+        # 等待一段时间再次推送，并记录实际唤醒相对预期的延迟
+        sleep_start = time.perf_counter()
+        socketio.sleep(PUSH_INTERVAL)
+        PUSH_LOOP_LAG.observe(max(0.0, time.perf_counter() - sleep_start - PUSH_INTERVAL))
+
+def emit_events(events, name=DEFAULT_MONITOR):
+    """
+    按客户端选择的传输模式推送一个监控器的一批事件，每种模式只编码一次
+
+    Returns:
+        有客户端订阅的传输模式
+    """
+    # 复制快照，避免客户端连接或断开时迭代出错
+    monitors = dict(client_monitors)
+    modes = {mode for client_id, mode in list(client_transports.items()) if monitors.get(client_id) == name}
+    
+    if TRANSPORT_JSON in modes:
+        # 兼容模式：完整字段名的JSON
+        socketio.emit('events_update', {"events": events}, to=transport_room(name, TRANSPORT_JSON))
+        EVENTS_PUSHED.inc(len(events), labels=(TRANSPORT_JSON,))
+    for mode, compress in ((TRANSPORT_BINARY, False), (TRANSPORT_BINARY_ZLIB, True)):
+        if mode in modes:
+            frame = encode_batch(events, compress=compress)
+            socketio.emit('events_batch', frame, to=transport_room(name, mode))
+            EVENTS_PUSHED.inc(len(events), labels=(mode,))
+            BYTES_PUSHED.inc(len(frame), labels=(mode,))
+    return modes
 
 def is_safe_filename(filename):
     """检查文件名是否安全"""
@@ -421,15 +856,18 @@ def parse_args():
         help="日志级别"
     )
     
+    parser.add_argument(
+        "--flush_workers",
+        type=int,
+        default=DEFAULT_FLUSH_WORKERS,
+        help="所有监控器共享的刷新线程数"
+    )
+    
     return parser.parse_args()
 
 def setup_logging(log_level):
-    """设置日志级别"""
-    level = getattr(logging, log_level)
-    for handler in logging.root.handlers:
-        handler.setLevel(level)
-    logging.root.setLevel(level)
-    logger.setLevel(level)
+    """配置异步日志并设置日志级别"""
+    configure_logging(log_level, log_file='web_app.log')
     logger.info(f"日志级别设置为: {log_level}")
 
 def main():
@@ -440,6 +878,9 @@ def main():
     # 设置日志级别
     setup_logging(args.log_level)
     
+    global registry
+    registry = MonitorRegistry(default_config, flush_workers=args.flush_workers)
+    
     # 检查系统
     import platform
     if platform.system() != "Darwin":